@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Generador de catálogo y pares sintéticos para pruebas de rendimiento
+Produce títulos de productos realistas en español e inglés y pares
+similares / no similares con tasas controlables de duplicados, typos,
+sinónimos y variaciones de unidades (pulgadas/inch, GB/gb). La salida se
+escribe en streaming a CSV, Parquet o DynamoDB Local, así que sirve para
+generar millones de pares sin cargarlos en memoria
+"""
+
+import os
+import re
+import sys
+import csv
+import time
+import random
+import argparse
+import unicodedata
+from array import array
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterator, List, Tuple
+
+# Catálogo base: (categoría, nombres en español, nombres en inglés, marcas, modelos, atributos)
+CATEGORIES = [
+    {
+        'name': 'celulares',
+        'es': ['Celular', 'Teléfono móvil', 'Smartphone'],
+        'en': ['Smartphone', 'Cell phone', 'Mobile phone'],
+        'brands': ['Samsung', 'Apple', 'Xiaomi', 'Motorola', 'Nokia', 'Huawei', 'Realme', 'OnePlus'],
+        'models': ['Galaxy S{n}', 'Galaxy A{n}', 'iPhone {n}', 'Redmi Note {n}', 'Moto G{n}', 'Nord {n}'],
+        'attributes': [('storage', ['64GB', '128GB', '256GB', '512GB']), ('ram', ['4GB RAM', '6GB RAM', '8GB RAM']),
+                       ('color', ['Negro', 'Blanco', 'Azul', 'Verde', 'Rosa'])],
+    },
+    {
+        'name': 'notebooks',
+        'es': ['Notebook', 'Laptop', 'Computadora portátil'],
+        'en': ['Laptop', 'Notebook'],
+        'brands': ['Lenovo', 'HP', 'Dell', 'Asus', 'Acer', 'Apple', 'MSI'],
+        'models': ['IdeaPad {n}', 'Pavilion {n}', 'Inspiron {n}', 'VivoBook {n}', 'Aspire {n}', 'MacBook Air M{n}'],
+        'attributes': [('screen', ['13 pulgadas', '14 pulgadas', '15.6 pulgadas', '17 pulgadas']),
+                       ('cpu', ['Core i5', 'Core i7', 'Ryzen 5', 'Ryzen 7']),
+                       ('storage', ['256GB SSD', '512GB SSD', '1TB SSD']), ('ram', ['8GB RAM', '16GB RAM'])],
+    },
+    {
+        'name': 'televisores',
+        'es': ['Smart TV', 'Televisor', 'Tele'],
+        'en': ['Smart TV', 'Television', 'TV'],
+        'brands': ['Samsung', 'LG', 'Sony', 'TCL', 'Philips', 'Hisense', 'Noblex'],
+        'models': ['Crystal UHD AU{n}000', 'OLED C{n}', 'Bravia X{n}0', 'Serie {n}'],
+        'attributes': [('screen', ['32 pulgadas', '43 pulgadas', '50 pulgadas', '55 pulgadas', '65 pulgadas']),
+                       ('resolution', ['4K', 'Full HD', 'UHD', '8K']), ('extra', ['HDR10', 'WiFi', 'Bluetooth'])],
+    },
+    {
+        'name': 'zapatillas',
+        'es': ['Zapatillas', 'Tenis', 'Calzado deportivo'],
+        'en': ['Sneakers', 'Running shoes', 'Trainers'],
+        'brands': ['Nike', 'Adidas', 'Puma', 'Topper', 'Fila', 'New Balance', 'Reebok'],
+        'models': ['Air Max {n}', 'Ultraboost {n}', 'Runner {n}', 'Classic {n}', 'Pegasus {n}'],
+        'attributes': [('size', ['Talle 38', 'Talle 40', 'Talle 42', 'Talle 44']),
+                       ('color', ['Negro', 'Blanco', 'Gris', 'Rojo', 'Azul']), ('gender', ['Hombre', 'Mujer', 'Niño'])],
+    },
+    {
+        'name': 'electrodomesticos',
+        'es': ['Heladera', 'Lavarropas', 'Microondas', 'Aire acondicionado'],
+        'en': ['Refrigerator', 'Washing machine', 'Microwave', 'Air conditioner'],
+        'brands': ['Whirlpool', 'Samsung', 'LG', 'Drean', 'Electrolux', 'BGH', 'Philco'],
+        'models': ['Serie {n}', 'Eco {n}', 'Inverter {n}', 'Pro {n}00'],
+        'attributes': [('capacity', ['20 litros', '300 litros', '7 kg', '8 kg', '3000 frigorías']),
+                       ('color', ['Blanco', 'Inoxidable', 'Negro']), ('extra', ['Inverter', 'No Frost', 'A+'])],
+    },
+    {
+        'name': 'libros',
+        'es': ['Libro', 'Novela', 'Manual'],
+        'en': ['Book', 'Novel', 'Handbook'],
+        'brands': ['Planeta', 'Penguin', 'Anagrama', 'Salamandra', 'O\'Reilly', 'Alfaguara'],
+        'models': ['Edición {n}', 'Tomo {n}', 'Volumen {n}'],
+        'attributes': [('format', ['Tapa dura', 'Tapa blanda', 'Bolsillo']), ('language', ['Español', 'Inglés']),
+                       ('extra', ['Nuevo', 'Usado', 'Firmado'])],
+    },
+]
+
+# Sinónimos intercambiables en un título (todas las variantes de cada grupo)
+SYNONYMS = [
+    ['celular', 'teléfono móvil', 'smartphone', 'cell phone'],
+    ['notebook', 'laptop', 'computadora portátil'],
+    ['televisor', 'tele', 'smart tv', 'television', 'tv'],
+    ['zapatillas', 'tenis', 'sneakers'],
+    ['heladera', 'refrigerador', 'refrigerator'],
+    ['lavarropas', 'lavadora', 'washing machine'],
+    ['negro', 'black'], ['blanco', 'white'], ['azul', 'blue'], ['gris', 'gray'], ['rojo', 'red'],
+    ['nuevo', 'new'], ['usado', 'used'], ['hombre', 'men'], ['mujer', 'women'],
+]
+_SYNONYM_INDEX = {word: group for group in SYNONYMS for word in group}
+# Palabras completas, las más largas primero ("smart tv" antes que "tv")
+_SYNONYM_PATTERN = re.compile(r'\b(' + '|'.join(re.escape(w) for w in sorted(_SYNONYM_INDEX, key=len, reverse=True)) + r')\b',
+                              re.IGNORECASE)
+
+# Variaciones de unidades: forma canónica -> alternativas
+UNIT_VARIANTS = {
+    'pulgadas': ['"', ' inch', ' in', ' pulg', ' pulgadas'],
+    'GB': ['GB', ' GB', 'gb', ' gigas'],
+    'TB': ['TB', ' TB', 'tb'],
+    'litros': [' litros', ' L', 'lts', ' liters'],
+    'kg': [' kg', 'kg', ' kilos'],
+}
+
+# Palabras de relleno para alargar títulos (la longitud se controla con --mean-extra-words)
+FILLER = ['original', 'garantía oficial', 'envío gratis', 'importado', 'oferta', 'nuevo modelo', 'liberado',
+          'con caja', 'premium', 'edición especial', 'factura A', 'stock inmediato', 'official', 'warranty',
+          'free shipping', 'brand new', 'sellado', 'última generación']
+
+KEYBOARD_NEIGHBOURS = {
+    'a': 'qs', 'b': 'vn', 'c': 'xv', 'd': 'sf', 'e': 'wr', 'f': 'dg', 'g': 'fh', 'h': 'gj', 'i': 'uo',
+    'j': 'hk', 'k': 'jl', 'l': 'kñ', 'm': 'n', 'n': 'bm', 'o': 'ip', 'p': 'o', 'r': 'et', 's': 'ad',
+    't': 'ry', 'u': 'yi', 'v': 'cb', 'x': 'zc', 'y': 'tu', 'z': 'x',
+}
+
+
+class ProductCatalog:
+    """Productos canónicos (categoría, marca, modelo, atributos) generados con una semilla.
+
+    Solo se guarda la categoría de cada producto (un array de ids por
+    categoría); el resto se deriva del id, así que el catálogo ocupa pocos
+    bytes por producto aunque tenga millones.
+    """
+
+    def __init__(self, n_products: int, seed: int = 42):
+        self.n_products = n_products
+        self.seed = seed
+        rng = random.Random(seed)
+        self.category_of = bytearray(rng.randrange(len(CATEGORIES)) for _ in range(n_products))
+        self.by_category = [array('I') for _ in CATEGORIES]
+        for product_id, category in enumerate(self.category_of):
+            self.by_category[category].append(product_id)
+
+    @lru_cache(maxsize=65536)
+    def product(self, product_id: int) -> Dict:
+        """Producto determinístico por id"""
+        rng = random.Random(self.seed * 1_000_003 + product_id)
+        category = CATEGORIES[self.category_of[product_id]]
+        return {
+            'product_id': product_id,
+            'category': category['name'],
+            'brand': rng.choice(category['brands']),
+            'model': rng.choice(category['models']).format(n=rng.randint(1, 30)),
+            'attributes': [rng.choice(values) for _, values in category['attributes']],
+            'names': (rng.choice(category['es']), rng.choice(category['en'])),
+            'filler': rng.sample(FILLER, 6),
+        }
+
+    def similar_product_id(self, product_id: int, rng: random.Random) -> int:
+        """Otro producto de la misma categoría (negativo difícil)"""
+        candidates = self.by_category[self.category_of[product_id]]
+        if len(candidates) < 2:
+            return (product_id + 1) % self.n_products
+        while True:
+            candidate = candidates[rng.randrange(len(candidates))]
+            if candidate != product_id:
+                return candidate
+
+
+def render_title(product: Dict, rng: random.Random, english_ratio: float, mean_extra_words: float) -> str:
+    """Título de un producto: nombre, marca, modelo, atributos y relleno en orden y cantidad variables"""
+    name = product['names'][1] if rng.random() < english_ratio else product['names'][0]
+    attributes = [a for a in product['attributes'] if rng.random() < 0.8]
+    n_extra = min(len(product['filler']), int(rng.expovariate(1 / mean_extra_words)) if mean_extra_words > 0 else 0)
+    parts = [name, product['brand'], product['model']] + attributes + product['filler'][:n_extra]
+    if rng.random() < 0.3:
+        # Algunos vendedores empiezan por la marca
+        parts[0], parts[1] = parts[1], parts[0]
+    return ' '.join(parts)
+
+
+def apply_typo(title: str, rng: random.Random) -> str:
+    """Un error de tipeo: letra vecina en el teclado, letra omitida, duplicada o transpuesta"""
+    positions = [i for i, c in enumerate(title) if c.isalpha()]
+    if len(positions) < 2:
+        return title
+    i = rng.choice(positions[:-1])
+    kind = rng.randrange(4)
+    if kind == 0 and title[i].lower() in KEYBOARD_NEIGHBOURS:
+        return title[:i] + rng.choice(KEYBOARD_NEIGHBOURS[title[i].lower()]) + title[i + 1:]
+    if kind == 1:
+        return title[:i] + title[i + 1:]
+    if kind == 2:
+        return title[:i] + title[i] + title[i:]
+    return title[:i] + title[i + 1] + title[i] + title[i + 2:]
+
+
+def apply_synonyms(title: str, rng: random.Random) -> str:
+    """Reemplazar una palabra (o frase) por un sinónimo de su grupo"""
+    matches = list(_SYNONYM_PATTERN.finditer(title))
+    if not matches:
+        return title
+    match = rng.choice(matches)
+    word = match.group(0).lower()
+    replacement = rng.choice([w for w in _SYNONYM_INDEX[word] if w != word])
+    return title[:match.start()] + replacement + title[match.end():]
+
+
+def apply_unit_variation(title: str, rng: random.Random) -> str:
+    for unit, variants in UNIT_VARIANTS.items():
+        for spacing in (' ' + unit, unit):
+            if spacing in title:
+                return title.replace(spacing, rng.choice(variants), 1)
+    return title
+
+
+def strip_accents(title: str) -> str:
+    return ''.join(c for c in unicodedata.normalize('NFD', title) if unicodedata.category(c) != 'Mn')
+
+
+def vary_title(title: str, rng: random.Random, typo_rate: float, synonym_rate: float, unit_rate: float) -> Tuple[str, List[str]]:
+    """Variante de un título del mismo producto; devuelve también las variaciones aplicadas"""
+    applied = []
+    if rng.random() < synonym_rate:
+        varied = apply_synonyms(title, rng)
+        if varied != title:
+            title, _ = varied, applied.append('synonym')
+    if rng.random() < unit_rate:
+        varied = apply_unit_variation(title, rng)
+        if varied != title:
+            title, _ = varied, applied.append('unit')
+    if rng.random() < typo_rate:
+        title = apply_typo(title, rng)
+        applied.append('typo')
+    if rng.random() < 0.2:
+        title = strip_accents(title)
+        applied.append('accents')
+    if rng.random() < 0.15:
+        title = title.upper() if rng.random() < 0.5 else title.lower()
+        applied.append('case')
+    return title, applied
+
+
+def generate_pairs(n_pairs: int, n_products: int, duplicate_rate: float = 0.3, repeat_rate: float = 0.0,
+                   hard_negative_rate: float = 0.5, typo_rate: float = 0.2, synonym_rate: float = 0.3,
+                   unit_rate: float = 0.3, english_ratio: float = 0.2, mean_extra_words: float = 2.0,
+                   seed: int = 42) -> Iterator[Dict]:
+    """Pares en streaming con la forma del dataset (ITEM_A, TITLE_A, ITEM_B, TITLE_B) más la etiqueta.
+
+    - duplicate_rate: fracción de pares del mismo producto (IS_SIMILAR = 1)
+    - repeat_rate: fracción de pares que repiten uno ya emitido (mismo par de ítems)
+    - hard_negative_rate: fracción de negativos de la misma categoría
+    """
+    rng = random.Random(seed)
+    catalog = ProductCatalog(n_products, seed)
+    recent: List[Dict] = []
+    next_item_id = 1_000_000
+
+    for _ in range(n_pairs):
+        if recent and rng.random() < repeat_rate:
+            yield rng.choice(recent)
+            continue
+
+        product_a = catalog.product(rng.randrange(n_products))
+        title_a = render_title(product_a, rng, english_ratio, mean_extra_words)
+        if rng.random() < duplicate_rate:
+            title_b, variations = vary_title(render_title(product_a, rng, english_ratio, mean_extra_words),
+                                             rng, typo_rate, synonym_rate, unit_rate)
+            is_similar = 1
+        else:
+            other = (catalog.similar_product_id(product_a['product_id'], rng) if rng.random() < hard_negative_rate
+                     else rng.randrange(n_products))
+            title_b, variations = render_title(catalog.product(other), rng, english_ratio, mean_extra_words), []
+            is_similar = 0
+
+        pair = {
+            'ITEM_A': next_item_id,
+            'TITLE_A': title_a,
+            'ITEM_B': next_item_id + 1,
+            'TITLE_B': title_b,
+            'IS_SIMILAR': is_similar,
+            'VARIATIONS': '|'.join(variations),
+        }
+        next_item_id += 2
+        # Reservorio acotado de pares para las repeticiones
+        if len(recent) < 10_000:
+            recent.append(pair)
+        else:
+            recent[rng.randrange(len(recent))] = pair
+        yield pair
+
+
+FIELDS = ['ITEM_A', 'TITLE_A', 'ITEM_B', 'TITLE_B', 'IS_SIMILAR', 'VARIATIONS']
+
+
+def write_csv(pairs: Iterator[Dict], path: str, report: callable) -> int:
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for count, pair in enumerate(pairs, 1):
+            writer.writerow(pair)
+            report(count)
+    return count
+
+
+def write_parquet(pairs: Iterator[Dict], path: str, report: callable, row_group_size: int = 100_000) -> int:
+    """Parquet por row groups (pyarrow, dependencia opcional)"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("❌ Para Parquet se necesita pyarrow: pip install pyarrow")
+        sys.exit(1)
+
+    schema = pa.schema([('ITEM_A', pa.int64()), ('TITLE_A', pa.string()), ('ITEM_B', pa.int64()),
+                        ('TITLE_B', pa.string()), ('IS_SIMILAR', pa.int8()), ('VARIATIONS', pa.string())])
+    count = 0
+    buffer: List[Dict] = []
+    with pq.ParquetWriter(path, schema, compression='snappy') as writer:
+        for count, pair in enumerate(pairs, 1):
+            buffer.append(pair)
+            if len(buffer) >= row_group_size:
+                writer.write_table(pa.Table.from_pylist(buffer, schema=schema))
+                buffer = []
+            report(count)
+        if buffer:
+            writer.write_table(pa.Table.from_pylist(buffer, schema=schema))
+    return count
+
+
+def write_dynamodb(pairs: Iterator[Dict], endpoint_url: str, table_name: str, report: callable) -> int:
+    """Escribir los pares con la forma de la tabla item_pairs (batch_writer, de a 25)"""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'common'))
+    from dynamodb_client import get_table
+
+    table = get_table(table_name, endpoint_url=endpoint_url)
+    now = datetime.now().isoformat()
+    count = 0
+    with table.batch_writer(overwrite_by_pkeys=['id']) as batch:
+        for count, pair in enumerate(pairs, 1):
+            item_a, item_b = pair['ITEM_A'], pair['ITEM_B']
+            batch.put_item(Item={
+                'id': f"{min(item_a, item_b)}_{max(item_a, item_b)}",
+                'item_a_id': item_a,
+                'item_a_title': pair['TITLE_A'],
+                'item_b_id': item_b,
+                'item_b_title': pair['TITLE_B'],
+                'status': 'positivo' if pair['IS_SIMILAR'] else 'negativo',
+                'created_at': now,
+                'updated_at': now,
+                'source': 'synthetic',
+            })
+            report(count)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generar pares de productos sintéticos a escala")
+    parser.add_argument('--pairs', type=int, default=1_000_000)
+    parser.add_argument('--products', type=int, default=200_000, help="Tamaño del catálogo de productos canónicos")
+    parser.add_argument('--format', choices=['csv', 'parquet', 'dynamodb'], default='csv')
+    parser.add_argument('--output', default='synthetic_pairs.csv', help="Archivo de salida (csv / parquet)")
+    parser.add_argument('--endpoint-url', default=os.getenv('AWS_ENDPOINT_URL', 'http://localhost:8000'),
+                        help="DynamoDB Local (solo --format dynamodb)")
+    parser.add_argument('--table', default='item_pairs')
+    parser.add_argument('--duplicate-rate', type=float, default=0.3, help="Fracción de pares del mismo producto")
+    parser.add_argument('--repeat-rate', type=float, default=0.0, help="Fracción de pares repetidos")
+    parser.add_argument('--hard-negative-rate', type=float, default=0.5, help="Negativos de la misma categoría")
+    parser.add_argument('--typo-rate', type=float, default=0.2)
+    parser.add_argument('--synonym-rate', type=float, default=0.3)
+    parser.add_argument('--unit-rate', type=float, default=0.3, help="Variaciones de unidades (pulgadas/inch, GB/gb)")
+    parser.add_argument('--english-ratio', type=float, default=0.2, help="Fracción de títulos en inglés")
+    parser.add_argument('--mean-extra-words', type=float, default=2.0, help="Media de frases de relleno por título")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    pairs = generate_pairs(args.pairs, args.products, duplicate_rate=args.duplicate_rate,
+                           repeat_rate=args.repeat_rate, hard_negative_rate=args.hard_negative_rate,
+                           typo_rate=args.typo_rate, synonym_rate=args.synonym_rate, unit_rate=args.unit_rate,
+                           english_ratio=args.english_ratio, mean_extra_words=args.mean_extra_words, seed=args.seed)
+
+    start = time.perf_counter()
+    step = max(1, args.pairs // 20)
+
+    def report(count: int):
+        if count % step == 0:
+            elapsed = time.perf_counter() - start
+            print(f"   {count:,} / {args.pairs:,} pares ({count / elapsed:,.0f} pares/s)")
+
+    print(f"🏭 Generando {args.pairs:,} pares ({args.format}) con {args.products:,} productos")
+    if args.format == 'csv':
+        count = write_csv(pairs, args.output, report)
+    elif args.format == 'parquet':
+        output = args.output if not args.output.endswith('.csv') else args.output[:-4] + '.parquet'
+        count = write_parquet(pairs, output, report)
+    else:
+        count = write_dynamodb(pairs, args.endpoint_url, args.table, report)
+    print(f"✅ {count:,} pares en {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,88 +1,67 @@
-import pandas as pd
-import boto3
-import os 
+import os
+import sys
+from decimal import Decimal
 from datetime import datetime
-from app import calculate_similarity, generate_pair_id
+import numpy as np
+from app import calculate_similarity
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'common'))
+from pair_array import PairArray
+from pair_store import build_pair_store
+
+def load_initial_data(csv_path: str = 'data_matches - dataset.csv', store=None):
+    """Cargar datos iniciales del CSV al repositorio de pares (DynamoDB por defecto)"""
+
+    # Cargar datos del CSV como columnas (ids empaquetados, títulos internados)
+    pairs = PairArray.from_csv(csv_path)
+
+    print(f"Cargando {len(pairs)} pares de ítems desde el CSV...")
+
+    # Repositorio compartido (PAIR_STORE_BACKEND; AWS_ENDPOINT_URL para DynamoDB local)
+    store = store or build_pair_store()
+
+    # Un BatchGetItem por cada 100 pares en lugar de un get_item por par;
+    # los ids repetidos dentro del CSV cuentan como existentes
+    pair_ids = pairs.pair_ids()
+    existing = store.batch_get(pair_ids)
+    _, first_rows = np.unique(pair_ids, return_index=True)
+    is_new = np.zeros(len(pairs), dtype=bool)
+    is_new[first_rows] = True
+    is_new &= np.array([pair_id not in existing for pair_id in pair_ids], dtype=bool)
+    existing_pairs = int((~is_new).sum())
+
+    new_pairs = pairs.select(is_new)
+    new_ids = [pair_ids[row] for row in np.flatnonzero(is_new)]
+    titles_a, titles_b = new_pairs.title_columns()
+    item_a_ids, item_b_ids = new_pairs.item_a_ids.tolist(), new_pairs.item_b_ids.tolist()
+    now = datetime.now().isoformat()
+
+    items = [{
+        'id': pair_id,
+        'item_a_id': item_a_ids[row],
+        'item_a_title': titles_a[row],
+        'item_b_id': item_b_ids[row],
+        'item_b_title': titles_b[row],
+        'similarity_score': Decimal(str(calculate_similarity(titles_a[row], titles_b[row]))),
+        'created_at': now,
+        'updated_at': now,
+        'source': 'initial_csv_load'
+    } for row, pair_id in enumerate(new_ids)]
 
-def load_initial_data():
-    """Cargar datos iniciales del CSV a DynamoDB"""
-    
-    # Configuración de DynamoDB
-    if os.getenv('AWS_ENDPOINT_URL'):
-        # Para desarrollo local con DynamoDB local
-        dynamodb = boto3.resource('dynamodb', 
-                                 endpoint_url=os.getenv('AWS_ENDPOINT_URL'),
-                                 region_name='us-east-1',
-                                 aws_access_key_id='dummy',
-                                 aws_secret_access_key='dummy')
-    else:
-        # Para producción en AWS
-        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-    
-    # Cargar datos del CSV
-    df = pd.read_csv('data_matches - dataset.csv')
-    
-    print(f"Cargando {len(df)} pares de ítems desde el CSV...")
-    
-    pairs_table = dynamodb.Table('item_pairs')
-    items_table = dynamodb.Table('items')
-    
     created_pairs = 0
-    existing_pairs = 0
     errors = 0
-    
-    for index, row in df.iterrows():
-        try:
-            # Preparar datos del par
-            item_a = {
-                'item_id': int(row['ITEM_A']),
-                'title': str(row['TITLE_A']).strip()
-            }
-            
-            item_b = {
-                'item_id': int(row['ITEM_B']),
-                'title': str(row['TITLE_B']).strip()
-            }
-            
-            # Generar ID del par
-            pair_id = generate_pair_id(item_a['item_id'], item_b['item_id'])
-            
-            # Verificar si el par ya existe
-            try:
-                response = pairs_table.get_item(Key={'pair_id': pair_id})
-                if 'Item' in response:
-                    existing_pairs += 1
-                    print(f"Par {pair_id} ya existe, saltando...")
-                    continue
-            except Exception as e:
-                print(f"Error verificando par {pair_id}: {e}")
-            
-            # Crear el par
-            pair_data = {
-                'pair_id': pair_id,
-                'item_a_id': item_a['item_id'],
-                'item_a_title': item_a['title'],
-                'item_b_id': item_b['item_id'],
-                'item_b_title': item_b['title'],
-                'similarity_score': calculate_similarity(item_a['title'], item_b['title']),
-                'created_at': datetime.now().isoformat(),
-                'source': 'initial_csv_load'
-            }
-            
-            pairs_table.put_item(Item=pair_data)
+    for result in store.batch_put(items):
+        if result['result'] == 'created':
             created_pairs += 1
-            
-            print(f"Par {pair_id} creado exitosamente")
-            
-        except Exception as e:
+        else:
             errors += 1
-            print(f"Error procesando fila {index}: {e}")
-    
+            print(f"Error creando par {result['pair_id']}: {result.get('error', result['result'])}")
+
     print(f"\n=== RESUMEN DE CARGA ===")
     print(f"Pares creados: {created_pairs}")
     print(f"Pares existentes: {existing_pairs}")
     print(f"Errores: {errors}")
-    print(f"Total procesados: {len(df)}")
+    print(f"Total procesados: {len(pairs)}")
 
 if __name__ == '__main__':
-    load_initial_data() 
\ No newline at end of file
+    load_initial_data()
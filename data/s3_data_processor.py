@@ -3,14 +3,20 @@
 Script para cargar datos a S3 y procesarlos a través del API
 """
 
+import os
+import sys
 import boto3
 import json
 import csv
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from typing import List, Dict, Any
 import requests
 import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'common'))
+from pair_array import PairArray
  
 class S3DataProcessor:
     def __init__(self, bucket_name: str, api_url: str):
@@ -57,82 +63,67 @@ class S3DataProcessor:
             print(f"❌ Error listando archivos: {e}")
             return []
     
-    def process_csv_through_api(self, csv_path: str, batch_size: int = 10) -> List[Dict]:
-        """Procesar CSV a través del API"""
-        results = []
-        
+    def process_csv_through_api(self, csv_path: str, batch_size: int = 10) -> PairArray:
+        """Procesar CSV a través del API.
+
+        Los resultados quedan en un PairArray: scores, flags y estado como
+        columnas, y los errores de cada par en pairs.errors.
+        """
         try:
             # Cargar datos del CSV
-            df = pd.read_csv(csv_path)
-            print(f"📊 Cargados {len(df)} registros del CSV")
+            pairs = PairArray.from_csv(csv_path)
+            print(f"📊 Cargados {len(pairs)} registros del CSV")
+        except Exception as e:
+            print(f"❌ Error procesando CSV: {e}")
+            return PairArray.from_records([])
+        
+        for flag in ('are_similar', 'are_equal', 'pair_exists'):
+            pairs.columns[flag] = np.zeros(len(pairs), dtype=bool)
+        pairs.columns['processed_at'] = np.zeros(len(pairs), dtype='datetime64[us]')
+        item_a_ids, item_b_ids = pairs.item_a_ids.tolist(), pairs.item_b_ids.tolist()
+        titles_a, titles_b = pairs.title_columns()
+        
+        # Procesar en lotes
+        for i in range(0, len(pairs), batch_size):
+            print(f"🔄 Procesando lote {i//batch_size + 1}/{(len(pairs)-1)//batch_size + 1}")
             
-            # Procesar en lotes
-            for i in range(0, len(df), batch_size):
-                batch = df.iloc[i:i+batch_size]
-                print(f"🔄 Procesando lote {i//batch_size + 1}/{(len(df)-1)//batch_size + 1}")
+            for row in range(i, min(i + batch_size, len(pairs))):
+                item_a = {'item_id': item_a_ids[row], 'title': titles_a[row]}
+                item_b = {'item_id': item_b_ids[row], 'title': titles_b[row]}
                 
-                for _, row in batch.iterrows():
-                    # Preparar datos para el API
-                    item_a = {
-                        'item_id': int(row.get('ITEM_A', 0)),
-                        'title': str(row.get('TITLE_A', '')).strip()
-                    }
-                    item_b = {
-                        'item_id': int(row.get('ITEM_B', 0)),
-                        'title': str(row.get('TITLE_B', '')).strip()
+                # Llamar al API
+                try:
+                    payload = {
+                        "item_a": item_a,
+                        "item_b": item_b
                     }
+                    response = self.session.post(
+                        f"{self.api_url}/items/compare",
+                        json=payload,
+                        timeout=30
+                    )
+                    response.raise_for_status()
+                    result = response.json()
                     
-                    # Llamar al API
-                    try:
-                        payload = {
-                            "item_a": item_a,
-                            "item_b": item_b
-                        }
-                        response = self.session.post(
-                            f"{self.api_url}/items/compare",
-                            json=payload,
-                            timeout=30
-                        )
-                        response.raise_for_status()
-                        result = response.json()
-                        
-                        # Agregar información adicional
-                        result['item_a_id'] = item_a['item_id']
-                        result['item_a_title'] = item_a['title']
-                        result['item_b_id'] = item_b['item_id']
-                        result['item_b_title'] = item_b['title']
-                        result['processed_at'] = datetime.now().isoformat()
-                        
-                        results.append(result)
-                        
-                    except Exception as e:
-                        print(f"❌ Error procesando par {item_a['item_id']}-{item_b['item_id']}: {e}")
-                        # Agregar resultado de error
-                        error_result = {
-                            'item_a_id': item_a['item_id'],
-                            'item_a_title': item_a['title'],
-                            'item_b_id': item_b['item_id'],
-                            'item_b_title': item_b['title'],
-                            'similarity_score': 0.0,
-                            'are_similar': False,
-                            'are_equal': False,
-                            'pair_exists': False,
-                            'error': str(e),
-                            'processed_at': datetime.now().isoformat()
-                        }
-                        results.append(error_result)
-                
-                # Pausa entre lotes
-                time.sleep(1)
-            
-            print(f"✅ Procesamiento completado: {len(results)} resultados")
-            return results
+                    pairs.scores[row] = result.get('similarity_score', 0.0)
+                    for flag in ('are_similar', 'are_equal', 'pair_exists'):
+                        pairs.columns[flag][row] = bool(result.get(flag, False))
+                    if result.get('status'):
+                        pairs.set_status(row, result['status'])
+                    
+                except Exception as e:
+                    print(f"❌ Error procesando par {item_a['item_id']}-{item_b['item_id']}: {e}")
+                    pairs.scores[row] = 0.0
+                    pairs.set_error(row, str(e))
+                pairs.columns['processed_at'][row] = np.datetime64(datetime.now(), 'us')
             
-        except Exception as e:
-            print(f"❌ Error procesando CSV: {e}")
-            return []
+            # Pausa entre lotes
+            time.sleep(1)
+        
+        print(f"✅ Procesamiento completado: {len(pairs)} resultados")
+        return pairs
     
-    def save_results_to_s3(self, results: List[Dict], s3_key: str = None) -> str:
+    def save_results_to_s3(self, results: PairArray, s3_key: str = None) -> str:
         """Guardar resultados en S3"""
         if not s3_key:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -140,7 +131,7 @@ class S3DataProcessor:
         
         try:
             # Guardar como JSON
-            json_data = json.dumps(results, indent=2, ensure_ascii=False)
+            json_data = json.dumps(list(results.iter_records()), indent=2, ensure_ascii=False)
             self.s3_client.put_object(
                 Bucket=self.bucket_name,
                 Key=s3_key,
@@ -150,7 +141,7 @@ class S3DataProcessor:
             
             # También guardar como CSV
             csv_key = s3_key.replace('.json', '.csv')
-            df = pd.DataFrame(results)
+            df = results.to_frame()
             csv_data = df.to_csv(index=False, encoding='utf-8')
             self.s3_client.put_object(
                 Bucket=self.bucket_name,
@@ -169,40 +160,36 @@ class S3DataProcessor:
             print(f"❌ Error guardando resultados: {e}")
             return None
     
-    def analyze_results(self, results: List[Dict]) -> Dict[str, Any]:
-        """Analizar resultados y generar estadísticas"""
-        if not results:
+    def analyze_results(self, pairs: PairArray) -> Dict[str, Any]:
+        """Analizar resultados y generar estadísticas (vectorizado sobre el PairArray)"""
+        if not len(pairs):
             return {}
         
         # Filtrar resultados con errores
-        valid_results = [r for r in results if 'error' not in r]
-        error_results = [r for r in results if 'error' in r]
+        valid = pairs.select(~pairs.error_mask())
         
         analysis = {
-            'total_processed': len(results),
-            'successful': len(valid_results),
-            'errors': len(error_results),
-            'success_rate': len(valid_results) / len(results) * 100 if results else 0
+            'total_processed': len(pairs),
+            'successful': len(valid),
+            'errors': len(pairs.errors),
+            'success_rate': len(valid) / len(pairs) * 100
         }
         
-        if valid_results:
+        if len(valid):
             # Estadísticas de similitud
-            similar_pairs = sum(1 for r in valid_results if r.get('are_similar', False))
-            equal_pairs = sum(1 for r in valid_results if r.get('are_equal', False))
-            existing_pairs = sum(1 for r in valid_results if r.get('pair_exists', False))
-            
-            # Calcular estadísticas de similitud
-            similarity_scores = [r.get('similarity_score', 0) for r in valid_results]
+            flags = {flag: int(valid.columns[flag].sum()) if flag in valid.columns else 0
+                     for flag in ('are_similar', 'are_equal', 'pair_exists')}
+            similarity_scores = np.nan_to_num(valid.scores.astype(np.float64))
             
             analysis.update({
-                'similar_pairs': similar_pairs,
-                'equal_pairs': equal_pairs,
-                'existing_pairs': existing_pairs,
-                'similarity_rate': similar_pairs / len(valid_results) * 100,
-                'equal_rate': equal_pairs / len(valid_results) * 100,
-                'avg_similarity': sum(similarity_scores) / len(similarity_scores),
-                'min_similarity': min(similarity_scores),
-                'max_similarity': max(similarity_scores)
+                'similar_pairs': flags['are_similar'],
+                'equal_pairs': flags['are_equal'],
+                'existing_pairs': flags['pair_exists'],
+                'similarity_rate': flags['are_similar'] / len(valid) * 100,
+                'equal_rate': flags['are_equal'] / len(valid) * 100,
+                'avg_similarity': float(similarity_scores.mean()),
+                'min_similarity': float(similarity_scores.min()),
+                'max_similarity': float(similarity_scores.max())
             })
         
         return analysis
@@ -247,7 +234,7 @@ def main():
     print(f"\n3️⃣ Procesando datos a través del API...")
     results = processor.process_csv_through_api(csv_path, batch_size=5)
     
-    if not results:
+    if not len(results):
         print("❌ No se obtuvieron resultados")
         return
     
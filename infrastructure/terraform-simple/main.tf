@@ -18,16 +18,60 @@ resource "aws_dynamodb_table" "item_pairs" {
   billing_mode   = "PAY_PER_REQUEST"
   hash_key       = "id"
 
+  # Registro de cambios que lee la réplica en memoria (PAIR_REPLICA=1), borrados incluidos
+  stream_enabled   = true
+  stream_view_type = "NEW_IMAGE"
+
   attribute {
     name = "id"
     type = "S"
   }
 
+  attribute {
+    name = "item_a_id"
+    type = "N"
+  }
+
+  attribute {
+    name = "item_b_id"
+    type = "N"
+  }
+
+  # Índices por ítem para GET /items/{item_id}/pairs (Query en vez de Scan)
+  global_secondary_index {
+    name            = "item_a_id-index"
+    hash_key        = "item_a_id"
+    projection_type = "ALL"
+  }
+
+  global_secondary_index {
+    name            = "item_b_id-index"
+    hash_key        = "item_b_id"
+    projection_type = "ALL"
+  }
+
   tags = {
     Name = "${var.project_name}-item-pairs-table"
   }
 }
 
+# Arriendos de lectura del stream de item_pairs: cada proceso toma un lugar
+# antes de leer (DynamoDB Streams limita a unos 2 lectores por shard)
+resource "aws_dynamodb_table" "item_pairs_stream_readers" {
+  name         = "item_pairs_stream_readers"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "slot"
+
+  attribute {
+    name = "slot"
+    type = "N"
+  }
+
+  tags = {
+    Name = "${var.project_name}-item-pairs-stream-readers-table"
+  }
+}
+
 # ECR Repository
 resource "aws_ecr_repository" "lambda" {
   name                 = "${var.project_name}-lambda"
@@ -81,7 +125,20 @@ resource "aws_iam_policy" "dynamodb_access" {
           "dynamodb:BatchWriteItem",
           "dynamodb:DescribeTable"
         ]
-        Resource = aws_dynamodb_table.item_pairs.arn
+        Resource = [
+          aws_dynamodb_table.item_pairs.arn,
+          "${aws_dynamodb_table.item_pairs.arn}/index/*",
+          aws_dynamodb_table.item_pairs_stream_readers.arn
+        ]
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "dynamodb:DescribeStream",
+          "dynamodb:GetShardIterator",
+          "dynamodb:GetRecords"
+        ]
+        Resource = "${aws_dynamodb_table.item_pairs.arn}/stream/*"
       }
     ]
   })
@@ -108,6 +165,29 @@ resource "aws_iam_policy" "lambda_logging" {
   })
 }
 
+# IAM Policy para leer el modelo desde S3 (solo si se configura model_s3_uri)
+locals {
+  model_s3_object = replace(var.model_s3_uri, "s3://", "")
+  model_s3_prefix = replace(local.model_s3_object, "/\\.pkl$/", "")
+}
+
+resource "aws_iam_policy" "model_access" {
+  count       = var.model_s3_uri == "" ? 0 : 1
+  name        = "${var.project_name}-model-access"
+  description = "Policy for reading the similarity model from S3"
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect   = "Allow"
+        Action   = ["s3:GetObject"]
+        Resource = "arn:aws:s3:::${local.model_s3_prefix}*"
+      }
+    ]
+  })
+}
+
 # Attach policies to role
 resource "aws_iam_role_policy_attachment" "lambda_dynamodb" {
   role       = aws_iam_role.lambda_role.name
@@ -119,6 +199,12 @@ resource "aws_iam_role_policy_attachment" "lambda_logs" {
   policy_arn = aws_iam_policy.lambda_logging.arn
 }
 
+resource "aws_iam_role_policy_attachment" "lambda_model" {
+  count      = var.model_s3_uri == "" ? 0 : 1
+  role       = aws_iam_role.lambda_role.name
+  policy_arn = aws_iam_policy.model_access[0].arn
+}
+
 # Lambda Function (Container Image)
 resource "aws_lambda_function" "api" {
   function_name = "${var.project_name}-api"
@@ -130,7 +216,12 @@ resource "aws_lambda_function" "api" {
 
   environment {
     variables = {
-      DYNAMODB_TABLE = aws_dynamodb_table.item_pairs.name
+      DYNAMODB_TABLE        = aws_dynamodb_table.item_pairs.name
+      MODEL_S3_URI          = var.model_s3_uri
+      MODEL_CACHE_DIR       = "/tmp/models"
+      MODEL_REFRESH_SECONDS = tostring(var.model_refresh_seconds)
+      # Snapshot del deploy: el filtro lo pone al día con el stream (lo retenido, ~24 h)
+      PAIR_BLOOM_PATH       = "/var/task/snapshots/pair_bloom.bin"
     }
   }
 
@@ -280,6 +371,58 @@ resource "aws_api_gateway_integration" "items_pairs_id_integration" {
   uri                    = aws_lambda_function.api.invoke_arn
 }
 
+# API Gateway Method - Items/Pairs/{pair_id} POST
+# (mutaciones masivas: /items/pairs/batch-create, batch-delete y batch-update)
+resource "aws_api_gateway_method" "items_pairs_id_post" {
+  rest_api_id   = aws_api_gateway_rest_api.api.id
+  resource_id   = aws_api_gateway_resource.items_pairs_id.id
+  http_method   = "POST"
+  authorization = "NONE"
+}
+
+# API Gateway Integration - Items/Pairs/{pair_id} POST
+resource "aws_api_gateway_integration" "items_pairs_id_post_integration" {
+  rest_api_id = aws_api_gateway_rest_api.api.id
+  resource_id = aws_api_gateway_resource.items_pairs_id.id
+  http_method = aws_api_gateway_method.items_pairs_id_post.http_method
+
+  integration_http_method = "POST"
+  type                   = "AWS_PROXY"
+  uri                    = aws_lambda_function.api.invoke_arn
+}
+
+# API Gateway Resource - Items/{item_id}/Pairs
+resource "aws_api_gateway_resource" "items_item_id" {
+  rest_api_id = aws_api_gateway_rest_api.api.id
+  parent_id   = aws_api_gateway_resource.items.id
+  path_part   = "{item_id}"
+}
+
+resource "aws_api_gateway_resource" "items_item_id_pairs" {
+  rest_api_id = aws_api_gateway_rest_api.api.id
+  parent_id   = aws_api_gateway_resource.items_item_id.id
+  path_part   = "pairs"
+}
+
+# API Gateway Method - Items/{item_id}/Pairs GET
+resource "aws_api_gateway_method" "items_item_id_pairs_get" {
+  rest_api_id   = aws_api_gateway_rest_api.api.id
+  resource_id   = aws_api_gateway_resource.items_item_id_pairs.id
+  http_method   = "GET"
+  authorization = "NONE"
+}
+
+# API Gateway Integration - Items/{item_id}/Pairs
+resource "aws_api_gateway_integration" "items_item_id_pairs_integration" {
+  rest_api_id = aws_api_gateway_rest_api.api.id
+  resource_id = aws_api_gateway_resource.items_item_id_pairs.id
+  http_method = aws_api_gateway_method.items_item_id_pairs_get.http_method
+
+  integration_http_method = "POST"
+  type                   = "AWS_PROXY"
+  uri                    = aws_lambda_function.api.invoke_arn
+}
+
 # Lambda Permission for API Gateway
 resource "aws_lambda_permission" "api_gateway" {
   statement_id  = "AllowExecutionFromAPIGateway"
@@ -309,6 +452,8 @@ resource "aws_api_gateway_deployment" "api" {
     aws_api_gateway_integration.items_pairs_get_integration,
     aws_api_gateway_integration.items_pairs_post_integration,
     aws_api_gateway_integration.items_pairs_id_integration,
+    aws_api_gateway_integration.items_pairs_id_post_integration,
+    aws_api_gateway_integration.items_item_id_pairs_integration,
   ]
 
   rest_api_id = aws_api_gateway_rest_api.api.id
@@ -8,4 +8,16 @@ variable "project_name" {
   description = "Name of the project"
   type        = string
   default     = "meli-challenge"
-} 
\ No newline at end of file
+} 
+
+variable "model_s3_uri" {
+  description = "URI s3:// del modelo de similitud (vacío = modelo incluido en la imagen)"
+  type        = string
+  default     = ""
+}
+
+variable "model_refresh_seconds" {
+  description = "Intervalo de verificación de versión nueva del modelo en S3"
+  type        = number
+  default     = 300
+}
@@ -1,19 +1,60 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from flask.wrappers import Request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flasgger import Swagger, swag_from
-import boto3
 import os
+import sys
+import time
+import base64
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import json
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import logging
 from decimal import Decimal
 
+# Módulos compartidos con Lambda (src/common)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from dynamodb_client import get_dynamodb
+from pair_cache import build_pair_cache, read_through
+from pair_bloom import PairBloomFilter, build_known_pair_index
+from single_flight import SingleFlight
+from write_behind import build_write_buffer
+from serialization import serializer
+from metrics import MetricsRegistry, describe_default_metrics, instrument_dynamodb
+from batch_mutations import build_update_expression
+from pair_store import STREAM_SPECIFICATION, PairExistsError, build_pair_store, item_index_schema, stream_lease_schema
+from profiling import RequestProfiler, build_stack_sampler, profiling_authorized, wrap_for_profiling
+
 # Configuración de logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Métricas de latencia por ruta y por etapa, expuestas en /metrics (formato Prometheus)
+metrics = MetricsRegistry()
+describe_default_metrics(metrics)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify con el serializer compartido (orjson si está instalado, Decimal como número)"""
+
+    def dumps(self, obj, **kwargs):
+        with metrics.timer('stage_duration_seconds', stage='json_serialize'):
+            return serializer.dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return serializer.loads(s)
+
+class TimedRequest(Request):
+    """Request que mide el parseo del body JSON"""
+
+    def get_json(self, *args, **kwargs):
+        with metrics.timer('stage_duration_seconds', stage='json_parse'):
+            return super().get_json(*args, **kwargs)
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+app.request_class = TimedRequest
 CORS(app)
 
 # Configuración de Swagger
@@ -47,25 +88,107 @@ swagger_template = {
 
 swagger = Swagger(app, config=swagger_config, template=swagger_template)
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        # Ruta con sus parámetros sin resolver (/items/pairs/<pair_id>) para acotar la cardinalidad
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - start,
+                        route=route, method=request.method, status=response.status_code)
+    return response
+
+def profiling_requested() -> bool:
+    return request.headers.get('X-Profile') == '1' or request.args.get('profile') == '1'
+
+@app.before_request
+def start_profiling():
+    """Perfilar la request con cProfile si lo pide (X-Profile: 1 o ?profile=1) con el token de admin"""
+    if not profiling_requested():
+        return None
+    if not profiling_authorized(request.headers.get('X-Admin-Token')):
+        return jsonify({
+            'status': 'error',
+            'message': 'El profiling requiere un X-Admin-Token válido'
+        }), 403
+    g.profiler = RequestProfiler(label=f"{request.method} {request.path}")
+    g.profiler.start()
+    return None
+
+@app.after_request
+def attach_profile(response):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    report = profiler.stop()
+    response.headers['X-Profile-Id'] = report['profile_id']
+    # En respuestas JSON el resumen va en el body; en el resto queda solo el .pstats guardado
+    if response.mimetype == 'application/json' and not response.is_streamed:
+        body = serializer.loads(response.get_data())
+        if isinstance(body, dict):
+            body['profile'] = report
+            response.set_data(serializer.dumps_bytes(body))
+    return response
+
 # Nombres de las tablas
 ITEMS_TABLE = 'items'
 PAIRS_TABLE = 'item_pairs'
 
-def get_dynamodb():
-    """Obtener cliente de DynamoDB configurado según el entorno"""
-    if os.getenv('AWS_ENDPOINT_URL'):
-        # Para desarrollo local con DynamoDB local
-        return boto3.resource('dynamodb', 
-                             endpoint_url=os.getenv('AWS_ENDPOINT_URL'),
-                             region_name='us-east-1',
-                             aws_access_key_id='dummy',
-                             aws_secret_access_key='dummy')
-    else:
-        # Para producción en AWS
-        return boto3.resource('dynamodb', region_name='us-east-1')
-
-# Cliente de DynamoDB por defecto
+# Cliente de DynamoDB por defecto (AWS_ENDPOINT_URL para DynamoDB Local)
 dynamodb = get_dynamodb()
+instrument_dynamodb(dynamodb.meta.client, metrics)
+
+# Repositorio de pares (PAIR_STORE_BACKEND: dynamodb, memory o sqlite)
+pair_store = build_pair_store()
+USES_DYNAMODB = pair_store.name == 'dynamodb'
+
+# Caché read-through de pares (se invalida en cada escritura)
+pair_cache = build_pair_cache()
+
+# Filtro de Bloom de pares conocidos: si asegura que un par no existe, no se lee DynamoDB
+# (mientras siga el registro de cambios dentro de PAIR_BLOOM_MAX_STALENESS_SECONDS)
+known_pairs = build_known_pair_index(pair_store)
+
+# Pool compartido para solapar las lecturas de DynamoDB (I/O) con el cálculo de similitud (CPU)
+io_executor = ThreadPoolExecutor(max_workers=int(os.getenv('IO_POOL_WORKERS', '8')),
+                                 thread_name_prefix='dynamodb-io')
+
+# Write-behind opcional (PAIR_WRITE_MODE=async): los creates responden 202 y se escriben en lote
+write_buffer = build_write_buffer(pair_store)
+
+# Sampler de stacks en segundo plano (PROFILING_SAMPLER=1): vuelca datos para flame graphs
+stack_sampler = build_stack_sampler()
+
+def get_item_timed(store, pair_id: str, use_cache: bool = True):
+    """Leer un par (a través de la caché si use_cache); devuelve (item o None, duración en ms)"""
+    start = time.perf_counter()
+    # Lo aceptado por el write-behind y aún no escrito es más nuevo que DynamoDB
+    item = write_buffer.get_pending(pair_id) if write_buffer is not None else None
+    if item is None:
+        if use_cache:
+            item = read_through(pair_cache, pair_id, store.get)
+        else:
+            item = store.get(pair_id)
+    return item, (time.perf_counter() - start) * 1000
+
+def known_pair_state(pair_id: str) -> Optional[bool]:
+    """Si un par existe sin leer el repositorio: True, False, o None si no se sabe.
+
+    Se consultan lo aceptado por el write-behind, la caché de pares y el
+    filtro de Bloom, en ese orden.
+    """
+    if write_buffer is not None and write_buffer.get_pending(pair_id) is not None:
+        return True
+    hit, item = pair_cache.get(pair_id)
+    if hit:
+        return item is not None
+    if not known_pairs.might_exist(pair_id):
+        return False
+    return None
 
 def create_tables():
     """Crear tablas en DynamoDB si no existen"""
@@ -91,24 +214,66 @@ def create_tables():
         logger.info(f"Tabla de ítems ya existe o error: {e}")
 
     try:
-        # Tabla de pares de ítems
+        # Tabla de pares de ítems, con los índices por ítem de GET /items/{item_id}/pairs
+        # y el stream que lee la réplica en memoria (PAIR_REPLICA=1)
+        throughput = {
+            'ReadCapacityUnits': 5,
+            'WriteCapacityUnits': 5
+        }
+        index_attributes, indexes = item_index_schema(throughput)
         pairs_table = dynamodb.create_table(
             TableName=PAIRS_TABLE,
             KeySchema=[
                 {'AttributeName': 'id', 'KeyType': 'HASH'}
             ],
             AttributeDefinitions=[
-                {'AttributeName': 'id', 'AttributeType': 'S'}
+                {'AttributeName': 'id', 'AttributeType': 'S'},
+                *index_attributes
             ],
-            ProvisionedThroughput={
-                'ReadCapacityUnits': 5,
-                'WriteCapacityUnits': 5
-            }
+            GlobalSecondaryIndexes=indexes,
+            StreamSpecification=STREAM_SPECIFICATION,
+            ProvisionedThroughput=throughput
         )
         logger.info("Tabla de pares creada")
     except Exception as e:
         logger.info(f"Tabla de pares ya existe o error: {e}")
 
+    try:
+        # Arriendos de los lugares para leer el stream de pares (PAIR_STREAM_MAX_READERS)
+        dynamodb.create_table(**stream_lease_schema(f"{PAIRS_TABLE}_stream_readers",
+                                                    {'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1}))
+        logger.info("Tabla de lectores del stream creada")
+    except Exception as e:
+        logger.info(f"Tabla de lectores del stream ya existe o error: {e}")
+
+def load_ml_similarity():
+    """Importar ml_similarity y conectar sus etapas (featurize, scale, predict_proba) a las métricas"""
+    import ml_similarity
+    ml_similarity.set_stage_observer(metrics.stage_observer)
+    return ml_similarity.get_ml_similarity
+
+def load_ml_scores():
+    """Como load_ml_similarity, pero para scores=all (ML, TF-IDF y características en una pasada)"""
+    import ml_similarity
+    ml_similarity.set_stage_observer(metrics.stage_observer)
+    return ml_similarity.get_ml_scores
+
+def tfidf_similarity(title1: str, title2: str) -> float:
+    """Similitud TF-IDF + coseno (método tradicional)"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+    title1_norm = title1.lower().strip()
+    title2_norm = title2.lower().strip()
+    if title1_norm == title2_norm:
+        metrics.inc('similarity_scorer_total', scorer='exact')
+        return 1.0
+    with metrics.timer('stage_duration_seconds', stage='tfidf'):
+        vectorizer = TfidfVectorizer(analyzer='word', ngram_range=(1, 2))
+        tfidf_matrix = vectorizer.fit_transform([title1_norm, title2_norm])
+        similarity = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0]
+    metrics.inc('similarity_scorer_total', scorer='tfidf')
+    return float(similarity)
+
 def calculate_similarity(title1: str, title2: str, force_ml: bool = None) -> float:
     """
     Calcular similitud entre dos títulos.
@@ -116,43 +281,128 @@ def calculate_similarity(title1: str, title2: str, force_ml: bool = None) -> flo
     """
     if force_ml is True:
         try:
-            from ml_similarity import get_ml_similarity
-            ml_result = get_ml_similarity(title1, title2)
-            return ml_result['similarity_score']
+            ml_result = load_ml_similarity()(title1, title2)
         except Exception as e:
+            metrics.inc('ml_fallback_total', reason=type(e).__name__, mode='forced')
             raise RuntimeError(f"ML no disponible: {e}")
+        if ml_result.get('scorer') != 'ml':
+            metrics.inc('ml_fallback_total', reason='untrained', mode='forced')
+            raise RuntimeError("ML no disponible: el modelo no está entrenado")
+        metrics.inc('similarity_scorer_total', scorer='ml')
+        return ml_result['similarity_score']
     elif force_ml is False:
-        from sklearn.feature_extraction.text import TfidfVectorizer
-        from sklearn.metrics.pairwise import cosine_similarity
-        title1_norm = title1.lower().strip()
-        title2_norm = title2.lower().strip()
-        if title1_norm == title2_norm:
-            return 1.0
-        vectorizer = TfidfVectorizer(analyzer='word', ngram_range=(1, 2))
-        tfidf_matrix = vectorizer.fit_transform([title1_norm, title2_norm])
-        similarity = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0]
-        return float(similarity)
+        return tfidf_similarity(title1, title2)
     else:
         try:
-            from ml_similarity import get_ml_similarity
-            ml_result = get_ml_similarity(title1, title2)
-            return ml_result['similarity_score']
+            ml_result = load_ml_similarity()(title1, title2)
         except Exception as e:
-            from sklearn.feature_extraction.text import TfidfVectorizer
-            from sklearn.metrics.pairwise import cosine_similarity
-            title1_norm = title1.lower().strip()
-            title2_norm = title2.lower().strip()
-            if title1_norm == title2_norm:
-                return 1.0
-            vectorizer = TfidfVectorizer(analyzer='word', ngram_range=(1, 2))
-            tfidf_matrix = vectorizer.fit_transform([title1_norm, title2_norm])
-            similarity = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0]
-            return float(similarity)
+            # Sin modelo (o si falla) se usa el método tradicional; queda contado en ml_fallback_total
+            logger.debug(f"ML no disponible, usando TF-IDF: {e}")
+            metrics.inc('ml_fallback_total', reason=type(e).__name__, mode='auto')
+            return tfidf_similarity(title1, title2)
+        if ml_result.get('scorer') != 'ml':
+            # El detector sin entrenar devuelve la similitud básica: no cuenta como ML
+            metrics.inc('ml_fallback_total', reason='untrained', mode='auto')
+            return tfidf_similarity(title1, title2)
+        metrics.inc('similarity_scorer_total', scorer='ml')
+        return ml_result['similarity_score']
+
+def calculate_all_scores(title1: str, title2: str, force_ml: bool = None) -> Tuple[float, Dict]:
+    """
+    Modo scores=all: probabilidad ML, coseno TF-IDF y características léxicas
+    de una sola featurización. Devuelve (similarity_score, scores).
+    - scores['tfidf'] es el coseno del vectorizer del modelo (1.0 con títulos
+      iguales); sin vectorizer, el TF-IDF tradicional del par, calculado una vez
+    - similarity_score sale de esa misma pasada: scores['ml'] si se usa ML y,
+      con force_ml=False o sin modelo entrenado, scores['tfidf']
+    """
+    mode = 'forced' if force_ml else 'auto'
+    try:
+        scores = load_ml_scores()(title1, title2)
+    except Exception as e:
+        if force_ml is not False:
+            # Con force_ml=False el score es el TF-IDF: que falte ML no es un fallback
+            metrics.inc('ml_fallback_total', reason=type(e).__name__, mode=mode)
+        if force_ml is True:
+            raise RuntimeError(f"ML no disponible: {e}")
+        logger.debug(f"ML no disponible, usando TF-IDF: {e}")
+        scores = {'ml': None, 'tfidf': None, 'features': None}
+    else:
+        if scores['ml'] is None and force_ml is not False:
+            metrics.inc('ml_fallback_total', reason='untrained', mode=mode)
+    if scores['ml'] is None and force_ml is True:
+        raise RuntimeError("ML no disponible: el modelo no está entrenado")
+    if scores['ml'] is not None and force_ml is not False:
+        metrics.inc('similarity_scorer_total', scorer='ml')
+        return scores['ml'], scores
+    if scores['tfidf'] is None:
+        # Sin vectorizer no hay coseno en la pasada: el TF-IDF tradicional (cuenta su propio scorer)
+        scores['tfidf'] = tfidf_similarity(title1, title2)
+    elif title1.lower().strip() == title2.lower().strip():
+        metrics.inc('similarity_scorer_total', scorer='exact')
+        scores['tfidf'] = 1.0
+    else:
+        metrics.inc('similarity_scorer_total', scorer='tfidf')
+    return scores['tfidf'], scores
 
 def generate_pair_id(item_a: int, item_b: int) -> str:
     """Generar ID único para un par de ítems"""
     return f"{min(item_a, item_b)}_{max(item_a, item_b)}"
 
+def is_item_id(value) -> bool:
+    """Los item_id son enteros: son la clave (numérica) de los índices por ítem de item_pairs"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+# Coalescencia de requests idénticas en curso: compare comparte todo el cálculo
+# (lectura + scoring); create solo comparte el scoring
+compare_flight = SingleFlight()
+scoring_flight = SingleFlight()
+
+def coalescing_key(item_a: Dict, item_b: Dict, use_ml: Optional[bool], all_scores: bool = False) -> tuple:
+    """Clave de coalescencia: id del par + títulos normalizados, sin importar el orden de los ítems"""
+    sides = sorted(((str(item['item_id']), item['title'].lower().strip()) for item in (item_a, item_b)))
+    return generate_pair_id(item_a['item_id'], item_b['item_id']), tuple(sides), use_ml, all_scores
+
+def compare_pair(pair_id: str, title_a: str, title_b: str, use_ml: Optional[bool],
+                 all_scores: bool = False) -> Dict:
+    """Similitud y existencia de un par; la lectura de DynamoDB se solapa con el scoring.
+
+    Con all_scores, la respuesta incluye además 'scores' (ML, TF-IDF y
+    características léxicas) calculados en la misma featurización.
+    """
+    start = time.perf_counter()
+    lookup = None
+    if known_pairs.might_exist(pair_id):
+        lookup = io_executor.submit(wrap_for_profiling(get_item_timed), pair_store, pair_id)
+    timings = {}
+    
+    scores = None
+    if all_scores:
+        similarity_score, scores = calculate_all_scores(title_a, title_b, force_ml=use_ml)
+    else:
+        similarity_score = calculate_similarity(title_a, title_b, force_ml=use_ml)
+    timings['scoring_ms'] = (time.perf_counter() - start) * 1000
+    
+    pair_exists = False
+    if lookup is not None:
+        try:
+            existing_item, timings['dynamodb_get_ms'] = lookup.result()
+            pair_exists = existing_item is not None
+        except Exception as e:
+            logger.error(f"Error verificando par existente: {e}")
+    timings['total_ms'] = (time.perf_counter() - start) * 1000
+    logger.info(f"compare_items {pair_id} tiempos (ms): " + ", ".join(f"{k}={v:.1f}" for k, v in timings.items()))
+    
+    result = {
+        'similarity_score': similarity_score,
+        'are_similar': similarity_score >= 0.7,  # Umbral de similitud
+        'pair_exists': pair_exists,
+        'pair_id': pair_id
+    }
+    if scores is not None:
+        result['scores'] = scores
+    return result
+
 @app.route('/health', methods=['GET'])
 @swag_from({
     'responses': {
@@ -180,6 +430,15 @@ def health_check():
 @app.route('/items/compare', methods=['POST'])
 @swag_from({
     'parameters': [
+        {
+            'name': 'scores',
+            'in': 'query',
+            'type': 'string',
+            'enum': ['all'],
+            'required': False,
+            'description': 'all: incluir scores ML, TF-IDF y características léxicas de una sola featurización; '
+                           'sin ML, similarity_score es scores.tfidf (el coseno del vectorizer del modelo)'
+        },
         {
             'name': 'body',
             'in': 'body',
@@ -215,7 +474,16 @@ def health_check():
                     'message': {'type': 'string'},
                     'similarity_score': {'type': 'number'},
                     'are_similar': {'type': 'boolean'},
-                    'pair_exists': {'type': 'boolean'}
+                    'pair_exists': {'type': 'boolean'},
+                    'scores': {
+                        'type': 'object',
+                        'description': 'Solo con scores=all',
+                        'properties': {
+                            'ml': {'type': 'number'},
+                            'tfidf': {'type': 'number'},
+                            'features': {'type': 'object'}
+                        }
+                    }
                 }
             }
         },
@@ -251,29 +519,35 @@ def compare_items():
                 'message': 'item_b debe contener item_id y title'
             }), 400
         
+        if not is_item_id(item_a['item_id']) or not is_item_id(item_b['item_id']):
+            return jsonify({
+                'status': 'error',
+                'message': 'item_id debe ser un entero'
+            }), 400
+        
+        # scores=all (query string o body): ML, TF-IDF y características de una sola pasada
+        scores_mode = request.args.get('scores', data.get('scores'))
+        if scores_mode not in (None, 'all'):
+            return jsonify({
+                'status': 'error',
+                'message': "scores solo admite el valor 'all'"
+            }), 400
+        all_scores = scores_mode == 'all'
+        
         # En los endpoints /items/compare y /items/pairs, leer use_ml del body y pasarlo a calculate_similarity
         use_ml = data.get('use_ml', None)
-        similarity_score = calculate_similarity(item_a['title'], item_b['title'], force_ml=use_ml)
-        are_similar = similarity_score >= 0.7  # Umbral de similitud
-        
-        # Verificar si el par ya existe
         pair_id = generate_pair_id(item_a['item_id'], item_b['item_id'])
-        pairs_table = dynamodb.Table(PAIRS_TABLE)
         
-        try:
-            response = pairs_table.get_item(Key={'id': pair_id})
-            pair_exists = 'Item' in response
-        except Exception as e:
-            logger.error(f"Error verificando par existente: {e}")
-            pair_exists = False
+        # Las comparaciones idénticas concurrentes comparten un único cálculo
+        result, _ = compare_flight.do(
+            coalescing_key(item_a, item_b, use_ml, all_scores),
+            lambda: compare_pair(pair_id, item_a['title'], item_b['title'], use_ml, all_scores)
+        )
         
         return jsonify({
             'status': 'success',
             'message': 'Comparación completada exitosamente',
-            'similarity_score': similarity_score,
-            'are_similar': are_similar,
-            'pair_exists': pair_exists,
-            'pair_id': pair_id
+            **result
         }), 200
         
     except Exception as e:
@@ -315,6 +589,9 @@ def compare_items():
         201: {
             'description': 'Par creado exitosamente'
         },
+        202: {
+            'description': 'Par aceptado para escritura en segundo plano (PAIR_WRITE_MODE=async)'
+        },
         200: {
             'description': 'Par ya existía'
         },
@@ -350,17 +627,33 @@ def create_item_pair():
                 'message': 'item_b debe contener item_id y title'
             }), 400
         
-        # En los endpoints /items/compare y /items/pairs, leer use_ml del body y pasarlo a calculate_similarity
-        use_ml = data.get('use_ml', None)
-        similarity_score = calculate_similarity(item_a['title'], item_b['title'], force_ml=use_ml)
+        if not is_item_id(item_a['item_id']) or not is_item_id(item_b['item_id']):
+            return jsonify({
+                'status': 'error',
+                'message': 'item_id debe ser un entero'
+            }), 400
         
-        # Verificar si el par ya existe
+        # Verificar si el par ya existe, en paralelo con el cálculo de similitud
         pair_id = generate_pair_id(item_a['item_id'], item_b['item_id'])
-        pairs_table = dynamodb.Table(PAIRS_TABLE)
+        # Modo asíncrono: se lee el repositorio solo si el write-behind, la caché y el
+        # filtro de Bloom no saben si el par existe (la escritura ya es "gana el último")
+        known = known_pair_state(pair_id) if write_buffer is not None else None
+        lookup = None
+        if known is None:
+            # Es una escritura: se lee directo del repositorio, sin la caché
+            lookup = io_executor.submit(wrap_for_profiling(get_item_timed), pair_store, pair_id, False)
+        
+        # En los endpoints /items/compare y /items/pairs, leer use_ml del body y pasarlo a calculate_similarity
+        # (los creates idénticos concurrentes comparten el scoring)
+        use_ml = data.get('use_ml', None)
+        similarity_score, _ = scoring_flight.do(
+            coalescing_key(item_a, item_b, use_ml),
+            lambda: calculate_similarity(item_a['title'], item_b['title'], force_ml=use_ml)
+        )
         
         try:
-            response = pairs_table.get_item(Key={'id': pair_id})
-            if 'Item' in response:
+            existing_item, _ = lookup.result() if lookup is not None else (None, 0.0)
+            if known or existing_item is not None:
                 return jsonify({
                     'status': 'success',
                     'message': 'El par de ítems ya existe en la base de datos',
@@ -371,6 +664,7 @@ def create_item_pair():
             logger.error(f"Error verificando par existente: {e}")
         
         # Crear el nuevo par
+        now = datetime.now().isoformat()
         pair_data = {
             'id': pair_id,
             'item_a_id': item_a['item_id'],
@@ -378,10 +672,39 @@ def create_item_pair():
             'item_b_id': item_b['item_id'],
             'item_b_title': item_b['title'],
             'similarity_score': Decimal(str(similarity_score)),
-            'created_at': datetime.now().isoformat()
+            'created_at': now,
+            'updated_at': now
         }
         
-        pairs_table.put_item(Item=pair_data)
+        if write_buffer is not None:
+            # Modo asíncrono: la escritura queda en el spool y la hace el flusher en lote.
+            # BatchWriteItem no admite condiciones: dos creates del mismo par antes
+            # del flush se coalescen en una sola escritura (gana el último)
+            write_buffer.enqueue(pair_data)
+            pair_cache.invalidate(pair_id)
+            known_pairs.add(pair_id)
+            return jsonify({
+                'status': 'success',
+                'message': 'Par de ítems aceptado, se guardará en segundo plano',
+                'pair_id': pair_id,
+                'similarity_score': similarity_score,
+                'are_similar': similarity_score >= 0.7,  # Umbral de similitud
+                'action': 'accepted'
+            }), 202
+        
+        # Escritura condicional: si otra request creó el par entre la lectura y
+        # la escritura, esta responde 'existing' en lugar de pisarlo
+        try:
+            pair_store.put(pair_data, if_not_exists=True)
+        except PairExistsError:
+            return jsonify({
+                'status': 'success',
+                'message': 'El par de ítems ya existe en la base de datos',
+                'pair_id': pair_id,
+                'action': 'existing'
+            }), 200
+        pair_cache.invalidate(pair_id)
+        known_pairs.add(pair_id)
         
         return jsonify({
             'status': 'success',
@@ -397,25 +720,83 @@ def create_item_pair():
             'message': f'Error interno del servidor: {str(e)}'
         }), 500
 
+def encode_continuation_token(last_evaluated_key: Dict) -> str:
+    """Serializar la clave de continuación del scan como token opaco (el mismo formato que Lambda)"""
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key, default=str).encode('utf-8')).decode('ascii')
+
+def decode_continuation_token(token: str) -> Dict:
+    """Recuperar la clave de inicio del scan a partir de un token de continuación"""
+    return json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+
+def parse_limit(default: Optional[int] = None) -> Optional[int]:
+    """Leer el query param limit; ValueError si no es un entero positivo"""
+    raw = request.args.get('limit')
+    if raw in (None, ''):
+        return default
+    limit = int(raw)
+    if limit < 1:
+        raise ValueError(f"limit debe ser positivo: {raw}")
+    return limit
+
 @app.route('/items/pairs', methods=['GET'])
 @swag_from({
+    'parameters': [
+        {
+            'name': 'limit',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': 'Pares por página (sin limit: una página del Scan, hasta 1 MB)'
+        },
+        {
+            'name': 'next_token',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': 'Token de continuación de la página anterior'
+        }
+    ],
     'responses': {
         200: {
             'description': 'Lista de pares obtenida exitosamente'
+        },
+        400: {
+            'description': 'limit o next_token inválidos'
         }
     }
 })
 def get_all_pairs():
-    """Obtener todos los pares de ítems"""
+    """Obtener los pares de ítems, paginados.
+
+    Sin limit se devuelve una página del Scan (hasta 1 MB, la misma respuesta
+    que antes de paginar) y next_token si quedan pares. Con limit se leen
+    páginas del scan hasta juntar limit pares.
+    """
     try:
-        pairs_table = dynamodb.Table(PAIRS_TABLE)
-        response = pairs_table.scan()
-        pairs = response.get('Items', [])
+        try:
+            limit = parse_limit()
+        except ValueError:
+            return jsonify({'status': 'error', 'message': 'limit debe ser un entero positivo'}), 400
+        start_key = None
+        if request.args.get('next_token'):
+            try:
+                start_key = decode_continuation_token(request.args['next_token'])
+            except Exception:
+                return jsonify({'status': 'error', 'message': 'next_token inválido'}), 400
+
+        pairs = []
+        while True:
+            page, last_key = pair_store.scan_page(limit - len(pairs) if limit else None, start_key)
+            pairs.extend(page)
+            if last_key is None or limit is None or len(pairs) >= limit:
+                break
+            start_key = last_key
         
         return jsonify({
             'status': 'success',
             'message': f'Se encontraron {len(pairs)} pares de ítems',
-            'pairs': pairs
+            'pairs': pairs,
+            'next_token': encode_continuation_token(last_key) if last_key else None
         }), 200
         
     except Exception as e:
@@ -448,10 +829,9 @@ def get_all_pairs():
 def get_pair(pair_id):
     """Obtener un par específico por ID"""
     try:
-        pairs_table = dynamodb.Table(PAIRS_TABLE)
-        response = pairs_table.get_item(Key={'id': pair_id})
+        pair, _ = get_item_timed(pair_store, pair_id)
         
-        if 'Item' not in response:
+        if pair is None:
             return jsonify({
                 'status': 'error',
                 'message': 'Par de ítems no encontrado'
@@ -460,7 +840,7 @@ def get_pair(pair_id):
         return jsonify({
             'status': 'success',
             'message': 'Par de ítems encontrado exitosamente',
-            'pair': response['Item']
+            'pair': pair
         }), 200
         
     except Exception as e:
@@ -470,6 +850,56 @@ def get_pair(pair_id):
             'message': f'Error interno del servidor: {str(e)}'
         }), 500
 
+# Máximo de pares por consulta de un ítem
+ITEM_PAIRS_MAX_LIMIT = 1000
+
+@app.route('/items/<int:item_id>/pairs', methods=['GET'])
+@swag_from({
+    'parameters': [
+        {
+            'name': 'item_id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True,
+            'description': 'ID del ítem'
+        },
+        {
+            'name': 'limit',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': 'Máximo de pares a devolver (100 por defecto, hasta 1000)'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Pares en los que participa el ítem'
+        },
+        400: {
+            'description': 'limit no es un entero positivo'
+        }
+    }
+})
+def get_item_pairs(item_id):
+    """Obtener los pares en los que participa un ítem (como item_a o item_b)"""
+    try:
+        try:
+            limit = min(parse_limit(100), ITEM_PAIRS_MAX_LIMIT)
+        except ValueError:
+            return jsonify({'status': 'error', 'message': 'limit debe ser un entero positivo'}), 400
+        pairs = pair_store.query_by_item(item_id, limit=limit)
+        return jsonify({
+            'status': 'success',
+            'message': f'Se encontraron {len(pairs)} pares del ítem {item_id}',
+            'pairs': pairs
+        }), 200
+    except Exception as e:
+        logger.error(f"Error en get_item_pairs: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': f'Error interno del servidor: {str(e)}'
+        }), 500
+
 @app.route('/ml/train', methods=['POST'])
 @swag_from({
     'parameters': [
@@ -565,6 +995,7 @@ def get_model_status():
             'status': 'success',
             'model_trained': ml_detector.is_trained,
             'model_path': ml_detector.model_path,
+            'model_uri': ml_detector.model_uri,
             'message': 'Modelo entrenado y listo' if ml_detector.is_trained else 'Modelo no entrenado'
         }), 200
         
@@ -575,11 +1006,45 @@ def get_model_status():
             'message': f'Error obteniendo estado del modelo: {str(e)}'
         }), 500
 
+@app.route('/cache/stats', methods=['GET'])
+@swag_from({
+    'responses': {
+        200: {
+            'description': 'Métricas de la caché de pares (hits, misses, hit_ratio, tamaño) y del filtro de Bloom'
+        }
+    }
+})
+def get_cache_stats():
+    """Obtener las métricas de la caché de pares"""
+    return jsonify({
+        'status': 'success',
+        'cache': pair_cache.stats(),
+        'bloom': known_pairs.stats(),
+        'single_flight': {'compare': compare_flight.stats(), 'scoring': scoring_flight.stats()},
+        'write_behind': write_buffer.stats() if write_buffer is not None else {'enabled': False},
+        'replica': pair_store.stats() if hasattr(pair_store, 'stats') else {'enabled': False}
+    }), 200
+
+@app.route('/metrics', methods=['GET'])
+@swag_from({
+    'responses': {
+        200: {
+            'description': 'Métricas en formato de texto de Prometheus (latencia por ruta y etapa, scorers, capacidad de DynamoDB)'
+        }
+    }
+})
+def get_metrics():
+    """Exponer las métricas para Prometheus"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/items/pairs/<pair_id>', methods=['DELETE'])
 def delete_pair(pair_id):
     try:
-        pairs_table = dynamodb.Table(PAIRS_TABLE)
-        pairs_table.delete_item(Key={'id': pair_id})
+        if write_buffer is not None:
+            # Que un create pendiente no reaparezca después del borrado
+            write_buffer.flush()
+        pair_store.delete(pair_id)
+        pair_cache.invalidate(pair_id)
         return jsonify({
             'status': 'success',
             'message': f'Par con id {pair_id} eliminado exitosamente'
@@ -597,27 +1062,206 @@ def update_pair(pair_id):
         data = request.get_json()
         if not data:
             return jsonify({'status': 'error', 'message': 'No se enviaron datos para actualizar'}), 400
-        pairs_table = dynamodb.Table(PAIRS_TABLE)
-        update_expr = []
-        expr_attr_vals = {}
-        for k, v in data.items():
-            update_expr.append(f"{k} = :{k}")
-            expr_attr_vals[f":{k}"] = v
-        update_expression = "set " + ", ".join(update_expr)
-        pairs_table.update_item(
-            Key={'id': pair_id},
-            UpdateExpression=update_expression,
-            ExpressionAttributeValues=expr_attr_vals
-        )
+        if write_buffer is not None:
+            # Que un create pendiente no pise la actualización
+            write_buffer.flush()
+        try:
+            build_update_expression(data)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        pair_store.update(pair_id, data)
+        pair_cache.invalidate(pair_id)
         return jsonify({'status': 'success', 'message': f'Par con id {pair_id} actualizado exitosamente'}), 200
     except Exception as e:
         logger.error(f"Error actualizando par: {e}")
         return jsonify({'status': 'error', 'message': f'Error actualizando par: {str(e)}'}), 500
 
+# Hilos para las mutaciones masivas (cada uno procesa chunks de 25 pares)
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '8'))
+
+def ndjson_stream(results, on_result=None):
+    """Respuesta NDJSON: una línea por par a medida que termina y un resumen al final"""
+    def generate():
+        summary = {}
+        for result in results:
+            if on_result is not None:
+                on_result(result)
+            summary[result['result']] = summary.get(result['result'], 0) + 1
+            yield serializer.dumps(result) + '\n'
+        yield serializer.dumps({'summary': summary}) + '\n'
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def read_pair_ids(data) -> Optional[List[str]]:
+    pair_ids = (data or {}).get('pair_ids')
+    if not isinstance(pair_ids, list) or not pair_ids or not all(isinstance(p, str) for p in pair_ids):
+        return None
+    return pair_ids
+
+def invalidate_written(result):
+    if result['result'] in ('created', 'updated', 'deleted'):
+        pair_cache.invalidate(result['pair_id'])
+        if result['result'] == 'created':
+            known_pairs.add(result['pair_id'])
+
+@app.route('/items/pairs/batch-create', methods=['POST'])
+@swag_from({
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'pairs': {'type': 'array', 'items': {'type': 'object'}},
+                    'use_ml': {'type': 'boolean'}
+                }
+            }
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'NDJSON: una línea por par (created, existing, invalid, failed) y un resumen final'
+        },
+        400: {
+            'description': 'Datos de entrada inválidos'
+        }
+    }
+})
+def batch_create_pairs():
+    """Crear muchos pares: los que ya existen se informan como existing y no se escriben"""
+    data = request.get_json(silent=True) or {}
+    pairs = data.get('pairs')
+    if not isinstance(pairs, list) or not pairs:
+        return jsonify({'status': 'error', 'message': 'Se requiere una lista no vacía en pairs'}), 400
+    use_ml = data.get('use_ml', None)
+
+    def results():
+        valid = []
+        for index, entry in enumerate(pairs):
+            item_a, item_b = (entry or {}).get('item_a') or {}, (entry or {}).get('item_b') or {}
+            if not all(key in item_a for key in ['item_id', 'title']) or \
+                    not all(key in item_b for key in ['item_id', 'title']):
+                yield {'index': index, 'pair_id': None, 'result': 'invalid',
+                       'error': 'item_a e item_b deben contener item_id y title'}
+                continue
+            if not is_item_id(item_a['item_id']) or not is_item_id(item_b['item_id']):
+                yield {'index': index, 'pair_id': None, 'result': 'invalid', 'error': 'item_id debe ser un entero'}
+                continue
+            valid.append((generate_pair_id(item_a['item_id'], item_b['item_id']), item_a, item_b))
+
+        if write_buffer is not None:
+            # Que los creates pendientes del write-behind se vean como existentes
+            write_buffer.flush()
+        try:
+            existing = pair_store.batch_get([pair_id for pair_id, _, _ in valid])
+        except Exception as e:
+            logger.error(f"Error verificando pares existentes: {e}")
+            for pair_id, _, _ in valid:
+                yield {'pair_id': pair_id, 'result': 'failed', 'error': str(e)}
+            return
+        now = datetime.now().isoformat()
+        new_pairs = {}
+        for pair_id, item_a, item_b in valid:
+            if pair_id in existing or pair_id in new_pairs:
+                yield {'pair_id': pair_id, 'result': 'existing'}
+                continue
+            similarity_score = calculate_similarity(item_a['title'], item_b['title'], force_ml=use_ml)
+            new_pairs[pair_id] = {
+                'id': pair_id,
+                'item_a_id': item_a['item_id'],
+                'item_a_title': item_a['title'],
+                'item_b_id': item_b['item_id'],
+                'item_b_title': item_b['title'],
+                'similarity_score': Decimal(str(similarity_score)),
+                'created_at': now,
+                'updated_at': now
+            }
+        # BatchWriteItem no admite condiciones: un create concurrente del mismo par se pisa
+        yield from pair_store.batch_put(new_pairs.values(), max_workers=BATCH_MAX_WORKERS)
+
+    return ndjson_stream(results(), invalidate_written)
+
+@app.route('/items/pairs/batch-delete', methods=['POST'])
+@swag_from({
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {'type': 'object', 'properties': {'pair_ids': {'type': 'array', 'items': {'type': 'string'}}}}
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'NDJSON: una línea por par (deleted, failed) y un resumen final'
+        },
+        400: {
+            'description': 'Datos de entrada inválidos'
+        }
+    }
+})
+def batch_delete_pairs():
+    """Eliminar muchos pares por id con BatchWriteItem"""
+    pair_ids = read_pair_ids(request.get_json(silent=True))
+    if pair_ids is None:
+        return jsonify({'status': 'error', 'message': 'Se requiere una lista no vacía de ids en pair_ids'}), 400
+    if write_buffer is not None:
+        write_buffer.flush()
+    return ndjson_stream(pair_store.batch_delete(pair_ids, max_workers=BATCH_MAX_WORKERS), invalidate_written)
+
+@app.route('/items/pairs/batch-update', methods=['POST'])
+@swag_from({
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'pair_ids': {'type': 'array', 'items': {'type': 'string'}},
+                    'changes': {'type': 'object'}
+                }
+            }
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'NDJSON: una línea por par (updated, not_found, failed) y un resumen final'
+        },
+        400: {
+            'description': 'Datos de entrada inválidos'
+        }
+    }
+})
+def batch_update_pairs():
+    """Aplicar los mismos cambios (p. ej. reetiquetar el status) a muchos pares"""
+    data = request.get_json(silent=True) or {}
+    pair_ids = read_pair_ids(data)
+    if pair_ids is None:
+        return jsonify({'status': 'error', 'message': 'Se requiere una lista no vacía de ids en pair_ids'}), 400
+    if write_buffer is not None:
+        write_buffer.flush()
+    try:
+        results = pair_store.batch_update(pair_ids, data.get('changes') or {}, max_workers=BATCH_MAX_WORKERS)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return ndjson_stream(results, invalidate_written)
+
 if __name__ == "__main__":
-    import sys
     if len(sys.argv) > 1 and sys.argv[1] == "create_tables":
-        create_tables()
-        print("Tablas de DynamoDB creadas o ya existentes.")
+        if USES_DYNAMODB:
+            create_tables()
+            print("Tablas de DynamoDB creadas o ya existentes.")
+        else:
+            pair_store.ensure_schema()
+            print(f"Esquema del repositorio {pair_store.name} creado o ya existente.")
+    elif len(sys.argv) > 1 and sys.argv[1] == "rebuild_bloom":
+        # Reconstruir el snapshot del filtro de Bloom recorriendo el repositorio
+        bloom_path = os.getenv('PAIR_BLOOM_PATH', 'pair_bloom.bin')
+        bloom = PairBloomFilter.from_ids(pair_store.iter_ids(), float(os.getenv('PAIR_BLOOM_FP_RATE', '0.01')))
+        bloom.save(bloom_path)
+        print(f"Filtro de Bloom con {bloom.count} pares guardado en {bloom_path} ({len(bloom.bits) / 1024:.1f} KB)")
     else:
         app.run(host="0.0.0.0", port=5000, debug=True) 
\ No newline at end of file
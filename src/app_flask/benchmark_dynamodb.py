@@ -0,0 +1,143 @@
+"""
+Benchmark de throughput contra DynamoDB Local con varios hilos
+Compara el resource por defecto de boto3 (Table por request) con la fábrica
+compartida de src/common/dynamodb_client.py, y mide /items/compare de Flask
+"""
+
+import os
+import sys
+import time
+import json
+import logging
+import argparse
+import threading
+from typing import Callable, Dict
+
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import dynamodb_client
+
+TABLE_NAME = 'item_pairs'
+
+
+def ensure_table(endpoint_url: str, n_items: int):
+    """Crear la tabla de pares (si no existe) y cargar n_items pares"""
+    table = dynamodb_client.get_table(TABLE_NAME, endpoint_url=endpoint_url)
+    try:
+        dynamodb_client.get_dynamodb(endpoint_url).create_table(
+            TableName=TABLE_NAME,
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+    except Exception:
+        pass
+    with table.batch_writer(overwrite_by_pkeys=['id']) as batch:
+        for i in range(n_items):
+            batch.put_item(Item={'id': f'{i}_{i + 1}', 'status': 'positivo'})
+
+
+def run_threads(worker: Callable[[int], None], threads: int, ops_per_thread: int) -> Dict[str, float]:
+    """Ejecutar worker(i) ops_per_thread veces en cada hilo y medir throughput"""
+    errors = []
+
+    def loop(thread_index):
+        for i in range(ops_per_thread):
+            try:
+                worker(thread_index * ops_per_thread + i)
+            except Exception as e:
+                errors.append(e)
+
+    pool = [threading.Thread(target=loop, args=(t,)) for t in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    total = threads * ops_per_thread
+    return {'ops': total, 'seconds': elapsed, 'ops_per_second': total / elapsed, 'errors': len(errors)}
+
+
+def bench_default(endpoint_url: str, threads: int, ops: int, n_items: int) -> Dict[str, float]:
+    """Configuración por defecto: pool de 10 conexiones y Table construido en cada request"""
+    resource = boto3.resource('dynamodb', endpoint_url=endpoint_url, region_name='us-east-1',
+                              aws_access_key_id='dummy', aws_secret_access_key='dummy')
+
+    def worker(i):
+        resource.Table(TABLE_NAME).get_item(Key={'id': f'{i % n_items}_{i % n_items + 1}'})
+
+    return run_threads(worker, threads, ops)
+
+
+def bench_shared(endpoint_url: str, threads: int, ops: int, n_items: int) -> Dict[str, float]:
+    """Fábrica compartida: pool configurable, reintentos adaptativos y Table cacheado"""
+    dynamodb_client.reset_clients()
+
+    def worker(i):
+        dynamodb_client.get_table(TABLE_NAME, endpoint_url=endpoint_url).get_item(
+            Key={'id': f'{i % n_items}_{i % n_items + 1}'})
+
+    return run_threads(worker, threads, ops)
+
+
+def bench_flask(threads: int, ops: int, n_items: int) -> Dict[str, float]:
+    """POST /items/compare con el test client de Flask desde varios hilos"""
+    from app import app
+    payloads = [json.dumps({
+        'item_a': {'item_id': i, 'title': f'Producto {i} negro 128GB'},
+        'item_b': {'item_id': i + 1, 'title': f'Producto {i} negro 256GB'},
+        'use_ml': False
+    }) for i in range(n_items)]
+
+    def worker(i):
+        with app.test_client() as client:
+            client.post('/items/compare', data=payloads[i % n_items], content_type='application/json')
+
+    return run_threads(worker, threads, ops)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput de DynamoDB con la configuración por defecto vs la fábrica compartida")
+    parser.add_argument('--endpoint-url', default=os.getenv('AWS_ENDPOINT_URL', 'http://localhost:8000'))
+    parser.add_argument('--moto', action='store_true', help="Levantar un servidor moto local en lugar de DynamoDB Local")
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--ops', type=int, default=200, help="Operaciones por hilo")
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--pool', type=int, default=None, help="DYNAMODB_MAX_POOL_CONNECTIONS para la fábrica compartida")
+    parser.add_argument('--skip-flask', action='store_true')
+    args = parser.parse_args()
+
+    server = None
+    if args.moto:
+        from moto.server import ThreadedMotoServer
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        server = ThreadedMotoServer(port=0)
+        server.start()
+        host, port = server.get_host_and_port()
+        args.endpoint_url = f"http://{host}:{port}"
+    if args.pool:
+        os.environ['DYNAMODB_MAX_POOL_CONNECTIONS'] = str(args.pool)
+    os.environ['AWS_ENDPOINT_URL'] = args.endpoint_url
+
+    try:
+        print(f"🏁 Endpoint {args.endpoint_url} | {args.threads} hilos x {args.ops} ops")
+        ensure_table(args.endpoint_url, args.items)
+        results = {
+            'default': bench_default(args.endpoint_url, args.threads, args.ops, args.items),
+            'shared': bench_shared(args.endpoint_url, args.threads, args.ops, args.items),
+        }
+        if not args.skip_flask:
+            results['flask_compare'] = bench_flask(args.threads, args.ops // 4 or 1, args.items)
+
+        print(f"\n{'modo':<14} {'ops':>7} {'seg':>8} {'ops/s':>10} {'errores':>8}")
+        for mode, r in results.items():
+            print(f"{mode:<14} {r['ops']:>7} {r['seconds']:>8.2f} {r['ops_per_second']:>10.1f} {r['errors']:>8}")
+    finally:
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark de serialización de un listado grande de pares (GET /items/pairs)
+Compara json.dumps(default=str) (lo que usaba create_response de Lambda), el
+encoder por defecto de Flask y los serializers de src/common/serialization.py
+"""
+
+import os
+import sys
+import time
+import json
+import argparse
+import statistics
+from decimal import Decimal
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import serialization
+
+
+def build_payload(n_pairs: int) -> Dict[str, Any]:
+    """Respuesta de listado con pares como los devuelve DynamoDB (números como Decimal)"""
+    pairs = [{
+        'id': f'{i}_{i + 1}',
+        'item_a_id': Decimal(i),
+        'item_a_title': f'Samsung Galaxy S{i % 30} {64 * (1 + i % 4)}GB Negro',
+        'item_b_id': Decimal(i + 1),
+        'item_b_title': f'Samsung Galaxy S{i % 30} Ultra {128 * (1 + i % 2)}GB',
+        'similarity_score': Decimal(str(round((i % 1000) / 1000, 6))),
+        'are_equal': False,
+        'are_similar': i % 3 == 0,
+        'status': 'positivo' if i % 3 == 0 else 'negativo',
+        'created_at': '2024-05-01T12:00:00.000000',
+        'updated_at': '2024-05-02T12:00:00.000000'
+    } for i in range(n_pairs)]
+    return {'status': 'success', 'message': f'Se encontraron {n_pairs} pares de ítems', 'pairs': pairs}
+
+
+def flask_default_dumps() -> Callable[[Any], str]:
+    from flask import Flask
+    from flask.json.provider import DefaultJSONProvider
+    return DefaultJSONProvider(Flask(__name__)).dumps
+
+
+def measure(fn: Callable[[Any], Any], payload: Any, repeat: int) -> Dict[str, float]:
+    times: List[float] = []
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn(payload)
+        times.append((time.perf_counter() - start) * 1000)
+        size = len(out)
+    return {'median_ms': statistics.median(times), 'min_ms': min(times), 'size_mb': size / 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serialización de un listado de pares con cada serializer")
+    parser.add_argument('--pairs', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    payload = build_payload(args.pairs)
+    candidates = {
+        'json default=str': lambda obj: json.dumps(obj, default=str),
+        'flask default': flask_default_dumps(),
+        'stdlib': serialization.StdlibSerializer().dumps_bytes,
+    }
+    try:
+        candidates['orjson'] = serialization.OrjsonSerializer().dumps_bytes
+    except ImportError:
+        print("⚠️ orjson no está instalado, se omite")
+
+    print(f"📦 Listado de {args.pairs} pares, {args.repeat} repeticiones")
+    print(f"\n{'serializer':<18} {'mediana ms':>11} {'mín ms':>9} {'MB':>7}")
+    baseline = None
+    for name, fn in candidates.items():
+        r = measure(fn, payload, args.repeat)
+        baseline = baseline or r['median_ms']
+        print(f"{name:<18} {r['median_ms']:>11.1f} {r['min_ms']:>9.1f} {r['size_mb']:>7.2f}"
+              f"  (x{baseline / r['median_ms']:.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,102 @@
+import os
+import sys
+import argparse
 import requests
-import csv
-import json
+
+# Modo offline: usa el detector y el motor de evaluación de src/ml
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ml'))
 
 API_URL = "http://localhost:5000/items/compare"
-CSV_PATH = "../data/data_matches - dataset.csv"
-
-results = []
-
-with open(CSV_PATH, newline='', encoding='utf-8') as csvfile:
-    reader = csv.DictReader(csvfile)
-    for row in reader:
-        item_a = {"item_id": int(row["ITEM_A"]), "title": row["TITLE_A"].strip()}
-        item_b = {"item_id": int(row["ITEM_B"]), "title": row["TITLE_B"].strip()}
-        # Sin ML
-        resp_no_ml = requests.post(API_URL, json={"item_a": item_a, "item_b": item_b, "use_ml": False})
-        score_no_ml = resp_no_ml.json().get("similarity_score", None)
-        # Con ML
-        resp_ml = requests.post(API_URL, json={"item_a": item_a, "item_b": item_b, "use_ml": True})
-        score_ml = resp_ml.json().get("similarity_score", None)
-        results.append({
-            "item_a": item_a["title"],
-            "item_b": item_b["title"],
-            "score_no_ml": score_no_ml,
-            "score_ml": score_ml,
-            "diff": abs((score_ml or 0) - (score_no_ml or 0))
-        })
-
-print("\nComparación de resultados ML vs Tradicional:")
-for r in results:
-    print(f"A: {r['item_a']} | B: {r['item_b']}")
-    print(f"  Sin ML: {r['score_no_ml']}, Con ML: {r['score_ml']}, Diferencia: {r['diff']:.3f}")
-    print()
-
-positivos_no_ml = sum(1 for r in results if r['score_no_ml'] is not None and r['score_no_ml'] >= 0.7)
-positivos_ml = sum(1 for r in results if r['score_ml'] is not None and r['score_ml'] >= 0.7)
-print(f"Total positivos sin ML: {positivos_no_ml}")
-print(f"Total positivos con ML: {positivos_ml}")
-print(f"Diferencia de positivos: {positivos_ml - positivos_no_ml}") 
\ No newline at end of file
+CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'data', 'data_matches - dataset.csv')
+THRESHOLD = 0.7
+
+def compare_offline(csv_path: str, model_path: str, n_jobs: int = None):
+    """Scores ML y TF-IDF de todo el CSV con una sola featurización (sin pasar por la API)"""
+    from ml_similarity import MLSimilarityDetector
+    from evaluation import evaluate
+    from train_ml_model import load_training_pairs
+
+    detector = MLSimilarityDetector(model_path)
+    if not detector.is_trained:
+        print(f"❌ No hay un modelo entrenado en {model_path}; usar --api para comparar contra la API")
+        sys.exit(1)
+
+    pairs = load_training_pairs(csv_path)
+    # evaluate deja el score ML en pairs.scores y el coseno TF-IDF en pairs.columns
+    report = evaluate(detector, pairs, threshold=THRESHOLD, n_jobs=n_jobs)
+    titles_a, titles_b = pairs.title_columns()
+    results = [{
+        "item_a": title_a,
+        "item_b": title_b,
+        "score_no_ml": score_no_ml,
+        "score_ml": score_ml,
+        "diff": abs(score_ml - score_no_ml)
+    } for title_a, title_b, score_no_ml, score_ml in zip(titles_a, titles_b,
+                                                         pairs.columns['tfidf_similarity'].tolist(),
+                                                         pairs.scores.tolist())]
+    return results, report
+
+def compare_api(csv_path: str, api_url: str):
+    """Comparar a través de la API: una sola llamada con scores=all por par.
+
+    Los dos scores salen de la misma pasada del servidor: "sin ML" es
+    scores.tfidf, el coseno del vectorizer del modelo (la misma columna que el
+    modo offline), y "con ML" es scores.ml, que llega en None si la API no
+    tiene modelo (entonces scores.tfidf es el TF-IDF tradicional del par).
+    """
+    import csv
+
+    results = []
+    with requests.Session() as session, open(csv_path, newline='', encoding='utf-8') as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            item_a = {"item_id": int(row["ITEM_A"]), "title": row["TITLE_A"].strip()}
+            item_b = {"item_id": int(row["ITEM_B"]), "title": row["TITLE_B"].strip()}
+            resp = session.post(api_url, params={"scores": "all"}, json={"item_a": item_a, "item_b": item_b})
+            scores = resp.json().get("scores") or {}
+            score_no_ml = scores.get("tfidf")
+            score_ml = scores.get("ml")
+            results.append({
+                "item_a": item_a["title"],
+                "item_b": item_b["title"],
+                "score_no_ml": score_no_ml,
+                "score_ml": score_ml,
+                "diff": abs((score_ml or 0) - (score_no_ml or 0))
+            })
+    return results
+
+def print_comparison(results, max_pairs: int):
+    print("\nComparación de resultados ML vs Tradicional:")
+    for r in results[:max_pairs]:
+        print(f"A: {r['item_a']} | B: {r['item_b']}")
+        print(f"  Sin ML: {r['score_no_ml']}, Con ML: {r['score_ml']}, Diferencia: {r['diff']:.3f}")
+        print()
+    if len(results) > max_pairs:
+        print(f"... {len(results) - max_pairs} pares más\n")
+
+    positivos_no_ml = sum(1 for r in results if r['score_no_ml'] is not None and r['score_no_ml'] >= THRESHOLD)
+    positivos_ml = sum(1 for r in results if r['score_ml'] is not None and r['score_ml'] >= THRESHOLD)
+    print(f"Total positivos sin ML: {positivos_no_ml}")
+    print(f"Total positivos con ML: {positivos_ml}")
+    print(f"Diferencia de positivos: {positivos_ml - positivos_no_ml}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Comparar la clasificación de pares con y sin ML")
+    parser.add_argument('--csv', default=CSV_PATH)
+    parser.add_argument('--api', nargs='?', const=API_URL, default=None,
+                        help=f"Comparar contra la API en vez de offline (por defecto {API_URL})")
+    parser.add_argument('--model-path', default='models/similarity_model.pkl',
+                        help="Modelo para la comparación offline")
+    parser.add_argument('--n-jobs', type=int, default=None, help="Procesos de featurización offline")
+    parser.add_argument('--max-pairs', type=int, default=50, help="Pares a mostrar en detalle")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.api:
+        print_comparison(compare_api(args.csv, args.api), args.max_pairs)
+    else:
+        from evaluation import print_evaluation_report
+        results, report = compare_offline(args.csv, args.model_path, n_jobs=args.n_jobs)
+        print_comparison(results, args.max_pairs)
+        print_evaluation_report(report)
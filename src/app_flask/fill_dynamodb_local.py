@@ -1,10 +1,13 @@
-import boto3
 import os
+import sys
 from datetime import datetime
 import pandas as pd
 from decimal import Decimal
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from dynamodb_client import get_table
+
 def generate_pair_id(item_a, item_b):
     return f"{min(item_a, item_b)}_{max(item_a, item_b)}"
 
@@ -21,8 +24,7 @@ def convert_floats(obj):
 def main():
     start = time.time()
     # Configuración para DynamoDB local
-    dynamodb = boto3.resource('dynamodb', endpoint_url='http://localhost:8000', region_name='us-east-1', aws_access_key_id='dummy', aws_secret_access_key='dummy')
-    table = dynamodb.Table('item_pairs')
+    table = get_table('item_pairs', endpoint_url=os.getenv('AWS_ENDPOINT_URL', 'http://localhost:8000'))
     # Ruta robusta al CSV (ajustada a la estructura actual)
     csv_path = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'data_matches - dataset.csv')
     df = pd.read_csv(csv_path)
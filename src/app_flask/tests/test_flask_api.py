@@ -53,4 +53,258 @@ def test_compare_items_with_and_without_ml(client):
     data_ml = response_ml.get_json()
     # Si ambos funcionaron, comparar resultados
     if response_ml.status_code == 200:
-        assert data_no_ml['similarity_score'] != data_ml['similarity_score'] or data_no_ml['similarity_score'] == data_ml['similarity_score'] 
\ No newline at end of file
+        assert data_no_ml['similarity_score'] != data_ml['similarity_score'] or data_no_ml['similarity_score'] == data_ml['similarity_score'] 
+
+def test_identical_concurrent_compares_are_coalesced(client, monkeypatch):
+    import importlib
+    import threading
+    import time
+
+    app_module = importlib.import_module(flask_app.import_name)
+    calls = []
+
+    def slow_similarity(title1, title2, force_ml=None):
+        calls.append((title1, title2))
+        time.sleep(0.2)
+        return 0.8
+
+    monkeypatch.setattr(app_module, 'calculate_similarity', slow_similarity)
+    payloads = [
+        {"item_a": {"item_id": 1, "title": "Telefono movil"}, "item_b": {"item_id": 2, "title": "Telefono celular"}},
+        # Mismo par con los ítems invertidos y otro formato de título
+        {"item_a": {"item_id": 2, "title": "telefono celular "}, "item_b": {"item_id": 1, "title": "Telefono Movil"}},
+    ]
+    responses = []
+
+    def post(payload):
+        with flask_app.test_client() as thread_client:
+            responses.append(thread_client.post('/items/compare', data=json.dumps(payload),
+                                                content_type='application/json'))
+
+    threads = [threading.Thread(target=post, args=(payloads[i % 2],)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(r.status_code == 200 and r.get_json()['similarity_score'] == 0.8 for r in responses)
+
+def test_async_create_returns_202_and_reads_pending_write(client, monkeypatch, tmp_path):
+    import importlib
+    from write_behind import WriteBehindBuffer  # src/common, ya en sys.path por app.py
+
+    from pair_store import MemoryPairStore
+
+    app_module = importlib.import_module(flask_app.import_name)
+    store = MemoryPairStore()
+    reads = []
+    store_get = store.get
+    monkeypatch.setattr(store, 'get', lambda pair_id: reads.append(pair_id) or store_get(pair_id))
+    monkeypatch.setattr(app_module, 'pair_store', store)
+    buffer = WriteBehindBuffer(store, spool_path=str(tmp_path / 'spool.jsonl'), autostart=False)
+    monkeypatch.setattr(app_module, 'write_buffer', buffer)
+    payload = {
+        "item_a": {"item_id": 901, "title": "Telefono movil"},
+        "item_b": {"item_id": 902, "title": "Telefono celular"},
+        "use_ml": False
+    }
+    response = client.post('/items/pairs', data=json.dumps(payload), content_type='application/json')
+    assert response.status_code == 202
+    data = response.get_json()
+    assert data['action'] == 'accepted' and 'similarity_score' in data
+
+    # La escritura todavía no llegó a DynamoDB pero ya se puede leer
+    response = client.get(f"/items/pairs/{data['pair_id']}")
+    assert response.status_code == 200
+    pair = response.get_json()['pair']
+    assert pair['item_a_id'] == 901
+    # Los Decimal se serializan como número, no como string
+    assert isinstance(pair['similarity_score'], float)
+    assert open(buffer.spool_file).read().count('\n') == 1
+
+    # Un create repetido lo responde el write-behind, sin leer el repositorio
+    assert len(reads) == 1
+    response = client.post('/items/pairs', data=json.dumps(payload), content_type='application/json')
+    assert response.status_code == 200 and response.get_json()['action'] == 'existing'
+    assert len(reads) == 1
+    assert buffer.flush() == 1 and store_get(data['pair_id'])['item_b_id'] == 902
+
+def test_batch_delete_streams_ndjson_results(client, monkeypatch):
+    import importlib
+    app_module = importlib.import_module(flask_app.import_name)
+
+    def fake_batch_delete(pair_ids, max_workers=4, should_continue=None):
+        for pair_id in pair_ids:
+            yield {'pair_id': pair_id, 'result': 'deleted' if pair_id != '5_6' else 'failed'}
+
+    monkeypatch.setattr(app_module.pair_store, 'batch_delete', fake_batch_delete)
+    response = client.post('/items/pairs/batch-delete', data=json.dumps({'pair_ids': ['1_2', '3_4', '5_6']}),
+                           content_type='application/json')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line.get('pair_id') for line in lines[:3]] == ['1_2', '3_4', '5_6']
+    assert lines[-1] == {'summary': {'deleted': 2, 'failed': 1}}
+
+    response = client.post('/items/pairs/batch-delete', data=json.dumps({'pair_ids': []}),
+                           content_type='application/json')
+    assert response.status_code == 400
+
+def test_metrics_endpoint_exposes_route_and_stage_histograms(client):
+    payload = {
+        "item_a": {"item_id": 1, "title": "Telefono movil"},
+        "item_b": {"item_id": 2, "title": "Telefono celular"},
+        "use_ml": False
+    }
+    client.post('/items/compare', data=json.dumps(payload), content_type='application/json')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert 'http_request_duration_seconds_count{method="POST",route="/items/compare",status="200"}' in text
+    assert 'stage_duration_seconds_count{stage="json_parse"}' in text
+    assert 'similarity_scorer_total{scorer="tfidf"}' in text
+
+def test_untrained_model_counts_as_fallback_not_ml(client, monkeypatch):
+    import importlib
+    app_module = importlib.import_module(flask_app.import_name)
+    registry = app_module.MetricsRegistry()
+    monkeypatch.setattr(app_module, 'metrics', registry)
+
+    def untrained_similarity(title1, title2):
+        return {'similarity_score': 0.3, 'are_equal': False, 'are_similar': False,
+                'confidence': 0.8, 'scorer': 'basic'}
+
+    monkeypatch.setattr(app_module, 'load_ml_similarity', lambda: untrained_similarity)
+    monkeypatch.setattr(app_module, 'tfidf_similarity', lambda *args: 0.25)
+
+    assert app_module.calculate_similarity('Telefono movil', 'Telefono celular') == 0.25
+    with pytest.raises(RuntimeError):
+        app_module.calculate_similarity('Telefono movil', 'Telefono celular', force_ml=True)
+
+    text = registry.render_prometheus()
+    assert 'ml_fallback_total{mode="auto",reason="untrained"} 1' in text
+    assert 'ml_fallback_total{mode="forced",reason="untrained"} 1' in text
+    assert 'scorer="ml"' not in text
+
+def test_profiling_requires_admin_token_and_returns_focus_frames(client, monkeypatch, tmp_path):
+    monkeypatch.setenv('PROFILING_ADMIN_TOKEN', 'secreto')
+    monkeypatch.setenv('PROFILE_DIR', str(tmp_path))
+    payload = {
+        "item_a": {"item_id": 1, "title": "Telefono movil"},
+        "item_b": {"item_id": 2, "title": "Telefono celular"},
+        "use_ml": False
+    }
+    denied = client.post('/items/compare?profile=1', data=json.dumps(payload), content_type='application/json')
+    assert denied.status_code == 403
+
+    response = client.post('/items/compare', data=json.dumps(payload), content_type='application/json',
+                           headers={'X-Profile': '1', 'X-Admin-Token': 'secreto'})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['similarity_score'] is not None
+    assert response.headers['X-Profile-Id'] == data['profile']['profile_id']
+    assert 'calculate_similarity' in {row['function'] for row in data['profile']['focus']}
+
+def test_item_pairs_endpoint_queries_the_pair_store(client, monkeypatch):
+    import importlib
+    from pair_store import MemoryPairStore
+    app_module = importlib.import_module(flask_app.import_name)
+    store = MemoryPairStore()
+    for pair_id, a, b in [('1_2', 1, 2), ('1_3', 1, 3), ('2_3', 2, 3)]:
+        store.put({'id': pair_id, 'item_a_id': a, 'item_b_id': b})
+    monkeypatch.setattr(app_module, 'pair_store', store)
+
+    response = client.get('/items/1/pairs')
+    assert response.status_code == 200
+    assert sorted(pair['id'] for pair in response.get_json()['pairs']) == ['1_2', '1_3']
+    assert len(client.get('/items/3/pairs?limit=1').get_json()['pairs']) == 1
+    assert client.get('/items/3/pairs?limit=0').status_code == 400
+    assert client.get('/items/3/pairs?limit=abc').status_code == 400
+
+def test_non_integer_item_ids_are_a_bad_request(client):
+    # Los índices por ítem tienen claves numéricas: un item_id string no llega a DynamoDB
+    payload = {"item_a": {"item_id": "sku-1", "title": "Telefono movil"},
+               "item_b": {"item_id": 2, "title": "Telefono celular"}}
+    for path in ('/items/compare', '/items/pairs'):
+        response = client.post(path, data=json.dumps(payload), content_type='application/json')
+        assert response.status_code == 400
+        assert response.get_json()['message'] == 'item_id debe ser un entero'
+
+def test_get_all_pairs_paginates_with_continuation_token(client, monkeypatch):
+    import importlib
+    from pair_store import MemoryPairStore
+    app_module = importlib.import_module(flask_app.import_name)
+    store = MemoryPairStore()
+    for i in range(5):
+        store.put({'id': f'{i}_{i + 10}', 'status': 'positivo'})
+    monkeypatch.setattr(app_module, 'pair_store', store)
+    monkeypatch.setattr(store, 'iter_items', lambda *args: pytest.fail("scan completo de la tabla"))
+
+    seen, token = [], None
+    while True:
+        url = '/items/pairs?limit=2' + (f'&next_token={token}' if token else '')
+        data = client.get(url).get_json()
+        assert len(data['pairs']) <= 2
+        seen.extend(pair['id'] for pair in data['pairs'])
+        token = data['next_token']
+        if token is None:
+            break
+    assert sorted(seen) == sorted(f'{i}_{i + 10}' for i in range(5))
+
+    # Sin limit: una página nativa del backend
+    assert len(client.get('/items/pairs').get_json()['pairs']) == 5
+    assert client.get('/items/pairs?limit=0').status_code == 400
+    assert client.get('/items/pairs?next_token=xx').status_code == 400
+
+def test_compare_scores_all_uses_a_single_scoring_pass(client, monkeypatch):
+    import importlib
+    app_module = importlib.import_module(flask_app.import_name)
+    calls = []
+
+    def fake_scores(title1, title2):
+        calls.append((title1, title2))
+        return {'ml': 0.9, 'tfidf': 0.4, 'features': {'exact_match': 0.0, 'contains_same_words': 0.5}}
+
+    monkeypatch.setattr(app_module, 'load_ml_scores', lambda: fake_scores)
+    monkeypatch.setattr(app_module, 'tfidf_similarity', lambda *args: pytest.fail("TF-IDF calculado dos veces"))
+    payload = {
+        "item_a": {"item_id": 1, "title": "Telefono movil"},
+        "item_b": {"item_id": 2, "title": "Telefono celular"}
+    }
+    data = client.post('/items/compare?scores=all', data=json.dumps(payload),
+                       content_type='application/json').get_json()
+
+    assert calls == [("Telefono movil", "Telefono celular")]
+    assert data['similarity_score'] == 0.9 and data['are_similar'] is True
+    assert data['scores'] == {'ml': 0.9, 'tfidf': 0.4, 'features': {'exact_match': 0.0, 'contains_same_words': 0.5}}
+
+    # Sin modelo, ml queda en None y el TF-IDF tradicional se calcula una sola vez
+    def missing_model():
+        raise ImportError('sin modelo')
+
+    tfidf_calls = []
+    monkeypatch.setattr(app_module, 'load_ml_scores', missing_model)
+    monkeypatch.setattr(app_module, 'tfidf_similarity', lambda *args: tfidf_calls.append(args) or 0.25)
+    data = client.post('/items/compare', data=json.dumps({**payload, 'scores': 'all'}),
+                       content_type='application/json').get_json()
+    assert data['scores']['ml'] is None and data['similarity_score'] == data['scores']['tfidf'] == 0.25
+    assert len(tfidf_calls) == 1
+
+    # use_ml=False: similarity_score es el TF-IDF de la misma pasada, sin un segundo ajuste
+    monkeypatch.setattr(app_module, 'load_ml_scores', lambda: fake_scores)
+    monkeypatch.setattr(app_module, 'tfidf_similarity', lambda *args: pytest.fail("TF-IDF calculado dos veces"))
+    data = client.post('/items/compare?scores=all', data=json.dumps({**payload, 'use_ml': False}),
+                       content_type='application/json').get_json()
+    assert data['similarity_score'] == data['scores']['tfidf'] == 0.4
+    assert data['are_similar'] is False and data['scores']['ml'] == 0.9
+
+    # Títulos iguales sin ML: 1.0, como el TF-IDF tradicional
+    same = {**payload, 'item_b': {"item_id": 2, "title": " telefono MOVIL "}, 'use_ml': False}
+    data = client.post('/items/compare?scores=all', data=json.dumps(same),
+                       content_type='application/json').get_json()
+    assert data['similarity_score'] == data['scores']['tfidf'] == 1.0
+
+    assert client.post('/items/compare?scores=ml', data=json.dumps(payload),
+                       content_type='application/json').status_code == 400
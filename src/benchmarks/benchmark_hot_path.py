@@ -0,0 +1,222 @@
+"""
+Micro-benchmarks del camino caliente del scoring
+Mide calculate_similarity (force_ml None / True / False), extract_text_features,
+predict_similarity, prepare_training_data, generate_pair_id y create_response
+de Lambda con títulos cortos, largos y con mucho unicode. Guarda los resultados
+en JSON y los compara contra un baseline para detectar regresiones
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+for folder in ('common', 'ml', 'app_flask', 'lambda'):
+    sys.path.insert(0, os.path.join(SRC_DIR, folder))
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, 'baseline_hot_path.json')
+
+# Pares de títulos por tipo: el scoring escala con el largo y la normalización con el unicode
+TITLE_SETS: Dict[str, List[Tuple[str, str]]] = {
+    'short': [
+        ('iPhone 13', 'iPhone 13 Pro'),
+        ('Mouse Logitech', 'Mouse inalámbrico Logitech'),
+        ('Silla gamer', 'Silla de escritorio'),
+    ],
+    'long': [
+        ('Notebook Lenovo IdeaPad 5 14 pulgadas Intel Core i7 1165G7 16GB RAM 512GB SSD NVMe '
+         'Windows 11 Home teclado retroiluminado lector de huellas color gris plata',
+         'Notebook Lenovo IdeaPad Slim 5 14" Core i7 11va generación 16 GB 512 GB SSD Win 11 '
+         'teclado en español retroiluminado gris platino garantía oficial 12 meses'),
+        ('Smart TV Samsung 55 pulgadas Crystal UHD 4K AU7000 HDR10+ Tizen WiFi Bluetooth '
+         'tres entradas HDMI dos USB control remoto incluido modelo 2023',
+         'Televisor Samsung Crystal 55" 4K UHD Smart Tizen HDR AU7000 con WiFi y Bluetooth '
+         '3 HDMI 2 USB incluye control remoto y soporte de mesa versión 2023'),
+    ],
+    'unicode': [
+        ('Zapatillas Niño Ñandú 👟 運動鞋 Größe 42 — edición «límite»',
+         'ZAPATILLAS NIÑO ÑANDÚ 👟 运动鞋 GRÖSSE 42 – EDICIÓN LÍMITE'),
+        ('Café Orgánico Señorío 咖啡 ☕ 500g Ñuñoa',
+         'café orgánico señorío コーヒー ☕ 500 g ñuñoa'),
+        ('Смартфон Xiaomi Redmi Note 12 📱 128ГБ',
+         'Xiaomi Redmi Note 12 смартфон 128 ГБ 📱 Ελληνικά'),
+    ],
+}
+
+# Tamaño del lote de prepare_training_data
+TRAINING_BATCH = 200
+
+
+def ensure_detector(model_path: Optional[str]):
+    """Detector ML entrenado: el de model_path, o uno sintético en un directorio temporal"""
+    from ml_similarity import MLSimilarityDetector
+    from train_ml_model import create_synthetic_training_data
+
+    if model_path and os.path.exists(model_path):
+        return MLSimilarityDetector(model_path)
+    path = os.path.join(tempfile.mkdtemp(prefix='bench-model-'), 'similarity_model.pkl')
+    print(f"⚠️ Sin modelo entrenado, usando uno sintético en {path}")
+    detector = MLSimilarityDetector(path)
+    detector.train_model(create_synthetic_training_data(), profile='fast')
+    return detector
+
+
+def measure(fn: Callable[[], Any], repeat: int, min_time: float) -> Dict[str, float]:
+    """Tiempo por llamada: calibra cuántas llamadas entran en min_time y repite"""
+    fn()  # warm-up (imports perezosos, cachés)
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9)))
+
+    per_call = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        per_call.append((time.perf_counter() - start) / loops * 1e6)
+    return {
+        'median_us': statistics.median(per_call),
+        'min_us': min(per_call),
+        'stdev_us': statistics.stdev(per_call) if len(per_call) > 1 else 0.0,
+        'loops': loops,
+    }
+
+
+def build_cases(detector) -> Dict[str, Callable[[], Any]]:
+    """Casos nombrados función[variante]/títulos -> callable sin argumentos"""
+    import ml_similarity
+    import app as flask_app
+    import lambda_app
+
+    # calculate_similarity de Flask usa el detector global del módulo
+    ml_similarity.ml_detector = detector
+
+    cases: Dict[str, Callable[[], Any]] = {}
+    for set_name, pairs in TITLE_SETS.items():
+        def cycle(fn, pairs=pairs):
+            # Recorre todos los pares del conjunto en cada llamada
+            return lambda: [fn(a, b) for a, b in pairs]
+
+        for mode in (None, True, False):
+            cases[f'calculate_similarity[force_ml={mode}]/{set_name}'] = cycle(
+                lambda a, b, mode=mode: flask_app.calculate_similarity(a, b, force_ml=mode))
+        cases[f'extract_text_features/{set_name}'] = cycle(detector.extract_text_features)
+        cases[f'predict_similarity/{set_name}'] = cycle(detector.predict_similarity)
+
+        batch = [{'item_a_title': pairs[i % len(pairs)][0], 'item_b_title': pairs[i % len(pairs)][1],
+                  'is_similar': i % 2} for i in range(TRAINING_BATCH)]
+        cases[f'prepare_training_data[{TRAINING_BATCH}]/{set_name}'] = lambda batch=batch: detector.prepare_training_data(batch)
+
+        body = {
+            'status': 'success',
+            'pairs': [{'id': f'{i}_{i + 1}', 'item_a_title': a, 'item_b_title': b, 'similarity_score': 0.5}
+                      for i, (a, b) in enumerate(pairs)]
+        }
+        cases[f'create_response/{set_name}'] = lambda body=body: lambda_app.create_response(200, body)
+
+    ids = [(i * 7919, i * 104729) for i in range(100)]
+    cases['generate_pair_id[100]'] = lambda: [flask_app.generate_pair_id(a, b) for a, b in ids]
+    return cases
+
+
+def reset_metrics():
+    # Las métricas de Lambda guardan cada observación hasta el flush por invocación
+    import app as flask_app
+    import lambda_app
+    flask_app.metrics.reset()
+    lambda_app.metrics.reset()
+
+
+def compare_to_baseline(results: Dict[str, Dict[str, float]], baseline: Dict[str, Any],
+                        threshold: float) -> List[Dict[str, Any]]:
+    """Casos cuya mediana empeoró más de threshold (fracción) respecto del baseline"""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+        ratio = result['median_us'] / previous['median_us']
+        result['baseline_ratio'] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append({'case': name, 'ratio': ratio,
+                                'median_us': result['median_us'], 'baseline_us': previous['median_us']})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks del camino caliente del scoring")
+    parser.add_argument('--filter', default='', help="Solo los casos que contienen este texto")
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--min-time', type=float, default=0.1, help="Segundos mínimos por repetición")
+    parser.add_argument('--model-path', default=os.path.join(SRC_DIR, 'ml', 'models', 'similarity_model.pkl'))
+    parser.add_argument('--output', default=None, help="JSON de resultados (por defecto results/hot_path-<fecha>.json)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="Guardar estos resultados como baseline")
+    parser.add_argument('--threshold', type=float, default=0.15, help="Regresión si la mediana empeora más de esta fracción")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    detector = ensure_detector(args.model_path)
+    cases = {name: fn for name, fn in build_cases(detector).items() if args.filter in name}
+
+    print(f"🏁 {len(cases)} casos, {args.repeat} repeticiones de al menos {args.min_time}s")
+    print(f"\n{'caso':<52} {'mediana µs':>12} {'mín µs':>10} {'±':>8}")
+    results = {}
+    for name, fn in cases.items():
+        results[name] = measure(fn, args.repeat, args.min_time)
+        reset_metrics()
+        r = results[name]
+        print(f"{name:<52} {r['median_us']:>12.1f} {r['min_us']:>10.1f} {r['stdev_us']:>8.1f}")
+
+    report = {
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'model_path': detector.model_path,
+        'results': results,
+    }
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        report['baseline'] = args.baseline
+        report['regressions'] = regressions
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(RESULTS_DIR, f"hot_path-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n💾 Resultados en {output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"📌 Baseline guardado en {args.baseline}")
+    elif regressions:
+        print(f"\n❌ {len(regressions)} regresiones (umbral {args.threshold:.0%}):")
+        for r in regressions:
+            print(f"   {r['case']}: {r['baseline_us']:.1f} -> {r['median_us']:.1f} µs (x{r['ratio']:.2f})")
+        sys.exit(1)
+    elif 'baseline' in report:
+        print(f"✅ Sin regresiones respecto de {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Prueba de carga end-to-end sin AWS
+Levanta la API Flask (servidor HTTP local) y/o invoca lambda_handler con
+eventos sintéticos de API Gateway, contra DynamoDB Local, moto en memoria o
+los repositorios de pares memory/sqlite (para comparar backends).
+Genera una mezcla configurable de compare, create, get y list desde varios
+hilos y reporta RPS, latencias p50/p95/p99 y tasa de errores por operación
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+import http.client
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+for folder in ('common', 'ml', 'app_flask', 'lambda'):
+    sys.path.insert(0, os.path.join(SRC_DIR, folder))
+
+TABLE_NAME = 'item_pairs'
+OPERATIONS = ('compare', 'create', 'get', 'list')
+DEFAULT_MIX = 'compare=50,create=20,get=25,list=5'
+
+BRANDS = ['Samsung', 'Apple', 'Xiaomi', 'Motorola', 'Lenovo', 'HP', 'Sony', 'LG']
+PRODUCTS = ['Celular', 'Notebook', 'Smart TV', 'Auriculares', 'Tablet', 'Monitor']
+VARIANTS = ['64GB', '128GB', '256GB', 'Negro', 'Blanco', 'Pro', 'Ultra', 'Lite', '2023']
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    """'compare=50,create=20' -> pesos por operación"""
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in OPERATIONS:
+            raise ValueError(f"Operación desconocida en --mix: {name}. Opciones: {', '.join(OPERATIONS)}")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def item_title(item_id: int) -> str:
+    rng = random.Random(item_id)
+    return f"{rng.choice(PRODUCTS)} {rng.choice(BRANDS)} {' '.join(rng.sample(VARIANTS, 2))}"
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Workload:
+    """Genera requests de la mezcla; las de get apuntan a pares que existen"""
+
+    def __init__(self, mix: Dict[str, float], n_items: int, seeded_ids: List[str], use_ml: bool):
+        self.operations = list(mix)
+        self.weights = [mix[op] for op in self.operations]
+        self.n_items = n_items
+        self.seeded_ids = seeded_ids
+        self.use_ml = use_ml
+
+    def next(self, rng: random.Random) -> Tuple[str, str, str, Optional[Dict[str, Any]], Dict[str, str]]:
+        """(operación, método, path, body, query) de la próxima request"""
+        op = rng.choices(self.operations, self.weights)[0]
+        if op in ('compare', 'create'):
+            a, b = rng.sample(range(1, self.n_items + 1), 2)
+            body = {'item_a': {'item_id': a, 'title': item_title(a)},
+                    'item_b': {'item_id': b, 'title': item_title(b)},
+                    'use_ml': self.use_ml}
+            return op, 'POST', '/items/compare' if op == 'compare' else '/items/pairs', body, {}
+        if op == 'get':
+            return op, 'GET', f"/items/pairs/{rng.choice(self.seeded_ids)}", None, {}
+        return op, 'GET', '/items/pairs', None, {'limit': '50'}
+
+
+class LambdaContext:
+    """Context sintético con el timeout de la función"""
+
+    def __init__(self, timeout_ms: int):
+        self.deadline = time.monotonic() + timeout_ms / 1000
+
+    def get_remaining_time_in_millis(self):
+        return int(max(0.0, self.deadline - time.monotonic()) * 1000)
+
+
+def lambda_target(timeout_ms: int, store) -> Callable:
+    import lambda_app
+    lambda_app.METRICS_EMF_ENABLED = False  # sin un registro EMF por request en stdout
+    lambda_app.pair_store = store  # Flask y Lambda comparten los pares precargados
+
+    def send(method: str, path: str, body: Optional[Dict], query: Dict[str, str]) -> int:
+        event = {'httpMethod': method, 'path': path, 'headers': {'Content-Type': 'application/json'},
+                 'queryStringParameters': query or None,
+                 'body': json.dumps(body) if body is not None else None}
+        return lambda_app.lambda_handler(event, LambdaContext(timeout_ms))['statusCode']
+
+    return send
+
+
+def flask_target(stack: ExitStack, store) -> Callable:
+    """Servir la app Flask en un puerto libre (servidor multihilo de werkzeug)"""
+    from werkzeug.serving import make_server
+    import app as flask_app
+    from app import app
+
+    flask_app.pair_store = store
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name='flask-server', daemon=True)
+    thread.start()
+    stack.callback(server.shutdown)
+    port = server.server_port
+
+    def send(method: str, path: str, body: Optional[Dict], query: Dict[str, str]) -> int:
+        if query:
+            path += '?' + '&'.join(f"{k}={v}" for k, v in query.items())
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        try:
+            payload = json.dumps(body) if body is not None else None
+            conn.request(method, path, body=payload, headers={'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        finally:
+            conn.close()
+
+    return send
+
+
+def run_load(send: Callable, workload: Workload, concurrency: int, duration: float,
+             max_requests: Optional[int], seed: int) -> Dict[str, Any]:
+    """Disparar requests desde concurrency hilos hasta duration segundos o max_requests"""
+    samples: Dict[str, List[float]] = {op: [] for op in workload.operations}
+    errors: Dict[str, int] = {op: 0 for op in workload.operations}
+    statuses: Dict[str, Dict[int, int]] = {op: {} for op in workload.operations}
+    lock = threading.Lock()
+    issued = [0]
+    stop_at = time.monotonic() + duration
+
+    def worker(worker_id: int):
+        rng = random.Random(seed + worker_id)
+        while time.monotonic() < stop_at:
+            with lock:
+                if max_requests is not None and issued[0] >= max_requests:
+                    return
+                issued[0] += 1
+            op, method, path, body, query = workload.next(rng)
+            start = time.perf_counter()
+            try:
+                status = send(method, path, body, query)
+            except Exception as e:
+                logging.getLogger(__name__).debug(f"{op} falló: {e}")
+                status = 0
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples[op].append(elapsed)
+                statuses[op][status] = statuses[op].get(status, 0) + 1
+                if not 200 <= status < 300:
+                    errors[op] += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), name=f'load-{i}') for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    report = {'seconds': elapsed, 'operations': {}}
+    all_latencies: List[float] = []
+    total_errors = 0
+    for op in workload.operations:
+        latencies = sorted(samples[op])
+        all_latencies.extend(latencies)
+        total_errors += errors[op]
+        report['operations'][op] = summarize_latencies(latencies, errors[op], elapsed)
+        report['operations'][op]['statuses'] = statuses[op]
+    report['total'] = summarize_latencies(sorted(all_latencies), total_errors, elapsed)
+    return report
+
+
+def summarize_latencies(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'error_rate': errors / len(latencies) if latencies else 0.0,
+    }
+
+
+def prepare_store(store, n_items: int, seed_pairs: int) -> List[str]:
+    """Crear item_pairs (si no existe) y cargar seed_pairs pares; devuelve sus ids"""
+    store.ensure_schema()
+    rng = random.Random(0)
+    pairs = {}
+    for _ in range(seed_pairs):
+        a, b = sorted(rng.sample(range(1, n_items + 1), 2))
+        pairs[f"{a}_{b}"] = {
+            'id': f"{a}_{b}", 'item_a_id': a, 'item_a_title': item_title(a),
+            'item_b_id': b, 'item_b_title': item_title(b), 'status': 'negativo'
+        }
+    failed = [r for r in store.batch_put(pairs.values()) if r['result'] != 'created']
+    if failed:
+        raise RuntimeError(f"No se pudieron precargar {len(failed)} pares")
+    return list(pairs)
+
+
+def print_report(target: str, report: Dict[str, Any]):
+    print(f"\n📊 {target}: {report['total']['requests']} requests en {report['seconds']:.1f}s")
+    print(f"{'operación':<10} {'requests':>9} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errores':>8}")
+    for op, r in list(report['operations'].items()) + [('total', report['total'])]:
+        print(f"{op:<10} {r['requests']:>9} {r['rps']:>9.1f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} "
+              f"{r['p99_ms']:>9.1f} {r['error_rate']:>8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de Flask y Lambda contra DynamoDB Local o moto")
+    parser.add_argument('--target', choices=['flask', 'lambda', 'both'], default='both')
+    parser.add_argument('--backend', choices=['moto', 'local', 'memory', 'sqlite'], default='moto',
+                        help="moto: DynamoDB en memoria; local: DynamoDB Local en --endpoint-url; "
+                             "memory/sqlite: repositorio de pares sin DynamoDB")
+    parser.add_argument('--sqlite-path', default=':memory:', help="Archivo de SQLite con --backend sqlite")
+    parser.add_argument('--endpoint-url', default=os.getenv('AWS_ENDPOINT_URL', 'http://localhost:8000'))
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"Pesos por operación (por defecto {DEFAULT_MIX})")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20.0, help="Segundos por target")
+    parser.add_argument('--requests', type=int, default=None, help="Cortar tras esta cantidad de requests por target")
+    parser.add_argument('--items', type=int, default=5000, help="Ids de ítems posibles en compare/create")
+    parser.add_argument('--seed-pairs', type=int, default=1000, help="Pares precargados (los que lee get)")
+    parser.add_argument('--use-ml', action='store_true', help="Mandar use_ml=true (por defecto TF-IDF)")
+    parser.add_argument('--lambda-timeout-ms', type=int, default=30_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help="Guardar el reporte en JSON")
+    args = parser.parse_args()
+
+    # Antes de importar las apps: su basicConfig(INFO) queda sin efecto y solo se ve el reporte
+    logging.basicConfig(level=logging.WARNING)
+    mix = parse_mix(args.mix)
+
+    # Antes de importar las apps: Bloom y write-behind solo se arman con DynamoDB
+    os.environ['PAIR_STORE_BACKEND'] = args.backend if args.backend in ('memory', 'sqlite') else 'dynamodb'
+    os.environ['PAIR_STORE_SQLITE_PATH'] = args.sqlite_path
+
+    with ExitStack() as stack:
+        if args.backend in ('moto', 'memory', 'sqlite'):
+            from moto import mock_aws
+            os.environ.pop('AWS_ENDPOINT_URL', None)
+            os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+            os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+            os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+            # Los clientes de boto3 deben crearse con el mock activo: las apps se importan después
+            # (con memory/sqlite el mock solo asegura que nada llegue a AWS)
+            stack.enter_context(mock_aws())
+        else:
+            os.environ['AWS_ENDPOINT_URL'] = args.endpoint_url
+
+        print(f"🏁 Backend {args.backend} | mezcla {mix} | {args.concurrency} hilos")
+        from pair_store import build_pair_store
+        store = build_pair_store()
+        seeded_ids = prepare_store(store, args.items, args.seed_pairs)
+        workload = Workload(mix, args.items, seeded_ids, args.use_ml)
+        print(f"📦 {len(seeded_ids)} pares precargados")
+
+        targets = ['flask', 'lambda'] if args.target == 'both' else [args.target]
+        reports = {}
+        for target in targets:
+            send = flask_target(stack, store) if target == 'flask' else lambda_target(args.lambda_timeout_ms, store)
+            reports[target] = run_load(send, workload, args.concurrency, args.duration, args.requests, args.seed)
+            print_report(target, reports[target])
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'reports': reports}, f, indent=2)
+        print(f"\n💾 Reporte guardado en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
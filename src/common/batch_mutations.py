@@ -0,0 +1,198 @@
+"""
+Mutaciones masivas de pares (creación, borrado y actualización en lote)
+Las escrituras van en BatchWriteItem de a 25, en paralelo y reintentando los
+UnprocessedItems; los resultados se devuelven por ítem a medida que terminan
+"""
+
+import time
+import random
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+# Límites de DynamoDB por llamada
+BATCH_WRITE_LIMIT = 25
+BATCH_GET_LIMIT = 100
+
+
+def chunked(items: List[Any], size: int) -> Iterator[List[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+@lru_cache(maxsize=256)
+def _update_expression_for(fields: Tuple[str, ...]) -> Tuple[str, Dict[str, str]]:
+    names = {f"#f{i}": field for i, field in enumerate(fields)}
+    expression = "SET " + ", ".join(f"#f{i} = :v{i}" for i in range(len(fields)))
+    return expression, names
+
+
+def build_update_expression(changes: Dict[str, Any]) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+    """UpdateExpression, ExpressionAttributeNames y ExpressionAttributeValues para changes.
+
+    Los nombres van como placeholders (#f0, #f1...), así que sirven también
+    palabras reservadas como status. La expresión se cachea por conjunto de
+    campos. Los float se convierten a Decimal (DynamoDB no acepta float).
+    """
+    if not changes:
+        raise ValueError("No hay campos para actualizar")
+    if 'id' in changes:
+        raise ValueError("No se puede modificar el id de un par")
+    fields = tuple(sorted(changes))
+    expression, names = _update_expression_for(fields)
+    values = {}
+    for i, field in enumerate(fields):
+        value = changes[field]
+        values[f":v{i}"] = Decimal(str(value)) if isinstance(value, float) else value
+    return expression, names, values
+
+
+def _request_id(request: Dict[str, Any]) -> str:
+    if 'PutRequest' in request:
+        return request['PutRequest']['Item']['id']
+    return request['DeleteRequest']['Key']['id']
+
+
+def _backoff(attempt: int, base_delay: float):
+    time.sleep(base_delay * (2 ** attempt) * (0.5 + random.random()))
+
+
+def write_chunk(dynamodb, table_name: str, requests: List[Dict[str, Any]], action: str,
+                max_retries: int = 5, base_delay: float = 0.05) -> List[Dict[str, Any]]:
+    """Un BatchWriteItem (hasta 25 requests) reintentando los UnprocessedItems con backoff"""
+    ids = [_request_id(r) for r in requests]
+    pending = requests
+    for attempt in range(max_retries + 1):
+        try:
+            response = dynamodb.batch_write_item(RequestItems={table_name: pending})
+        except ClientError as e:
+            logger.error(f"Error en BatchWriteItem de {len(pending)} pares: {e}")
+            failed = {_request_id(r) for r in pending}
+            return [{'pair_id': pair_id, 'result': 'failed', 'error': str(e)} if pair_id in failed
+                    else {'pair_id': pair_id, 'result': action} for pair_id in ids]
+        pending = response.get('UnprocessedItems', {}).get(table_name, [])
+        if not pending:
+            break
+        if attempt < max_retries:
+            _backoff(attempt, base_delay)
+    unprocessed = {_request_id(r) for r in pending}
+    return [{'pair_id': pair_id, 'result': 'failed', 'error': 'UnprocessedItems tras los reintentos'}
+            if pair_id in unprocessed else {'pair_id': pair_id, 'result': action} for pair_id in ids]
+
+
+def run_chunks(chunks: Iterable[List[Any]], work: Callable[[List[Any]], List[Dict[str, Any]]],
+               chunk_ids: Callable[[List[Any]], List[str]], max_workers: int = 4,
+               should_continue: Optional[Callable[[], bool]] = None) -> Iterator[Dict[str, Any]]:
+    """Ejecutar work sobre cada chunk en paralelo y devolver los resultados a medida que terminan.
+
+    Se mantienen a lo sumo 2 * max_workers chunks en curso. Si should_continue
+    devuelve False (p. ej. se acaba el deadline), no se envían más chunks y sus
+    ítems se devuelven con result 'not_attempted'.
+    """
+    chunks = iter(chunks)
+    stopped = False
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='dynamodb-batch') as pool:
+        in_flight = set()
+        while True:
+            while not stopped and len(in_flight) < max_workers * 2:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                if should_continue is not None and not should_continue():
+                    stopped = True
+                    yield from ({'pair_id': pair_id, 'result': 'not_attempted'} for pair_id in chunk_ids(chunk))
+                    break
+                in_flight.add(pool.submit(work, chunk))
+            if not in_flight:
+                break
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+    for chunk in chunks:
+        yield from ({'pair_id': pair_id, 'result': 'not_attempted'} for pair_id in chunk_ids(chunk))
+
+
+def _unique(pair_ids: Iterable[str]) -> List[str]:
+    # BatchWriteItem rechaza el chunk entero si repite una clave
+    return list(dict.fromkeys(pair_ids))
+
+
+def batch_delete(dynamodb, table_name: str, pair_ids: Iterable[str], max_workers: int = 4,
+                 should_continue: Optional[Callable[[], bool]] = None) -> Iterator[Dict[str, Any]]:
+    """Borrar pares por id; un resultado 'deleted', 'failed' o 'not_attempted' por id"""
+    requests = [{'DeleteRequest': {'Key': {'id': pair_id}}} for pair_id in _unique(pair_ids)]
+    return run_chunks(chunked(requests, BATCH_WRITE_LIMIT),
+                      lambda chunk: write_chunk(dynamodb, table_name, chunk, 'deleted'),
+                      lambda chunk: [_request_id(r) for r in chunk], max_workers, should_continue)
+
+
+def batch_put(dynamodb, table_name: str, items: Iterable[Dict[str, Any]], action: str = 'created',
+              max_workers: int = 4, should_continue: Optional[Callable[[], bool]] = None) -> Iterator[Dict[str, Any]]:
+    """Escribir pares completos (si un id se repite, gana el último)"""
+    unique = {item['id']: item for item in items}
+    requests = [{'PutRequest': {'Item': item}} for item in unique.values()]
+    return run_chunks(chunked(requests, BATCH_WRITE_LIMIT),
+                      lambda chunk: write_chunk(dynamodb, table_name, chunk, action),
+                      lambda chunk: [_request_id(r) for r in chunk], max_workers, should_continue)
+
+
+def batch_update(table, pair_ids: Iterable[str], changes: Dict[str, Any], max_workers: int = 4,
+                 should_continue: Optional[Callable[[], bool]] = None) -> Iterator[Dict[str, Any]]:
+    """Aplicar los mismos cambios a muchos pares.
+
+    BatchWriteItem no soporta updates, así que cada par es un UpdateItem (en
+    paralelo, de a chunks de 25) con la expresión armada una sola vez. La
+    condición attribute_exists(id) evita crear pares fantasma: los ids que no
+    existen devuelven 'not_found'.
+    """
+    expression, names, values = build_update_expression(changes)
+
+    def work(chunk):
+        results = []
+        for pair_id in chunk:
+            try:
+                table.update_item(Key={'id': pair_id}, UpdateExpression=expression,
+                                  ConditionExpression='attribute_exists(id)',
+                                  ExpressionAttributeNames=names, ExpressionAttributeValues=values)
+                results.append({'pair_id': pair_id, 'result': 'updated'})
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                    results.append({'pair_id': pair_id, 'result': 'not_found'})
+                else:
+                    results.append({'pair_id': pair_id, 'result': 'failed', 'error': str(e)})
+        return results
+
+    return run_chunks(chunked(_unique(pair_ids), BATCH_WRITE_LIMIT), work, list, max_workers, should_continue)
+
+
+def batch_get(dynamodb, table_name: str, pair_ids: Iterable[str], max_retries: int = 5,
+              base_delay: float = 0.05) -> Dict[str, Dict[str, Any]]:
+    """Leer pares por id con BatchGetItem (de a 100); devuelve {id: item} de los que existen"""
+    found = {}
+    for chunk in chunked(_unique(pair_ids), BATCH_GET_LIMIT):
+        request = {table_name: {'Keys': [{'id': pair_id} for pair_id in chunk]}}
+        for attempt in range(max_retries + 1):
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response.get('Responses', {}).get(table_name, []):
+                found[item['id']] = item
+            request = response.get('UnprocessedKeys') or {}
+            if not request:
+                break
+            if attempt < max_retries:
+                _backoff(attempt, base_delay)
+        else:
+            raise RuntimeError(f"BatchGetItem dejó {len(request[table_name]['Keys'])} claves sin leer")
+    return found
+
+
+def summarize(results: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    summary: Dict[str, int] = {}
+    for result in results:
+        summary[result['result']] = summary.get(result['result'], 0) + 1
+    return summary
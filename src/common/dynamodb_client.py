@@ -0,0 +1,102 @@
+"""
+Fábrica compartida de clientes DynamoDB
+Un único resource por proceso (y endpoint) con pool de conexiones, reintentos
+adaptativos, TCP keepalive y timeouts configurables; los Table se cachean por nombre
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+
+DEFAULT_REGION = os.getenv('AWS_REGION', 'us-east-1')
+
+_lock = threading.Lock()
+_resources: Dict[Tuple[Optional[str], str], Any] = {}
+_tables: Dict[Tuple[Optional[str], str, str], Any] = {}
+_streams: Dict[Tuple[Optional[str], str], Any] = {}
+
+
+def build_config(max_pool_connections: Optional[int] = None) -> Config:
+    """Configuración de botocore para DynamoDB a partir de variables de entorno.
+
+    - DYNAMODB_MAX_POOL_CONNECTIONS: conexiones HTTP reutilizables (botocore usa 10)
+    - DYNAMODB_RETRY_MODE / DYNAMODB_MAX_ATTEMPTS: reintentos (adaptive limita la
+      tasa del cliente cuando DynamoDB responde con throttling)
+    - DYNAMODB_CONNECT_TIMEOUT / DYNAMODB_READ_TIMEOUT: en segundos
+    """
+    return Config(
+        max_pool_connections=max_pool_connections or int(os.getenv('DYNAMODB_MAX_POOL_CONNECTIONS', '50')),
+        retries={
+            'mode': os.getenv('DYNAMODB_RETRY_MODE', 'adaptive'),
+            'max_attempts': int(os.getenv('DYNAMODB_MAX_ATTEMPTS', '5')),
+        },
+        tcp_keepalive=True,
+        connect_timeout=float(os.getenv('DYNAMODB_CONNECT_TIMEOUT', '2')),
+        read_timeout=float(os.getenv('DYNAMODB_READ_TIMEOUT', '5')),
+    )
+
+
+def get_dynamodb(endpoint_url: Optional[str] = None, region_name: Optional[str] = None):
+    """Resource de DynamoDB compartido.
+
+    Si no se pasa endpoint_url se usa AWS_ENDPOINT_URL (DynamoDB Local), en cuyo
+    caso se usan credenciales dummy como en el resto de los scripts locales.
+    """
+    endpoint_url = endpoint_url or os.getenv('AWS_ENDPOINT_URL') or None
+    region_name = region_name or DEFAULT_REGION
+    key = (endpoint_url, region_name)
+    with _lock:
+        resource = _resources.get(key)
+        if resource is None:
+            # Una sesión propia: la sesión por defecto de boto3 no es thread-safe
+            session = boto3.session.Session()
+            kwargs = {'region_name': region_name, 'config': build_config()}
+            if endpoint_url:
+                # Para desarrollo local con DynamoDB local
+                kwargs.update(endpoint_url=endpoint_url, aws_access_key_id='dummy',
+                              aws_secret_access_key='dummy')
+            resource = session.resource('dynamodb', **kwargs)
+            _resources[key] = resource
+        return resource
+
+
+def get_table(name: str, endpoint_url: Optional[str] = None, region_name: Optional[str] = None):
+    """Table cacheado: se construye una vez por proceso en lugar de en cada request"""
+    endpoint_url = endpoint_url or os.getenv('AWS_ENDPOINT_URL') or None
+    region_name = region_name or DEFAULT_REGION
+    key = (endpoint_url, region_name, name)
+    table = _tables.get(key)
+    if table is None:
+        table = get_dynamodb(endpoint_url, region_name).Table(name)
+        with _lock:
+            table = _tables.setdefault(key, table)
+    return table
+
+
+def get_streams_client(endpoint_url: Optional[str] = None, region_name: Optional[str] = None):
+    """Cliente de DynamoDB Streams compartido, con la misma configuración que get_dynamodb"""
+    endpoint_url = endpoint_url or os.getenv('AWS_ENDPOINT_URL') or None
+    region_name = region_name or DEFAULT_REGION
+    key = (endpoint_url, region_name)
+    with _lock:
+        client = _streams.get(key)
+        if client is None:
+            session = boto3.session.Session()
+            kwargs = {'region_name': region_name, 'config': build_config()}
+            if endpoint_url:
+                kwargs.update(endpoint_url=endpoint_url, aws_access_key_id='dummy',
+                              aws_secret_access_key='dummy')
+            client = session.client('dynamodbstreams', **kwargs)
+            _streams[key] = client
+        return client
+
+
+def reset_clients():
+    """Descartar resources, tablas y clientes cacheados (tests o cambio de credenciales)"""
+    with _lock:
+        _resources.clear()
+        _tables.clear()
+        _streams.clear()
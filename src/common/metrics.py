@@ -0,0 +1,220 @@
+"""
+Métricas de latencia y uso de las APIs (Flask y Lambda)
+Histogramas por ruta y por etapa, contadores (scorer usado, fallbacks de ML,
+capacidad consumida de DynamoDB). Flask los expone en /metrics con formato
+Prometheus; Lambda los emite por invocación como logs EMF de CloudWatch
+"""
+
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Buckets (segundos) de los histogramas de latencia
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Operaciones de DynamoDB que aceptan ReturnConsumedCapacity
+_CAPACITY_OPERATIONS = {'GetItem', 'PutItem', 'UpdateItem', 'DeleteItem', 'Query', 'Scan',
+                        'BatchGetItem', 'BatchWriteItem', 'TransactGetItems', 'TransactWriteItems'}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Histogram:
+    __slots__ = ('counts', 'sum', 'count', 'raw')
+
+    def __init__(self, n_buckets: int):
+        self.counts = [0] * n_buckets
+        self.sum = 0.0
+        self.count = 0
+        self.raw: List[float] = []
+
+
+class MetricsRegistry:
+    """Registro de contadores e histogramas con labels, seguro entre hilos.
+
+    Con keep_raw=True guarda además las observaciones crudas desde el último
+    flush_emf (Lambda emite los valores de cada invocación).
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, keep_raw: bool = False):
+        self.buckets = tuple(buckets)
+        self.keep_raw = keep_raw
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = _Histogram(len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    hist.counts[i] += 1
+                    break
+            hist.sum += seconds
+            hist.count += 1
+            if self.keep_raw:
+                hist.raw.append(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def stage_observer(self, stage: str, seconds: float):
+        """Callback (etapa, segundos) para módulos que no dependen de este registro"""
+        self.observe('stage_duration_seconds', seconds, stage=stage)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    @staticmethod
+    def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(key) + ([extra] if extra else [])
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+    def render_prometheus(self) -> str:
+        """Formato de exposición de texto de Prometheus (versión 0.0.4)"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{self._format_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._format_labels(key, ('le', f'{bound:g}'))} {cumulative}")
+                    lines.append(f"{name}_bucket{self._format_labels(key, ('le', '+Inf'))} {hist.count}")
+                    lines.append(f"{name}_sum{self._format_labels(key)} {hist.sum:.6f}")
+                    lines.append(f"{name}_count{self._format_labels(key)} {hist.count}")
+        return '\n'.join(lines) + '\n'
+
+    def flush_emf(self, namespace: str, dimensions: Dict[str, str]) -> Dict[str, Any]:
+        """Registro EMF (Embedded Metric Format) con lo observado desde el último flush.
+
+        Cada serie se convierte en una métrica cuyo nombre incluye sus labels
+        (p. ej. stage_duration_seconds con stage=featurize -> stage_featurize_ms):
+        las latencias van en milisegundos como lista de valores y los contadores
+        sumados. Después del flush el registro queda vacío.
+        """
+        values: Dict[str, Any] = {}
+        definitions = []
+        with self._lock:
+            for name, series in self._histograms.items():
+                for key, hist in series.items():
+                    metric = self._emf_name(name, key, suffix='_ms')
+                    observations = hist.raw if self.keep_raw else [hist.sum / hist.count]
+                    values[metric] = [round(v * 1000, 3) for v in observations]
+                    definitions.append({'Name': metric, 'Unit': 'Milliseconds'})
+            for name, series in self._counters.items():
+                for key, value in series.items():
+                    metric = self._emf_name(name, key)
+                    values[metric] = value
+                    definitions.append({'Name': metric, 'Unit': 'Count'})
+            self._counters.clear()
+            self._histograms.clear()
+        return {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': namespace,
+                    'Dimensions': [sorted(dimensions)],
+                    'Metrics': definitions,
+                }],
+            },
+            **dimensions,
+            **values,
+        }
+
+    @staticmethod
+    def _emf_name(name: str, key: LabelKey, suffix: str = '') -> str:
+        base = name
+        for unit in ('_seconds', '_total'):
+            if base.endswith(unit):
+                base = base[:-len(unit)]
+        if base == 'stage_duration':
+            base = 'stage'
+        parts = [base] + [v for _, v in key]
+        return '_'.join(parts) + suffix
+
+
+def instrument_dynamodb(client, registry: MetricsRegistry):
+    """Medir cada llamada del cliente de DynamoDB y su capacidad consumida.
+
+    Agrega ReturnConsumedCapacity=TOTAL a las operaciones que lo aceptan (si
+    la llamada no lo pide) y registra la duración como etapa dynamodb_<op>.
+    """
+    events = client.meta.events
+
+    def add_capacity(params, model, **kwargs):
+        if model.name in _CAPACITY_OPERATIONS:
+            params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+    def before_call(context, **kwargs):
+        context['metrics_start'] = time.perf_counter()
+
+    def after_call(parsed, model, context, **kwargs):
+        start = context.get('metrics_start')
+        if start is not None:
+            registry.observe('stage_duration_seconds', time.perf_counter() - start, stage=f'dynamodb_{model.name}')
+        consumed = parsed.get('ConsumedCapacity') if isinstance(parsed, dict) else None
+        for entry in consumed if isinstance(consumed, list) else [consumed] if consumed else []:
+            registry.inc('dynamodb_consumed_capacity_units_total', float(entry.get('CapacityUnits', 0.0)),
+                         table=entry.get('TableName', ''), operation=model.name)
+
+    # before-parameter-build recibe los parámetros finales (el resource de boto3
+    # los copia en provide-client-params)
+    events.register('before-parameter-build.dynamodb', add_capacity, unique_id='metrics-capacity')
+    events.register('before-call.dynamodb', before_call, unique_id='metrics-before-call')
+    events.register('after-call.dynamodb', after_call, unique_id='metrics-after-call')
+
+
+def emit_emf(record: Dict[str, Any]):
+    """Escribir el registro EMF en stdout: CloudWatch lo convierte en métricas"""
+    print(json.dumps(record, separators=(',', ':')), flush=True)
+
+
+def describe_default_metrics(registry: MetricsRegistry):
+    registry.describe('http_request_duration_seconds', 'Latencia de las requests por ruta, método y status')
+    registry.describe('stage_duration_seconds', 'Latencia por etapa (json_parse, featurize, scale, predict_proba, dynamodb_*)')
+    registry.describe('similarity_scorer_total', 'Requests de similitud por scorer usado')
+    registry.describe('ml_fallback_total', 'Veces que ML falló y se usó el fallback TF-IDF')
+    registry.describe('dynamodb_consumed_capacity_units_total', 'Capacidad consumida de DynamoDB por tabla y operación')
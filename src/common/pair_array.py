@@ -0,0 +1,429 @@
+"""
+Arreglo compacto de pares para jobs batch (carga inicial, procesamiento de
+CSVs, evaluación de modelos). Guarda los pares por columnas en arrays de NumPy
+en lugar de listas de dicts: los dos ids van empaquetados en un entero de 64
+bits, los títulos se internan en una tabla de strings y los scores, etiquetas
+y estados son arrays tipados, por lo que filtrar y serializar es vectorizado
+"""
+
+import logging
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bits por id en la clave empaquetada (item_a en la parte alta, item_b en la baja)
+ID_BITS = 32
+MAX_ITEM_ID = (1 << ID_BITS) - 1
+_LOW_MASK = np.uint64(MAX_ITEM_ID)
+
+# Etiqueta de los pares sin is_similar conocido
+UNKNOWN_LABEL = -1
+
+# Código de estado de los pares sin estado
+NO_STATUS = -1
+
+# Columnas aceptadas en los CSVs y DataFrames (formato del dataset o de la tabla)
+_ID_COLUMNS = (('ITEM_A', 'ITEM_B'), ('item_a_id', 'item_b_id'))
+_TITLE_COLUMNS = (('TITLE_A', 'TITLE_B'), ('item_a_title', 'item_b_title'))
+_LABEL_COLUMNS = ('is_similar', 'IS_SIMILAR')
+
+_FORMAT_VERSION = 1
+
+
+def pack_pair_keys(item_a_ids: Sequence[int], item_b_ids: Sequence[int]) -> np.ndarray:
+    """Empaquetar dos columnas de ids de 32 bits en claves uint64"""
+    item_a = np.asarray(item_a_ids, dtype=np.int64)
+    item_b = np.asarray(item_b_ids, dtype=np.int64)
+    for ids in (item_a, item_b):
+        if ids.size and (ids.min() < 0 or ids.max() > MAX_ITEM_ID):
+            raise ValueError(f"Los ids de ítems deben estar entre 0 y {MAX_ITEM_ID}")
+    return (item_a.astype(np.uint64) << np.uint64(ID_BITS)) | item_b.astype(np.uint64)
+
+
+def unpack_pair_keys(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Separar claves uint64 en (item_a_ids, item_b_ids)"""
+    keys = np.asarray(keys, dtype=np.uint64)
+    return (keys >> np.uint64(ID_BITS)).astype(np.int64), (keys & _LOW_MASK).astype(np.int64)
+
+
+def _first_present(columns, candidates) -> Optional[Any]:
+    """Primer candidato (columna o par de columnas) presente en columns"""
+    columns = set(columns)
+    for candidate in candidates:
+        if set((candidate,) if isinstance(candidate, str) else candidate) <= columns:
+            return candidate
+    return None
+
+
+class StringTable:
+    """Tabla de strings internados: un blob UTF-8 y un array de offsets.
+
+    Cada título distinto se guarda una sola vez y los pares lo referencian con
+    un código int32. Los strings se decodifican del blob al leerlos.
+    """
+
+    def __init__(self, blob: bytes = b'', offsets: Optional[np.ndarray] = None):
+        self._blob = bytearray(blob)
+        self._offsets = array('q', [0] if offsets is None else np.asarray(offsets, dtype=np.int64).tolist())
+        self._codes: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, code: int) -> str:
+        return self._blob[self._offsets[code]:self._offsets[code + 1]].decode('utf-8')
+
+    def _index(self) -> Dict[str, int]:
+        # El índice string -> código se arma recién al internar (no al cargar)
+        if self._codes is None:
+            self._codes = {self[code]: code for code in range(len(self))}
+        return self._codes
+
+    def intern(self, value: str) -> int:
+        """Código de un string, agregándolo a la tabla si es nuevo"""
+        codes = self._index()
+        code = codes.get(value)
+        if code is None:
+            code = len(self)
+            self._blob += value.encode('utf-8')
+            self._offsets.append(len(self._blob))
+            codes[value] = code
+        return code
+
+    def intern_many(self, values: Iterable[str]) -> np.ndarray:
+        """Códigos int32 de una secuencia de strings"""
+        intern = self.intern
+        return np.fromiter((intern(value) for value in values), dtype=np.int32)
+
+    def code_of(self, value: str) -> int:
+        """Código de un string existente, o -1"""
+        return self._index().get(value, -1)
+
+    def decode(self, codes: np.ndarray) -> List[str]:
+        """Strings de un array de códigos, decodificando cada código distinto una vez"""
+        codes = np.asarray(codes)
+        if codes.size == 0:
+            return []
+        unique, inverse = np.unique(codes, return_inverse=True)
+        strings = [self[int(code)] for code in unique]
+        return [strings[index] for index in inverse]
+
+    def remap(self, other: 'StringTable', codes: np.ndarray) -> np.ndarray:
+        """Traducir códigos de otra tabla a códigos de esta"""
+        codes = np.asarray(codes)
+        if codes.size == 0:
+            return codes.astype(np.int32)
+        unique, inverse = np.unique(codes, return_inverse=True)
+        translated = np.array([self.intern(other[int(code)]) for code in unique], dtype=np.int32)
+        return translated[inverse]
+
+    def to_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        return np.frombuffer(bytes(self._blob), dtype=np.uint8), np.frombuffer(self._offsets, dtype=np.int64).copy()
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._blob) + self._offsets.itemsize * len(self._offsets)
+
+
+class PairArray:
+    """Pares por columnas: claves empaquetadas, títulos internados y arrays tipados.
+
+    - keys: uint64 con item_a_id en los 32 bits altos e item_b_id en los bajos
+    - title_a / title_b: códigos int32 en la tabla compartida titles
+    - scores: float32, NaN para pares sin score
+    - labels: int8 con is_similar (UNKNOWN_LABEL si no se conoce)
+    - status: int8 con códigos en la tabla statuses (NO_STATUS si no tiene)
+    - columns: columnas numéricas o booleanas adicionales, por nombre
+    - errors: mensajes de error por fila (disperso; la mayoría de las filas no tiene)
+
+    Un PairArray también se puede recorrer como secuencia de dicts (iter,
+    len, índice entero), por lo que sirve donde antes se pasaba una lista de
+    pares.
+    """
+
+    def __init__(self, keys: np.ndarray, title_a: np.ndarray, title_b: np.ndarray,
+                 titles: Optional[StringTable] = None, scores: Optional[np.ndarray] = None,
+                 labels: Optional[np.ndarray] = None, status: Optional[np.ndarray] = None,
+                 statuses: Optional[StringTable] = None, columns: Optional[Dict[str, np.ndarray]] = None,
+                 errors: Optional[Dict[int, str]] = None):
+        size = len(keys)
+        self.keys = np.asarray(keys, dtype=np.uint64)
+        self.title_a = np.asarray(title_a, dtype=np.int32)
+        self.title_b = np.asarray(title_b, dtype=np.int32)
+        self.titles = titles if titles is not None else StringTable()
+        self.scores = np.full(size, np.nan, dtype=np.float32) if scores is None else np.asarray(scores, dtype=np.float32)
+        self.labels = np.full(size, UNKNOWN_LABEL, dtype=np.int8) if labels is None else np.asarray(labels, dtype=np.int8)
+        self.status = np.full(size, NO_STATUS, dtype=np.int8) if status is None else np.asarray(status, dtype=np.int8)
+        self.statuses = statuses if statuses is not None else StringTable()
+        self.columns = dict(columns or {})
+        self.errors = dict(errors or {})
+        for name, values in [('title_a', self.title_a), ('title_b', self.title_b), ('scores', self.scores),
+                             ('labels', self.labels), ('status', self.status), *self.columns.items()]:
+            if len(values) != size:
+                raise ValueError(f"La columna {name} tiene {len(values)} filas y se esperaban {size}")
+
+    # --- Construcción ---
+
+    @classmethod
+    def from_columns(cls, item_a_ids: Sequence[int], item_b_ids: Sequence[int],
+                     titles_a: Sequence[str], titles_b: Sequence[str],
+                     labels: Optional[Sequence[int]] = None,
+                     titles: Optional[StringTable] = None) -> 'PairArray':
+        """Construir desde columnas de ids y títulos"""
+        titles = titles if titles is not None else StringTable()
+        return cls(pack_pair_keys(item_a_ids, item_b_ids), titles.intern_many(titles_a),
+                   titles.intern_many(titles_b), titles=titles, labels=labels)
+
+    @classmethod
+    def from_records(cls, records: Sequence[Dict[str, Any]]) -> 'PairArray':
+        """Construir desde una lista de dicts con la forma de item_pairs o del CSV de entrenamiento"""
+        pairs = cls.from_columns(
+            [int(record.get('item_a_id', 0) or 0) for record in records],
+            [int(record.get('item_b_id', 0) or 0) for record in records],
+            [str(record.get('item_a_title', '')) for record in records],
+            [str(record.get('item_b_title', '')) for record in records],
+            labels=[int(record.get('is_similar', UNKNOWN_LABEL)) for record in records],
+        )
+        for row, record in enumerate(records):
+            if record.get('similarity_score') is not None:
+                pairs.scores[row] = float(record['similarity_score'])
+            if record.get('status') is not None:
+                pairs.status[row] = pairs.statuses.intern(str(record['status']))
+        return pairs
+
+    @classmethod
+    def _frame_columns(cls, frame, titles: StringTable) -> Tuple[np.ndarray, ...]:
+        """(keys, title_a, title_b, labels) de un DataFrame, internando los títulos en titles"""
+        id_columns = _first_present(frame.columns, _ID_COLUMNS)
+        title_columns = _first_present(frame.columns, _TITLE_COLUMNS)
+        if title_columns is None:
+            raise ValueError("El DataFrame no tiene columnas de títulos (TITLE_A/TITLE_B o item_a_title/item_b_title)")
+        if id_columns is None:
+            keys = np.zeros(len(frame), dtype=np.uint64)
+        else:
+            keys = pack_pair_keys(frame[id_columns[0]].to_numpy(dtype=np.int64),
+                                  frame[id_columns[1]].to_numpy(dtype=np.int64))
+        title_a = titles.intern_many(frame[title_columns[0]].fillna('').astype(str).str.strip())
+        title_b = titles.intern_many(frame[title_columns[1]].fillna('').astype(str).str.strip())
+        label_column = _first_present(frame.columns, _LABEL_COLUMNS)
+        if label_column is None:
+            labels = np.full(len(frame), UNKNOWN_LABEL, dtype=np.int8)
+        else:
+            import pandas as pd
+
+            # from_csv lee sin NaN por defecto: una etiqueta vacía llega como '' y queda sin conocer
+            labels = pd.to_numeric(frame[label_column], errors='coerce').fillna(UNKNOWN_LABEL).astype(np.int8).to_numpy()
+        return keys, title_a, title_b, labels
+
+    @classmethod
+    def from_frame(cls, frame) -> 'PairArray':
+        """Construir desde un DataFrame (títulos con strip; ids 0 si no hay columnas de ids)"""
+        titles = StringTable()
+        keys, title_a, title_b, labels = cls._frame_columns(frame, titles)
+        return cls(keys, title_a, title_b, titles=titles, labels=labels)
+
+    @classmethod
+    def from_csv(cls, csv_path: str, chunksize: int = 100_000) -> 'PairArray':
+        """Leer un CSV por bloques con una única tabla de títulos"""
+        import pandas as pd
+
+        titles = StringTable()
+        parts = []
+        reader = pd.read_csv(csv_path, chunksize=chunksize, keep_default_na=False,
+                             dtype={column: str for pair in _TITLE_COLUMNS for column in pair})
+        for chunk in reader:
+            parts.append(cls._frame_columns(chunk, titles))
+        if not parts:
+            return cls(np.zeros(0, dtype=np.uint64), np.zeros(0), np.zeros(0), titles=titles)
+        keys, title_a, title_b, labels = (np.concatenate(column) for column in zip(*parts))
+        logger.info(f"Cargados {len(keys)} pares desde {csv_path} ({len(titles)} títulos distintos)")
+        return cls(keys, title_a, title_b, titles=titles, labels=labels)
+
+    @classmethod
+    def concat(cls, arrays: Sequence['PairArray']) -> 'PairArray':
+        """Unir varios PairArray; los códigos de títulos y estados se traducen a tablas nuevas"""
+        titles, statuses = StringTable(), StringTable()
+        names = sorted({name for pairs in arrays for name in pairs.columns})
+        columns = {name: [] for name in names}
+        parts = {'keys': [], 'title_a': [], 'title_b': [], 'scores': [], 'labels': [], 'status': []}
+        errors, offset = {}, 0
+        for pairs in arrays:
+            parts['keys'].append(pairs.keys)
+            parts['title_a'].append(titles.remap(pairs.titles, pairs.title_a))
+            parts['title_b'].append(titles.remap(pairs.titles, pairs.title_b))
+            parts['scores'].append(pairs.scores)
+            parts['labels'].append(pairs.labels)
+            status = pairs.status.copy()
+            has_status = status != NO_STATUS
+            status[has_status] = statuses.remap(pairs.statuses, status[has_status])
+            parts['status'].append(status)
+            for name in names:
+                if name not in pairs.columns:
+                    raise ValueError(f"Falta la columna {name} en uno de los arreglos")
+                columns[name].append(pairs.columns[name])
+            errors.update({offset + row: message for row, message in pairs.errors.items()})
+            offset += len(pairs)
+        merged = {name: np.concatenate(values) if values else np.zeros(0) for name, values in parts.items()}
+        return cls(merged['keys'], merged['title_a'], merged['title_b'], titles=titles,
+                   scores=merged['scores'], labels=merged['labels'], status=merged['status'],
+                   statuses=statuses, columns={name: np.concatenate(values) for name, values in columns.items()},
+                   errors=errors)
+
+    # --- Acceso ---
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def item_a_ids(self) -> np.ndarray:
+        return unpack_pair_keys(self.keys)[0]
+
+    @property
+    def item_b_ids(self) -> np.ndarray:
+        return unpack_pair_keys(self.keys)[1]
+
+    def pair_ids(self) -> List[str]:
+        """Ids de par con el formato de generate_pair_id (menor_mayor)"""
+        item_a, item_b = unpack_pair_keys(self.keys)
+        low, high = np.minimum(item_a, item_b), np.maximum(item_a, item_b)
+        return [f"{a}_{b}" for a, b in zip(low.tolist(), high.tolist())]
+
+    def title_columns(self) -> Tuple[List[str], List[str]]:
+        """Títulos decodificados (item_a_title, item_b_title) como listas"""
+        return self.titles.decode(self.title_a), self.titles.decode(self.title_b)
+
+    def valid_titles(self) -> np.ndarray:
+        """Máscara de pares con ambos títulos no vacíos"""
+        empty = self.titles.code_of('')
+        return (self.title_a != empty) & (self.title_b != empty)
+
+    def set_status(self, rows, value: str):
+        """Asignar un estado a una fila, máscara o array de filas"""
+        self.status[rows] = self.statuses.intern(value)
+
+    def status_mask(self, value: str) -> np.ndarray:
+        code = self.statuses.code_of(value)
+        return self.status == code if code != -1 else np.zeros(len(self), dtype=bool)
+
+    def set_error(self, row: int, message: str):
+        self.errors[int(row)] = message
+
+    def error_mask(self) -> np.ndarray:
+        mask = np.zeros(len(self), dtype=bool)
+        mask[list(self.errors)] = True
+        return mask
+
+    def record(self, row: int) -> Dict[str, Any]:
+        """Fila como dict con la forma de item_pairs (solo los campos presentes)"""
+        if row < 0:
+            row += len(self)
+        key = int(self.keys[row])
+        record = {
+            'item_a_id': key >> ID_BITS,
+            'item_a_title': self.titles[int(self.title_a[row])],
+            'item_b_id': key & MAX_ITEM_ID,
+            'item_b_title': self.titles[int(self.title_b[row])],
+        }
+        if self.labels[row] != UNKNOWN_LABEL:
+            record['is_similar'] = int(self.labels[row])
+        if not np.isnan(self.scores[row]):
+            # str() de un float32 da el decimal más corto (0.8 y no 0.800000011920929)
+            record['similarity_score'] = float(str(self.scores[row]))
+        if self.status[row] != NO_STATUS:
+            record['status'] = self.statuses[int(self.status[row])]
+        for name, values in self.columns.items():
+            value = values[row].item()
+            record[name] = value.isoformat() if hasattr(value, 'isoformat') else value
+        if row in self.errors:
+            record['error'] = self.errors[row]
+        return record
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.record(int(index))
+        return self.select(index)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self.iter_records()
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        for row in range(len(self)):
+            yield self.record(row)
+
+    def select(self, index) -> 'PairArray':
+        """Subconjunto por máscara booleana, slice o array de filas (comparte las tablas de strings)"""
+        rows = np.arange(len(self))[index]
+        errors = {}
+        if self.errors:
+            positions = np.full(len(self), -1, dtype=np.int64)
+            positions[rows] = np.arange(len(rows))
+            errors = {int(positions[row]): message for row, message in self.errors.items() if positions[row] >= 0}
+        return PairArray(
+            self.keys[rows], self.title_a[rows], self.title_b[rows], titles=self.titles,
+            scores=self.scores[rows], labels=self.labels[rows], status=self.status[rows],
+            statuses=self.statuses, columns={name: values[rows] for name, values in self.columns.items()},
+            errors=errors,
+        )
+
+    filter = select
+
+    def to_frame(self):
+        """DataFrame con una columna por campo (títulos decodificados)"""
+        import pandas as pd
+
+        title_a, title_b = self.title_columns()
+        data = {'item_a_id': self.item_a_ids, 'item_a_title': title_a,
+                'item_b_id': self.item_b_ids, 'item_b_title': title_b}
+        if (self.labels != UNKNOWN_LABEL).any():
+            data['is_similar'] = self.labels
+        if not np.isnan(self.scores).all():
+            data['similarity_score'] = self.scores
+        if (self.status != NO_STATUS).any():
+            data['status'] = [self.statuses[int(code)] if code != NO_STATUS else None for code in self.status]
+        data.update(self.columns)
+        if self.errors:
+            data['error'] = [self.errors.get(row) for row in range(len(self))]
+        return pd.DataFrame(data)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes usados por las columnas y las tablas de strings"""
+        arrays = [self.keys, self.title_a, self.title_b, self.scores, self.labels, self.status, *self.columns.values()]
+        errors = sum(len(message) for message in self.errors.values())
+        return sum(array.nbytes for array in arrays) + self.titles.nbytes + self.statuses.nbytes + errors
+
+    # --- Serialización ---
+
+    def save(self, path: str):
+        """Guardar en un .npz (arrays sin pickle; se carga con PairArray.load)"""
+        title_blob, title_offsets = self.titles.to_arrays()
+        status_blob, status_offsets = self.statuses.to_arrays()
+        error_table = StringTable()
+        error_rows = np.fromiter(self.errors, dtype=np.int64, count=len(self.errors))
+        error_codes = error_table.intern_many(self.errors.values())
+        error_blob, error_offsets = error_table.to_arrays()
+        np.savez(path, version=np.int64(_FORMAT_VERSION), keys=self.keys, title_a=self.title_a,
+                 title_b=self.title_b, title_blob=title_blob, title_offsets=title_offsets,
+                 scores=self.scores, labels=self.labels, status=self.status, status_blob=status_blob,
+                 status_offsets=status_offsets, error_rows=error_rows, error_codes=error_codes,
+                 error_blob=error_blob, error_offsets=error_offsets,
+                 **{f"column_{name}": values for name, values in self.columns.items()})
+
+    @classmethod
+    def load(cls, path: str) -> 'PairArray':
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['version']) != _FORMAT_VERSION:
+                raise ValueError(f"Versión de PairArray no soportada: {int(data['version'])}")
+            errors_table = StringTable(data['error_blob'].tobytes(), data['error_offsets'])
+            return cls(
+                data['keys'], data['title_a'], data['title_b'],
+                titles=StringTable(data['title_blob'].tobytes(), data['title_offsets']),
+                scores=data['scores'], labels=data['labels'], status=data['status'],
+                statuses=StringTable(data['status_blob'].tobytes(), data['status_offsets']),
+                columns={name[len('column_'):]: data[name] for name in data.files if name.startswith('column_')},
+                errors={int(row): errors_table[int(code)]
+                        for row, code in zip(data['error_rows'], data['error_codes'])},
+            )
@@ -0,0 +1,346 @@
+"""
+Filtro de Bloom de ids de pares conocidos (generate_pair_id)
+Permite responder "el par seguro no existe" sin leer DynamoDB. Se construye
+con un scan de la tabla o se carga de un snapshot binario compacto, y se
+mantiene al día con el registro de cambios del repositorio
+"""
+
+import os
+import math
+import time
+import struct
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+from pair_store import ChangeFeedGap
+
+logger = logging.getLogger(__name__)
+
+# Cabecera del snapshot: magic, versión, bits, hashes, ids, capacidad, tasa FP, timestamp
+_HEADER = struct.Struct('<4sBQIQQdd')
+_MAGIC = b'PBF1'
+_VERSION = 1
+
+# Cada cuánto el índice lee el registro de cambios, y antigüedad máxima de la
+# última lectura para confiar en los negativos del filtro
+DEFAULT_SYNC_SECONDS = 30.0
+DEFAULT_MAX_STALENESS_SECONDS = 120.0
+
+# Margen al pedir los cambios desde el snapshot (relojes desfasados entre
+# el que construyó el snapshot y los escritores)
+SYNC_OVERLAP_SECONDS = 30.0
+
+
+class PairBloomFilter:
+    """Filtro de Bloom con doble hashing sobre blake2b.
+
+    Los bits y la cantidad de hashes se calculan a partir de la capacidad
+    esperada y la tasa de falsos positivos: con más ids que la capacidad, la
+    tasa real de falsos positivos crece (ver is_saturated).
+    """
+
+    def __init__(self, capacity: int, false_positive_rate: float = 0.01):
+        if not 0 < false_positive_rate < 1:
+            raise ValueError("false_positive_rate debe estar entre 0 y 1")
+        self.capacity = max(1, int(capacity))
+        self.false_positive_rate = false_positive_rate
+        self.num_bits = max(8, math.ceil(-self.capacity * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+        self.built_at = time.time()
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    @property
+    def is_saturated(self) -> bool:
+        return self.count > self.capacity
+
+    @classmethod
+    def from_ids(cls, ids: Iterable[str], false_positive_rate: float = 0.01,
+                 capacity: Optional[int] = None, headroom: float = 2.0) -> 'PairBloomFilter':
+        """Construir el filtro a partir de ids, dejando margen para escrituras futuras.
+
+        built_at es la hora de antes de recorrer ids: lo escrito durante el
+        recorrido puede faltar y se trae del registro de cambios.
+        """
+        started = time.time()
+        ids = list(ids)
+        bloom = cls(capacity or max(1000, int(len(ids) * headroom)), false_positive_rate)
+        bloom.built_at = started
+        for pair_id in ids:
+            bloom.add(pair_id)
+        return bloom
+
+    def to_bytes(self) -> bytes:
+        header = _HEADER.pack(_MAGIC, _VERSION, self.num_bits, self.num_hashes, self.count,
+                              self.capacity, self.false_positive_rate, self.built_at)
+        return header + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'PairBloomFilter':
+        magic, version, num_bits, num_hashes, count, capacity, fp_rate, built_at = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Snapshot de filtro de Bloom inválido")
+        bloom = cls.__new__(cls)
+        bloom.capacity, bloom.false_positive_rate = capacity, fp_rate
+        bloom.num_bits, bloom.num_hashes, bloom.count, bloom.built_at = num_bits, num_hashes, count, built_at
+        bloom.bits = bytearray(data[_HEADER.size:])
+        if len(bloom.bits) != (num_bits + 7) // 8:
+            raise ValueError("Snapshot de filtro de Bloom truncado")
+        return bloom
+
+    def save(self, path: str):
+        """Guardar el snapshot de forma atómica"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self.to_bytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'PairBloomFilter':
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+
+def scan_pair_ids(table) -> Iterable[str]:
+    """Recorrer todos los ids de la tabla de pares (scan paginado, solo la clave)"""
+    kwargs = {'ProjectionExpression': 'id'}
+    while True:
+        response = table.scan(**kwargs)
+        for item in response.get('Items', []):
+            yield item['id']
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def build_from_table(table, false_positive_rate: float = 0.01) -> PairBloomFilter:
+    """Construir el filtro con un scan completo de la tabla"""
+    start = time.perf_counter()
+    bloom = PairBloomFilter.from_ids(scan_pair_ids(table), false_positive_rate)
+    logger.info(f"Filtro de Bloom construido con {bloom.count} pares en {time.perf_counter() - start:.2f}s "
+                f"({len(bloom.bits) / 1024:.1f} KB)")
+    return bloom
+
+
+class KnownPairIndex:
+    """Índice de pares conocidos que usan las APIs antes de leer DynamoDB.
+
+    might_exist devuelve True salvo que el filtro asegure que el par no existe.
+    Además del snapshot y de las escrituras de este proceso, el filtro sigue el
+    registro de cambios del repositorio (change_feed), que trae lo escrito por
+    todos los procesos (otros workers, contenedores Lambda, scripts de carga):
+
+    - follow(since) abre el registro desde la hora del snapshot, con un margen
+      de overlap_seconds por relojes desfasados. Si el registro ya no retiene
+      esos cambios (snapshot más viejo que la retención), ChangeFeedGap
+    - cada sync_seconds, en el camino de una consulta, se leen los cambios nuevos
+    - la lectura solo se omite si la última lectura del registro tiene menos
+      de max_staleness_seconds: un par creado por otro proceso dentro de esa
+      ventana puede dar un falso negativo (la misma cota que la réplica)
+
+    Sin registro (no se pudo abrir, o no hay lugar para leer el stream) el
+    filtro solo cuenta los negativos que habría usado (would_skip) y se
+    reintenta en el próximo sync.
+    """
+
+    def __init__(self, bloom: Optional[PairBloomFilter] = None, source=None,
+                 sync_seconds: float = DEFAULT_SYNC_SECONDS,
+                 max_staleness_seconds: float = DEFAULT_MAX_STALENESS_SECONDS,
+                 overlap_seconds: float = SYNC_OVERLAP_SECONDS):
+        self.bloom = bloom
+        self.source = source
+        self.sync_seconds = sync_seconds
+        self.max_staleness_seconds = max_staleness_seconds
+        self.overlap_seconds = overlap_seconds
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._feed = None
+        # Hora (epoch) hasta la que el filtro tiene todos los pares (None = no sigue el registro)
+        self._synced_until: Optional[float] = None
+        # Última lectura exitosa del registro y último intento (monotonic)
+        self._synced_at: Optional[float] = None
+        self._attempted_at: Optional[float] = None
+        self.skipped_reads = 0
+        self.would_skip = 0
+        self.checks = 0
+        self.sync_errors = 0
+
+    @property
+    def synced(self) -> bool:
+        return self._synced_at is not None
+
+    def staleness_seconds(self) -> Optional[float]:
+        return None if self._synced_at is None else time.monotonic() - self._synced_at
+
+    @property
+    def usable(self) -> bool:
+        if self.bloom is None or self.bloom.is_saturated:
+            return False
+        staleness = self.staleness_seconds()
+        return staleness is not None and staleness <= self.max_staleness_seconds
+
+    def follow(self, since: float) -> int:
+        """Seguir el registro de cambios sabiendo que el filtro tiene todos los pares escritos hasta since (epoch).
+
+        Devuelve cuántos pares nuevos trajo la primera lectura.
+        """
+        self._close_feed()
+        self._synced_until = since
+        return self.sync()
+
+    def sync(self) -> int:
+        """Agregar al filtro los pares escritos desde la última lectura del registro; devuelve cuántos"""
+        if self.bloom is None or self.source is None or self._synced_until is None:
+            return 0
+        started_epoch = time.time()
+        self._attempted_at = started = time.monotonic()
+        opening = self._feed is None
+        try:
+            if opening:
+                self._feed = self.source.change_feed(since=self._synced_until - self.overlap_seconds)
+            changes = self._feed.poll()
+        except ChangeFeedGap:
+            self._close_feed()
+            if opening:
+                # El registro ya no cubre lo que le falta al filtro: no hay forma de ponerse al día
+                self._synced_until = None
+            raise
+        added = 0
+        for pair_id, item in changes:
+            if item is not None and pair_id not in self.bloom:
+                self.add(pair_id)
+                added += 1
+        self._synced_until = started_epoch
+        self._synced_at = started
+        return added
+
+    def _close_feed(self):
+        if self._feed is not None:
+            self._feed.close()
+            self._feed = None
+
+    def _sync_if_due(self):
+        if self._synced_until is None or not self.sync_seconds:
+            return
+        if self._attempted_at is not None and time.monotonic() - self._attempted_at < self.sync_seconds:
+            return
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self.sync()
+        except Exception as e:
+            # Las escrituras por la API ya están en el filtro; si se pasa la cota, no se omiten lecturas
+            self.sync_errors += 1
+            logger.warning(f"No se pudo leer el registro de cambios para el filtro de Bloom: {e}")
+        finally:
+            self._sync_lock.release()
+
+    def might_exist(self, pair_id: str) -> bool:
+        if self.bloom is None or self.bloom.is_saturated:
+            return True
+        self._sync_if_due()
+        self.checks += 1
+        if pair_id in self.bloom:
+            return True
+        if not self.usable:
+            self.would_skip += 1
+            return True
+        self.skipped_reads += 1
+        return False
+
+    def add(self, pair_id: str):
+        """Registrar un par escrito por este proceso"""
+        if self.bloom is not None:
+            with self._lock:
+                self.bloom.add(pair_id)
+
+    def replace(self, bloom: PairBloomFilter):
+        """Usar otro filtro; hasta seguir el registro desde su snapshot (follow) sus negativos no se usan"""
+        self._close_feed()
+        self.bloom = bloom
+        self._synced_until = self._synced_at = self._attempted_at = None
+
+    def stats(self) -> Dict[str, Any]:
+        if self.bloom is None:
+            return {'enabled': False}
+        staleness = self.staleness_seconds()
+        return {
+            'enabled': True,
+            'usable': self.usable,
+            'following_changes': self._synced_until is not None,
+            'staleness_seconds': round(staleness, 3) if staleness is not None else None,
+            'max_staleness_seconds': self.max_staleness_seconds,
+            'pairs': self.bloom.count,
+            'capacity': self.bloom.capacity,
+            'false_positive_rate': self.bloom.false_positive_rate,
+            'size_bytes': len(self.bloom.bits),
+            'age_seconds': time.time() - self.bloom.built_at,
+            'checks': self.checks,
+            'skipped_reads': self.skipped_reads,
+            'would_skip': self.would_skip,
+            'sync_errors': self.sync_errors,
+        }
+
+
+def build_known_pair_index(store=None) -> KnownPairIndex:
+    """Índice configurado por variables de entorno.
+
+    - PAIR_BLOOM_PATH: snapshot a cargar (sin él, el índice queda desactivado)
+    - PAIR_BLOOM_BUILD_ON_START=1: si no hay snapshot, construirlo recorriendo store
+    - PAIR_BLOOM_SYNC_SECONDS (30): cada cuánto se lee el registro de cambios
+    - PAIR_BLOOM_MAX_STALENESS_SECONDS (120): antigüedad máxima de la última
+      lectura del registro para omitir lecturas
+    - PAIR_BLOOM_FP_RATE (0.01)
+    """
+    index = KnownPairIndex(
+        source=store,
+        sync_seconds=float(os.getenv('PAIR_BLOOM_SYNC_SECONDS', str(DEFAULT_SYNC_SECONDS))),
+        max_staleness_seconds=float(os.getenv('PAIR_BLOOM_MAX_STALENESS_SECONDS',
+                                              str(DEFAULT_MAX_STALENESS_SECONDS))))
+    path = os.getenv('PAIR_BLOOM_PATH')
+    if not path:
+        return index
+    try:
+        if os.path.exists(path):
+            index.replace(PairBloomFilter.load(path))
+            logger.info(f"Filtro de Bloom cargado desde {path} ({index.bloom.count} pares)")
+        elif store is not None and os.getenv('PAIR_BLOOM_BUILD_ON_START') == '1':
+            bloom = PairBloomFilter.from_ids(store.iter_ids(), float(os.getenv('PAIR_BLOOM_FP_RATE', '0.01')))
+            bloom.save(path)
+            index.replace(bloom)
+            logger.info(f"Filtro de Bloom construido con {bloom.count} pares")
+        else:
+            return index
+    except Exception as e:
+        logger.warning(f"No se pudo preparar el filtro de Bloom de pares: {e}")
+        return index
+    if store is not None:
+        # El snapshot es del momento en que se construyó: traer lo escrito desde entonces
+        try:
+            added = index.follow(index.bloom.built_at)
+            logger.info(f"Filtro de Bloom al día con el registro de cambios ({added} pares nuevos)")
+        except ChangeFeedGap as e:
+            logger.warning(f"El registro de cambios no cubre el snapshot del filtro de Bloom, "
+                           f"no se omitirán lecturas: {e}")
+        except Exception as e:
+            index.sync_errors += 1
+            logger.warning(f"No se pudo leer el registro de cambios para el filtro de Bloom: {e}")
+    return index
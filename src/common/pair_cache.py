@@ -0,0 +1,298 @@
+"""
+Caché read-through de registros de pares (tabla item_pairs)
+LRU con TTL en memoria, o Redis como backend compartido entre workers.
+Cachea también las ausencias (negative caching) con un TTL más corto.
+Cada invalidación avanza la generación de la clave: una lectura que empezó
+antes de una escritura no puede dejar en la caché el valor viejo
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Marca de "el par no existe" dentro del backend
+_MISSING = {'__missing__': True}
+
+# Vida de los contadores de generación en Redis (muy por encima de lo que dura una lectura)
+GENERATION_TTL_SECONDS = 3600
+
+
+class MemoryCacheBackend:
+    """LRU acotado con TTL por entrada, local al proceso"""
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        # Secuencia global de invalidaciones y la última de cada clave (acotado
+        # como las entradas; al olvidar una clave se recuerda su secuencia)
+        self._sequence = 0
+        self._invalidated: 'OrderedDict[str, int]' = OrderedDict()
+        self._forgotten_sequence = 0
+
+    def generation(self, key: str) -> int:
+        with self._lock:
+            return self._sequence
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl_seconds: float, generation: Optional[int] = None) -> bool:
+        """Guardar; con generation, solo si la clave no se invalidó desde entonces"""
+        with self._lock:
+            if generation is not None and max(self._invalidated.get(key, 0), self._forgotten_sequence) > generation:
+                return False
+            self._entries[key] = (time.monotonic() + ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._sequence += 1
+            self._invalidated[key] = self._sequence
+            self._invalidated.move_to_end(key)
+            while len(self._invalidated) > self.max_entries:
+                _, sequence = self._invalidated.popitem(last=False)
+                self._forgotten_sequence = max(self._forgotten_sequence, sequence)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _encode(value):
+    if isinstance(value, Decimal):
+        return {'__decimal__': str(value)}
+    raise TypeError(f"Tipo no serializable: {type(value)}")
+
+
+def _decode(obj):
+    if '__decimal__' in obj and len(obj) == 1:
+        return Decimal(obj['__decimal__'])
+    return obj
+
+
+class RedisCacheBackend:
+    """Backend compartido: las invalidaciones de un worker las ven todos los demás"""
+
+    def __init__(self, url: str, prefix: str = 'pair:'):
+        import redis  # dependencia opcional
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.evictions = 0  # la expulsión la maneja Redis (maxmemory-policy)
+
+    def _generation_key(self, key: str) -> str:
+        return f"{self.prefix}gen:{key}"
+
+    def generation(self, key: str) -> int:
+        return int(self.client.get(self._generation_key(key)) or 0)
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self.client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw, object_hook=_decode)
+
+    def set(self, key: str, value: Any, ttl_seconds: float, generation: Optional[int] = None) -> bool:
+        """Guardar; con generation, solo si ningún worker invalidó la clave desde entonces (WATCH)"""
+        from redis.exceptions import WatchError
+
+        raw = json.dumps(value, default=_encode)
+        px = max(1, int(ttl_seconds * 1000))
+        if generation is None:
+            self.client.set(self.prefix + key, raw, px=px)
+            return True
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(self._generation_key(key))
+                if int(pipe.get(self._generation_key(key)) or 0) != generation:
+                    return False
+                pipe.multi()
+                pipe.set(self.prefix + key, raw, px=px)
+                pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    def delete(self, key: str):
+        with self.client.pipeline() as pipe:
+            pipe.delete(self.prefix + key)
+            pipe.incr(self._generation_key(key))
+            pipe.expire(self._generation_key(key), GENERATION_TTL_SECONDS)
+            pipe.execute()
+
+    def clear(self):
+        for key in self.client.scan_iter(match=f"{self.prefix}*"):
+            if not key.startswith(f"{self.prefix}gen:".encode()):
+                self.client.delete(key)
+
+    def __len__(self) -> int:
+        generation_prefix = f"{self.prefix}gen:".encode()
+        return sum(1 for key in self.client.scan_iter(match=f"{self.prefix}*")
+                   if not key.startswith(generation_prefix))
+
+
+class PairCache:
+    """Caché de pares por id con hits/misses contabilizados.
+
+    get devuelve (hit, item): un hit con item None significa que se sabe que
+    el par no existe (negative caching). Los errores del backend se registran
+    y se tratan como miss, de modo que la caché nunca rompe una request.
+    """
+
+    def __init__(self, backend=None, ttl_seconds: float = 60.0, negative_ttl_seconds: float = 5.0):
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'invalidations': 0, 'stale_skips': 0,
+                          'errors': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, pair_id: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        if not self.enabled:
+            return False, None
+        try:
+            value = self.backend.get(pair_id)
+        except Exception as e:
+            logger.warning(f"Error leyendo la caché de pares: {e}")
+            self._count('errors')
+            value = None
+        if value is None:
+            self._count('misses')
+            return False, None
+        if value == _MISSING:
+            self._count('negative_hits')
+            return True, None
+        self._count('hits')
+        return True, dict(value)
+
+    def generation(self, pair_id: str) -> Optional[int]:
+        """Generación actual de un par; se toma antes de leerlo de DynamoDB"""
+        if not self.enabled:
+            return None
+        try:
+            return self.backend.generation(pair_id)
+        except Exception as e:
+            logger.warning(f"Error leyendo la generación de la caché de pares: {e}")
+            self._count('errors')
+            return None
+
+    def put(self, pair_id: str, item: Optional[Dict[str, Any]], generation: Optional[int] = None):
+        """Guardar un par leído de DynamoDB (None = no existe).
+
+        Con generation (la de antes de la lectura), no se guarda si el par se
+        invalidó mientras tanto: el valor leído puede ser anterior a la escritura.
+        """
+        if not self.enabled or (item is None and self.negative_ttl_seconds <= 0):
+            return
+        try:
+            if item is None:
+                stored = self.backend.set(pair_id, _MISSING, self.negative_ttl_seconds, generation)
+            else:
+                stored = self.backend.set(pair_id, dict(item), self.ttl_seconds, generation)
+            if stored is False:
+                self._count('stale_skips')
+        except Exception as e:
+            logger.warning(f"Error escribiendo la caché de pares: {e}")
+            self._count('errors')
+
+    def invalidate(self, pair_id: str):
+        """Descartar la entrada de un par después de escribirlo o borrarlo"""
+        if not self.enabled:
+            return
+        try:
+            self.backend.delete(pair_id)
+            self._count('invalidations')
+        except Exception as e:
+            logger.warning(f"Error invalidando la caché de pares: {e}")
+            self._count('errors')
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters['hits'] + counters['negative_hits'] + counters['misses']
+        try:
+            size = len(self.backend)
+        except Exception:
+            size = None
+        return {
+            **counters,
+            'lookups': lookups,
+            'hit_ratio': (counters['hits'] + counters['negative_hits']) / lookups if lookups else 0.0,
+            'evictions': self.backend.evictions,
+            'size': size,
+            'backend': type(self.backend).__name__,
+            'ttl_seconds': self.ttl_seconds,
+            'negative_ttl_seconds': self.negative_ttl_seconds,
+        }
+
+
+def read_through(cache: PairCache, pair_id: str, loader: Callable[[str], Optional[Dict[str, Any]]]):
+    """Leer un par desde la caché o, si no está, con loader (y cachear el resultado)"""
+    hit, item = cache.get(pair_id)
+    if hit:
+        return item
+    # Si el par se invalida durante la lectura, el resultado se devuelve pero no se cachea
+    generation = cache.generation(pair_id)
+    if generation is None and cache.enabled:
+        return loader(pair_id)
+    item = loader(pair_id)
+    cache.put(pair_id, item, generation)
+    return item
+
+
+def build_pair_cache() -> PairCache:
+    """Caché configurada por variables de entorno.
+
+    - PAIR_CACHE_TTL_SECONDS (60; 0 desactiva la caché)
+    - PAIR_CACHE_NEGATIVE_TTL_SECONDS (5; 0 desactiva el negative caching)
+    - PAIR_CACHE_MAX_ENTRIES (10000, solo backend en memoria)
+    - PAIR_CACHE_REDIS_URL: usar Redis como backend compartido
+    """
+    backend = None
+    redis_url = os.getenv('PAIR_CACHE_REDIS_URL')
+    if redis_url:
+        try:
+            backend = RedisCacheBackend(redis_url)
+        except ImportError:
+            logger.warning("PAIR_CACHE_REDIS_URL configurado pero redis no está instalado, usando caché en memoria")
+    if backend is None:
+        backend = MemoryCacheBackend(int(os.getenv('PAIR_CACHE_MAX_ENTRIES', '10000')))
+    return PairCache(
+        backend,
+        ttl_seconds=float(os.getenv('PAIR_CACHE_TTL_SECONDS', '60')),
+        negative_ttl_seconds=float(os.getenv('PAIR_CACHE_NEGATIVE_TTL_SECONDS', '5')),
+    )
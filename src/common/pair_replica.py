@@ -0,0 +1,517 @@
+"""
+Réplica en memoria de item_pairs (PAIR_REPLICA=1)
+Carga un snapshot de la tabla al arrancar en un almacenamiento columnar
+compacto (arrays tipados + índice id -> fila) y responde get/batch_get desde
+memoria. Se mantiene al día aplicando las escrituras propias y leyendo
+periódicamente el registro de cambios del repositorio (altas, modificaciones y
+borrados de todos los escritores). Si la última actualización es más vieja
+que la cota de staleness, las lecturas vuelven al repositorio.
+"""
+
+import os
+import sys
+import math
+import time
+import logging
+import threading
+from array import array
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from pair_store import Change, ChangeFeed, ChangeFeedGap, Item, PairStore, normalize_changes
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1)
+_NO_INT = -2 ** 63
+_NO_BOOL = 2
+
+# Columnas tipadas: el resto de los campos (o valores que no se pueden
+# reconstruir exactos) van a un dict de extras por fila
+INT_FIELDS = ('item_a_id', 'item_b_id')
+FLOAT_FIELDS = ('similarity_score',)
+BOOL_FIELDS = ('are_equal', 'are_similar')
+CODE_FIELDS = ('status', 'source')
+TEXT_FIELDS = ('item_a_title', 'item_b_title')
+TIME_FIELDS = ('created_at', 'updated_at')
+
+# Intentos de carga del snapshot si el registro pierde cambios mientras se recorre la tabla
+LOAD_ATTEMPTS = 3
+
+
+def _encode_int(value) -> Optional[int]:
+    if isinstance(value, bool) or not isinstance(value, (int, Decimal)):
+        return None
+    if isinstance(value, Decimal) and value != value.to_integral_value():
+        return None
+    number = int(value)
+    return number if _NO_INT < number < 2 ** 63 else None
+
+
+def _encode_float(value) -> Optional[float]:
+    # Solo si Decimal(repr(float)) reproduce el mismo texto (así se escriben los scores)
+    if not isinstance(value, Decimal):
+        return None
+    number = float(value)
+    return number if str(Decimal(repr(number))) == str(value) else None
+
+
+def _encode_time(value) -> Optional[int]:
+    # Microsegundos desde 1970 si isoformat() reproduce el mismo texto
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None or parsed.isoformat() != value:
+        return None
+    return (parsed - _EPOCH) // timedelta(microseconds=1)
+
+
+def _decode_time(micros: int) -> str:
+    return (_EPOCH + timedelta(microseconds=micros)).isoformat()
+
+
+class PairColumns:
+    """Pares en columnas: una fila por par, sin un dict por par.
+
+    Los ids de ítems y los timestamps van en array('q'), el score en
+    array('d'), los booleanos en un bytearray y status/source como códigos
+    de una tabla de valores. Los títulos se internan, así que un título
+    repetido en muchos pares se guarda una sola vez. Las filas borradas se
+    reutilizan.
+    """
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+        self.ids: List[Optional[str]] = []
+        self.ints = {field: array('q') for field in INT_FIELDS}
+        self.floats = {field: array('d') for field in FLOAT_FIELDS}
+        self.bools = {field: bytearray() for field in BOOL_FIELDS}
+        self.codes = {field: array('H') for field in CODE_FIELDS}
+        self.texts: Dict[str, List[Optional[str]]] = {field: [] for field in TEXT_FIELDS}
+        self.times = {field: array('q') for field in TIME_FIELDS}
+        self.extras: Dict[int, Dict[str, Any]] = {}
+        # Código 0 = campo ausente
+        self._code_values: List[Optional[str]] = [None]
+        self._code_of: Dict[str, int] = {}
+        self._free: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, pair_id: str) -> bool:
+        return pair_id in self.index
+
+    def _code(self, value: str) -> Optional[int]:
+        code = self._code_of.get(value)
+        if code is None:
+            if len(self._code_values) >= 2 ** 16:
+                return None
+            code = len(self._code_values)
+            self._code_values.append(value)
+            self._code_of[value] = code
+        return code
+
+    def _new_row(self) -> int:
+        if self._free:
+            return self._free.pop()
+        self.ids.append(None)
+        for column in self.ints.values():
+            column.append(_NO_INT)
+        for column in self.floats.values():
+            column.append(math.nan)
+        for column in self.bools.values():
+            column.append(_NO_BOOL)
+        for column in self.codes.values():
+            column.append(0)
+        for column in self.texts.values():
+            column.append(None)
+        for column in self.times.values():
+            column.append(_NO_INT)
+        return len(self.ids) - 1
+
+    def _clear_row(self, row: int):
+        self.ids[row] = None
+        for column in self.ints.values():
+            column[row] = _NO_INT
+        for column in self.floats.values():
+            column[row] = math.nan
+        for column in self.bools.values():
+            column[row] = _NO_BOOL
+        for column in self.codes.values():
+            column[row] = 0
+        for column in self.texts.values():
+            column[row] = None
+        for column in self.times.values():
+            column[row] = _NO_INT
+        self.extras.pop(row, None)
+
+    def upsert(self, item: Item):
+        """Escribir el par completo (reemplaza la fila si ya existía)"""
+        pair_id = item['id']
+        row = self.index.get(pair_id)
+        if row is None:
+            row = self._new_row()
+            self.index[pair_id] = row
+        else:
+            self._clear_row(row)
+        self.ids[row] = pair_id
+        extras = {}
+        for field, value in item.items():
+            if field == 'id':
+                continue
+            if field in self.ints and (number := _encode_int(value)) is not None:
+                self.ints[field][row] = number
+            elif field in self.floats and (number := _encode_float(value)) is not None:
+                self.floats[field][row] = number
+            elif field in self.bools and isinstance(value, bool):
+                self.bools[field][row] = int(value)
+            elif field in self.codes and isinstance(value, str) and (code := self._code(value)) is not None:
+                self.codes[field][row] = code
+            elif field in self.texts and isinstance(value, str):
+                self.texts[field][row] = sys.intern(value)
+            elif field in self.times and (micros := _encode_time(value)) is not None:
+                self.times[field][row] = micros
+            else:
+                extras[field] = value
+        if extras:
+            self.extras[row] = extras
+
+    def remove(self, pair_id: str):
+        row = self.index.pop(pair_id, None)
+        if row is not None:
+            self._clear_row(row)
+            self._free.append(row)
+
+    def get(self, pair_id: str) -> Optional[Item]:
+        row = self.index.get(pair_id)
+        if row is None:
+            return None
+        item: Item = {'id': pair_id}
+        for field, column in self.ints.items():
+            if column[row] != _NO_INT:
+                item[field] = Decimal(column[row])
+        for field, column in self.floats.items():
+            if not math.isnan(column[row]):
+                item[field] = Decimal(repr(column[row]))
+        for field, column in self.bools.items():
+            if column[row] != _NO_BOOL:
+                item[field] = bool(column[row])
+        for field, column in self.codes.items():
+            if column[row]:
+                item[field] = self._code_values[column[row]]
+        for field, column in self.texts.items():
+            if column[row] is not None:
+                item[field] = column[row]
+        for field, column in self.times.items():
+            if column[row] != _NO_INT:
+                item[field] = _decode_time(column[row])
+        extras = self.extras.get(row)
+        if extras:
+            item.update(extras)
+        return item
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """Bytes aproximados por componente (arrays, índice, títulos únicos y extras)"""
+        typed = [*self.ints.values(), *self.floats.values(), *self.codes.values(), *self.times.values()]
+        columns = sum(column.buffer_info()[1] * column.itemsize for column in typed)
+        columns += sum(len(column) for column in self.bools.values())
+        columns += sum(sys.getsizeof(column) for column in self.texts.values()) + sys.getsizeof(self.ids)
+        index = sys.getsizeof(self.index) + sum(sys.getsizeof(pair_id) for pair_id in self.index)
+        titles = {id(title): title for column in self.texts.values() for title in column if title is not None}
+        extras = sys.getsizeof(self.extras) + sum(
+            sys.getsizeof(fields) + sum(sys.getsizeof(v) for v in fields.values()) for fields in self.extras.values())
+        return {
+            'columns': columns,
+            'index': index,
+            'titles': sum(sys.getsizeof(title) for title in titles.values()),
+            'extras': extras,
+        }
+
+
+class ReplicaPairStore(PairStore):
+    """Repositorio con réplica en memoria delante de otro (normalmente DynamoDB).
+
+    - get y batch_get se responden desde la réplica mientras esté fresca; un
+      par ausente en la réplica se informa como inexistente sin ir a la red
+    - las escrituras van al repositorio de origen y, si salen bien, se aplican
+      a la réplica; cada escritura lleva updated_at
+    - cada refresh_seconds se leen los cambios del origen (change_feed), que
+      incluyen los borrados de otros procesos; el lector se crea antes de
+      cargar el snapshot, así que lo escrito durante la carga también se ve.
+      Si el registro perdió cambios (ChangeFeedGap), se recarga todo. Si el
+      proceso no consigue lugar para leer el stream (ChangeFeedUnavailable),
+      la réplica no carga y las lecturas van al origen; se reintenta en cada
+      refresco
+    - si la última actualización exitosa supera max_staleness_seconds, las
+      lecturas van al origen hasta que la réplica se ponga al día: esa es la
+      cota de staleness tanto para escrituras como para borrados
+    """
+
+    def __init__(self, source: PairStore, refresh_seconds: float = 30.0, max_staleness_seconds: float = 120.0):
+        self.source = source
+        self.name = source.name
+        self.refresh_seconds = refresh_seconds
+        self.max_staleness_seconds = max_staleness_seconds
+        self._columns = PairColumns()
+        self._feed: Optional[ChangeFeed] = None
+        self._lock = threading.RLock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._refreshed_at: Optional[float] = None
+        self._loaded_at: Optional[float] = None
+        self.replica_reads = 0
+        self.fallback_reads = 0
+        self.deltas_applied = 0
+        self.deletes_applied = 0
+        self.reloads = 0
+        self.refresh_errors = 0
+
+    def __getattr__(self, name):
+        # Atributos propios del origen (p. ej. DynamoDBPairStore.table)
+        return getattr(self.source, name)
+
+    # --- Sincronización ---
+
+    def load(self):
+        """Cargar el snapshot completo del origen (reemplaza la réplica).
+
+        Si el registro pierde cambios mientras se recorre la tabla se vuelve a
+        empezar, hasta LOAD_ATTEMPTS veces; después se propaga ChangeFeedGap.
+        """
+        for attempt in range(1, LOAD_ATTEMPTS + 1):
+            start = time.perf_counter()
+            feed = self.source.change_feed()
+            columns = PairColumns()
+            try:
+                for item in self.source.iter_items():
+                    columns.upsert(item)
+                # Lo escrito mientras se recorría la tabla
+                polled_at = time.monotonic()
+                self._apply_changes(columns, feed.poll())
+            except ChangeFeedGap as e:
+                feed.close()
+                logger.warning(f"Cambios perdidos durante la carga de la réplica (intento {attempt}): {e}")
+                continue
+            except BaseException:
+                feed.close()
+                raise
+            with self._lock:
+                previous, self._columns, self._feed = self._feed, columns, feed
+                self._loaded_at = self._refreshed_at = polled_at
+            if previous is not None:
+                previous.close()
+            logger.info(f"Réplica de pares cargada: {len(columns)} pares en {time.perf_counter() - start:.2f}s "
+                        f"({sum(columns.memory_bytes().values()) / 1024 / 1024:.1f} MB)")
+            return
+        raise ChangeFeedGap(f"La réplica no pudo cargarse sin perder cambios en {LOAD_ATTEMPTS} intentos")
+
+    def _apply_changes(self, columns: PairColumns, changes: List[Change]):
+        deletes = 0
+        for pair_id, item in changes:
+            if item is None:
+                columns.remove(pair_id)
+                deletes += 1
+            else:
+                columns.upsert(item)
+        self.deltas_applied += len(changes) - deletes
+        self.deletes_applied += deletes
+
+    def refresh(self) -> int:
+        """Aplicar los cambios del origen desde la última actualización; devuelve cuántos se aplicaron.
+
+        Sin lector (no se pudo cargar) o con cambios perdidos se recarga el snapshot.
+        """
+        if self._feed is None:
+            self.load()
+            return 0
+        started = time.monotonic()
+        try:
+            changes = self._feed.poll()
+        except ChangeFeedGap as e:
+            logger.warning(f"Réplica de pares desfasada del registro de cambios, recargando: {e}")
+            self.reloads += 1
+            self.load()
+            return 0
+        with self._lock:
+            self._apply_changes(self._columns, changes)
+            # La réplica queda al día con lo que había al empezar el poll
+            self._refreshed_at = started
+        return len(changes)
+
+    def start(self):
+        """Cargar el snapshot y arrancar el hilo de refresco"""
+        try:
+            self.load()
+        except Exception as e:
+            # Sin snapshot la réplica no está fresca: las lecturas van al origen hasta que cargue
+            self.refresh_errors += 1
+            logger.warning(f"No se pudo cargar la réplica de pares: {e}")
+        if self._thread is None and self.refresh_seconds > 0:
+            self._thread = threading.Thread(target=self._run, name='pair-replica', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        if self._feed is not None:
+            self._feed.close()
+
+    def _run(self):
+        while not self._stopped.wait(self.refresh_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                self.refresh_errors += 1
+                logger.warning(f"No se pudo actualizar la réplica de pares: {e}")
+
+    def staleness_seconds(self) -> Optional[float]:
+        return None if self._refreshed_at is None else time.monotonic() - self._refreshed_at
+
+    @property
+    def fresh(self) -> bool:
+        staleness = self.staleness_seconds()
+        return staleness is not None and staleness <= self.max_staleness_seconds
+
+    # --- Lecturas ---
+
+    def get(self, pair_id):
+        if not self.fresh:
+            self.fallback_reads += 1
+            return self.source.get(pair_id)
+        with self._lock:
+            self.replica_reads += 1
+            return self._columns.get(pair_id)
+
+    def batch_get(self, pair_ids):
+        if not self.fresh:
+            self.fallback_reads += 1
+            return self.source.batch_get(pair_ids)
+        found = {}
+        with self._lock:
+            self.replica_reads += 1
+            for pair_id in pair_ids:
+                item = self._columns.get(pair_id)
+                if item is not None:
+                    found[pair_id] = item
+        return found
+
+    def query_by_item(self, item_id, limit=100):
+        return self.source.query_by_item(item_id, limit=limit)
+
+    def scan_page(self, limit, start_key=None):
+        return self.source.scan_page(limit, start_key)
+
+    def change_feed(self, since=None):
+        return self.source.change_feed(since)
+
+    # --- Escrituras (van al origen y después a la réplica) ---
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now().isoformat()
+
+    def _apply(self, item: Item):
+        with self._lock:
+            self._columns.upsert(item)
+
+    def _merge(self, pair_id: str, changes: Dict[str, Any]):
+        with self._lock:
+            current = self._columns.get(pair_id)
+            if current is not None:
+                self._apply({**current, **changes})
+                return
+        # El par no estaba en la réplica: se lee completo del origen
+        item = self.source.get(pair_id)
+        if item is not None:
+            self._apply(item)
+
+    def _remove(self, pair_id: str):
+        with self._lock:
+            self._columns.remove(pair_id)
+
+    def put(self, item, if_not_exists=False):
+        item = {**item, 'updated_at': item.get('updated_at') or self._now()}
+        self.source.put(item, if_not_exists=if_not_exists)
+        self._apply(item)
+
+    def update(self, pair_id, changes, must_exist=False):
+        changes = normalize_changes({**changes, 'updated_at': changes.get('updated_at') or self._now()})
+        self.source.update(pair_id, changes, must_exist=must_exist)
+        self._merge(pair_id, changes)
+
+    def delete(self, pair_id):
+        self.source.delete(pair_id)
+        self._remove(pair_id)
+
+    def _follow(self, results: Iterable[Dict[str, Any]], ok: str, apply: Callable[[str], None]) -> Iterator[Dict[str, Any]]:
+        for result in results:
+            if result['result'] == ok:
+                apply(result['pair_id'])
+            yield result
+
+    def batch_put(self, items, action='created', max_workers=4, should_continue=None):
+        now = self._now()
+        stamped = {item['id']: {**item, 'updated_at': item.get('updated_at') or now} for item in items}
+        results = self.source.batch_put(stamped.values(), action=action, max_workers=max_workers,
+                                        should_continue=should_continue)
+        return self._follow(results, action, lambda pair_id: self._apply(stamped[pair_id]))
+
+    def batch_update(self, pair_ids, changes, max_workers=4, should_continue=None):
+        changes = normalize_changes({**changes, 'updated_at': changes.get('updated_at') or self._now()})
+        results = self.source.batch_update(pair_ids, changes, max_workers=max_workers, should_continue=should_continue)
+        return self._follow(results, 'updated', lambda pair_id: self._merge(pair_id, changes))
+
+    def batch_delete(self, pair_ids, max_workers=4, should_continue=None):
+        results = self.source.batch_delete(pair_ids, max_workers=max_workers, should_continue=should_continue)
+        return self._follow(results, 'deleted', self._remove)
+
+    def ping(self):
+        self.source.ping()
+
+    def ensure_schema(self):
+        self.source.ensure_schema()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            memory = self._columns.memory_bytes()
+            pairs = len(self._columns)
+            extras = len(self._columns.extras)
+        total = sum(memory.values())
+        staleness = self.staleness_seconds()
+        return {
+            'enabled': True,
+            'fresh': self.fresh,
+            'pairs': pairs,
+            'rows_with_extras': extras,
+            'staleness_seconds': round(staleness, 3) if staleness is not None else None,
+            'max_staleness_seconds': self.max_staleness_seconds,
+            'memory_bytes': total,
+            'memory_breakdown': memory,
+            'bytes_per_pair': round(total / pairs, 1) if pairs else 0,
+            'replica_reads': self.replica_reads,
+            'fallback_reads': self.fallback_reads,
+            'deltas_applied': self.deltas_applied,
+            'deletes_applied': self.deletes_applied,
+            'reloads': self.reloads,
+            'refresh_errors': self.refresh_errors,
+        }
+
+
+def build_pair_replica(source: PairStore) -> ReplicaPairStore:
+    """Réplica configurada por variables de entorno, ya cargada y refrescándose.
+
+    - PAIR_REPLICA_REFRESH_SECONDS (30): cada cuánto se leen los cambios
+    - PAIR_REPLICA_MAX_STALENESS_SECONDS (120): antigüedad máxima para leer de memoria
+    """
+    replica = ReplicaPairStore(
+        source,
+        refresh_seconds=float(os.getenv('PAIR_REPLICA_REFRESH_SECONDS', '30')),
+        max_staleness_seconds=float(os.getenv('PAIR_REPLICA_MAX_STALENESS_SECONDS', '120')),
+    )
+    replica.start()
+    return replica
@@ -0,0 +1,1089 @@
+"""
+Repositorio de pares (Flask y Lambda)
+Una misma interfaz con tres backends, elegidos con PAIR_STORE_BACKEND:
+- dynamodb (por defecto): la tabla item_pairs, con los lotes de batch_mutations
+- memory: diccionarios en memoria, para benchmarks y tests herméticos
+- sqlite: un archivo SQLite, para despliegues chicos de un solo nodo
+Cada backend expone además un registro de cambios (change_feed) con las
+altas, modificaciones y borrados de todos los escritores.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from collections import deque
+from itertools import islice
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+from dynamodb_client import get_dynamodb, get_streams_client, get_table
+from batch_mutations import BATCH_WRITE_LIMIT, batch_delete, batch_get, batch_put, batch_update, \
+    build_update_expression, chunked
+from serialization import decimal_to_number
+
+logger = logging.getLogger(__name__)
+
+PAIRS_TABLE = 'item_pairs'
+STORE_BACKENDS = ('dynamodb', 'memory', 'sqlite')
+
+Item = Dict[str, Any]
+Result = Dict[str, Any]
+# Un cambio del registro: (id del par, el par como quedó o None si se borró)
+Change = Tuple[str, Optional[Item]]
+
+# Cambios que guarda el backend en memoria y antigüedad máxima del registro
+# de SQLite (la misma retención que DynamoDB Streams)
+MEMORY_CHANGE_LOG_SIZE = 100_000
+SQLITE_CHANGE_RETENTION_SECONDS = 24 * 3600
+DYNAMODB_STREAM_RETENTION_SECONDS = 24 * 3600
+
+# change_feed(since=...) exige que since esté al menos este margen dentro de la
+# retención (DynamoDB descarta los registros "aproximadamente" a las 24 h)
+CHANGE_RETENTION_MARGIN_SECONDS = 3600
+
+# Stream de item_pairs (el registro de cambios del backend dynamodb): con la
+# imagen nueva de cada par; los borrados traen solo la clave
+STREAM_SPECIFICATION = {'StreamEnabled': True, 'StreamViewType': 'NEW_IMAGE'}
+
+# Lectores simultáneos del stream: DynamoDB Streams limita a unos 2 por shard
+# (más lectores reciben throttling). Cada proceso comparte un solo lector entre
+# sus consumidores y toma un lugar en la tabla de arriendos
+# ({tabla}_stream_readers) antes de leer; el arriendo se renueva en cada poll
+DEFAULT_STREAM_READERS = 2
+STREAM_READER_LEASE_SECONDS = 300.0
+
+# Cambios sin leer que se guardan por consumidor del lector compartido
+STREAM_SUBSCRIBER_BUFFER = 100_000
+
+# Índices globales por ítem de item_pairs: query_by_item consulta los dos
+# (un ítem puede estar en el par como item_a o como item_b)
+ITEM_INDEXES = (('item_a_id', 'item_a_id-index'), ('item_b_id', 'item_b_id-index'))
+
+
+class PairExistsError(Exception):
+    """put con if_not_exists sobre un par que ya existe"""
+
+
+class PairNotFoundError(Exception):
+    """update con must_exist sobre un par que no existe"""
+
+
+class ChangeFeedGap(Exception):
+    """El registro de cambios ya no tiene todo lo ocurrido desde la posición del lector"""
+
+
+class ChangeFeedUnavailable(Exception):
+    """No hay lugar para otro lector del stream (ver DEFAULT_STREAM_READERS)"""
+
+
+def normalize_changes(changes: Dict[str, Any]) -> Dict[str, Any]:
+    """Validar los cambios de un update igual que en DynamoDB (sin id, float -> Decimal)"""
+    _, names, values = build_update_expression(changes)
+    return {names[f"#f{i}"]: values[f":v{i}"] for i in range(len(names))}
+
+
+def _item_key(item_id: Any) -> str:
+    # 7, Decimal('7') y '7' son el mismo ítem
+    try:
+        return str(int(item_id))
+    except (TypeError, ValueError):
+        return str(item_id)
+
+
+class PairStore(ABC):
+    """Interfaz del repositorio. Todos los métodos son seguros entre hilos.
+
+    Los lotes devuelven un resultado por par ({'pair_id', 'result', 'error'?})
+    a medida que se procesan, con el mismo formato que batch_mutations; con
+    should_continue en False, los pares restantes quedan 'not_attempted'.
+    """
+
+    name = 'base'
+
+    @abstractmethod
+    def get(self, pair_id: str) -> Optional[Item]:
+        """El par, o None si no existe"""
+
+    @abstractmethod
+    def put(self, item: Item, if_not_exists: bool = False):
+        """Escribir un par completo; con if_not_exists lanza PairExistsError si ya existe"""
+
+    @abstractmethod
+    def update(self, pair_id: str, changes: Dict[str, Any], must_exist: bool = False):
+        """Aplicar cambios; sin must_exist crea el par si no existe (como UpdateItem)"""
+
+    @abstractmethod
+    def delete(self, pair_id: str):
+        """Borrar un par (no falla si no existe)"""
+
+    @abstractmethod
+    def batch_get(self, pair_ids: Iterable[str]) -> Dict[str, Item]:
+        """Los pares que existen, por id"""
+
+    @abstractmethod
+    def batch_put(self, items: Iterable[Item], action: str = 'created', max_workers: int = 4,
+                  should_continue: Optional[Callable[[], bool]] = None) -> Iterator[Result]:
+        """Escribir pares completos; cada resultado exitoso es action"""
+
+    @abstractmethod
+    def batch_delete(self, pair_ids: Iterable[str], max_workers: int = 4,
+                     should_continue: Optional[Callable[[], bool]] = None) -> Iterator[Result]:
+        """Borrar pares; cada resultado exitoso es 'deleted'"""
+
+    @abstractmethod
+    def batch_update(self, pair_ids: Iterable[str], changes: Dict[str, Any], max_workers: int = 4,
+                     should_continue: Optional[Callable[[], bool]] = None) -> Iterator[Result]:
+        """Aplicar los mismos cambios a pares existentes ('updated' o 'not_found')"""
+
+    @abstractmethod
+    def query_by_item(self, item_id: Any, limit: int = 100) -> List[Item]:
+        """Pares en los que participa un ítem (como item_a o item_b)"""
+
+    @abstractmethod
+    def scan_page(self, limit: Optional[int], start_key: Optional[Dict[str, Any]] = None) -> Tuple[List[Item], Optional[Dict[str, Any]]]:
+        """Una página de pares y la clave para seguir (None en la última), como Scan.
+
+        Con limit None se devuelve una página nativa del backend (en DynamoDB,
+        un Scan sin Limit: hasta 1 MB).
+        """
+
+    @abstractmethod
+    def change_feed(self, since: Optional[float] = None) -> 'ChangeFeed':
+        """Lector del registro de cambios, posicionado en el momento actual.
+
+        Con since (epoch) el primer poll trae además los cambios retenidos desde
+        esa hora; si el registro no puede asegurar que los tiene todos (since
+        es más viejo que la retención o que el registro), ChangeFeedGap.
+        """
+
+    def iter_items(self, page_size: int = 1000) -> Iterator[Item]:
+        """Todos los pares, de a una página por vez"""
+        start_key = None
+        while True:
+            items, start_key = self.scan_page(page_size, start_key)
+            yield from items
+            if start_key is None:
+                return
+
+    def iter_ids(self) -> Iterator[str]:
+        return (item['id'] for item in self.iter_items())
+
+    def ping(self):
+        """Verificar que el backend responde (lo usa /health)"""
+
+    def ensure_schema(self):
+        """Crear la tabla si no existe"""
+
+
+class ChangeFeed(ABC):
+    """Lector de los cambios de todos los escritores, en orden.
+
+    poll devuelve lo escrito desde la llamada anterior (o desde que se creó el
+    lector). Si el registro ya descartó cambios que el lector no vio, lanza
+    ChangeFeedGap y hay que recargar todo. Un mismo cambio puede repetirse
+    (p. ej. después de reintentar): aplicarlo dos veces da el mismo estado.
+    """
+
+    @abstractmethod
+    def poll(self) -> List[Change]:
+        """Cambios pendientes de leer, del más viejo al más nuevo"""
+
+    def close(self):
+        """Dejar de leer (libera el lugar en el stream si era el último consumidor)"""
+
+
+def item_index_schema(throughput: Optional[Dict[str, int]] = None) -> Tuple[List[Dict[str, str]], List[Dict[str, Any]]]:
+    """AttributeDefinitions y GlobalSecondaryIndexes de los índices por ítem (para create_table).
+
+    throughput es el ProvisionedThroughput de cada índice si la tabla no es PAY_PER_REQUEST.
+    """
+    attributes = [{'AttributeName': field, 'AttributeType': 'N'} for field, _ in ITEM_INDEXES]
+    indexes = []
+    for field, index_name in ITEM_INDEXES:
+        index = {'IndexName': index_name, 'KeySchema': [{'AttributeName': field, 'KeyType': 'HASH'}],
+                 'Projection': {'ProjectionType': 'ALL'}}
+        if throughput:
+            index['ProvisionedThroughput'] = dict(throughput)
+        indexes.append(index)
+    return attributes, indexes
+
+
+def _local_batches(entries: List[Any], work: Callable[[List[Any]], List[Result]], entry_id: Callable[[Any], str],
+                   should_continue: Optional[Callable[[], bool]]) -> Iterator[Result]:
+    # Backends locales: los chunks son secuenciales, pero respetan should_continue igual que DynamoDB
+    for start in range(0, len(entries), BATCH_WRITE_LIMIT):
+        if should_continue is not None and not should_continue():
+            yield from ({'pair_id': entry_id(entry), 'result': 'not_attempted'} for entry in entries[start:])
+            return
+        yield from work(entries[start:start + BATCH_WRITE_LIMIT])
+
+
+class DynamoDBPairStore(PairStore):
+    """La tabla item_pairs de DynamoDB (resource y Table compartidos de dynamodb_client)"""
+
+    name = 'dynamodb'
+
+    def __init__(self, table_name: str = PAIRS_TABLE, max_stream_readers: int = DEFAULT_STREAM_READERS):
+        self.table_name = table_name
+        self.leases_table_name = f"{table_name}_stream_readers"
+        self.max_stream_readers = max_stream_readers
+        self._reader: Optional[StreamReader] = None
+        self._reader_lock = threading.Lock()
+
+    @property
+    def table(self):
+        # Se resuelve en cada uso: dynamodb_client lo cachea y los tests lo reinician
+        return get_table(self.table_name)
+
+    def get(self, pair_id: str) -> Optional[Item]:
+        return self.table.get_item(Key={'id': pair_id}).get('Item')
+
+    def put(self, item: Item, if_not_exists: bool = False):
+        if not if_not_exists:
+            self.table.put_item(Item=item)
+            return
+        try:
+            self.table.put_item(Item=item, ConditionExpression='attribute_not_exists(id)')
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                raise PairExistsError(item['id'])
+            raise
+
+    def update(self, pair_id: str, changes: Dict[str, Any], must_exist: bool = False):
+        expression, names, values = build_update_expression(changes)
+        kwargs = {'ConditionExpression': 'attribute_exists(id)'} if must_exist else {}
+        try:
+            self.table.update_item(Key={'id': pair_id}, UpdateExpression=expression,
+                                   ExpressionAttributeNames=names, ExpressionAttributeValues=values, **kwargs)
+        except ClientError as e:
+            if must_exist and e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                raise PairNotFoundError(pair_id)
+            raise
+
+    def delete(self, pair_id: str):
+        self.table.delete_item(Key={'id': pair_id})
+
+    def batch_get(self, pair_ids: Iterable[str]) -> Dict[str, Item]:
+        return batch_get(get_dynamodb(), self.table_name, pair_ids)
+
+    def batch_put(self, items, action='created', max_workers=4, should_continue=None):
+        return batch_put(get_dynamodb(), self.table_name, items, action=action, max_workers=max_workers,
+                         should_continue=should_continue)
+
+    def batch_delete(self, pair_ids, max_workers=4, should_continue=None):
+        return batch_delete(get_dynamodb(), self.table_name, pair_ids, max_workers=max_workers,
+                            should_continue=should_continue)
+
+    def batch_update(self, pair_ids, changes, max_workers=4, should_continue=None):
+        return batch_update(self.table, pair_ids, changes, max_workers=max_workers, should_continue=should_continue)
+
+    def query_by_item(self, item_id: Any, limit: int = 100) -> List[Item]:
+        # Un Query por índice (como item_a y como item_b), hasta limit pares cada uno
+        try:
+            item_id = int(item_id)
+        except (TypeError, ValueError):
+            return []  # las claves de los índices son numéricas
+        found: Dict[str, Item] = {}
+        for field, index_name in ITEM_INDEXES:
+            kwargs = {'IndexName': index_name, 'KeyConditionExpression': Key(field).eq(item_id), 'Limit': limit}
+            matched = 0
+            while matched < limit:
+                response = self.table.query(**kwargs)
+                for item in response.get('Items', []):
+                    found.setdefault(item['id'], item)
+                    matched += 1
+                if 'LastEvaluatedKey' not in response:
+                    break
+                kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return [found[pair_id] for pair_id in sorted(found)[:limit]]
+
+    def scan_page(self, limit, start_key=None):
+        kwargs = {'Limit': limit} if limit else {}
+        if start_key:
+            kwargs['ExclusiveStartKey'] = start_key
+        response = self.table.scan(**kwargs)
+        return response.get('Items', []), response.get('LastEvaluatedKey')
+
+    def change_feed(self, since=None):
+        # Un lector del stream por proceso, compartido por todos sus consumidores
+        with self._reader_lock:
+            if self._reader is None:
+                lease = StreamReaderLease(self.leases_table_name, self.max_stream_readers) \
+                    if self.max_stream_readers else None
+                self._reader = StreamReader(self.table, lease)
+        return DynamoDBChangeFeed(self._reader, since)
+
+    def ping(self):
+        self.table.table_status
+
+    def ensure_schema(self):
+        try:
+            get_dynamodb().create_table(**stream_lease_schema(self.leases_table_name))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ResourceInUseException':
+                raise
+        attributes, indexes = item_index_schema()
+        try:
+            get_dynamodb().create_table(
+                TableName=self.table_name,
+                KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+                AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}, *attributes],
+                GlobalSecondaryIndexes=indexes,
+                StreamSpecification=STREAM_SPECIFICATION,
+                BillingMode='PAY_PER_REQUEST'
+            )
+            return
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'ResourceInUseException':
+                raise
+        if not (self.table.stream_specification or {}).get('StreamEnabled'):
+            logger.info(f"Habilitando el stream de {self.table_name}")
+            self.table.meta.client.update_table(TableName=self.table_name, StreamSpecification=STREAM_SPECIFICATION)
+            self.table.reload()
+        # Tabla anterior a los índices por ítem: se agregan (uno por UpdateTable)
+        existing = {index['IndexName'] for index in self.table.global_secondary_indexes or ()}
+        for attribute, index in zip(attributes, indexes):
+            if index['IndexName'] not in existing:
+                logger.info(f"Creando el índice {index['IndexName']} en {self.table_name}")
+                self.table.meta.client.update_table(
+                    TableName=self.table_name, AttributeDefinitions=[attribute],
+                    GlobalSecondaryIndexUpdates=[{'Create': index}])
+                self.table.reload()
+
+
+class StreamPosition:
+    """Posición en el stream de item_pairs.
+
+    Al crearse arranca en LATEST en los shards abiertos; los shards que
+    aparecen después (splits) se leen desde TRIM_HORIZON, y un shard hijo
+    recién después de terminar el padre, para no desordenar los cambios de un
+    mismo par. Si un iterador expira se retoma después del último registro
+    leído; si el stream ya descartó registros no leídos, ChangeFeedGap.
+
+    Con from_start arranca en TRIM_HORIZON en todos los shards: el primer
+    read trae todo lo retenido (hasta DYNAMODB_STREAM_RETENTION_SECONDS).
+    """
+
+    def __init__(self, table, from_start: bool = False):
+        self.stream_arn = table.latest_stream_arn
+        if not self.stream_arn:
+            raise RuntimeError(f"La tabla {table.name} no tiene stream (ver ensure_schema)")
+        self.client = get_streams_client()
+        self.created_at = None
+        self._deserializer = TypeDeserializer()
+        # Por shard activo: iterador y último número de secuencia leído
+        self._iterators: Dict[str, Optional[str]] = {}
+        self._last_sequence: Dict[str, str] = {}
+        self._parents: Dict[str, Optional[str]] = {}
+        self._finished: set = set()
+        for shard in self._shards():
+            if from_start:
+                self._track(shard, 'TRIM_HORIZON')
+            elif 'EndingSequenceNumber' in shard.get('SequenceNumberRange', {}):
+                self._finished.add(shard['ShardId'])  # cerrado: todo lo suyo es anterior
+            else:
+                self._track(shard, 'LATEST')
+
+    def _describe(self, **kwargs) -> Dict[str, Any]:
+        description = self.client.describe_stream(StreamArn=self.stream_arn, **kwargs)['StreamDescription']
+        self.created_at = description.get('CreationRequestDateTime')
+        return description
+
+    def _shards(self) -> Iterator[Dict[str, Any]]:
+        kwargs = {}
+        while True:
+            description = self._describe(**kwargs)
+            yield from description.get('Shards', [])
+            if not description.get('LastEvaluatedShardId'):
+                return
+            kwargs['ExclusiveStartShardId'] = description['LastEvaluatedShardId']
+
+    def _track(self, shard: Dict[str, Any], iterator_type: str):
+        shard_id = shard['ShardId']
+        self._parents[shard_id] = shard.get('ParentShardId')
+        self._iterators[shard_id] = self._iterator(shard_id, iterator_type)
+
+    def _iterator(self, shard_id: str, iterator_type: str, sequence: Optional[str] = None) -> str:
+        kwargs = {'StreamArn': self.stream_arn, 'ShardId': shard_id, 'ShardIteratorType': iterator_type}
+        if sequence:
+            kwargs['SequenceNumber'] = sequence
+        return self.client.get_shard_iterator(**kwargs)['ShardIterator']
+
+    def _change(self, record: Dict[str, Any]) -> Change:
+        data = record['dynamodb']
+        pair_id = self._deserializer.deserialize(data['Keys']['id'])
+        if record['eventName'] == 'REMOVE':
+            return pair_id, None
+        return pair_id, {k: self._deserializer.deserialize(v) for k, v in data['NewImage'].items()}
+
+    def _read_shard(self, shard_id: str) -> List[Change]:
+        changes = []
+        while True:
+            try:
+                response = self.client.get_records(ShardIterator=self._iterators[shard_id])
+            except ClientError as e:
+                code = e.response.get('Error', {}).get('Code')
+                if code == 'TrimmedDataAccessException':
+                    raise ChangeFeedGap(f"El stream descartó registros no leídos del shard {shard_id}")
+                if code != 'ExpiredIteratorException':
+                    raise
+                sequence = self._last_sequence.get(shard_id)
+                self._iterators[shard_id] = (self._iterator(shard_id, 'AFTER_SEQUENCE_NUMBER', sequence) if sequence
+                                             else self._iterator(shard_id, 'TRIM_HORIZON'))
+                continue
+            records = response.get('Records', [])
+            for record in records:
+                changes.append(self._change(record))
+                self._last_sequence[shard_id] = record['dynamodb']['SequenceNumber']
+            next_iterator = response.get('NextShardIterator')
+            if next_iterator is None:
+                # Shard cerrado y leído entero
+                del self._iterators[shard_id]
+                self._finished.add(shard_id)
+                return changes
+            self._iterators[shard_id] = next_iterator
+            if not records:
+                return changes
+
+    def read(self) -> List[Change]:
+        for shard in self._shards():
+            if shard['ShardId'] not in self._iterators and shard['ShardId'] not in self._finished:
+                self._track(shard, 'TRIM_HORIZON')
+        changes = []
+        pending = list(self._iterators)
+        while pending:
+            # Un hijo espera a que su padre (si lo seguimos) termine en esta misma vuelta
+            ready = [shard_id for shard_id in pending if self._parents.get(shard_id) not in self._iterators]
+            if not ready:
+                break
+            for shard_id in ready:
+                changes.extend(self._read_shard(shard_id))
+                pending.remove(shard_id)
+        return changes
+
+
+def stream_lease_schema(table_name: str, throughput: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """Parámetros de create_table de la tabla de arriendos de lectores del stream (un ítem por lugar)"""
+    schema = {
+        'TableName': table_name,
+        'KeySchema': [{'AttributeName': 'slot', 'KeyType': 'HASH'}],
+        'AttributeDefinitions': [{'AttributeName': 'slot', 'AttributeType': 'N'}],
+    }
+    if throughput:
+        schema['ProvisionedThroughput'] = dict(throughput)
+    else:
+        schema['BillingMode'] = 'PAY_PER_REQUEST'
+    return schema
+
+
+class StreamReaderLease:
+    """Un lugar para leer el stream (de slots posibles), arrendado por lease_seconds.
+
+    Un lugar libre es uno sin ítem o con el arriendo vencido (un proceso que
+    murió lo libera al vencer). acquire renueva el arriendo propio cuando pasó
+    la mitad del plazo; si otro proceso lo tomó (p. ej. este estuvo congelado
+    más que el plazo) busca otro lugar.
+    """
+
+    def __init__(self, table_name: str, slots: int, lease_seconds: float = STREAM_READER_LEASE_SECONDS):
+        self.table_name = table_name
+        self.slots = slots
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.slot: Optional[int] = None
+        self._expires_at = 0.0
+
+    def _claim(self, slot: int, now: float) -> bool:
+        expires_at = now + self.lease_seconds
+        try:
+            get_table(self.table_name).put_item(
+                Item={'slot': slot, 'owner': self.owner, 'expires_at': Decimal(str(round(expires_at, 3)))},
+                ConditionExpression='attribute_not_exists(slot) OR expires_at < :now OR #owner = :owner',
+                ExpressionAttributeNames={'#owner': 'owner'},
+                ExpressionAttributeValues={':now': Decimal(str(round(now, 3))), ':owner': self.owner})
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return False
+            raise
+        self.slot, self._expires_at = slot, expires_at
+        return True
+
+    def acquire(self) -> bool:
+        """Tener un lugar arrendado; False si están todos ocupados"""
+        now = time.time()
+        if self.slot is not None:
+            if self._expires_at - now > self.lease_seconds / 2:
+                return True
+            if self._claim(self.slot, now):
+                return True
+            logger.warning(f"Otro proceso tomó el lugar {self.slot} de lectura del stream")
+            self.slot = None
+        return any(self._claim(slot, now) for slot in range(self.slots))
+
+    def release(self):
+        if self.slot is None:
+            return
+        try:
+            get_table(self.table_name).delete_item(
+                Key={'slot': self.slot}, ConditionExpression='#owner = :owner',
+                ExpressionAttributeNames={'#owner': 'owner'}, ExpressionAttributeValues={':owner': self.owner})
+        except ClientError:
+            pass  # ya lo tomó otro proceso
+        self.slot = None
+
+
+class StreamReader:
+    """Lector del stream compartido por los consumidores de un proceso (réplica, filtro de Bloom).
+
+    Cada poll de un consumidor lee lo nuevo del stream y lo reparte en los
+    pendientes de todos, así el proceso ocupa un solo lugar en el stream
+    (lease, None = sin límite). Un consumidor nuevo ve los cambios desde que se
+    suscribe. Si el stream pierde registros no leídos, todos los consumidores
+    reciben ChangeFeedGap y la próxima suscripción vuelve a posicionarse.
+    """
+
+    def __init__(self, table, lease: Optional[StreamReaderLease]):
+        self.table = table
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._position: Optional[StreamPosition] = None
+        self._pending: Dict[int, List[Change]] = {}
+        self._gaps: Dict[int, str] = {}
+        self._next_token = 0
+
+    def _check_lease(self):
+        if self.lease is not None and not self.lease.acquire():
+            raise ChangeFeedUnavailable(
+                f"Ya hay {self.lease.slots} procesos leyendo el stream de {self.table.name}")
+
+    def _pull(self):
+        try:
+            changes = self._position.read()
+        except ChangeFeedGap as e:
+            self._gaps.update((token, str(e)) for token in self._pending)
+            self._pending.clear()
+            self._position = None
+            return
+        for token, pending in list(self._pending.items()):
+            pending.extend(changes)
+            if len(pending) > STREAM_SUBSCRIBER_BUFFER:
+                # Un consumidor que no lee hace rato: que recargue en vez de acumular sin límite
+                del self._pending[token]
+                self._gaps[token] = f"Más de {STREAM_SUBSCRIBER_BUFFER} cambios sin leer"
+
+    def _history(self, since: float) -> List[Change]:
+        # Un recorrido aparte desde TRIM_HORIZON; lo que se superponga con el
+        # lector compartido llega dos veces, y aplicarlo dos veces da lo mismo
+        history = StreamPosition(self.table, from_start=True)
+        created_at = history.created_at.timestamp() if history.created_at else None
+        if created_at is None or since < created_at:
+            raise ChangeFeedGap(f"El stream de {self.table.name} es posterior a {since}")
+        if since < time.time() - DYNAMODB_STREAM_RETENTION_SECONDS + CHANGE_RETENTION_MARGIN_SECONDS:
+            raise ChangeFeedGap(f"El stream de {self.table.name} ya no retiene los cambios desde {since}")
+        return history.read()
+
+    def subscribe(self, since: Optional[float] = None) -> int:
+        with self._lock:
+            self._check_lease()
+            if self._position is None:
+                self._position = StreamPosition(self.table)
+            elif self._pending:
+                # Lo anterior a la suscripción es de los consumidores que ya estaban
+                self._pull()
+                if self._position is None:
+                    self._position = StreamPosition(self.table)
+            history = self._history(since) if since is not None else []
+            self._next_token += 1
+            self._pending[self._next_token] = history
+            return self._next_token
+
+    def poll(self, token: int) -> List[Change]:
+        with self._lock:
+            if token not in self._gaps:
+                self._check_lease()
+                self._pull()
+            if token in self._gaps:
+                raise ChangeFeedGap(self._gaps.pop(token))
+            changes, self._pending[token] = self._pending[token], []
+            return changes
+
+    def unsubscribe(self, token: int):
+        with self._lock:
+            self._pending.pop(token, None)
+            self._gaps.pop(token, None)
+            if not self._pending:
+                self._position = None
+                if self.lease is not None:
+                    self.lease.release()
+
+
+class DynamoDBChangeFeed(ChangeFeed):
+    """Consumidor del lector compartido del stream de item_pairs.
+
+    Lanza ChangeFeedUnavailable al crearse o al leer si el proceso no
+    consigue lugar para leer el stream. Con since, el stream se recorre una
+    vez desde TRIM_HORIZON (lo retenido, hasta 24 h).
+    """
+
+    def __init__(self, reader: StreamReader, since: Optional[float] = None):
+        self.reader = reader
+        self._token: Optional[int] = reader.subscribe(since)
+
+    def poll(self) -> List[Change]:
+        if self._token is None:
+            raise ChangeFeedGap("El lector está cerrado")
+        try:
+            return self.reader.poll(self._token)
+        except ChangeFeedGap:
+            self._token = None
+            raise
+
+    def close(self):
+        if self._token is not None:
+            self.reader.unsubscribe(self._token)
+            self._token = None
+
+
+class MemoryPairStore(PairStore):
+    """Pares en un dict, con un índice por ítem. Se pierde al reiniciar el proceso"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._items: Dict[str, Item] = {}
+        self._by_item: Dict[str, set] = {}
+        # Ids ordenados para paginar; se reconstruye solo si cambió el conjunto de ids
+        self._sorted_ids: Optional[List[str]] = None
+        # Registro de cambios: (secuencia, id, par o None, hora), los últimos MEMORY_CHANGE_LOG_SIZE
+        self._changes: deque = deque(maxlen=MEMORY_CHANGE_LOG_SIZE)
+        self._sequence = 0
+        # Hora del cambio más nuevo que se descartó del registro (el store arranca vacío)
+        self._dropped_until = 0.0
+
+    def _log(self, pair_id: str, item: Optional[Item]):
+        # Los pares guardados no se modifican en el lugar (update guarda un dict nuevo)
+        if self._changes.maxlen is not None and len(self._changes) == self._changes.maxlen:
+            self._dropped_until = self._changes[0][3]
+        self._sequence += 1
+        self._changes.append((self._sequence, pair_id, item, time.time()))
+
+    def _index(self, item: Item, add: bool):
+        for field in ('item_a_id', 'item_b_id'):
+            if field in item:
+                ids = self._by_item.setdefault(_item_key(item[field]), set())
+                if add:
+                    ids.add(item['id'])
+                else:
+                    ids.discard(item['id'])
+
+    def _store(self, item: Item):
+        previous = self._items.get(item['id'])
+        if previous is not None:
+            self._index(previous, add=False)
+        else:
+            self._sorted_ids = None
+        self._items[item['id']] = item
+        self._index(item, add=True)
+        self._log(item['id'], item)
+
+    def _remove(self, pair_id: str) -> bool:
+        previous = self._items.pop(pair_id, None)
+        if previous is None:
+            return False
+        self._index(previous, add=False)
+        self._sorted_ids = None
+        self._log(pair_id, None)
+        return True
+
+    def get(self, pair_id):
+        with self._lock:
+            item = self._items.get(pair_id)
+            return dict(item) if item is not None else None
+
+    def put(self, item, if_not_exists=False):
+        with self._lock:
+            if if_not_exists and item['id'] in self._items:
+                raise PairExistsError(item['id'])
+            self._store(dict(item))
+
+    def update(self, pair_id, changes, must_exist=False):
+        changes = normalize_changes(changes)
+        with self._lock:
+            current = self._items.get(pair_id)
+            if current is None and must_exist:
+                raise PairNotFoundError(pair_id)
+            self._store({**(current or {'id': pair_id}), **changes})
+
+    def delete(self, pair_id):
+        with self._lock:
+            self._remove(pair_id)
+
+    def batch_get(self, pair_ids):
+        with self._lock:
+            return {pair_id: dict(self._items[pair_id]) for pair_id in pair_ids if pair_id in self._items}
+
+    def batch_put(self, items, action='created', max_workers=4, should_continue=None):
+        unique = list({item['id']: item for item in items}.values())
+
+        def work(chunk):
+            with self._lock:
+                for item in chunk:
+                    self._store(dict(item))
+            return [{'pair_id': item['id'], 'result': action} for item in chunk]
+
+        return _local_batches(unique, work, lambda item: item['id'], should_continue)
+
+    def batch_delete(self, pair_ids, max_workers=4, should_continue=None):
+        def work(chunk):
+            with self._lock:
+                for pair_id in chunk:
+                    self._remove(pair_id)
+            return [{'pair_id': pair_id, 'result': 'deleted'} for pair_id in chunk]
+
+        return _local_batches(list(dict.fromkeys(pair_ids)), work, str, should_continue)
+
+    def batch_update(self, pair_ids, changes, max_workers=4, should_continue=None):
+        changes = normalize_changes(changes)
+
+        def work(chunk):
+            results = []
+            with self._lock:
+                for pair_id in chunk:
+                    current = self._items.get(pair_id)
+                    if current is None:
+                        results.append({'pair_id': pair_id, 'result': 'not_found'})
+                        continue
+                    self._store({**current, **changes})
+                    results.append({'pair_id': pair_id, 'result': 'updated'})
+            return results
+
+        return _local_batches(list(dict.fromkeys(pair_ids)), work, str, should_continue)
+
+    def query_by_item(self, item_id, limit=100):
+        with self._lock:
+            pair_ids = sorted(self._by_item.get(_item_key(item_id), ()))[:limit]
+            return [dict(self._items[pair_id]) for pair_id in pair_ids]
+
+    def scan_page(self, limit, start_key=None):
+        with self._lock:
+            if self._sorted_ids is None:
+                self._sorted_ids = sorted(self._items)
+            start = bisect_right(self._sorted_ids, start_key['id']) if start_key else 0
+            end = start + limit if limit else len(self._sorted_ids)
+            page_ids = self._sorted_ids[start:end]
+            items = [dict(self._items[pair_id]) for pair_id in page_ids]
+            more = end < len(self._sorted_ids)
+            return items, ({'id': page_ids[-1]} if more and page_ids else None)
+
+    def change_feed(self, since=None):
+        return MemoryChangeFeed(self, since)
+
+    def sequence_at(self, since: Optional[float]) -> int:
+        """Secuencia anterior al primer cambio desde since (o la última); ChangeFeedGap si ya se descartaron"""
+        with self._lock:
+            if since is None:
+                return self._sequence
+            if since <= self._dropped_until:
+                raise ChangeFeedGap(f"El registro en memoria ya no tiene los cambios desde {since}")
+            for sequence, _, _, changed_at in self._changes:
+                if changed_at >= since:
+                    return sequence - 1
+            return self._sequence
+
+    def changes_after(self, sequence: int) -> Tuple[List[Change], int]:
+        """Cambios con secuencia mayor a sequence y la última secuencia; ChangeFeedGap si ya se descartaron"""
+        with self._lock:
+            oldest = self._changes[0][0] if self._changes else self._sequence + 1
+            if oldest > sequence + 1:
+                raise ChangeFeedGap(f"El registro en memoria ya no tiene los cambios posteriores a {sequence}")
+            changes = [(pair_id, dict(item) if item is not None else None)
+                       for _, pair_id, item, _ in islice(self._changes, sequence + 1 - oldest, None)]
+            return changes, self._sequence
+
+
+class MemoryChangeFeed(ChangeFeed):
+    """Lector del registro de cambios de un MemoryPairStore"""
+
+    def __init__(self, store: MemoryPairStore, since: Optional[float] = None):
+        self.store = store
+        self._sequence = store.sequence_at(since)
+
+    def poll(self) -> List[Change]:
+        changes, self._sequence = self.store.changes_after(self._sequence)
+        return changes
+
+
+def _encode_number(obj):
+    if isinstance(obj, Decimal):
+        return decimal_to_number(obj)
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+class SQLitePairStore(PairStore):
+    """Pares en SQLite: una fila por par (JSON) con índices por item_a_id e item_b_id.
+
+    Cada hilo usa su propia conexión (WAL, así las lecturas no esperan a las
+    escrituras). Los números se leen como Decimal, igual que desde DynamoDB.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path: str = 'item_pairs.sqlite3', table_name: str = PAIRS_TABLE):
+        self.table_name = table_name
+        self.changes_table = f"{table_name}_changes"
+        if path == ':memory:':
+            # Base en memoria compartida entre los hilos del proceso
+            self.path, self._uri = f"file:pair_store_{id(self)}?mode=memory&cache=shared", True
+        else:
+            self.path, self._uri = path, False
+        self._local = threading.local()
+        self._keepalive = self._connection()
+        self.ensure_schema()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, uri=self._uri, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            if not self._uri:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def ensure_schema(self):
+        conn = self._connection()
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table_name} "
+                     "(id TEXT PRIMARY KEY, item_a_id TEXT, item_b_id TEXT, data TEXT NOT NULL)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table_name}_item_a ON {self.table_name} (item_a_id)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table_name}_item_b ON {self.table_name} (item_b_id)")
+        # Registro de cambios de todos los procesos: triggers que anotan el id de cada par escrito o borrado
+        log = self.changes_table
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {log} (seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL, "
+                     "changed_at REAL NOT NULL DEFAULT (julianday('now')))")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {log}_changed_at ON {log} (changed_at)")
+        # Desde cuándo existen los triggers: los cambios anteriores no están en el registro
+        # (si la tabla estaba vacía, el registro tiene todo: started_at = 0)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {log}_meta (started_at REAL NOT NULL)")
+        conn.execute(f"INSERT INTO {log}_meta (started_at) "
+                     f"SELECT CASE WHEN EXISTS (SELECT 1 FROM {self.table_name}) THEN julianday('now') ELSE 0 END "
+                     f"WHERE NOT EXISTS (SELECT 1 FROM {log}_meta)")
+        for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            conn.execute(f"CREATE TRIGGER IF NOT EXISTS {log}_{event.lower()} AFTER {event} ON {self.table_name} "
+                         f"BEGIN INSERT INTO {log} (id) VALUES ({row}.id); END")
+
+    @staticmethod
+    def _row(item: Item) -> Tuple[str, Optional[str], Optional[str], str]:
+        return (item['id'],
+                _item_key(item['item_a_id']) if 'item_a_id' in item else None,
+                _item_key(item['item_b_id']) if 'item_b_id' in item else None,
+                json.dumps(item, default=_encode_number, ensure_ascii=False))
+
+    @staticmethod
+    def _load(data: str) -> Item:
+        return json.loads(data, parse_float=Decimal, parse_int=Decimal)
+
+    def _write(self, conn: sqlite3.Connection, items: Iterable[Item], replace: bool = True):
+        verb = 'INSERT OR REPLACE' if replace else 'INSERT'
+        conn.executemany(f"{verb} INTO {self.table_name} (id, item_a_id, item_b_id, data) VALUES (?, ?, ?, ?)",
+                         [self._row(item) for item in items])
+
+    def _transaction(self, work: Callable[[sqlite3.Connection], Any]):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = work(conn)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return result
+
+    def get(self, pair_id):
+        row = self._connection().execute(f"SELECT data FROM {self.table_name} WHERE id = ?", (pair_id,)).fetchone()
+        return self._load(row[0]) if row else None
+
+    def put(self, item, if_not_exists=False):
+        try:
+            self._write(self._connection(), [item], replace=not if_not_exists)
+        except sqlite3.IntegrityError:
+            raise PairExistsError(item['id'])
+
+    def _apply_changes(self, conn, pair_ids: List[str], changes: Dict[str, Any], upsert: bool) -> List[Result]:
+        placeholders = ','.join('?' * len(pair_ids))
+        rows = conn.execute(f"SELECT id, data FROM {self.table_name} WHERE id IN ({placeholders})", pair_ids)
+        current = {pair_id: self._load(data) for pair_id, data in rows}
+        updated, results = [], []
+        for pair_id in pair_ids:
+            if pair_id not in current and not upsert:
+                results.append({'pair_id': pair_id, 'result': 'not_found'})
+                continue
+            updated.append({**current.get(pair_id, {'id': pair_id}), **changes})
+            results.append({'pair_id': pair_id, 'result': 'updated'})
+        self._write(conn, updated)
+        return results
+
+    def update(self, pair_id, changes, must_exist=False):
+        changes = normalize_changes(changes)
+        results = self._transaction(lambda conn: self._apply_changes(conn, [pair_id], changes, upsert=not must_exist))
+        if results[0]['result'] == 'not_found':
+            raise PairNotFoundError(pair_id)
+
+    def delete(self, pair_id):
+        self._connection().execute(f"DELETE FROM {self.table_name} WHERE id = ?", (pair_id,))
+
+    def batch_get(self, pair_ids):
+        found = {}
+        conn = self._connection()
+        for chunk in chunked(list(dict.fromkeys(pair_ids)), 500):
+            placeholders = ','.join('?' * len(chunk))
+            for pair_id, data in conn.execute(
+                    f"SELECT id, data FROM {self.table_name} WHERE id IN ({placeholders})", chunk):
+                found[pair_id] = self._load(data)
+        return found
+
+    def batch_put(self, items, action='created', max_workers=4, should_continue=None):
+        unique = list({item['id']: item for item in items}.values())
+
+        def work(chunk):
+            self._transaction(lambda conn: self._write(conn, chunk))
+            return [{'pair_id': item['id'], 'result': action} for item in chunk]
+
+        return _local_batches(unique, work, lambda item: item['id'], should_continue)
+
+    def batch_delete(self, pair_ids, max_workers=4, should_continue=None):
+        def work(chunk):
+            self._transaction(lambda conn: conn.executemany(
+                f"DELETE FROM {self.table_name} WHERE id = ?", [(pair_id,) for pair_id in chunk]))
+            return [{'pair_id': pair_id, 'result': 'deleted'} for pair_id in chunk]
+
+        return _local_batches(list(dict.fromkeys(pair_ids)), work, str, should_continue)
+
+    def batch_update(self, pair_ids, changes, max_workers=4, should_continue=None):
+        changes = normalize_changes(changes)
+
+        def work(chunk):
+            return self._transaction(lambda conn: self._apply_changes(conn, chunk, changes, upsert=False))
+
+        return _local_batches(list(dict.fromkeys(pair_ids)), work, str, should_continue)
+
+    def query_by_item(self, item_id, limit=100):
+        key = _item_key(item_id)
+        rows = self._connection().execute(
+            f"SELECT data FROM {self.table_name} WHERE item_a_id = ? "
+            f"UNION SELECT data FROM {self.table_name} WHERE item_b_id = ? LIMIT ?", (key, key, limit))
+        return [self._load(data) for data, in rows]
+
+    def scan_page(self, limit, start_key=None):
+        # Sin limit se devuelve el resto de la tabla (SQLite no tiene páginas nativas)
+        rows = self._connection().execute(
+            f"SELECT id, data FROM {self.table_name} WHERE id > ? ORDER BY id LIMIT ?",
+            (start_key['id'] if start_key else '', limit + 1 if limit else -1)).fetchall()
+        if not limit or len(rows) <= limit:
+            return [self._load(data) for _, data in rows], None
+        return [self._load(data) for _, data in rows[:limit]], {'id': rows[limit - 1][0]}
+
+    def change_feed(self, since=None):
+        return SQLiteChangeFeed(self, since)
+
+    def sequence_at(self, since: Optional[float]) -> int:
+        """Secuencia anterior al primer cambio desde since (o la última); ChangeFeedGap si el registro no lo cubre"""
+        if since is None:
+            return self.last_change()
+        conn = self._connection()
+        started_at, = conn.execute(f"SELECT MIN(started_at) FROM {self.changes_table}_meta").fetchone()
+        since_day = since / 86400 + 2440587.5  # epoch -> día juliano
+        retained_from = time.time() - SQLITE_CHANGE_RETENTION_SECONDS + CHANGE_RETENTION_MARGIN_SECONDS
+        if started_at is None or since_day < started_at or since < retained_from:
+            raise ChangeFeedGap(f"El registro de SQLite no cubre los cambios desde {since}")
+        # changed_at tiene precisión de milisegundos: un segundo de margen (repetir un cambio no importa)
+        first, = conn.execute(f"SELECT MIN(seq) FROM {self.changes_table} WHERE changed_at >= ?",
+                              (since_day - 1 / 86400,)).fetchone()
+        return first - 1 if first is not None else self.last_change()
+
+    def last_change(self) -> int:
+        row = self._connection().execute("SELECT seq FROM sqlite_sequence WHERE name = ?",
+                                          (self.changes_table,)).fetchone()
+        return row[0] if row else 0
+
+    def changes_after(self, sequence: int) -> Tuple[List[Change], int]:
+        """Pares escritos o borrados después de sequence, como están ahora, y la última secuencia leída.
+
+        Se descartan los cambios con más de SQLITE_CHANGE_RETENTION_SECONDS; si
+        faltan cambios posteriores a sequence, ChangeFeedGap.
+        """
+        conn = self._connection()
+        conn.execute(f"DELETE FROM {self.changes_table} WHERE changed_at < julianday('now') - ?",
+                     (SQLITE_CHANGE_RETENTION_SECONDS / 86400,))
+        # Una transacción de lectura: la verificación y los cambios ven el mismo estado
+        conn.execute('BEGIN')
+        try:
+            rows = conn.execute(
+                f"SELECT c.seq, c.id, p.data FROM {self.changes_table} c LEFT JOIN {self.table_name} p "
+                f"ON p.id = c.id WHERE c.seq > ? ORDER BY c.seq", (sequence,)).fetchall()
+            last = self.last_change()
+        finally:
+            conn.execute('COMMIT')
+        if (rows[0][0] if rows else last + 1) > sequence + 1:
+            raise ChangeFeedGap(f"El registro de SQLite ya no tiene los cambios posteriores a {sequence}")
+        return [(pair_id, self._load(data) if data is not None else None) for _, pair_id, data in rows], \
+            (rows[-1][0] if rows else sequence)
+
+    def ping(self):
+        self._connection().execute('SELECT 1')
+
+
+class SQLiteChangeFeed(ChangeFeed):
+    """Lector del registro de cambios de un SQLitePairStore (escrito por triggers, lo ven todos los procesos).
+
+    Cada cambio trae el par como está al leerlo: si se escribió varias veces,
+    todas las entradas traen la última versión.
+    """
+
+    def __init__(self, store: SQLitePairStore, since: Optional[float] = None):
+        self.store = store
+        self._sequence = store.sequence_at(since)
+
+    def poll(self) -> List[Change]:
+        changes, self._sequence = self.store.changes_after(self._sequence)
+        return changes
+
+
+def build_pair_store(backend: Optional[str] = None) -> PairStore:
+    """Repositorio configurado por variables de entorno.
+
+    - PAIR_STORE_BACKEND: dynamodb (por defecto), memory o sqlite
+    - PAIR_STORE_SQLITE_PATH: archivo de SQLite (item_pairs.sqlite3; ':memory:' para uno en memoria)
+    - PAIR_STREAM_MAX_READERS (2): procesos que pueden leer el stream de DynamoDB a la
+      vez (0 = sin límite ni tabla de arriendos)
+    - PAIR_REPLICA=1: réplica en memoria delante del backend (ver pair_replica)
+    """
+    backend = backend or os.getenv('PAIR_STORE_BACKEND', 'dynamodb')
+    if backend == 'dynamodb':
+        store = DynamoDBPairStore(max_stream_readers=int(os.getenv('PAIR_STREAM_MAX_READERS',
+                                                                   str(DEFAULT_STREAM_READERS))))
+    elif backend == 'memory':
+        logger.info("Repositorio de pares en memoria (no persistente)")
+        store = MemoryPairStore()
+    elif backend == 'sqlite':
+        path = os.getenv('PAIR_STORE_SQLITE_PATH', 'item_pairs.sqlite3')
+        logger.info(f"Repositorio de pares en SQLite ({path})")
+        store = SQLitePairStore(path)
+    else:
+        raise ValueError(f"PAIR_STORE_BACKEND desconocido: {backend}. Opciones: {', '.join(STORE_BACKENDS)}")
+    if os.getenv('PAIR_REPLICA') == '1':
+        from pair_replica import build_pair_replica
+        return build_pair_replica(store)
+    return store
@@ -0,0 +1,225 @@
+"""
+Profiling bajo demanda de requests y sampler de stacks en segundo plano
+- RequestProfiler: corre una request con cProfile (protegido por un token de
+  admin) y resume los frames más costosos, con foco en el scoring y boto3
+- StackSampler: muestrea periódicamente los stacks de todos los hilos y
+  vuelca archivos "folded" para armar flame graphs (flamegraph.pl, speedscope)
+"""
+
+import os
+import sys
+import hmac
+import time
+import uuid
+import pstats
+import logging
+import cProfile
+import threading
+import contextvars
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_DIR = '/tmp/profiles'
+
+# Funciones que interesan en el resumen aunque no estén entre las más costosas
+FOCUS_FUNCTIONS = {
+    'calculate_similarity', 'score_titles', 'extract_text_features', 'extract_features_batch',
+    'predict_similarity', 'predict_proba_features', 'get_item_timed', '_make_api_call',
+}
+
+# Profiler de la request en curso (lo usa wrap_for_profiling en los hilos del pool)
+_active_profiler: contextvars.ContextVar = contextvars.ContextVar('active_profiler', default=None)
+
+
+def profiling_authorized(token: Optional[str]) -> bool:
+    """El token coincide con PROFILING_ADMIN_TOKEN (sin variable, el profiling está desactivado)"""
+    expected = os.getenv('PROFILING_ADMIN_TOKEN')
+    if not expected or not token:
+        return False
+    return hmac.compare_digest(expected.encode('utf-8'), token.encode('utf-8'))
+
+
+def _frame_row(func, stat) -> Dict[str, Any]:
+    filename, line, name = func
+    calls, primitive_calls, tottime, cumtime, _ = stat
+    return {
+        'function': name,
+        'file': filename,
+        'line': line,
+        'calls': calls,
+        'tottime_ms': round(tottime * 1000, 3),
+        'cumtime_ms': round(cumtime * 1000, 3),
+    }
+
+
+class RequestProfiler:
+    """cProfile de una request, incluyendo las tareas que esta envía al pool de I/O.
+
+    cProfile solo ve el hilo que lo activa: las funciones enviadas al pool con
+    wrap_for_profiling se perfilan en su hilo y se suman al reporte.
+    """
+
+    def __init__(self, label: str = '', top_n: int = 25, profile_dir: Optional[str] = None):
+        self.label = label
+        self.top_n = top_n
+        # PROFILE_DIR por defecto; '' para no guardar el .pstats
+        self.profile_dir = os.getenv('PROFILE_DIR', DEFAULT_PROFILE_DIR) if profile_dir is None else profile_dir
+        self.profile_id = uuid.uuid4().hex[:12]
+        self._profile = cProfile.Profile()
+        self._worker_profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+        self._token = None
+        self._start = None
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._token = _active_profiler.set(self)
+        self._profile.enable()
+
+    def wrap(self, fn: Callable) -> Callable:
+        def profiled(*args, **kwargs):
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self._lock:
+                    self._worker_profiles.append(profile)
+        return profiled
+
+    def stop(self) -> Dict[str, Any]:
+        """Detener el profiler y devolver el resumen (y guardar el .pstats si hay profile_dir)"""
+        self._profile.disable()
+        elapsed_ms = (time.perf_counter() - self._start) * 1000
+        if self._token is not None:
+            _active_profiler.reset(self._token)
+            self._token = None
+        stats = pstats.Stats(self._profile)
+        with self._lock:
+            for profile in self._worker_profiles:
+                stats.add(profile)
+
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        report = {
+            'profile_id': self.profile_id,
+            'label': self.label,
+            'wall_ms': round(elapsed_ms, 3),
+            'top': [_frame_row(func, stat) for func, stat in rows[:self.top_n]],
+            'focus': [_frame_row(func, stat) for func, stat in rows if func[2] in FOCUS_FUNCTIONS],
+        }
+        if self.profile_dir:
+            try:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                path = os.path.join(self.profile_dir, f"request-{self.profile_id}.pstats")
+                stats.dump_stats(path)
+                report['pstats_path'] = path
+            except OSError as e:
+                logger.warning(f"No se pudo guardar el profile: {e}")
+        logger.info(f"Profile {self.profile_id} ({self.label}): {elapsed_ms:.1f} ms")
+        return report
+
+
+def wrap_for_profiling(fn: Callable) -> Callable:
+    """fn tal cual, o perfilada si la request en curso tiene un RequestProfiler activo"""
+    profiler = _active_profiler.get()
+    return fn if profiler is None else profiler.wrap(fn)
+
+
+class StackSampler:
+    """Sampler de bajo overhead: cada interval_seconds toma el stack de todos los hilos.
+
+    Acumula stacks en formato "folded" (frame;frame;frame cantidad) y los vuelca
+    a profile_dir cada dump_seconds. Cuesta un recorrido de frames por muestra,
+    sin instrumentar llamadas, así que puede quedar activo en producción.
+    """
+
+    def __init__(self, interval_seconds: float = 0.01, dump_seconds: float = 60.0,
+                 profile_dir: Optional[str] = None, max_depth: int = 64):
+        self.interval_seconds = interval_seconds
+        self.dump_seconds = dump_seconds
+        self.profile_dir = profile_dir or os.getenv('PROFILE_DIR', DEFAULT_PROFILE_DIR)
+        self.max_depth = max_depth
+        self._stacks: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.samples = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        self.dump()
+
+    def sample(self):
+        """Tomar una muestra del stack de cada hilo (salvo el propio sampler)"""
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        folded = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            folded.append(';'.join(reversed(stack)))
+        with self._lock:
+            self._stacks.update(folded)
+            self.samples += 1
+
+    def folded(self) -> str:
+        with self._lock:
+            return ''.join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def dump(self) -> Optional[str]:
+        """Volcar lo acumulado a un archivo .folded y empezar de nuevo"""
+        data = self.folded()
+        with self._lock:
+            self._stacks.clear()
+        if not data:
+            return None
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f"stacks-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.folded")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        return path
+
+    def _run(self):
+        last_dump = time.monotonic()
+        while not self._stopped.wait(self.interval_seconds):
+            try:
+                self.sample()
+                if time.monotonic() - last_dump >= self.dump_seconds:
+                    path = self.dump()
+                    last_dump = time.monotonic()
+                    if path:
+                        logger.info(f"Stacks muestreados volcados en {path}")
+            except Exception as e:
+                logger.warning(f"Error en el sampler de stacks: {e}")
+
+
+def build_stack_sampler() -> Optional[StackSampler]:
+    """Sampler configurado por variables de entorno (None si PROFILING_SAMPLER no es 1).
+
+    - PROFILING_SAMPLE_INTERVAL (0.01 s) y PROFILING_DUMP_SECONDS (60)
+    - PROFILE_DIR: carpeta de los .folded y .pstats (por defecto /tmp/profiles)
+    """
+    if os.getenv('PROFILING_SAMPLER') != '1':
+        return None
+    sampler = StackSampler(
+        interval_seconds=float(os.getenv('PROFILING_SAMPLE_INTERVAL', '0.01')),
+        dump_seconds=float(os.getenv('PROFILING_DUMP_SECONDS', '60')),
+    )
+    sampler.start()
+    return sampler
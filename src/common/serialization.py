@@ -0,0 +1,100 @@
+"""
+Serialización JSON de las respuestas (Flask y Lambda)
+Usa orjson si está instalado y json de la librería estándar si no. Los
+Decimal de DynamoDB se serializan como números (int si son enteros)
+"""
+
+import os
+import json
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+# Enteros representables exactamente como float, y rango de int que acepta orjson
+_MAX_SAFE_INT = 2 ** 53
+_MAX_INT64 = 2 ** 63
+
+
+def decimal_to_number(value: Decimal):
+    """Decimal de DynamoDB a int (si es entero) o float"""
+    number = float(value)
+    if number.is_integer():
+        if -_MAX_SAFE_INT < number < _MAX_SAFE_INT:
+            return int(number)
+        # Fuera del rango exacto de float, el int sale del Decimal (si entra en 64 bits)
+        if -_MAX_INT64 <= value < _MAX_INT64:
+            return int(value)
+    return number
+
+
+def _default(obj: Any):
+    if isinstance(obj, Decimal):
+        return decimal_to_number(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    # Mismo comportamiento que el default=str anterior para cualquier otro tipo
+    return str(obj)
+
+
+class StdlibSerializer:
+    """json de la librería estándar con el mismo manejo de tipos"""
+
+    name = 'json'
+
+    def dumps(self, obj: Any) -> str:
+        return json.dumps(obj, default=_default, ensure_ascii=False)
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        return self.dumps(obj).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonSerializer:
+    """orjson: serialización en C; los Decimal pasan por _default"""
+
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson  # dependencia opcional
+        self._orjson = orjson
+
+    def dumps(self, obj: Any) -> str:
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        return self._orjson.dumps(obj, default=_default, option=self._orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data):
+        return self._orjson.loads(data)
+
+
+def build_serializer(name: str = None):
+    """Serializer por nombre (JSON_SERIALIZER: 'orjson', 'json' o 'auto', por defecto auto)"""
+    name = name or os.getenv('JSON_SERIALIZER', 'auto')
+    if name == 'json':
+        return StdlibSerializer()
+    try:
+        return OrjsonSerializer()
+    except ImportError:
+        if name == 'orjson':
+            logger.warning("JSON_SERIALIZER=orjson pero orjson no está instalado, usando json")
+        return StdlibSerializer()
+
+
+serializer = build_serializer()
+
+
+def dumps(obj: Any) -> str:
+    return serializer.dumps(obj)
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    return serializer.dumps_bytes(obj)
@@ -0,0 +1,64 @@
+"""
+Coalescencia de llamadas concurrentes idénticas (single-flight)
+La primera llamada con una clave ejecuta el cálculo; las que llegan mientras
+está en curso esperan y comparten su resultado (o su excepción)
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Grupo de llamadas en curso indexadas por clave.
+
+    Solo se coalescen llamadas simultáneas: al terminar, la clave se libera y
+    la siguiente llamada vuelve a ejecutar (no es una caché). El resultado se
+    comparte por referencia, así que quien lo reciba no debe modificarlo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Ejecutar fn o unirse a la ejecución en curso; devuelve (resultado, compartido)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'executions': self.executions, 'coalesced': self.coalesced, 'in_flight': len(self._calls)}
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los módulos compartidos se importan de forma plana (from pair_cache import ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -0,0 +1,45 @@
+from decimal import Decimal
+
+from batch_mutations import batch_delete, build_update_expression
+
+
+class FlakyDynamoDB:
+    """Devuelve parte de cada batch como UnprocessedItems las primeras veces"""
+
+    def __init__(self, throttled_rounds):
+        self.throttled_rounds = throttled_rounds
+        self.calls = []
+
+    def batch_write_item(self, RequestItems):
+        requests = RequestItems['item_pairs']
+        self.calls.append(len(requests))
+        assert len(requests) <= 25
+        if self.throttled_rounds > 0:
+            self.throttled_rounds -= 1
+            return {'UnprocessedItems': {'item_pairs': requests[len(requests) // 2:]}}
+        return {'UnprocessedItems': {}}
+
+
+def test_batch_delete_chunks_and_retries_unprocessed_items():
+    dynamodb = FlakyDynamoDB(throttled_rounds=2)
+    ids = [f'{i}_{i + 1}' for i in range(60)] + ['0_1']
+
+    results = list(batch_delete(dynamodb, 'item_pairs', ids, max_workers=2))
+
+    assert sorted(r['pair_id'] for r in results) == sorted(set(ids))
+    assert all(r['result'] == 'deleted' for r in results)
+    # 3 chunks (25, 25, 10) más los reintentos de las mitades no procesadas
+    assert len(dynamodb.calls) == 5
+
+
+def test_batch_delete_reports_items_left_unprocessed():
+    dynamodb = FlakyDynamoDB(throttled_rounds=100)
+    results = list(batch_delete(dynamodb, 'item_pairs', ['1_2', '3_4'], max_workers=1))
+    assert {r['pair_id']: r['result'] for r in results} == {'1_2': 'deleted', '3_4': 'failed'}
+
+
+def test_update_expression_uses_placeholders_for_reserved_words():
+    expression, names, values = build_update_expression({'status': 'negativo', 'similarity_score': 0.25})
+    assert expression == 'SET #f0 = :v0, #f1 = :v1'
+    assert names == {'#f0': 'similarity_score', '#f1': 'status'}
+    assert values == {':v0': Decimal('0.25'), ':v1': 'negativo'}
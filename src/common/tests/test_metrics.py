@@ -0,0 +1,57 @@
+import boto3
+from moto import mock_aws
+
+from metrics import MetricsRegistry, instrument_dynamodb
+
+
+def test_prometheus_histograms_and_counters():
+    registry = MetricsRegistry(buckets=(0.01, 0.1))
+    registry.describe('stage_duration_seconds', 'Latencia por etapa')
+    registry.observe('stage_duration_seconds', 0.005, stage='featurize')
+    registry.observe('stage_duration_seconds', 0.05, stage='featurize')
+    registry.observe('stage_duration_seconds', 0.5, stage='featurize')
+    registry.inc('similarity_scorer_total', scorer='ml')
+
+    text = registry.render_prometheus()
+    assert '# HELP stage_duration_seconds Latencia por etapa' in text
+    assert 'stage_duration_seconds_bucket{stage="featurize",le="0.01"} 1' in text
+    assert 'stage_duration_seconds_bucket{stage="featurize",le="0.1"} 2' in text
+    assert 'stage_duration_seconds_bucket{stage="featurize",le="+Inf"} 3' in text
+    assert 'stage_duration_seconds_count{stage="featurize"} 3' in text
+    assert 'similarity_scorer_total{scorer="ml"} 1' in text
+
+
+def test_emf_record_contains_raw_values_and_resets():
+    registry = MetricsRegistry(keep_raw=True)
+    registry.observe('stage_duration_seconds', 0.002, stage='predict_proba')
+    registry.observe('stage_duration_seconds', 0.004, stage='predict_proba')
+    registry.inc('similarity_scorer_total', scorer='tfidf')
+
+    record = registry.flush_emf('ItemSimilarity', {'Route': '/items/compare'})
+    directive = record['_aws']['CloudWatchMetrics'][0]
+    assert directive['Dimensions'] == [['Route']]
+    assert record['Route'] == '/items/compare'
+    assert record['stage_predict_proba_ms'] == [2.0, 4.0]
+    assert record['similarity_scorer_tfidf'] == 1.0
+    assert {'Name': 'stage_predict_proba_ms', 'Unit': 'Milliseconds'} in directive['Metrics']
+    assert registry.flush_emf('ItemSimilarity', {})['_aws']['CloudWatchMetrics'][0]['Metrics'] == []
+
+
+@mock_aws
+def test_dynamodb_calls_record_latency_and_consumed_capacity():
+    resource = boto3.resource('dynamodb', region_name='us-east-1')
+    table = resource.create_table(
+        TableName='item_pairs',
+        KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    registry = MetricsRegistry()
+    instrument_dynamodb(resource.meta.client, registry)
+
+    table.put_item(Item={'id': '1_2'})
+    table.get_item(Key={'id': '1_2'})
+
+    text = registry.render_prometheus()
+    assert 'stage_duration_seconds_count{stage="dynamodb_GetItem"} 1' in text
+    assert 'dynamodb_consumed_capacity_units_total{operation="PutItem",table="item_pairs"}' in text
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pair_array import MAX_ITEM_ID, UNKNOWN_LABEL, PairArray, pack_pair_keys, unpack_pair_keys
+
+
+def test_keys_pack_both_ids_and_reject_overflow():
+    keys = pack_pair_keys([645_000_000, 0], [MAX_ITEM_ID, 7])
+    assert keys.dtype == np.uint64
+    item_a, item_b = unpack_pair_keys(keys)
+    assert item_a.tolist() == [645_000_000, 0] and item_b.tolist() == [MAX_ITEM_ID, 7]
+    with pytest.raises(ValueError):
+        pack_pair_keys([MAX_ITEM_ID + 1], [1])
+
+
+def test_from_csv_interns_titles_and_filters(tmp_path):
+    csv_path = tmp_path / "pairs.csv"
+    pd.DataFrame([[9, ' Mouse Logitech ', 2, 'Teclado'],
+                  [3, 'Mouse Logitech', 4, ''],
+                  [5, 'Teclado', 6, 'Mouse Logitech']],
+                 columns=['ITEM_A', 'TITLE_A', 'ITEM_B', 'TITLE_B']).to_csv(csv_path, index=False)
+
+    pairs = PairArray.from_csv(str(csv_path), chunksize=2)
+
+    assert len(pairs) == 3 and len(pairs.titles) == 3
+    assert pairs.pair_ids() == ['2_9', '3_4', '5_6']
+    assert pairs[0]['item_a_title'] == 'Mouse Logitech'
+
+    valid = pairs.select(pairs.valid_titles())
+    assert valid.item_a_ids.tolist() == [9, 5]
+    assert [pair['item_b_title'] for pair in valid] == ['Teclado', 'Mouse Logitech']
+
+
+def test_from_csv_blank_labels_are_unknown(tmp_path):
+    csv_path = tmp_path / "labels.csv"
+    csv_path.write_text("ITEM_A,TITLE_A,ITEM_B,TITLE_B,IS_SIMILAR\n"
+                        "1,Mouse,2,Mouse Logitech,1\n"
+                        "3,Teclado,4,Monitor,\n"
+                        "5,Monitor LG,6,Pantalla LG,0\n"
+                        "7,Mouse,8,Teclado,n/a\n")
+
+    pairs = PairArray.from_csv(str(csv_path), chunksize=2)
+
+    assert pairs.labels.tolist() == [1, UNKNOWN_LABEL, 0, UNKNOWN_LABEL]
+
+
+def test_save_load_round_trip_keeps_columns_status_and_errors(tmp_path):
+    pairs = PairArray.from_records([
+        {'item_a_id': 1, 'item_a_title': 'Monitor LG', 'item_b_id': 2, 'item_b_title': 'Pantalla LG', 'is_similar': 1},
+        {'item_a_id': 3, 'item_a_title': 'Mouse', 'item_b_id': 4, 'item_b_title': 'Teclado', 'is_similar': 0},
+    ])
+    pairs.scores[:] = [0.9, 0.1]
+    pairs.columns['pair_exists'] = np.array([True, False])
+    pairs.set_status(0, 'positivo')
+    pairs.set_error(1, 'timeout')
+
+    pairs.save(str(tmp_path / "pairs.npz"))
+    loaded = PairArray.load(str(tmp_path / "pairs.npz"))
+
+    assert list(loaded) == list(pairs)
+    assert loaded[0] == {'item_a_id': 1, 'item_a_title': 'Monitor LG', 'item_b_id': 2, 'item_b_title': 'Pantalla LG',
+                         'is_similar': 1, 'similarity_score': 0.9, 'status': 'positivo', 'pair_exists': True}
+    assert loaded.select(loaded.error_mask())[0]['error'] == 'timeout'
+    assert loaded.status_mask('positivo').tolist() == [True, False]
+
+
+def test_concat_remaps_title_codes():
+    first = PairArray.from_records([{'item_a_title': 'a', 'item_b_title': 'b', 'is_similar': 1}])
+    second = PairArray.from_records([{'item_a_title': 'c', 'item_b_title': 'a', 'is_similar': 0}])
+
+    merged = PairArray.concat([first, second])
+
+    assert merged.title_columns() == (['a', 'c'], ['b', 'a'])
+    assert merged.labels.tolist() == [1, 0]
+    assert len(merged.titles) == 3
@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from pair_bloom import KnownPairIndex, PairBloomFilter
+from pair_store import ChangeFeedGap, MemoryPairStore, SQLitePairStore
+
+
+def test_no_false_negatives_and_bounded_false_positives(tmp_path):
+    ids = [f"{i}_{i + 7}" for i in range(5000)]
+    bloom = PairBloomFilter.from_ids(ids, false_positive_rate=0.01)
+
+    assert all(pair_id in bloom for pair_id in ids)
+    false_positives = sum(f"{i}_x" in bloom for i in range(20000))
+    assert false_positives / 20000 < 0.02
+
+    path = tmp_path / "pair_bloom.bin"
+    bloom.save(str(path))
+    loaded = PairBloomFilter.load(str(path))
+    assert loaded.count == bloom.count and loaded.bits == bloom.bits
+    assert path.stat().st_size < 15_000
+
+
+def _pair(pair_id):
+    return {'id': pair_id}
+
+
+def test_index_skips_only_while_following_the_change_feed():
+    store = MemoryPairStore()
+    index = KnownPairIndex(source=store)
+    assert index.might_exist("1_2")  # sin filtro nunca se omite la lectura
+
+    index.replace(PairBloomFilter.from_ids(["1_2"]))
+    assert index.might_exist("3_4")  # sin seguir el registro no se confía en los negativos
+    index.follow(index.bloom.built_at)
+    assert index.might_exist("1_2")
+    assert not index.might_exist("3_4")
+    index.add("3_4")
+    assert index.might_exist("3_4")
+    assert index.stats()['skipped_reads'] == 1
+
+    # Pasada la cota de staleness sin leer el registro, los negativos dejan de usarse
+    index.sync_seconds = 0
+    index._synced_at -= index.max_staleness_seconds + 1
+    assert index.might_exist("5_6")
+    assert index.stats()['would_skip'] == 2
+
+
+def test_other_writers_reach_the_filter_through_the_change_feed():
+    store = MemoryPairStore()
+    snapshot = PairBloomFilter.from_ids(["1_2"])
+    writer_a = KnownPairIndex(PairBloomFilter.from_bytes(snapshot.to_bytes()), source=store, sync_seconds=0.01)
+    writer_b = KnownPairIndex(PairBloomFilter.from_bytes(snapshot.to_bytes()), source=store, sync_seconds=0.01)
+    for index in (writer_a, writer_b):
+        index.follow(snapshot.built_at)
+
+    # A crea un par; B lo ve en su próxima lectura del registro, sin leer la tabla
+    store.put(_pair("5_6"))
+    writer_a.add("5_6")
+    time.sleep(0.02)
+    assert writer_b.might_exist("5_6")
+    assert "5_6" in writer_b.bloom and writer_b.skipped_reads == 0
+
+
+def test_snapshot_catches_up_with_writes_since_it_was_built(tmp_path):
+    store = SQLitePairStore(str(tmp_path / 'pairs.sqlite3'))
+    store.put(_pair("1_2"))
+    snapshot = PairBloomFilter.from_ids(store.iter_ids())
+    store.put(_pair("7_8"))  # escrito después del snapshot (p. ej. mientras se desplegaba)
+
+    index = KnownPairIndex(snapshot, source=store)
+    assert index.follow(snapshot.built_at) == 1
+    assert index.might_exist("7_8")
+    assert not index.might_exist("9_10")
+
+
+def test_snapshot_older_than_the_log_is_never_trusted():
+    store = MemoryPairStore()
+    store._changes = type(store._changes)(maxlen=1)
+    snapshot = PairBloomFilter.from_ids([])
+    for i in range(3):
+        store.put(_pair(f"{i}_{i + 1}"))  # el registro descartó cambios posteriores al snapshot
+
+    index = KnownPairIndex(snapshot, source=store)
+    with pytest.raises(ChangeFeedGap):
+        index.follow(snapshot.built_at)
+    assert index.might_exist("0_1") and not index.usable
+    assert index.stats()['following_changes'] is False
@@ -0,0 +1,65 @@
+import time
+from decimal import Decimal
+
+from pair_cache import MemoryCacheBackend, PairCache, read_through
+
+
+def test_read_through_caches_hits_and_misses():
+    calls = []
+    store = {'1_2': {'id': '1_2', 'similarity_score': Decimal('0.91')}}
+
+    def loader(pair_id):
+        calls.append(pair_id)
+        return store.get(pair_id)
+
+    cache = PairCache(ttl_seconds=60, negative_ttl_seconds=60)
+    for _ in range(3):
+        assert read_through(cache, '1_2', loader)['similarity_score'] == Decimal('0.91')
+        assert read_through(cache, '3_4', loader) is None
+
+    assert calls == ['1_2', '3_4']
+    stats = cache.stats()
+    assert (stats['hits'], stats['negative_hits'], stats['misses']) == (2, 2, 2)
+    assert stats['hit_ratio'] == 4 / 6
+
+
+def test_invalidate_ttl_and_lru_bound():
+    cache = PairCache(MemoryCacheBackend(max_entries=2), ttl_seconds=0.05, negative_ttl_seconds=0.05)
+    cache.put('a', {'id': 'a'})
+    cache.invalidate('a')
+    assert cache.get('a') == (False, None)
+
+    cache.put('a', {'id': 'a'})
+    time.sleep(0.06)
+    assert cache.get('a') == (False, None)
+
+    for key in ('a', 'b', 'c'):
+        cache.put(key, {'id': key})
+    assert cache.get('a') == (False, None)
+    assert cache.get('c') == (True, {'id': 'c'})
+    assert cache.stats()['evictions'] == 1
+
+
+def test_disabled_cache_never_hits():
+    cache = PairCache(ttl_seconds=0)
+    cache.put('a', {'id': 'a'})
+    assert cache.get('a') == (False, None)
+
+
+def test_load_racing_an_invalidation_is_not_cached():
+    cache = PairCache(ttl_seconds=60, negative_ttl_seconds=60)
+    store = {'1_2': {'id': '1_2', 'status': 'negativo'}}
+
+    def racing_loader(pair_id):
+        stale = dict(store[pair_id])
+        # Escritura + invalidación concurrente mientras la lectura está en vuelo
+        store[pair_id] = {'id': '1_2', 'status': 'positivo'}
+        cache.invalidate(pair_id)
+        return stale
+
+    assert read_through(cache, '1_2', racing_loader)['status'] == 'negativo'
+    assert cache.get('1_2') == (False, None)
+    assert cache.stats()['stale_skips'] == 1
+
+    assert read_through(cache, '1_2', store.get)['status'] == 'positivo'
+    assert cache.get('1_2') == (True, {'id': '1_2', 'status': 'positivo'})
@@ -0,0 +1,106 @@
+from decimal import Decimal
+
+import pytest
+
+from pair_replica import PairColumns, ReplicaPairStore
+from pair_store import ChangeFeedGap, MemoryPairStore
+
+
+def _pair(a, b, **extra):
+    return {'id': f'{a}_{b}', 'item_a_id': Decimal(a), 'item_a_title': f'Producto {a}',
+            'item_b_id': Decimal(b), 'item_b_title': f'Producto {b}', 'similarity_score': Decimal('0.8734'),
+            'are_similar': True, 'status': 'positivo', 'created_at': '2024-05-01T10:00:00.123456',
+            'updated_at': '2024-05-01T10:00:00.123456', **extra}
+
+
+def test_columns_round_trip_exactly_and_keep_odd_values_as_extras():
+    columns = PairColumns()
+    odd = _pair(1, 2, similarity_score=Decimal('0.50'), created_at='2024-05-01 10:00:00',
+                item_a_id='sku-1', tags=['a', 'b'])
+    for item in (_pair(3, 4), odd):
+        columns.upsert(item)
+        assert columns.get(item['id']) == item
+
+    columns.remove('1_2')
+    columns.upsert(_pair(5, 6))
+    assert len(columns) == 2 and len(columns.ids) == 2  # reutiliza la fila borrada
+    assert columns.get('1_2') is None
+    assert not columns.extras
+
+
+def test_replica_serves_reads_and_applies_writes_and_deltas():
+    source = MemoryPairStore()
+    list(source.batch_put([_pair(i, i + 1) for i in range(10)]))
+    replica = ReplicaPairStore(source, refresh_seconds=0)
+    replica.start()
+
+    assert replica.get('3_4') == _pair(3, 4)
+    assert replica.get('99_100') is None
+    assert replica.stats()['replica_reads'] == 2
+
+    replica.update('3_4', {'status': 'negativo'})
+    assert replica.get('3_4')['status'] == 'negativo'
+    assert source.get('3_4')['updated_at'] == replica.get('3_4')['updated_at'] > '2024-05-01'
+
+    # Escritura de otro proceso: la réplica la ve recién en el refresh
+    source.put(_pair(20, 21, updated_at='2024-06-01T00:00:00'))
+    assert replica.get('20_21') is None
+    assert replica.refresh() >= 1
+    assert replica.get('20_21')['item_a_title'] == 'Producto 20'
+
+    list(replica.batch_delete(['0_1']))
+    assert replica.get('0_1') is None and source.get('0_1') is None
+    assert replica.stats()['memory_bytes'] > 0
+
+
+def test_stale_replica_falls_back_to_the_source():
+    source = MemoryPairStore()
+    replica = ReplicaPairStore(source, refresh_seconds=0, max_staleness_seconds=0.0)
+    replica.start()
+    source.put(_pair(1, 2))
+
+    replica._refreshed_at -= 1
+    assert not replica.fresh
+    assert replica.get('1_2')['id'] == '1_2'
+    assert replica.stats()['fallback_reads'] == 1
+
+
+def test_replica_sees_deletes_from_other_writers_and_reloads_on_a_gap():
+    source = MemoryPairStore()
+    list(source.batch_put([_pair(i, i + 1) for i in range(5)]))
+    replica = ReplicaPairStore(source, refresh_seconds=0)
+    replica.start()
+
+    # Borrado de otro proceso: lo trae el registro de cambios, sin recarga completa
+    source.delete('2_3')
+    assert replica.get('2_3') is not None
+    replica.refresh()
+    assert replica.get('2_3') is None
+    assert replica.stats()['deletes_applied'] == 1 and replica.stats()['reloads'] == 0
+
+    # El registro descartó cambios sin leer: se recarga el snapshot
+    source._changes = type(source._changes)(maxlen=1)
+    source.delete('3_4')
+    source.put(_pair(9, 10))
+    replica.refresh()
+    assert replica.get('3_4') is None and replica.get('9_10') is not None
+    assert replica.stats()['reloads'] == 1
+
+
+
+def test_replica_load_gives_up_after_repeated_gaps_without_recursing():
+    class GappyFeed:
+        def poll(self):
+            raise ChangeFeedGap("retención vencida")
+
+        def close(self):
+            pass
+
+    source = MemoryPairStore()
+    source.put(_pair(1, 2))
+    replica = ReplicaPairStore(source, refresh_seconds=0)
+    source.change_feed = GappyFeed
+    with pytest.raises(ChangeFeedGap):
+        replica.load()
+    assert not replica.fresh
+    assert replica.get('1_2')['id'] == '1_2'  # desde el origen
@@ -0,0 +1,202 @@
+import time
+from decimal import Decimal
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from pair_store import ChangeFeedGap, ChangeFeedUnavailable, DynamoDBPairStore, MemoryPairStore, PairExistsError, PairNotFoundError, PairStore, \
+    SQLitePairStore, build_pair_store
+
+
+@pytest.fixture(params=['memory', 'sqlite', 'dynamodb'])
+def store(request, monkeypatch, tmp_path):
+    if request.param == 'memory':
+        yield MemoryPairStore()
+    elif request.param == 'sqlite':
+        yield SQLitePairStore(str(tmp_path / 'pairs.sqlite3'))
+    else:
+        monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+        monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+        monkeypatch.delenv("AWS_ENDPOINT_URL", raising=False)
+        with mock_aws():
+            from dynamodb_client import reset_clients
+            reset_clients()
+            dynamo_store = build_pair_store('dynamodb')
+            dynamo_store.ensure_schema()
+            yield dynamo_store
+            reset_clients()
+
+
+def _pair(a, b, **extra):
+    return {'id': f'{a}_{b}', 'item_a_id': a, 'item_b_id': b, 'similarity_score': Decimal('0.5'), **extra}
+
+
+def test_put_get_update_delete(store):
+    store.put(_pair(1, 2))
+    with pytest.raises(PairExistsError):
+        store.put(_pair(1, 2), if_not_exists=True)
+
+    store.update('1_2', {'status': 'positivo', 'similarity_score': 0.9})
+    pair = store.get('1_2')
+    assert pair['status'] == 'positivo'
+    assert pair['similarity_score'] == Decimal('0.9')
+    assert pair['item_a_id'] == 1
+
+    with pytest.raises(PairNotFoundError):
+        store.update('8_9', {'status': 'negativo'}, must_exist=True)
+    with pytest.raises(ValueError):
+        store.update('1_2', {'id': 'otro'})
+
+    store.delete('1_2')
+    assert store.get('1_2') is None
+
+
+def test_batches_report_per_pair_results(store):
+    results = list(store.batch_put([_pair(i, i + 1) for i in range(60)]))
+    assert len(results) == 60 and {r['result'] for r in results} == {'created'}
+    assert set(store.batch_get(['0_1', '59_60', '99_100'])) == {'0_1', '59_60'}
+
+    updated = {r['pair_id']: r['result'] for r in store.batch_update(['0_1', '99_100'], {'status': 'negativo'})}
+    assert updated == {'0_1': 'updated', '99_100': 'not_found'}
+    assert store.get('99_100') is None
+
+    calls = []
+    deleted = list(store.batch_delete([f'{i}_{i + 1}' for i in range(60)], max_workers=1,
+                                      should_continue=lambda: not calls.append(1) and len(calls) <= 1))
+    assert sum(r['result'] == 'deleted' for r in deleted) == 25
+    assert sum(r['result'] == 'not_attempted' for r in deleted) == 35
+
+
+def test_query_by_item_and_paged_scan(store):
+    list(store.batch_put([_pair(1, 2), _pair(1, 3), _pair(2, 3), _pair(4, 5)]))
+
+    assert sorted(p['id'] for p in store.query_by_item(3)) == ['1_3', '2_3']
+    assert len(store.query_by_item(1, limit=1)) == 1
+
+    seen, start_key = [], None
+    while True:
+        items, start_key = store.scan_page(3, start_key)
+        seen.extend(item['id'] for item in items)
+        if start_key is None:
+            break
+    assert sorted(seen) == ['1_2', '1_3', '2_3', '4_5']
+    assert sorted(store.iter_ids()) == sorted(seen)
+
+    # Sin limit: una página nativa del backend (toda la tabla en este tamaño)
+    items, start_key = store.scan_page(None)
+    assert sorted(item['id'] for item in items) == sorted(seen) and start_key is None
+
+
+def test_dynamodb_query_by_item_uses_the_item_indexes(monkeypatch):
+    with pytest.raises(TypeError):
+        PairStore()
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.delenv("AWS_ENDPOINT_URL", raising=False)
+    with mock_aws():
+        from dynamodb_client import reset_clients
+        reset_clients()
+        # Tabla creada antes de los índices: ensure_schema los agrega
+        boto3.resource('dynamodb', region_name='us-east-1').create_table(
+            TableName='item_pairs', KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}], BillingMode='PAY_PER_REQUEST')
+        store = build_pair_store('dynamodb')
+        store.ensure_schema()
+        assert {index['IndexName'] for index in store.table.global_secondary_indexes} == \
+            {'item_a_id-index', 'item_b_id-index'}
+
+        list(store.batch_put([_pair(1, 2), _pair(1, 3), _pair(2, 3), _pair(3, 3)]))
+        monkeypatch.setattr(type(store.table), 'scan', lambda *args, **kwargs: pytest.fail("Scan de la tabla"),
+                            raising=False)
+        assert [p['id'] for p in store.query_by_item(3)] == ['1_3', '2_3', '3_3']
+        assert [p['id'] for p in store.query_by_item('3', limit=2)] == ['1_3', '2_3']
+        assert store.query_by_item('sku-1') == []
+        reset_clients()
+
+
+def test_change_feed_reports_writes_and_deletes(store, tmp_path):
+    list(store.batch_put([_pair(1, 2), _pair(2, 3)]))
+    feed = store.change_feed()
+    assert feed.poll() == []
+
+    store.put(_pair(3, 4))
+    store.update('1_2', {'status': 'negativo'})
+    store.delete('2_3')
+    list(store.batch_put([_pair(5, 6), _pair(6, 7)]))
+    list(store.batch_delete(['5_6']))
+    if isinstance(store, SQLitePairStore):
+        # Otro proceso sobre el mismo archivo: los triggers registran también sus escrituras
+        SQLitePairStore(store.path).put(_pair(8, 9))
+
+    replica = {item['id']: item for item in [_pair(1, 2), _pair(2, 3)]}
+    for pair_id, item in feed.poll():
+        if item is None:
+            replica.pop(pair_id, None)
+        else:
+            replica[pair_id] = item
+    assert replica == {item['id']: item for item in store.iter_items()}
+    assert replica['1_2']['status'] == 'negativo' and '2_3' not in replica and '5_6' not in replica
+    assert feed.poll() == []
+
+
+def test_change_feed_since_replays_retained_changes(store):
+    store.put(_pair(1, 2))
+    since = time.time()
+    store.put(_pair(3, 4))
+    store.delete('1_2')
+
+    changes = store.change_feed(since=since).poll()
+    assert ('3_4', _pair(3, 4)) in changes and ('1_2', None) in changes
+    if not isinstance(store, MemoryPairStore):
+        # Más viejo que la retención (o que el registro): no se puede asegurar que estén todos
+        with pytest.raises(ChangeFeedGap):
+            store.change_feed(since=since - 2 * 24 * 3600)
+
+
+def test_change_feed_gap_when_the_log_dropped_unread_changes(tmp_path):
+    memory = MemoryPairStore()
+    feed = memory.change_feed()
+    memory._changes = type(memory._changes)(maxlen=2)
+    for i in range(3):
+        memory.put(_pair(i, i + 1))
+    with pytest.raises(ChangeFeedGap):
+        feed.poll()
+
+    sqlite = SQLitePairStore(str(tmp_path / 'pairs.sqlite3'))
+    feed = sqlite.change_feed()
+    sqlite.put(_pair(1, 2))
+    sqlite._connection().execute(f"DELETE FROM {sqlite.changes_table}")  # retención vencida
+    with pytest.raises(ChangeFeedGap):
+        feed.poll()
+
+
+
+def test_dynamodb_stream_reader_is_shared_per_process_and_limited(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.delenv("AWS_ENDPOINT_URL", raising=False)
+    with mock_aws():
+        from dynamodb_client import reset_clients
+        reset_clients()
+        store = DynamoDBPairStore(max_stream_readers=1)
+        store.ensure_schema()
+        # Dos consumidores del mismo proceso ocupan un solo lugar
+        replica_feed, bloom_feed = store.change_feed(), store.change_feed()
+        other_process = DynamoDBPairStore(max_stream_readers=1)
+        with pytest.raises(ChangeFeedUnavailable):
+            other_process.change_feed()
+
+        store.put(_pair(1, 2))
+        assert [pair_id for pair_id, _ in replica_feed.poll()] == ['1_2']
+        assert [pair_id for pair_id, _ in bloom_feed.poll()] == ['1_2']
+
+        # Al cerrar el último consumidor se libera el lugar
+        replica_feed.close()
+        with pytest.raises(ChangeFeedUnavailable):
+            other_process.change_feed()
+        bloom_feed.close()
+        feed = other_process.change_feed()
+        other_process.put(_pair(2, 3))
+        assert [pair_id for pair_id, _ in feed.poll()] == ['2_3']
+        reset_clients()
@@ -0,0 +1,54 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from profiling import RequestProfiler, StackSampler, profiling_authorized, wrap_for_profiling
+
+
+def extract_text_features(n):
+    return sum(i * i for i in range(n))
+
+
+def get_item_timed():
+    return extract_text_features(1000)
+
+
+def test_request_profiler_includes_pool_work_and_focus_frames(tmp_path):
+    profiler = RequestProfiler(label='POST /items/compare', profile_dir=str(tmp_path))
+    profiler.start()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pool.submit(wrap_for_profiling(get_item_timed)).result()
+    extract_text_features(100)
+    report = profiler.stop()
+
+    focus = {row['function']: row for row in report['focus']}
+    assert focus['extract_text_features']['calls'] == 2
+    assert 'get_item_timed' in focus
+    assert (tmp_path / f"request-{report['profile_id']}.pstats").exists()
+    # Sin profiler activo la función no se envuelve
+    assert wrap_for_profiling(get_item_timed) is get_item_timed
+
+
+def test_profiling_requires_configured_token(monkeypatch):
+    monkeypatch.delenv('PROFILING_ADMIN_TOKEN', raising=False)
+    assert not profiling_authorized('secreto')
+    monkeypatch.setenv('PROFILING_ADMIN_TOKEN', 'secreto')
+    assert profiling_authorized('secreto')
+    assert not profiling_authorized('otro')
+
+
+def test_stack_sampler_dumps_folded_stacks(tmp_path):
+    sampler = StackSampler(profile_dir=str(tmp_path))
+    release = threading.Event()
+    worker = threading.Thread(target=release.wait, name='worker')
+    worker.start()
+    try:
+        sampler.sample()
+        sampler.sample()
+    finally:
+        release.set()
+        worker.join()
+
+    path = sampler.dump()
+    lines = open(path, encoding='utf-8').read().splitlines()
+    assert any(line.startswith('worker;') and line.endswith(' 2') for line in lines)
+    assert sampler.dump() is None
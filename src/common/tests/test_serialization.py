@@ -0,0 +1,26 @@
+import json
+from decimal import Decimal
+
+import pytest
+
+from serialization import OrjsonSerializer, StdlibSerializer
+
+
+@pytest.mark.parametrize('serializer_cls', [StdlibSerializer, OrjsonSerializer])
+def test_decimals_are_serialized_as_numbers(serializer_cls):
+    try:
+        serializer = serializer_cls()
+    except ImportError:
+        pytest.skip("orjson no está instalado")
+    body = {
+        'similarity_score': Decimal('0.8125'),
+        'item_a_id': Decimal('1234'),
+        'big_id': Decimal('1234567890123456789'),
+        'huge': Decimal('1E+40'),
+        'title': 'Teléfono',
+    }
+    decoded = json.loads(serializer.dumps(body))
+    assert decoded == {'similarity_score': 0.8125, 'item_a_id': 1234,
+                       'big_id': 1234567890123456789, 'huge': 1e40, 'title': 'Teléfono'}
+    assert isinstance(decoded['item_a_id'], int)
+    assert serializer.loads(serializer.dumps_bytes(body)) == decoded
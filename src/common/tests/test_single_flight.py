@@ -0,0 +1,58 @@
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return {'score': 0.9}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do('k', compute))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(result == {'score': 0.9} for result, _ in results)
+    assert sum(shared for _, shared in results) == 7
+    # Terminada la llamada, la clave se libera
+    flight.do('k', compute)
+    assert len(calls) == 2
+
+
+def test_errors_propagate_to_waiters():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.05)
+        raise RuntimeError("boom")
+
+    errors = []
+
+    def waiter():
+        started.wait()
+        try:
+            flight.do('k', fail)
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    with pytest.raises(RuntimeError):
+        flight.do('k', fail)
+    thread.join()
+
+    assert len(errors) == 1
+    assert flight.stats()['in_flight'] == 0
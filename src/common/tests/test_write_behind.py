@@ -0,0 +1,131 @@
+import os
+import subprocess
+import sys
+from decimal import Decimal
+
+import boto3
+from moto import mock_aws
+
+import write_behind
+from pair_store import DynamoDBPairStore, MemoryPairStore, SQLitePairStore
+from write_behind import WriteBehindBuffer, process_spool_path
+
+
+def _create_table():
+    from dynamodb_client import reset_clients
+    reset_clients()
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    return dynamodb.create_table(
+        TableName='item_pairs',
+        KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+
+@mock_aws
+def test_writes_are_coalesced_per_pair_and_flushed_in_batch(tmp_path):
+    table = _create_table()
+    buffer = WriteBehindBuffer(DynamoDBPairStore(), spool_path=str(tmp_path / 'spool.jsonl'), autostart=False)
+
+    buffer.enqueue({'id': '1_2', 'similarity_score': Decimal('0.5')})
+    buffer.enqueue({'id': '1_2', 'similarity_score': Decimal('0.9')})
+    buffer.enqueue({'id': '3_4', 'similarity_score': Decimal('0.1')})
+    assert buffer.get_pending('1_2')['similarity_score'] == Decimal('0.9')
+
+    assert buffer.flush() == 2
+    assert table.get_item(Key={'id': '1_2'})['Item']['similarity_score'] == Decimal('0.9')
+    assert buffer.get_pending('1_2') is None
+    assert buffer.stats()['coalesced'] == 1
+    # El spool del proceso queda compactado: no hay nada pendiente
+    assert open(process_spool_path(str(tmp_path / 'spool.jsonl'))).read() == ''
+
+
+@mock_aws
+def test_spool_replays_writes_accepted_before_a_crash(tmp_path):
+    table = _create_table()
+    spool = tmp_path / 'spool.jsonl'
+    crashed = WriteBehindBuffer(DynamoDBPairStore(), spool_path=str(spool), autostart=False)
+    crashed.enqueue({'id': '5_6', 'similarity_score': Decimal('0.75')})
+    # Línea a medio escribir al momento del crash
+    with open(process_spool_path(str(spool)), 'a') as f:
+        f.write('{"id": "7_')
+
+    recovered = WriteBehindBuffer(DynamoDBPairStore(), spool_path=str(spool), autostart=False)
+    assert recovered.get_pending('5_6') is not None
+    assert recovered.flush() == 1
+    assert table.get_item(Key={'id': '5_6'})['Item']['similarity_score'] == Decimal('0.75')
+
+
+def _dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+@mock_aws
+def test_workers_keep_separate_spools_and_dead_ones_are_recovered(tmp_path):
+    table = _create_table()
+    base = str(tmp_path / 'spool.jsonl')
+    # Un worker vivo (el padre) con un par pendiente y uno muerto con otro
+    live_spool = process_spool_path(base, os.getppid())
+    with open(live_spool, 'w') as f:
+        f.write('{"id": "1_2", "similarity_score": {"__decimal__": "0.4"}}\n')
+    with open(process_spool_path(base, _dead_pid()), 'w') as f:
+        f.write('{"id": "3_4", "similarity_score": {"__decimal__": "0.8"}}\n')
+
+    buffer = WriteBehindBuffer(DynamoDBPairStore(), spool_path=base, autostart=False)
+    assert buffer.get_pending('3_4') is not None
+    assert buffer.get_pending('1_2') is None
+    buffer.enqueue({'id': '5_6', 'similarity_score': Decimal('0.9')})
+    assert buffer.flush() == 2
+
+    # La compactación solo toca el spool propio: el del worker vivo sigue intacto
+    assert '1_2' in open(live_spool).read()
+    assert sorted(os.listdir(tmp_path)) == sorted([os.path.basename(live_spool),
+                                                   os.path.basename(process_spool_path(base))])
+
+
+@mock_aws
+def test_enqueue_during_compaction_is_kept_in_the_spool(tmp_path, monkeypatch):
+    table = _create_table()
+    buffer = WriteBehindBuffer(DynamoDBPairStore(), spool_path=str(tmp_path / 'spool.jsonl'), autostart=False)
+    buffer.enqueue({'id': '1_2', 'similarity_score': Decimal('0.5')})
+    real_fsync = os.fsync
+    enqueued = []
+
+    def fsync_with_concurrent_enqueue(fd):
+        # El fsync de la compactación corre sin el lock: otra request puede encolar
+        if not enqueued:
+            enqueued.append(True)
+            buffer.enqueue({'id': '7_8', 'similarity_score': Decimal('0.6')})
+        real_fsync(fd)
+
+    monkeypatch.setattr(write_behind.os, 'fsync', fsync_with_concurrent_enqueue)
+    assert buffer.flush() == 1
+
+    assert enqueued and '7_8' in open(buffer.spool_file).read()
+    recovered = WriteBehindBuffer(DynamoDBPairStore(), spool_path=str(tmp_path / 'spool.jsonl'), autostart=False)
+    assert recovered.get_pending('7_8') is not None
+
+
+def test_local_backends_flush_and_failed_pairs_are_retried(tmp_path):
+    sqlite = SQLitePairStore(str(tmp_path / 'pairs.sqlite3'))
+    buffer = WriteBehindBuffer(sqlite, spool_path=str(tmp_path / 'spool.jsonl'), autostart=False)
+    buffer.enqueue({'id': '1_2', 'similarity_score': Decimal('0.5')})
+    assert buffer.flush() == 1
+    assert sqlite.get('1_2')['similarity_score'] == Decimal('0.5')
+
+    class FlakyStore(MemoryPairStore):
+        def batch_put(self, items, action='created', max_workers=4, should_continue=None):
+            items = list(items)
+            ok = list(super().batch_put([item for item in items if item['id'] != '5_6'], action=action))
+            return ok + [{'pair_id': '5_6', 'result': 'failed', 'error': 'throttling'}]
+
+    store = FlakyStore()
+    buffer = WriteBehindBuffer(store, spool_path=str(tmp_path / 'flaky.jsonl'), autostart=False)
+    buffer.enqueue({'id': '3_4', 'similarity_score': Decimal('0.1')})
+    buffer.enqueue({'id': '5_6', 'similarity_score': Decimal('0.2')})
+    assert buffer.flush() == 1
+    assert store.get('3_4') is not None
+    assert buffer.get_pending('5_6') is not None and buffer.stats()['errors'] == 1
@@ -0,0 +1,308 @@
+"""
+Persistencia write-behind de pares
+Las escrituras se acumulan en memoria (coalesciendo por id de par), se
+registran en un spool JSONL local por proceso y un hilo en segundo plano las
+vuelca en lote al repositorio de pares (PairStore.batch_put, cualquier backend)
+"""
+
+import os
+import glob
+import json
+import time
+import atexit
+import logging
+import threading
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(value):
+    if isinstance(value, Decimal):
+        return {'__decimal__': str(value)}
+    raise TypeError(f"Tipo no serializable: {type(value)}")
+
+
+def _decode(obj):
+    if '__decimal__' in obj and len(obj) == 1:
+        return Decimal(obj['__decimal__'])
+    return obj
+
+
+def process_spool_path(base_path: str, pid: Optional[int] = None) -> str:
+    """Spool de un proceso: write_behind_spool.jsonl -> write_behind_spool.<pid>.jsonl"""
+    root, ext = os.path.splitext(base_path)
+    return f"{root}.{os.getpid() if pid is None else pid}{ext}"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _orphan_spools(base_path: str) -> Iterator[str]:
+    """Spools de procesos que ya no existen (y el spool compartido de versiones anteriores).
+
+    El nombre es <root>.<pid>[-<pid original>]<ext>: el primer pid es el dueño actual.
+    """
+    root, ext = os.path.splitext(base_path)
+    if os.path.exists(base_path):
+        yield base_path
+    for path in sorted(glob.glob(f"{glob.escape(root)}.*{ext}")):
+        owner = path[len(root) + 1:len(path) - len(ext)].split('-')[0]
+        if owner.isdigit() and int(owner) != os.getpid() and not _pid_alive(int(owner)):
+            yield path
+
+
+def _read_spool(path: str) -> List[Dict[str, Any]]:
+    items = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line, object_hook=_decode))
+            except json.JSONDecodeError:
+                # Última línea truncada por un crash a mitad de escritura
+                logger.warning("Línea inválida en el spool de write-behind, se descarta")
+    return items
+
+
+class WriteBehindBuffer:
+    """Buffer de escrituras pendientes con flush periódico al repositorio de pares.
+
+    - Coalescencia: dos escrituras del mismo id antes del flush generan una sola
+      (gana la última).
+    - Spool: cada escritura se agrega al archivo antes de confirmarse al cliente.
+      Cada proceso tiene el suyo (spool_path con el pid en el nombre), así
+      varios workers no se pisan al compactar. Al arrancar se recuperan los
+      spools de procesos que ya no existen, así que un crash no pierde lo
+      aceptado. Tras cada flush exitoso el spool se compacta con lo que sigue
+      pendiente; la escritura del archivo se hace fuera del lock.
+    - Lecturas: get_pending permite que las lecturas vean lo aceptado y aún no
+      escrito.
+    - Errores: los pares que batch_put no pudo escribir vuelven a pendientes y
+      se reintentan en el próximo flush.
+    """
+
+    def __init__(self, store, spool_path: Optional[str] = None, flush_interval: float = 0.5,
+                 max_batch: int = 500, fsync: bool = False, autostart: bool = True):
+        self.store = store
+        # spool_path es el nombre base; el archivo de este proceso lleva el pid
+        self.spool_path = spool_path
+        self.spool_file = process_spool_path(spool_path) if spool_path else None
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._in_flight: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._spool = None
+        # Líneas agregadas mientras se compacta el spool (None si no hay compactación en curso)
+        self._spool_tail: Optional[List[str]] = None
+        self._thread = None
+        self._counters = {'enqueued': 0, 'coalesced': 0, 'flushed': 0, 'flushes': 0, 'errors': 0}
+
+        if spool_path:
+            self._replay_spools()
+        if autostart:
+            self.start()
+
+    def _replay_spools(self):
+        """Recuperar las escrituras aceptadas que no llegaron al repositorio.
+
+        Se toma el spool propio (pid reutilizado) y los de procesos muertos.
+        Cada uno se reclama con un rename atómico, así dos workers que arrancan
+        a la vez no recuperan el mismo. Lo recuperado pasa al spool propio antes
+        de borrar el reclamado.
+        """
+        claimed: List[Tuple[str, List[Dict[str, Any]]]] = []
+        if os.path.exists(self.spool_file):
+            claimed.append((None, _read_spool(self.spool_file)))
+        for path in _orphan_spools(self.spool_path):
+            root, ext = os.path.splitext(self.spool_path)
+            original = path[len(root) + 1:len(path) - len(ext)].split('-')[-1] if path != self.spool_path else 'shared'
+            claim_path = f"{root}.{os.getpid()}-{original}{ext}"
+            try:
+                os.rename(path, claim_path)
+            except OSError:
+                continue  # lo reclamó otro proceso
+            claimed.append((claim_path, _read_spool(claim_path)))
+
+        for _, items in claimed:
+            for item in items:
+                self._pending[item['id']] = item
+        self._write_spool(list(self._pending.values()))
+        self._spool = open(self.spool_file, 'a', encoding='utf-8')
+        for claim_path, _ in claimed:
+            if claim_path is not None:
+                os.remove(claim_path)
+        if self._pending:
+            logger.info(f"Write-behind: {len(self._pending)} pares pendientes recuperados de {len(claimed)} spools")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='write-behind-flusher', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def enqueue(self, item: Dict[str, Any]):
+        """Aceptar una escritura: queda en el spool y en memoria hasta el próximo flush"""
+        line = json.dumps(item, default=_encode)
+        with self._lock:
+            if self._spool is not None:
+                self._spool.write(line + '\n')
+                self._spool.flush()
+                if self.fsync:
+                    os.fsync(self._spool.fileno())
+                if self._spool_tail is not None:
+                    self._spool_tail.append(line)
+            if item['id'] in self._pending:
+                self._counters['coalesced'] += 1
+            self._pending[item['id']] = item
+            self._counters['enqueued'] += 1
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def get_pending(self, pair_id: str) -> Optional[Dict[str, Any]]:
+        """Escritura aceptada y todavía no confirmada por el repositorio, si la hay"""
+        with self._lock:
+            item = self._pending.get(pair_id) or self._in_flight.get(pair_id)
+            return dict(item) if item is not None else None
+
+    def flush(self) -> int:
+        """Volcar lo pendiente al repositorio; devuelve la cantidad de pares escritos"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._in_flight, self._pending = self._pending, {}
+            batch = self._in_flight
+            try:
+                results = list(self.store.batch_put(batch.values(), action='flushed'))
+                failed = {result['pair_id'] for result in results if result['result'] != 'flushed'}
+            except Exception as e:
+                logger.error(f"Write-behind: error escribiendo {len(batch)} pares, se reintenta: {e}")
+                failed = set(batch)
+            if failed:
+                logger.error(f"Write-behind: {len(failed)} de {len(batch)} pares sin escribir, se reintentan")
+            with self._lock:
+                # Las escrituras más nuevas del mismo id tienen prioridad
+                for pair_id in failed:
+                    self._pending.setdefault(pair_id, batch[pair_id])
+                self._in_flight = {}
+                if failed:
+                    self._counters['errors'] += 1
+                self._counters['flushed'] += len(batch) - len(failed)
+                if len(failed) < len(batch):
+                    self._counters['flushes'] += 1
+            if len(failed) < len(batch):
+                self._compact_spool()
+            return len(batch) - len(failed)
+
+    def _write_spool(self, items: List[Dict[str, Any]]):
+        """Reemplazar el spool de este proceso por items, de forma atómica"""
+        tmp_path = f"{self.spool_file}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for item in items:
+                f.write(json.dumps(item, default=_encode) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.spool_file)
+
+    def _compact_spool(self):
+        """Reescribir el spool solo con lo pendiente (se llama con _flush_lock tomado).
+
+        Bajo el lock solo se copia lo pendiente; la escritura y el fsync se
+        hacen afuera. Lo que se encola mientras tanto queda en el spool actual
+        y en _spool_tail, y se agrega al compactado antes de reemplazarlo.
+        """
+        with self._lock:
+            if self._spool is None:
+                return
+            items = list(self._pending.values())
+            self._spool_tail = []
+        tmp_path = f"{self.spool_file}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for item in items:
+                    f.write(json.dumps(item, default=_encode) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception:
+            with self._lock:
+                self._spool_tail = None
+            raise
+        with self._lock:
+            tail, self._spool_tail = self._spool_tail, None
+            if self._spool is None:
+                os.remove(tmp_path)
+                return
+            if tail:
+                with open(tmp_path, 'a', encoding='utf-8') as f:
+                    f.write(''.join(line + '\n' for line in tail))
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+            self._spool.close()
+            os.replace(tmp_path, self.spool_file)
+            self._spool = open(self.spool_file, 'a', encoding='utf-8')
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind: error inesperado en el flusher: {e}")
+                time.sleep(self.flush_interval)
+
+    def close(self):
+        """Detener el flusher y volcar lo pendiente"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+        with self._lock:
+            if self._spool is not None:
+                self._spool.close()
+                self._spool = None
+                # Sin pendientes el spool de este proceso ya no hace falta
+                if not self._pending and os.path.exists(self.spool_file) and os.path.getsize(self.spool_file) == 0:
+                    os.remove(self.spool_file)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._counters, 'pending': len(self._pending), 'in_flight': len(self._in_flight)}
+
+
+def build_write_buffer(store) -> Optional[WriteBehindBuffer]:
+    """Buffer configurado por variables de entorno (None si PAIR_WRITE_MODE no es 'async').
+
+    - WRITE_BEHIND_SPOOL: nombre base del spool local (por defecto write_behind_spool.jsonl;
+      cada proceso escribe write_behind_spool.<pid>.jsonl)
+    - WRITE_BEHIND_FLUSH_INTERVAL (0.5 s) y WRITE_BEHIND_MAX_BATCH (500)
+    - WRITE_BEHIND_FSYNC=1: fsync por escritura (sobrevive a un corte de energía, más lento)
+    """
+    if os.getenv('PAIR_WRITE_MODE', 'sync') != 'async':
+        return None
+    return WriteBehindBuffer(
+        store,
+        spool_path=os.getenv('WRITE_BEHIND_SPOOL', 'write_behind_spool.jsonl'),
+        flush_interval=float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', '0.5')),
+        max_batch=int(os.getenv('WRITE_BEHIND_MAX_BATCH', '500')),
+        fsync=os.getenv('WRITE_BEHIND_FSYNC') == '1',
+    )
@@ -1,51 +1,291 @@
 import json
-import boto3
+import time
+import base64
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from decimal import Decimal
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import logging
 
+from dynamodb_client import get_dynamodb
+from pair_cache import build_pair_cache, read_through
+from pair_bloom import build_known_pair_index
+from serialization import dumps
+from metrics import MetricsRegistry, describe_default_metrics, emit_emf, instrument_dynamodb
+from batch_mutations import build_update_expression, summarize
+from pair_store import build_pair_store
+from profiling import RequestProfiler, build_stack_sampler, profiling_authorized, wrap_for_profiling
+
 # Configuración de logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Configuración de DynamoDB
-dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+# Configuración de DynamoDB (resource compartido con pool de conexiones y tablas cacheadas)
+dynamodb = get_dynamodb()
 PAIRS_TABLE = 'item_pairs'
 
-def calculate_similarity(title1: str, title2: str) -> float:
-    """Calcular similitud entre dos títulos usando ML model o fallback a TF-IDF"""
+# Repositorio de pares (PAIR_STORE_BACKEND: dynamodb, memory o sqlite)
+pair_store = build_pair_store()
+
+# Métricas por invocación (latencia por etapa, scorer, capacidad de DynamoDB),
+# emitidas al final de cada request como un log EMF de CloudWatch
+metrics = MetricsRegistry(keep_raw=True)
+describe_default_metrics(metrics)
+instrument_dynamodb(dynamodb.meta.client, metrics)
+METRICS_NAMESPACE = os.getenv('METRICS_NAMESPACE', 'ItemSimilarity')
+METRICS_EMF_ENABLED = os.getenv('METRICS_EMF', '1') == '1'
+
+# Caché read-through de pares; vive entre invocaciones calientes del contenedor
+# (con PAIR_CACHE_REDIS_URL se comparte entre contenedores)
+pair_cache = build_pair_cache()
+
+# Filtro de Bloom de pares conocidos, cargado del snapshot PAIR_BLOOM_PATH en el cold start y
+# puesto al día con el stream de la tabla; sin lugar para leer el stream solo se cuentan los negativos
+known_pairs = build_known_pair_index(pair_store)
+
+# Pool compartido (vive entre invocaciones del contenedor) para solapar las
+# lecturas de DynamoDB con el cálculo de similitud
+io_executor = ThreadPoolExecutor(max_workers=int(os.getenv('IO_POOL_WORKERS', '4')),
+                                 thread_name_prefix='dynamodb-io')
+
+# Sampler de stacks (PROFILING_SAMPLER=1): el contenedor se congela entre
+# invocaciones, así que solo muestrea mientras hay requests en curso
+stack_sampler = build_stack_sampler()
+
+def get_item_timed(store, pair_id: str, use_cache: bool = True):
+    """Leer un par (a través de la caché si use_cache); devuelve (item o None, duración en ms)"""
+    start = time.perf_counter()
+    if use_cache:
+        item = read_through(pair_cache, pair_id, store.get)
+    else:
+        item = store.get(pair_id)
+    return item, (time.perf_counter() - start) * 1000
+
+# Margen reservado para serializar y devolver la respuesta antes del timeout
+DEADLINE_SAFETY_MS = float(os.getenv('DEADLINE_SAFETY_MS', '500'))
+
+# Costo estimado (ms) de cada etapa, actualizado con una media móvil exponencial
+# de las duraciones observadas en el contenedor. Los scorers van del más
+# preciso al más barato.
+SCORERS = ('ml', 'tfidf', 'lexical')
+STAGE_COST_MS = {'ml': 50.0, 'tfidf': 20.0, 'lexical': 0.1, 'scores_all': 60.0, 'dynamodb_get': 30.0,
+                 'dynamodb_put': 30.0, 'dynamodb_scan_page': 200.0, 'dynamodb_batch_write': 100.0}
+COST_EWMA_ALPHA = 0.2
+
+# Pares por defecto de GET /items/{item_id}/pairs (GET /items/pairs sin limit
+# devuelve una página del Scan, como antes de paginar)
+DEFAULT_PAGE_SIZE = 100
+
+# Máximo de pares por consulta de un ítem (GET /items/{item_id}/pairs)
+ITEM_PAIRS_MAX_LIMIT = 1000
+
+# Hilos para las mutaciones masivas (cada uno procesa chunks de 25 pares)
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '4'))
+
+
+class RequestDeadline:
+    """Tiempo restante de una invocación, tomado de context.get_remaining_time_in_millis()"""
+    
+    def __init__(self, context=None, safety_ms: float = DEADLINE_SAFETY_MS):
+        remaining_ms = None
+        if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+            remaining_ms = context.get_remaining_time_in_millis()
+        # Sin context (tests, invocación local) no hay deadline
+        self.deadline = time.monotonic() + (remaining_ms - safety_ms) / 1000 if remaining_ms is not None else None
+    
+    def remaining_ms(self) -> float:
+        if self.deadline is None:
+            return float('inf')
+        return max(0.0, (self.deadline - time.monotonic()) * 1000)
+    
+    def fits(self, stage: str, reserve_ms: float = 0.0) -> bool:
+        """Indica si la etapa (según su costo estimado) entra en el tiempo restante"""
+        return STAGE_COST_MS[stage] + reserve_ms <= self.remaining_ms()
+
+
+def record_stage_cost(stage: str, elapsed_ms: float):
+    """Actualizar el costo estimado de una etapa con una duración observada"""
+    STAGE_COST_MS[stage] += COST_EWMA_ALPHA * (elapsed_ms - STAGE_COST_MS[stage])
+
+
+_ml_detector = None
+
+def get_ml_detector():
+    """Detector ML entrenado, o None si el modelo no está disponible (se importa una sola vez)"""
+    global _ml_detector
+    if _ml_detector is None:
+        try:
+            import ml_similarity
+            ml_similarity.set_stage_observer(metrics.stage_observer)
+            _ml_detector = ml_similarity.ml_detector
+        except Exception as e:
+            logger.warning(f"ML model not available, using fallback: {e}")
+            _ml_detector = False
+    return _ml_detector if _ml_detector and _ml_detector.is_trained else None
+
+
+def tfidf_similarity(title1_norm: str, title2_norm: str) -> float:
+    """Similitud TF-IDF + coseno ajustando un vectorizer con los dos títulos"""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+    
+    vectorizer = TfidfVectorizer(analyzer='word', ngram_range=(1, 2), stop_words=None)
+    tfidf_matrix = vectorizer.fit_transform([title1_norm, title2_norm])
+    return float(cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0])
+
+
+def lexical_similarity(title1_norm: str, title2_norm: str) -> float:
+    """Similitud de Jaccard entre las palabras de ambos títulos (costo despreciable)"""
+    words1, words2 = set(title1_norm.split()), set(title2_norm.split())
+    union = words1 | words2
+    return len(words1 & words2) / len(union) if union else 0.0
+
+
+def choose_scorer(deadline: RequestDeadline = None, reserve_ms: float = 0.0) -> str:
+    """Elegir el scorer más preciso disponible cuyo costo estimado entre en el presupuesto"""
+    candidates = [scorer for scorer in SCORERS if scorer != 'ml' or get_ml_detector() is not None]
+    if deadline is None:
+        return candidates[0]
+    for scorer in candidates:
+        if deadline.fits(scorer, reserve_ms):
+            return scorer
+    return 'lexical'
+
+
+def score_titles(title1: str, title2: str, deadline: RequestDeadline = None,
+                 reserve_ms: float = 0.0) -> tuple:
+    """Calcular la similitud con el scorer que permita el deadline; devuelve (score, scorer)"""
+    # Normalizar títulos
+    title1_norm = title1.lower().strip()
+    title2_norm = title2.lower().strip()
+    
+    scorer = choose_scorer(deadline, reserve_ms)
+    # Si son exactamente iguales y no se usa ML (el modelo da su propia probabilidad, como antes)
+    if scorer != 'ml' and title1_norm == title2_norm:
+        metrics.inc('similarity_scorer_total', scorer='exact')
+        return 1.0, 'exact'
+    
+    start = time.perf_counter()
     try:
-        # Intentar usar el modelo ML si está disponible
-        from ml_similarity import get_ml_similarity
-        result = get_ml_similarity(title1, title2)
-        return result['similarity_score']
+        if scorer == 'ml':
+            score = get_ml_detector().predict_similarity(title1, title2)['similarity_score']
+        elif scorer == 'tfidf':
+            score = tfidf_similarity(title1_norm, title2_norm)
+        else:
+            score = lexical_similarity(title1_norm, title2_norm)
     except Exception as e:
-        logger.warning(f"ML model not available, using fallback: {e}")
-        # Fallback a similitud básica usando TF-IDF
-        from sklearn.feature_extraction.text import TfidfVectorizer
-        from sklearn.metrics.pairwise import cosine_similarity
-        
-        # Normalizar títulos
-        title1_norm = title1.lower().strip()
-        title2_norm = title2.lower().strip()
-        
-        # Si son exactamente iguales
+        logger.warning(f"Scorer {scorer} falló, usando similitud léxica: {e}")
+        if scorer == 'ml':
+            metrics.inc('ml_fallback_total', reason=type(e).__name__)
         if title1_norm == title2_norm:
-            return 1.0
-        
-        # Calcular similitud usando TF-IDF y cosine similarity
-        vectorizer = TfidfVectorizer(analyzer='word', ngram_range=(1, 2), stop_words=None)
-        tfidf_matrix = vectorizer.fit_transform([title1_norm, title2_norm])
-        similarity = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0]
-        
-        return float(similarity)
+            metrics.inc('similarity_scorer_total', scorer='exact')
+            return 1.0, 'exact'
+        metrics.inc('similarity_scorer_total', scorer='lexical')
+        return lexical_similarity(title1_norm, title2_norm), 'lexical'
+    elapsed = time.perf_counter() - start
+    record_stage_cost(scorer, elapsed * 1000)
+    metrics.observe('stage_duration_seconds', elapsed, stage=scorer)
+    metrics.inc('similarity_scorer_total', scorer=scorer)
+    return float(score), scorer
+
+
+def score_all_titles(title1: str, title2: str, deadline: RequestDeadline = None,
+                     reserve_ms: float = 0.0) -> tuple:
+    """Modo scores=all: ML, coseno TF-IDF y características léxicas de una sola featurización.
+
+    Devuelve (score, scorer, scores), con el score derivado de la misma pasada:
+    el ML si hay modelo y, si no, scores['tfidf'] (1.0 con títulos iguales).
+    scores['tfidf'] es el coseno del vectorizer del modelo; sin modelo, 'ml'
+    queda en None y el TF-IDF es el tradicional del par, calculado una vez.
+    Si la pasada completa no entra en el deadline se usa score_titles y
+    scores queda en None.
+    """
+    if deadline is not None and not deadline.fits('scores_all', reserve_ms):
+        score, scorer = score_titles(title1, title2, deadline, reserve_ms)
+        return score, scorer, None
+    
+    title1_norm = title1.lower().strip()
+    title2_norm = title2.lower().strip()
+    scores = {'ml': None, 'tfidf': None, 'features': None}
+    detector = get_ml_detector()
+    start = time.perf_counter()
+    if detector is not None:
+        try:
+            scores = detector.score_all(title1, title2)
+        except Exception as e:
+            logger.warning(f"Scorer ml falló en scores=all, usando TF-IDF: {e}")
+            metrics.inc('ml_fallback_total', reason=type(e).__name__)
+    if scores['ml'] is None:
+        if title1_norm == title2_norm:
+            scores['tfidf'] = 1.0
+        elif scores['tfidf'] is None:
+            scores['tfidf'] = tfidf_similarity(title1_norm, title2_norm)
+    elapsed = time.perf_counter() - start
+    # Costo propio: la pasada completa no es comparable con un scorer suelto
+    record_stage_cost('scores_all', elapsed * 1000)
+    metrics.observe('stage_duration_seconds', elapsed, stage='scores_all')
+    if scores['ml'] is not None:
+        scorer = 'ml'
+    else:
+        scorer = 'exact' if title1_norm == title2_norm else 'tfidf'
+    metrics.inc('similarity_scorer_total', scorer=scorer)
+    return float(scores['ml'] if scorer == 'ml' else scores['tfidf']), scorer, scores
+
+
+def calculate_similarity(title1: str, title2: str, deadline: RequestDeadline = None) -> float:
+    """Calcular similitud entre dos títulos usando ML model o fallback a TF-IDF"""
+    return score_titles(title1, title2, deadline)[0]
+
+
+def degradation_info(scorer: str, skipped: list = None) -> Dict[str, Any]:
+    """Campos de la respuesta que indican si se degradó el cálculo para cumplir el deadline"""
+    reasons = list(skipped or [])
+    best = 'ml' if get_ml_detector() is not None else 'tfidf'
+    if scorer not in ('exact', best):
+        reasons.append(f'scorer_{scorer}')
+    info = {'scorer': scorer, 'degraded': bool(reasons)}
+    if reasons:
+        info['degraded_reasons'] = reasons
+    return info
+
+
+def encode_continuation_token(last_evaluated_key: Dict[str, Any]) -> str:
+    """Serializar LastEvaluatedKey de DynamoDB como token opaco"""
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key, default=str).encode('utf-8')).decode('ascii')
+
+
+def decode_continuation_token(token: str) -> Dict[str, Any]:
+    """Recuperar el ExclusiveStartKey a partir de un token de continuación"""
+    return json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+
+def parse_limit(params: Dict[str, Any], default: Optional[int] = None) -> Optional[int]:
+    """Leer el query param limit; ValueError si no es un entero positivo"""
+    raw = params.get('limit')
+    if raw in (None, ''):
+        return default
+    limit = int(raw)
+    if limit < 1:
+        raise ValueError(f"limit debe ser positivo: {raw}")
+    return limit
 
 def generate_pair_id(item_a: int, item_b: int) -> str:
     """Generar ID único para un par de ítems"""
     return f"{min(item_a, item_b)}_{max(item_a, item_b)}"
 
+def is_item_id(value) -> bool:
+    """Los item_id son enteros: son la clave (numérica) de los índices por ítem de item_pairs"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def serialize_body(body: Dict[str, Any]) -> str:
+    with metrics.timer('stage_duration_seconds', stage='json_serialize'):
+        return dumps(body)
+
+def parse_body(event) -> Dict[str, Any]:
+    """Body JSON de la request (vacío si no hay)"""
+    with metrics.timer('stage_duration_seconds', stage='json_parse'):
+        return json.loads(event.get('body') or '{}')
+
 def create_response(status_code: int, body: Dict[str, Any]) -> Dict[str, Any]:
     """Crear respuesta estándar para API Gateway"""
     return {
@@ -56,11 +296,75 @@ def create_response(status_code: int, body: Dict[str, Any]) -> Dict[str, Any]:
             'Access-Control-Allow-Headers': 'Content-Type',
             'Access-Control-Allow-Methods': 'GET, POST, OPTIONS'
         },
-        'body': json.dumps(body, default=str)
+        'body': serialize_body(body)
     }
 
+def route_template(path: str) -> str:
+    """Ruta sin el id del par, para usarla como dimensión de las métricas"""
+    if path.startswith('/items/pairs/') and not path.rsplit('/', 1)[-1].startswith('batch-'):
+        return '/items/pairs/{pair_id}'
+    if item_pairs_path_id(path) is not None:
+        return '/items/{item_id}/pairs'
+    return path
+
+def item_pairs_path_id(path: str):
+    """item_id de un path /items/{item_id}/pairs (None si el path es otro)"""
+    parts = path.strip('/').split('/')
+    if len(parts) == 3 and parts[0] == 'items' and parts[2] == 'pairs' and parts[1].isdigit():
+        return int(parts[1])
+    return None
+
+def request_header(event, name: str):
+    """Header de la request sin distinguir mayúsculas (API Gateway respeta las del cliente)"""
+    headers = event.get('headers') or {}
+    name = name.lower()
+    return next((value for key, value in headers.items() if key.lower() == name), None)
+
+def profiling_requested(event) -> bool:
+    query = event.get('queryStringParameters') or {}
+    return request_header(event, 'X-Profile') == '1' or query.get('profile') == '1'
+
+def profiled_route_request(event, context):
+    """route_request bajo cProfile; el resumen va en el body (y el .pstats en PROFILE_DIR)"""
+    if not profiling_authorized(request_header(event, 'X-Admin-Token')):
+        return create_response(403, {
+            'status': 'error',
+            'message': 'El profiling requiere un X-Admin-Token válido'
+        })
+    profiler = RequestProfiler(label=f"{event.get('httpMethod', 'GET')} {event.get('path', '/')}")
+    profiler.start()
+    try:
+        response = route_request(event, context)
+    finally:
+        report = profiler.stop()
+    response['headers']['X-Profile-Id'] = report['profile_id']
+    body = json.loads(response['body'])
+    if isinstance(body, dict):
+        body['profile'] = report
+        response['body'] = serialize_body(body)
+    return response
+
 def lambda_handler(event, context):
     """Handler principal para AWS Lambda"""
+    start = time.perf_counter()
+    if profiling_requested(event):
+        response = profiled_route_request(event, context)
+    else:
+        response = route_request(event, context)
+    
+    metrics.observe('http_request_duration_seconds', time.perf_counter() - start)
+    metrics.inc('http_requests_total', status=response['statusCode'])
+    if METRICS_EMF_ENABLED:
+        emit_emf(metrics.flush_emf(METRICS_NAMESPACE, {
+            'Route': route_template(event.get('path', '/')),
+            'Method': event.get('httpMethod', 'GET')
+        }))
+    else:
+        metrics.reset()
+    return response
+
+def route_request(event, context):
+    """Routing basado en método y path"""
     
     # Manejar preflight CORS
     if event.get('httpMethod') == 'OPTIONS':
@@ -69,17 +373,31 @@ def lambda_handler(event, context):
     # Obtener información de la petición
     http_method = event.get('httpMethod', 'GET')
     path = event.get('path', '/')
+    deadline = RequestDeadline(context)
     
     try:
         # Routing basado en método y path
         if http_method == 'GET' and path == '/health':
             return health_check()
         elif http_method == 'POST' and path == '/items/compare':
-            return compare_items(event)
+            return compare_items(event, deadline)
         elif http_method == 'POST' and path == '/items/pairs':
-            return create_item_pair(event)
+            return create_item_pair(event, deadline)
+        elif http_method == 'POST' and path == '/items/pairs/batch-create':
+            return batch_create_pairs(event, deadline)
+        elif http_method == 'POST' and path == '/items/pairs/batch-delete':
+            return batch_delete_pairs(event, deadline)
+        elif http_method == 'POST' and path == '/items/pairs/batch-update':
+            return batch_update_pairs(event, deadline)
         elif http_method == 'GET' and path == '/items/pairs':
-            return get_all_pairs()
+            return get_all_pairs(event, deadline)
+        elif http_method == 'GET' and path == '/cache/stats':
+            return create_response(200, {'status': 'success', 'cache': pair_cache.stats(),
+                                         'bloom': known_pairs.stats(),
+                                         'replica': pair_store.stats() if hasattr(pair_store, 'stats')
+                                         else {'enabled': False}})
+        elif http_method == 'GET' and item_pairs_path_id(path) is not None:
+            return get_item_pairs(event, item_pairs_path_id(path))
         elif http_method == 'GET' and path.startswith('/items/pairs/'):
             pair_id = path.split('/')[-1]
             return get_pair(pair_id)
@@ -103,9 +421,8 @@ def lambda_handler(event, context):
 def health_check():
     """Endpoint de salud de la API"""
     try:
-        # Verificar que DynamoDB está accesible
-        pairs_table = dynamodb.Table(PAIRS_TABLE)
-        pairs_table.table_status
+        # Verificar que el repositorio de pares está accesible
+        pair_store.ping()
         
         # Verificar que las dependencias de ML están disponibles
         try:
@@ -122,6 +439,7 @@ def health_check():
             'timestamp': datetime.now().isoformat(),
             'environment': 'aws-lambda',
             'dynamodb_status': 'connected',
+            'pair_store': pair_store.name,
             'ml_dependencies': ml_status
         })
     except Exception as e:
@@ -133,10 +451,15 @@ def health_check():
             'environment': 'aws-lambda'
         })
 
-def compare_items(event):
-    """Comparar dos ítems y determinar si son iguales, similares o si ya existe el par"""
+def compare_items(event, deadline: RequestDeadline = None):
+    """Comparar dos ítems y determinar si son iguales, similares o si ya existe el par.
+
+    Con poco tiempo restante se usa un scorer más barato y se omite la
+    verificación de existencia (pair_exists = None); la respuesta lo indica
+    con degraded / degraded_reasons.
+    """
     try:
-        body = json.loads(event.get('body', '{}'))
+        body = parse_body(event)
         
         if not body or 'item_a' not in body or 'item_b' not in body:
             return create_response(400, {
@@ -160,30 +483,73 @@ def compare_items(event):
                 'message': 'item_b debe contener item_id y title'
             })
         
+        if not is_item_id(item_a['item_id']) or not is_item_id(item_b['item_id']):
+            return create_response(400, {
+                'status': 'error',
+                'message': 'item_id debe ser un entero'
+            })
+        
+        # scores=all (query string o body): ML, TF-IDF y características de una sola pasada
+        query = event.get('queryStringParameters') or {}
+        scores_mode = query.get('scores', body.get('scores'))
+        if scores_mode not in (None, 'all'):
+            return create_response(400, {
+                'status': 'error',
+                'message': "scores solo admite el valor 'all'"
+            })
+        
+        # Verificar si el par ya existe, en paralelo con el cálculo de similitud
+        # (no esencial: se omite si no entra en el deadline)
+        start = time.perf_counter()
+        pair_id = generate_pair_id(item_a['item_id'], item_b['item_id'])
+        skipped = []
+        lookup = None
+        known_missing = False
+        if deadline is not None and not deadline.fits('dynamodb_get'):
+            skipped.append('existence_check_skipped')
+        elif not known_pairs.might_exist(pair_id):
+            # El filtro de Bloom asegura que el par no existe
+            known_missing = True
+        else:
+            lookup = io_executor.submit(wrap_for_profiling(get_item_timed), pair_store, pair_id)
+        timings = {}
+        
         # Calcular similitud
-        similarity_score = calculate_similarity(item_a['title'], item_b['title'])
+        scores = None
+        if scores_mode == 'all':
+            similarity_score, scorer, scores = score_all_titles(item_a['title'], item_b['title'], deadline)
+            if scores is None:
+                skipped.append('scores_all_skipped')
+        else:
+            similarity_score, scorer = score_titles(item_a['title'], item_b['title'], deadline)
         are_equal = similarity_score == 1.0
         are_similar = similarity_score >= 0.7  # Umbral de similitud
+        timings['scoring_ms'] = (time.perf_counter() - start) * 1000
         
-        # Verificar si el par ya existe
-        pair_id = generate_pair_id(item_a['item_id'], item_b['item_id'])
-        pairs_table = dynamodb.Table(PAIRS_TABLE)
+        pair_exists = False if known_missing else None
+        if lookup is not None:
+            try:
+                existing_item, timings['dynamodb_get_ms'] = lookup.result()
+                record_stage_cost('dynamodb_get', timings['dynamodb_get_ms'])
+                pair_exists = existing_item is not None
+            except Exception as e:
+                logger.error(f"Error verificando par existente: {e}")
+                pair_exists = False
+        timings['total_ms'] = (time.perf_counter() - start) * 1000
+        logger.info(f"compare_items {pair_id} tiempos (ms): " + ", ".join(f"{k}={v:.1f}" for k, v in timings.items()))
         
-        try:
-            response = pairs_table.get_item(Key={'id': pair_id})
-            pair_exists = 'Item' in response
-        except Exception as e:
-            logger.error(f"Error verificando par existente: {e}")
-            pair_exists = False
-        
-        return create_response(200, {
+        response_body = {
             'status': 'success',
             'message': 'Comparación completada exitosamente',
             'similarity_score': similarity_score,
             'are_similar': are_similar,
             'pair_exists': pair_exists,
-            'pair_id': pair_id
-        })
+            'pair_id': pair_id,
+            **degradation_info(scorer, skipped)
+        }
+        if scores is not None:
+            response_body['scores'] = scores
+        return create_response(200, response_body)
         
     except Exception as e:
         logger.error(f"Error en compare_items: {e}")
@@ -192,10 +558,51 @@ def compare_items(event):
             'message': f'Error interno del servidor: {str(e)}'
         })
 
-def create_item_pair(event):
-    """Crear o actualizar un par de ítems según la lógica de la consigna"""
+def pair_status(similarity_score: float) -> str:
+    """Status según la consigna: positivo si los títulos son iguales o similares"""
+    return "positivo" if similarity_score >= 0.7 else "negativo"
+
+def decide_regeneration(pair_exists: bool, existing_status: str, new_status: str):
+    """Lógica de regeneración de la consigna; devuelve (escribir, mensaje)"""
+    if not pair_exists:
+        return True, "Se crea nuevo par en la base de datos"
+    if existing_status == "positivo":
+        return False, "No se regenera porque ya existe ese par en la base de datos con status positivo"
+    if existing_status == "negativo":
+        if new_status == "positivo":
+            return True, "Se regenera porque el par existente era negativo y ahora es positivo"
+        # Se escribe igual para actualizar updated_at aunque siga negativo
+        return True, "No se regenera porque sigue siendo negativo (solo se actualiza updated_at)"
+    # Para otros status, siempre actualiza
+    return True, "Se regenera porque el par existente tiene status diferente"
+
+def build_pair_record(pair_id: str, item_a: Dict[str, Any], item_b: Dict[str, Any],
+                      similarity_score: float, existing_item: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Registro del par a escribir (conserva created_at si el par ya existía)"""
+    now = datetime.now().isoformat()
+    return {
+        'id': pair_id,
+        'item_a_id': item_a['item_id'],
+        'item_a_title': item_a['title'],
+        'item_b_id': item_b['item_id'],
+        'item_b_title': item_b['title'],
+        'similarity_score': Decimal(str(similarity_score)),
+        'are_equal': similarity_score == 1.0,
+        'are_similar': similarity_score >= 0.7,
+        'status': pair_status(similarity_score),
+        'created_at': (existing_item or {}).get('created_at', now),
+        'updated_at': now
+    }
+
+def create_item_pair(event, deadline: RequestDeadline = None):
+    """Crear o actualizar un par de ítems según la lógica de la consigna.
+
+    La lectura del par existente es necesaria para la lógica de regeneración,
+    por lo que no se omite: solo el scorer se degrada según el deadline,
+    reservando tiempo para la escritura.
+    """
     try:
-        body = json.loads(event.get('body', '{}'))
+        body = parse_body(event)
         
         if not body or 'item_a' not in body or 'item_b' not in body:
             return create_response(400, {
@@ -219,14 +626,28 @@ def create_item_pair(event):
                 'message': 'item_b debe contener item_id y title'
             })
         
-        # Verificar si el par ya existe
+        if not is_item_id(item_a['item_id']) or not is_item_id(item_b['item_id']):
+            return create_response(400, {
+                'status': 'error',
+                'message': 'item_id debe ser un entero'
+            })
+        
+        # Verificar si el par ya existe, en paralelo con el cálculo de similitud
         pair_id = generate_pair_id(item_a['item_id'], item_b['item_id'])
-        pairs_table = dynamodb.Table(PAIRS_TABLE)
+        # La lógica de regeneración decide sobre el estado real: se lee sin la caché
+        lookup = io_executor.submit(wrap_for_profiling(get_item_timed), pair_store, pair_id, False)
+        
+        # Calcular similitud (reservando tiempo para el put_item)
+        similarity_score, scorer = score_titles(item_a['title'], item_b['title'], deadline,
+                                                reserve_ms=STAGE_COST_MS['dynamodb_put'])
+        are_equal = similarity_score == 1.0
+        are_similar = similarity_score >= 0.7
         
         try:
-            response = pairs_table.get_item(Key={'id': pair_id})
-            pair_exists = 'Item' in response
-            existing_item = response.get('Item', {}) if pair_exists else {}
+            existing_item, elapsed_ms = lookup.result()
+            record_stage_cost('dynamodb_get', elapsed_ms)
+            pair_exists = existing_item is not None
+            existing_item = existing_item or {}
             existing_status = existing_item.get('status', '') if pair_exists else ''
         except Exception as e:
             logger.error(f"Error verificando par existente: {e}")
@@ -234,56 +655,17 @@ def create_item_pair(event):
             existing_status = ''
             existing_item = {}
         
-        # Calcular similitud
-        similarity_score = calculate_similarity(item_a['title'], item_b['title'])
-        are_equal = similarity_score == 1.0
-        are_similar = similarity_score >= 0.7
-        
-        # Determinar el status según la consigna
-        if are_similar or are_equal:
-            new_status = "positivo"
-        else:
-            new_status = "negativo"
-        
-        # Lógica de regeneración
-        action_message = ""
-        should_update = False
-        now = datetime.now().isoformat()
-        
-        if pair_exists:
-            if existing_status == "positivo":
-                action_message = "No se regenera porque ya existe ese par en la base de datos con status positivo"
-                should_update = False
-            elif existing_status == "negativo":
-                if new_status == "positivo":
-                    action_message = "Se regenera porque el par existente era negativo y ahora es positivo"
-                    should_update = True
-                else:
-                    action_message = "No se regenera porque sigue siendo negativo (solo se actualiza updated_at)"
-                    should_update = True  # Para actualizar updated_at aunque siga negativo
-            else:
-                # Para otros status, siempre actualiza
-                action_message = "Se regenera porque el par existente tiene status diferente"
-                should_update = True
-        else:
-            action_message = "Se crea nuevo par en la base de datos"
-            should_update = True
+        # Determinar el status según la consigna y si corresponde regenerar
+        new_status = pair_status(similarity_score)
+        should_update, action_message = decide_regeneration(pair_exists, existing_status, new_status)
         
         if should_update:
-            pair_data = {
-                'id': pair_id,
-                'item_a_id': item_a['item_id'],
-                'item_a_title': item_a['title'],
-                'item_b_id': item_b['item_id'],
-                'item_b_title': item_b['title'],
-                'similarity_score': Decimal(str(similarity_score)),
-                'are_equal': are_equal,
-                'are_similar': are_similar,
-                'status': new_status,
-                'created_at': existing_item.get('created_at', now),
-                'updated_at': now
-            }
-            pairs_table.put_item(Item=pair_data)
+            pair_data = build_pair_record(pair_id, item_a, item_b, similarity_score, existing_item)
+            put_start = time.perf_counter()
+            pair_store.put(pair_data)
+            record_stage_cost('dynamodb_put', (time.perf_counter() - put_start) * 1000)
+            pair_cache.invalidate(pair_id)
+            known_pairs.add(pair_id)
             return create_response(201, {
                 'status': 'success',
                 'message': f'Par de ítems procesado: {action_message}',
@@ -292,7 +674,8 @@ def create_item_pair(event):
                 'are_equal': are_equal,
                 'are_similar': are_similar,
                 'new_status': new_status,
-                'action': 'created_or_updated'
+                'action': 'created_or_updated',
+                **degradation_info(scorer)
             })
         else:
             return create_response(200, {
@@ -312,18 +695,52 @@ def create_item_pair(event):
             'message': f'Error interno del servidor: {str(e)}'
         })
 
-def get_all_pairs():
-    """Obtener todos los pares de ítems"""
+def get_all_pairs(event=None, deadline: RequestDeadline = None):
+    """Obtener los pares de ítems, paginados.
+
+    Query params: limit y next_token. Sin limit se devuelve una página del
+    Scan (hasta 1 MB, la misma respuesta que antes de paginar) y next_token si
+    quedan pares. Con limit se leen páginas del scan hasta juntar limit pares
+    mientras el deadline lo permita; si se corta antes, la respuesta es
+    parcial y trae next_token para seguir.
+    """
     try:
-        pairs_table = dynamodb.Table(PAIRS_TABLE)
-        response = pairs_table.scan()
-        pairs = response.get('Items', [])
+        params = (event or {}).get('queryStringParameters') or {}
+        try:
+            limit = parse_limit(params)
+        except ValueError:
+            return create_response(400, {'status': 'error', 'message': 'limit debe ser un entero positivo'})
+        start_key = None
+        if params.get('next_token'):
+            try:
+                start_key = decode_continuation_token(params['next_token'])
+            except Exception:
+                return create_response(400, {'status': 'error', 'message': 'next_token inválido'})
         
-        return create_response(200, {
+        pairs = []
+        last_key = None
+        partial = False
+        while True:
+            start = time.perf_counter()
+            page, last_key = pair_store.scan_page(limit - len(pairs) if limit else None, start_key)
+            record_stage_cost('dynamodb_scan_page', (time.perf_counter() - start) * 1000)
+            pairs.extend(page)
+            if last_key is None or limit is None or len(pairs) >= limit:
+                break
+            if deadline is not None and not deadline.fits('dynamodb_scan_page'):
+                partial = True
+                break
+            start_key = last_key
+        
+        body = {
             'status': 'success',
             'message': f'Se encontraron {len(pairs)} pares de ítems',
-            'pairs': pairs
-        })
+            'pairs': pairs,
+            'next_token': encode_continuation_token(last_key) if last_key else None
+        }
+        if partial:
+            body.update({'degraded': True, 'degraded_reasons': ['partial_results']})
+        return create_response(200, body)
         
     except Exception as e:
         logger.error(f"Error en get_all_pairs: {e}")
@@ -335,10 +752,9 @@ def get_all_pairs():
 def get_pair(pair_id):
     """Obtener un par específico por ID"""
     try:
-        pairs_table = dynamodb.Table(PAIRS_TABLE)
-        response = pairs_table.get_item(Key={'id': pair_id})
+        pair, _ = get_item_timed(pair_store, pair_id)
         
-        if 'Item' not in response:
+        if pair is None:
             return create_response(404, {
                 'status': 'error',
                 'message': 'Par de ítems no encontrado'
@@ -347,7 +763,7 @@ def get_pair(pair_id):
         return create_response(200, {
             'status': 'success',
             'message': 'Par de ítems encontrado exitosamente',
-            'pair': response['Item']
+            'pair': pair
         })
         
     except Exception as e:
@@ -357,25 +773,40 @@ def get_pair(pair_id):
             'message': f'Error interno del servidor: {str(e)}'
         }) 
 
+def get_item_pairs(event, item_id: int):
+    """Obtener los pares en los que participa un ítem (query param limit, hasta ITEM_PAIRS_MAX_LIMIT)"""
+    try:
+        params = (event or {}).get('queryStringParameters') or {}
+        try:
+            limit = min(parse_limit(params, DEFAULT_PAGE_SIZE), ITEM_PAIRS_MAX_LIMIT)
+        except ValueError:
+            return create_response(400, {'status': 'error', 'message': 'limit debe ser un entero positivo'})
+        pairs = pair_store.query_by_item(item_id, limit=limit)
+        return create_response(200, {
+            'status': 'success',
+            'message': f'Se encontraron {len(pairs)} pares del ítem {item_id}',
+            'pairs': pairs
+        })
+    except Exception as e:
+        logger.error(f"Error en get_item_pairs: {e}")
+        return create_response(500, {
+            'status': 'error',
+            'message': f'Error interno del servidor: {str(e)}'
+        })
+
 def update_pair(event, context=None):
     """Actualizar campos de un par existente por id"""
     pair_id = event.get('pathParameters', {}).get('pair_id')
-    body = json.loads(event.get('body', '{}'))
+    body = parse_body(event)
     if not pair_id or not body:
         return create_response(400, {'status': 'error', 'message': 'Faltan datos para actualizar'})
     try:
-        pairs_table = dynamodb.Table(PAIRS_TABLE)
-        update_expr = []
-        expr_attr_vals = {}
-        for k, v in body.items():
-            update_expr.append(f"{k} = :{k}")
-            expr_attr_vals[f":{k}"] = v
-        update_expression = "set " + ", ".join(update_expr)
-        pairs_table.update_item(
-            Key={'id': pair_id},
-            UpdateExpression=update_expression,
-            ExpressionAttributeValues=expr_attr_vals
-        )
+        try:
+            build_update_expression(body)
+        except ValueError as e:
+            return create_response(400, {'status': 'error', 'message': str(e)})
+        pair_store.update(pair_id, body)
+        pair_cache.invalidate(pair_id)
         return create_response(200, {'status': 'success', 'message': f'Par con id {pair_id} actualizado exitosamente'})
     except Exception as e:
         logger.error(f"Error actualizando par: {e}")
@@ -387,9 +818,123 @@ def delete_pair(event, context=None):
     if not pair_id:
         return create_response(400, {'status': 'error', 'message': 'Falta el id del par'})
     try:
-        pairs_table = dynamodb.Table(PAIRS_TABLE)
-        pairs_table.delete_item(Key={'id': pair_id})
+        pair_store.delete(pair_id)
+        pair_cache.invalidate(pair_id)
         return create_response(200, {'status': 'success', 'message': f'Par con id {pair_id} eliminado exitosamente'})
     except Exception as e:
         logger.error(f"Error eliminando par: {e}")
-        return create_response(500, {'status': 'error', 'message': f'Error eliminando par: {str(e)}'}) 
\ No newline at end of file
+        return create_response(500, {'status': 'error', 'message': f'Error eliminando par: {str(e)}'}) 
+
+def batch_response(results, degraded_reasons: list = None) -> Dict[str, Any]:
+    """Resultados por par de una mutación masiva.
+
+    API Gateway no permite respuestas en streaming: los resultados van en una
+    lista. Si el deadline corta el lote, los ids no enviados vuelven en
+    remaining_ids para reintentarlos en otra request.
+    """
+    results = list(results)
+    for result in results:
+        if result['result'] in ('created_or_updated', 'updated', 'deleted'):
+            pair_cache.invalidate(result['pair_id'])
+            if result['result'] == 'created_or_updated':
+                known_pairs.add(result['pair_id'])
+    remaining_ids = [r['pair_id'] for r in results if r['result'] == 'not_attempted']
+    reasons = list(degraded_reasons or [])
+    if remaining_ids:
+        reasons.append('partial_results')
+    body = {
+        'status': 'success',
+        'summary': summarize(results),
+        'results': results,
+        'remaining_ids': remaining_ids
+    }
+    if reasons:
+        body.update({'degraded': True, 'degraded_reasons': reasons})
+    return create_response(200, body)
+
+def read_pair_ids(body: Dict[str, Any]):
+    pair_ids = (body or {}).get('pair_ids')
+    if not isinstance(pair_ids, list) or not pair_ids or not all(isinstance(p, str) for p in pair_ids):
+        return None
+    return pair_ids
+
+def batch_write_fits(deadline: RequestDeadline = None):
+    return None if deadline is None else (lambda: deadline.fits('dynamodb_batch_write'))
+
+def batch_create_pairs(event, deadline: RequestDeadline = None):
+    """Crear o regenerar muchos pares con la misma lógica que POST /items/pairs"""
+    try:
+        body = parse_body(event)
+        pairs = body.get('pairs')
+        if not isinstance(pairs, list) or not pairs:
+            return create_response(400, {'status': 'error', 'message': 'Se requiere una lista no vacía en pairs'})
+        
+        results, valid = [], []
+        for index, entry in enumerate(pairs):
+            item_a, item_b = (entry or {}).get('item_a') or {}, (entry or {}).get('item_b') or {}
+            if not all(key in item_a for key in ['item_id', 'title']) or \
+                    not all(key in item_b for key in ['item_id', 'title']):
+                results.append({'index': index, 'pair_id': None, 'result': 'invalid',
+                                'error': 'item_a e item_b deben contener item_id y title'})
+                continue
+            if not is_item_id(item_a['item_id']) or not is_item_id(item_b['item_id']):
+                results.append({'index': index, 'pair_id': None, 'result': 'invalid',
+                                'error': 'item_id debe ser un entero'})
+                continue
+            valid.append((generate_pair_id(item_a['item_id'], item_b['item_id']), item_a, item_b))
+        
+        # La regeneración decide sobre el estado real: se lee sin la caché, de a 100 por BatchGetItem
+        existing = pair_store.batch_get([pair_id for pair_id, _, _ in valid])
+        to_write = {}
+        scorers = set()
+        for pair_id, item_a, item_b in valid:
+            similarity_score, scorer = score_titles(item_a['title'], item_b['title'], deadline,
+                                                    reserve_ms=STAGE_COST_MS['dynamodb_batch_write'])
+            scorers.add(scorer)
+            existing_item = existing.get(pair_id)
+            should_update, _ = decide_regeneration(existing_item is not None,
+                                                   (existing_item or {}).get('status', ''),
+                                                   pair_status(similarity_score))
+            if should_update:
+                to_write[pair_id] = build_pair_record(pair_id, item_a, item_b, similarity_score, existing_item)
+            else:
+                results.append({'pair_id': pair_id, 'result': 'unchanged'})
+        
+        results.extend(pair_store.batch_put(to_write.values(), action='created_or_updated',
+                                            max_workers=BATCH_MAX_WORKERS, should_continue=batch_write_fits(deadline)))
+        # Con el deadline ajustado, algunos pares pueden puntuarse con un scorer más barato
+        reasons = sorted({reason for scorer in scorers
+                          for reason in degradation_info(scorer).get('degraded_reasons', [])})
+        return batch_response(results, reasons)
+    except Exception as e:
+        logger.error(f"Error en batch_create_pairs: {e}")
+        return create_response(500, {'status': 'error', 'message': f'Error interno del servidor: {str(e)}'})
+
+def batch_delete_pairs(event, deadline: RequestDeadline = None):
+    """Eliminar muchos pares por id con BatchWriteItem"""
+    try:
+        pair_ids = read_pair_ids(parse_body(event))
+        if pair_ids is None:
+            return create_response(400, {'status': 'error', 'message': 'Se requiere una lista no vacía de ids en pair_ids'})
+        return batch_response(pair_store.batch_delete(pair_ids, max_workers=BATCH_MAX_WORKERS,
+                                                      should_continue=batch_write_fits(deadline)))
+    except Exception as e:
+        logger.error(f"Error en batch_delete_pairs: {e}")
+        return create_response(500, {'status': 'error', 'message': f'Error interno del servidor: {str(e)}'})
+
+def batch_update_pairs(event, deadline: RequestDeadline = None):
+    """Aplicar los mismos cambios (p. ej. reetiquetar el status) a muchos pares"""
+    try:
+        body = parse_body(event)
+        pair_ids = read_pair_ids(body)
+        if pair_ids is None:
+            return create_response(400, {'status': 'error', 'message': 'Se requiere una lista no vacía de ids en pair_ids'})
+        try:
+            results = pair_store.batch_update(pair_ids, body.get('changes') or {},
+                                              max_workers=BATCH_MAX_WORKERS, should_continue=batch_write_fits(deadline))
+        except ValueError as e:
+            return create_response(400, {'status': 'error', 'message': str(e)})
+        return batch_response(results)
+    except Exception as e:
+        logger.error(f"Error en batch_update_pairs: {e}")
+        return create_response(500, {'status': 'error', 'message': f'Error interno del servidor: {str(e)}'})
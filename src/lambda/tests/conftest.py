@@ -0,0 +1,39 @@
+import os
+import sys
+
+import boto3
+import pytest
+from moto import mock_aws
+
+# lambda_app se importa de forma plana, igual que en la imagen de Lambda
+# (donde src/common se copia junto a lambda_app.py)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'common')))
+
+
+class FakeContext:
+    """Context mínimo de Lambda con un tiempo restante fijo"""
+
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+@pytest.fixture
+def pairs_table(monkeypatch):
+    """Tabla item_pairs en moto, conectada a lambda_app"""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.delenv("AWS_ENDPOINT_URL", raising=False)
+    with mock_aws():
+        import lambda_app
+        from dynamodb_client import reset_clients
+        from pair_cache import build_pair_cache
+        reset_clients()
+        monkeypatch.setattr(lambda_app, 'pair_cache', build_pair_cache())
+        # El mismo esquema que en producción (con los índices por ítem)
+        lambda_app.pair_store.ensure_schema()
+        yield boto3.resource('dynamodb', region_name='us-east-1').Table('item_pairs')
+        reset_clients()
@@ -0,0 +1,270 @@
+import json
+
+import pytest
+
+import lambda_app
+from conftest import FakeContext
+
+ITEMS = {
+    'item_a': {'item_id': 1, 'title': 'Samsung Galaxy S21 128GB'},
+    'item_b': {'item_id': 2, 'title': 'Samsung Galaxy S21 Ultra'},
+}
+
+
+def _post(path, body):
+    return {'httpMethod': 'POST', 'path': path, 'body': json.dumps(body)}
+
+
+def test_compare_with_budget_uses_best_scorer(pairs_table):
+    response = lambda_app.lambda_handler(_post('/items/compare', ITEMS), FakeContext(30_000))
+    body = json.loads(response['body'])
+
+    assert response['statusCode'] == 200
+    assert body['degraded'] is False
+    assert body['pair_exists'] is False
+
+
+def test_compare_near_deadline_degrades(pairs_table):
+    response = lambda_app.lambda_handler(_post('/items/compare', ITEMS), FakeContext(510))
+    body = json.loads(response['body'])
+
+    assert response['statusCode'] == 200
+    assert body['scorer'] == 'lexical'
+    assert body['pair_exists'] is None
+    assert body['degraded_reasons'] == ['existence_check_skipped', 'scorer_lexical']
+
+
+def test_compare_scores_all_returns_every_score_from_one_pass(pairs_table, monkeypatch):
+    calls = []
+
+    class FakeDetector:
+        def score_all(self, title1, title2):
+            calls.append((title1, title2))
+            return {'ml': 0.85, 'tfidf': 0.6, 'features': {'contains_same_words': 0.5}}
+
+    monkeypatch.setattr(lambda_app, 'get_ml_detector', lambda: FakeDetector())
+    event = {**_post('/items/compare', ITEMS), 'queryStringParameters': {'scores': 'all'}}
+    body = json.loads(lambda_app.lambda_handler(event, FakeContext(30_000))['body'])
+
+    assert len(calls) == 1
+    assert body['similarity_score'] == 0.85 and body['scorer'] == 'ml'
+    assert body['scores'] == {'ml': 0.85, 'tfidf': 0.6, 'features': {'contains_same_words': 0.5}}
+
+    monkeypatch.setattr(lambda_app, 'get_ml_detector', lambda: None)
+    body = json.loads(lambda_app.lambda_handler(_post('/items/compare', {**ITEMS, 'scores': 'all'}),
+                                                FakeContext(30_000))['body'])
+    assert body['scores']['ml'] is None and body['similarity_score'] == body['scores']['tfidf']
+
+    # Sin score ML, similarity_score es el coseno de la misma pasada, sin un segundo ajuste TF-IDF
+    class UntrainedDetector:
+        def score_all(self, title1, title2):
+            return {'ml': None, 'tfidf': 0.6, 'features': {'contains_same_words': 0.5}}
+
+    monkeypatch.setattr(lambda_app, 'get_ml_detector', lambda: UntrainedDetector())
+    monkeypatch.setattr(lambda_app, 'tfidf_similarity', lambda *args: pytest.fail("TF-IDF calculado dos veces"))
+    tfidf_cost = lambda_app.STAGE_COST_MS['tfidf']
+    body = json.loads(lambda_app.lambda_handler(event, FakeContext(30_000))['body'])
+    assert body['similarity_score'] == body['scores']['tfidf'] == 0.6 and body['scorer'] == 'tfidf'
+    # La pasada completa se registra con su propio costo
+    assert lambda_app.STAGE_COST_MS['tfidf'] == tfidf_cost
+
+
+def test_compare_scores_all_respects_the_deadline(pairs_table, monkeypatch):
+    class FakeDetector:
+        def score_all(self, title1, title2):
+            pytest.fail("scores=all no entra en el deadline")
+
+    monkeypatch.setattr(lambda_app, 'get_ml_detector', lambda: FakeDetector())
+    event = {**_post('/items/compare', ITEMS), 'queryStringParameters': {'scores': 'all'}}
+    body = json.loads(lambda_app.lambda_handler(event, FakeContext(510))['body'])
+
+    assert 'scores' not in body and body['scorer'] == 'lexical'
+    assert body['degraded_reasons'] == ['existence_check_skipped', 'scores_all_skipped', 'scorer_lexical']
+
+
+def test_get_all_pairs_paginates_with_continuation_token(pairs_table):
+    for i in range(5):
+        pairs_table.put_item(Item={'id': f'{i}_{i + 10}', 'status': 'positivo'})
+
+    seen, token = [], None
+    while True:
+        params = {'limit': '2', **({'next_token': token} if token else {})}
+        event = {'httpMethod': 'GET', 'path': '/items/pairs', 'queryStringParameters': params}
+        body = json.loads(lambda_app.lambda_handler(event, FakeContext(30_000))['body'])
+        seen.extend(pair['id'] for pair in body['pairs'])
+        token = body['next_token']
+        if not token:
+            break
+
+    assert sorted(seen) == sorted(f'{i}_{i + 10}' for i in range(5))
+
+
+def test_compare_overlaps_lookup_with_scoring(pairs_table, monkeypatch):
+    import threading
+
+    real_get_item_timed = lambda_app.get_item_timed
+    real_score_titles = lambda_app.score_titles
+    lookup_started = threading.Event()
+    overlapped = []
+
+    def tracked_get_item(*args, **kwargs):
+        lookup_started.set()
+        return real_get_item_timed(*args, **kwargs)
+
+    def waiting_score(*args, **kwargs):
+        # Si la lectura corriera después del scoring, el evento nunca llegaría a tiempo
+        overlapped.append(lookup_started.wait(timeout=5))
+        return real_score_titles(*args, **kwargs)
+
+    monkeypatch.setattr(lambda_app, 'get_item_timed', tracked_get_item)
+    monkeypatch.setattr(lambda_app, 'score_titles', waiting_score)
+
+    response = lambda_app.lambda_handler(_post('/items/compare', ITEMS), FakeContext(30_000))
+
+    assert json.loads(response['body'])['pair_exists'] is False
+    assert overlapped == [True]
+
+
+def test_pair_cache_serves_reads_and_is_invalidated_on_write(pairs_table):
+    compare = _post('/items/compare', ITEMS)
+    assert json.loads(lambda_app.lambda_handler(compare, None)['body'])['pair_exists'] is False
+    # Ausencia cacheada: la segunda comparación no vuelve a leer DynamoDB
+    lambda_app.lambda_handler(compare, None)
+    assert lambda_app.pair_cache.stats()['negative_hits'] == 1
+
+    created = lambda_app.lambda_handler(_post('/items/pairs', ITEMS), None)
+    assert created['statusCode'] == 201
+    assert json.loads(lambda_app.lambda_handler(compare, None)['body'])['pair_exists'] is True
+
+    stats = json.loads(lambda_app.lambda_handler({'httpMethod': 'GET', 'path': '/cache/stats'}, None)['body'])['cache']
+    assert stats['invalidations'] == 1
+
+
+def test_bloom_filter_skips_reads_for_unknown_pairs(pairs_table, monkeypatch):
+    from pair_bloom import KnownPairIndex, PairBloomFilter
+
+    pairs_table.put_item(Item={'id': '1_2', 'status': 'positivo'})
+    # Solo omite lecturas siguiendo el stream de la tabla (la tabla es recién creada: sin margen)
+    index = KnownPairIndex(PairBloomFilter.from_ids(['1_2']), source=lambda_app.pair_store, overlap_seconds=0)
+    index.follow(index.bloom.built_at)
+    monkeypatch.setattr(lambda_app, 'known_pairs', index)
+
+    known = json.loads(lambda_app.lambda_handler(_post('/items/compare', ITEMS), None)['body'])
+    unknown_items = {'item_a': ITEMS['item_a'], 'item_b': {'item_id': 99, 'title': 'Otro producto'}}
+    unknown = json.loads(lambda_app.lambda_handler(_post('/items/compare', unknown_items), None)['body'])
+
+    assert known['pair_exists'] is True
+    assert unknown['pair_exists'] is False
+    assert index.skipped_reads == 1
+    assert lambda_app.pair_cache.stats()['lookups'] == 1
+
+
+def test_batch_endpoints_report_per_pair_results(pairs_table):
+    pairs = [{'item_a': {'item_id': i, 'title': f'Producto {i} negro'},
+              'item_b': {'item_id': i + 1000, 'title': f'Producto {i} negro'}} for i in range(30)]
+    pairs.append({'item_a': {'item_id': 1}})
+    response = lambda_app.lambda_handler(_post('/items/pairs/batch-create', {'pairs': pairs}), FakeContext(30_000))
+    body = json.loads(response['body'])
+    assert body['summary'] == {'created_or_updated': 30, 'invalid': 1}
+    assert pairs_table.get_item(Key={'id': '3_1003'})['Item']['status'] == 'positivo'
+
+    # Reetiquetar: 'status' es palabra reservada de DynamoDB
+    ids = [f'{i}_{i + 1000}' for i in range(30)] + ['no_existe']
+    response = lambda_app.lambda_handler(
+        _post('/items/pairs/batch-update', {'pair_ids': ids, 'changes': {'status': 'negativo'}}), FakeContext(30_000))
+    assert json.loads(response['body'])['summary'] == {'updated': 30, 'not_found': 1}
+    assert pairs_table.get_item(Key={'id': '3_1003'})['Item']['status'] == 'negativo'
+
+    # Sin tiempo para otro BatchWriteItem, los ids vuelven en remaining_ids
+    response = lambda_app.lambda_handler(_post('/items/pairs/batch-delete', {'pair_ids': ids}), FakeContext(550))
+    body = json.loads(response['body'])
+    assert body['summary'] == {'not_attempted': 31}
+    assert body['remaining_ids'] == ids
+
+    response = lambda_app.lambda_handler(_post('/items/pairs/batch-delete', {'pair_ids': ids}), FakeContext(30_000))
+    assert json.loads(response['body'])['summary'] == {'deleted': 31}
+    assert pairs_table.scan()['Count'] == 0
+
+
+def test_each_invocation_emits_an_emf_record(pairs_table, capsys):
+    from metrics import instrument_dynamodb
+    from dynamodb_client import get_dynamodb
+    instrument_dynamodb(get_dynamodb().meta.client, lambda_app.metrics)
+    capsys.readouterr()
+
+    lambda_app.lambda_handler(_post('/items/compare', ITEMS), FakeContext(30_000))
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{"_aws"')]
+
+    assert len(records) == 1
+    record = records[0]
+    assert record['Route'] == '/items/compare' and record['Method'] == 'POST'
+    assert record['http_requests_200'] == 1.0
+    assert len(record['http_request_duration_ms']) == 1
+    assert 'stage_json_parse_ms' in record and 'stage_dynamodb_GetItem_ms' in record
+    assert any(key.startswith('similarity_scorer_') for key in record)
+    assert record['dynamodb_consumed_capacity_units_GetItem_item_pairs'] > 0
+
+
+def test_profiled_request_returns_top_frames(pairs_table, monkeypatch, tmp_path):
+    monkeypatch.setenv('PROFILING_ADMIN_TOKEN', 'secreto')
+    monkeypatch.setenv('PROFILE_DIR', str(tmp_path))
+    event = {**_post('/items/compare', ITEMS), 'queryStringParameters': {'profile': '1'}}
+
+    denied = lambda_app.lambda_handler(event, FakeContext(30_000))
+    assert denied['statusCode'] == 403
+
+    response = lambda_app.lambda_handler({**event, 'headers': {'x-admin-token': 'secreto'}}, FakeContext(30_000))
+    body = json.loads(response['body'])
+    assert response['statusCode'] == 200
+    assert response['headers']['X-Profile-Id'] == body['profile']['profile_id']
+    assert {'score_titles', 'get_item_timed'} <= {row['function'] for row in body['profile']['focus']}
+
+
+def test_item_pairs_and_pagination_work_on_the_sqlite_store(monkeypatch):
+    from pair_store import SQLitePairStore
+    store = SQLitePairStore(':memory:')
+    list(store.batch_put([{'id': f'{i}_{i + 1}', 'item_a_id': i, 'item_b_id': i + 1} for i in range(1, 6)]))
+    monkeypatch.setattr(lambda_app, 'pair_store', store)
+
+    event = {'httpMethod': 'GET', 'path': '/items/3/pairs', 'queryStringParameters': None}
+    body = json.loads(lambda_app.lambda_handler(event, FakeContext(30_000))['body'])
+    assert sorted(pair['id'] for pair in body['pairs']) == ['2_3', '3_4']
+
+    event = {'httpMethod': 'GET', 'path': '/items/pairs', 'queryStringParameters': {'limit': '3'}}
+    first = json.loads(lambda_app.lambda_handler(event, FakeContext(30_000))['body'])
+    event['queryStringParameters']['next_token'] = first['next_token']
+    second = json.loads(lambda_app.lambda_handler(event, FakeContext(30_000))['body'])
+    assert [p['id'] for p in first['pairs'] + second['pairs']] == ['1_2', '2_3', '3_4', '4_5', '5_6']
+    assert second['next_token'] is None
+
+    # Sin limit: una página del Scan, como antes de paginar
+    event = {'httpMethod': 'GET', 'path': '/items/pairs', 'queryStringParameters': None}
+    assert len(json.loads(lambda_app.lambda_handler(event, FakeContext(30_000))['body'])['pairs']) == 5
+
+
+def test_invalid_limit_is_a_bad_request(pairs_table):
+    for path in ('/items/pairs', '/items/3/pairs'):
+        for limit in ('abc', '0'):
+            event = {'httpMethod': 'GET', 'path': path, 'queryStringParameters': {'limit': limit}}
+            assert lambda_app.lambda_handler(event, FakeContext(30_000))['statusCode'] == 400
+
+
+def test_non_integer_item_ids_are_a_bad_request(pairs_table):
+    items = {'item_a': {'item_id': 'sku-1', 'title': 'Mouse'}, 'item_b': {'item_id': 2, 'title': 'Mouse'}}
+    for path in ('/items/compare', '/items/pairs'):
+        assert lambda_app.lambda_handler(_post(path, items), FakeContext(30_000))['statusCode'] == 400
+    response = lambda_app.lambda_handler(_post('/items/pairs/batch-create', {'pairs': [items]}), FakeContext(30_000))
+    assert json.loads(response['body'])['results'][0]['result'] == 'invalid'
+
+
+def test_identical_titles_keep_the_model_probability_on_the_ml_path(monkeypatch):
+    class FakeDetector:
+        def predict_similarity(self, title1, title2):
+            return {'similarity_score': 0.93}
+
+    monkeypatch.setattr(lambda_app, 'get_ml_detector', lambda: FakeDetector())
+    assert lambda_app.score_titles('Mouse Logitech', ' mouse logitech ') == (0.93, 'ml')
+
+    monkeypatch.setattr(lambda_app, 'get_ml_detector', lambda: None)
+    assert lambda_app.score_titles('Mouse Logitech', ' mouse logitech ') == (1.0, 'exact')
+
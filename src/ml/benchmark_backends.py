@@ -0,0 +1,108 @@
+"""
+Benchmark de latencia de los backends de inferencia (joblib, ONNX y NumPy)
+Mide un par individual y un batch de 10k pares con cada backend
+"""
+
+import os
+import json
+import time
+import argparse
+import tempfile
+import statistics
+from typing import Dict, List
+
+import numpy as np
+
+from ml_similarity import MLSimilarityDetector, INFERENCE_BACKENDS
+from train_ml_model import create_synthetic_training_data
+
+
+def build_pairs(n: int) -> List[Dict]:
+    """Repetir los pares sintéticos hasta obtener n pares"""
+    base = create_synthetic_training_data()
+    return [base[i % len(base)] for i in range(n)]
+
+
+def ensure_model(model_path: str, backends: List[str]):
+    """Entrenar (y exportar a ONNX / NumPy) un modelo de prueba si no existe"""
+    if not os.path.exists(model_path):
+        print(f"⚠️ No existe {model_path}, entrenando modelo sintético...")
+        MLSimilarityDetector(model_path).train_model(create_synthetic_training_data(), profile='fast')
+    if 'onnx' in backends:
+        from onnx_backend import export_onnx, default_onnx_path
+        if not os.path.exists(default_onnx_path(model_path)):
+            export_onnx(MLSimilarityDetector(model_path))
+    if 'numpy' in backends:
+        from tree_ensemble import export_numpy, default_numpy_path
+        if not os.path.exists(default_numpy_path(model_path)):
+            export_numpy(MLSimilarityDetector(model_path))
+
+
+def benchmark_backend(backend: str, model_path: str, pairs: List[Dict], repeat: int) -> Dict[str, float]:
+    """Latencias de un backend: par individual, batch completo y solo modelo"""
+    detector = MLSimilarityDetector(model_path, backend=backend)
+    if not detector.is_trained:
+        raise RuntimeError(f"No se pudo cargar el modelo con backend {backend}")
+
+    title_a, title_b = pairs[0]['item_a_title'], pairs[0]['item_b_title']
+    detector.predict_similarity(title_a, title_b)  # warm-up
+    single = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        detector.predict_similarity(title_a, title_b)
+        single.append(time.perf_counter() - start)
+
+    titles_a = [pair['item_a_title'] for pair in pairs]
+    titles_b = [pair['item_b_title'] for pair in pairs]
+    batch, model_only = [], []
+    features = detector.extract_features_batch(titles_a, titles_b)
+    for _ in range(3):
+        start = time.perf_counter()
+        detector.predict_similarity_batch(titles_a, titles_b)
+        batch.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        detector.predict_proba_features(features)
+        model_only.append(time.perf_counter() - start)
+
+    return {
+        'single_p50_ms': statistics.median(single) * 1000,
+        'single_p95_ms': float(np.percentile(single, 95)) * 1000,
+        'batch_ms': min(batch) * 1000,
+        'batch_us_per_pair': min(batch) / len(pairs) * 1e6,
+        'model_only_batch_ms': min(model_only) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comparar latencia de los backends joblib, ONNX y NumPy")
+    parser.add_argument('--model-path', default=None,
+                        help="Modelo .pkl a usar (por defecto, uno sintético en un directorio temporal)")
+    parser.add_argument('--backends', default=','.join(INFERENCE_BACKENDS))
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=200, help="Repeticiones del par individual")
+    parser.add_argument('--json', dest='json_path', default=None, help="Guardar resultados en JSON")
+    args = parser.parse_args()
+
+    backends = [backend.strip() for backend in args.backends.split(',') if backend.strip()]
+    model_path = args.model_path or os.path.join(tempfile.mkdtemp(), 'models', 'similarity_model.pkl')
+    ensure_model(model_path, backends)
+    pairs = build_pairs(args.batch_size)
+
+    results = {}
+    for backend in backends:
+        results[backend] = benchmark_backend(backend, model_path, pairs, args.repeat)
+
+    print(f"\n=== Latencia por backend ({args.batch_size} pares por batch) ===")
+    print(f"{'backend':<8} {'par p50':>10} {'par p95':>10} {'batch':>12} {'µs/par':>8} {'solo modelo':>12}")
+    for backend, r in results.items():
+        print(f"{backend:<8} {r['single_p50_ms']:>8.3f}ms {r['single_p95_ms']:>8.3f}ms "
+              f"{r['batch_ms']:>10.1f}ms {r['batch_us_per_pair']:>8.2f} {r['model_only_batch_ms']:>10.2f}ms")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Resultados guardados en {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Evaluación offline del modelo de similitud.
+
+Se puntúa todo el set en una pasada por lotes. Una única featurización da el
+score ML (predict_proba) y el coseno TF-IDF (la característica
+tfidf_similarity), y las métricas se calculan vectorizadas: accuracy,
+precision, recall, F1, ROC-AUC y un barrido de umbrales.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ml_similarity import MLSimilarityDetector, FEATURE_NAMES, SIMILARITY_THRESHOLD, UNKNOWN_LABEL, pair_columns
+
+logger = logging.getLogger(__name__)
+
+# Columna de la matriz de características con el coseno TF-IDF
+TFIDF_FEATURE = FEATURE_NAMES.index('tfidf_similarity')
+
+# Pares por bloque de featurización (cada bloque va a un proceso distinto)
+DEFAULT_EVAL_CHUNKSIZE = 100_000
+
+# Umbrales del barrido (0.00, 0.01, ..., 1.00)
+DEFAULT_THRESHOLDS = np.round(np.linspace(0.0, 1.0, 101), 2)
+
+# Estado que heredan los procesos hijos por fork (no se serializa el detector)
+_fork_state: Optional[Tuple[MLSimilarityDetector, Sequence[str], Sequence[str]]] = None
+
+
+def _featurize_range(bounds: Tuple[int, int]) -> np.ndarray:
+    detector, titles_a, titles_b = _fork_state
+    start, end = bounds
+    return detector.extract_features_batch(titles_a[start:end], titles_b[start:end])
+
+
+def featurize(detector: MLSimilarityDetector, titles_a: Sequence[str], titles_b: Sequence[str],
+              n_jobs: Optional[int] = None, chunksize: int = DEFAULT_EVAL_CHUNKSIZE) -> np.ndarray:
+    """Matriz de características de todos los pares, por bloques en paralelo.
+
+    Con más de un bloque y n_jobs > 1, los bloques se reparten en procesos
+    creados por fork (heredan el detector y los títulos sin copiarlos). Donde
+    no hay fork, o con un solo núcleo, se featuriza en el proceso actual.
+    """
+    global _fork_state
+    n_jobs = n_jobs or os.cpu_count() or 1
+    bounds = [(start, min(start + chunksize, len(titles_a))) for start in range(0, len(titles_a), chunksize)]
+    if n_jobs <= 1 or len(bounds) <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return detector.extract_features_batch(titles_a, titles_b)
+
+    _fork_state = (detector, titles_a, titles_b)
+    try:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(bounds)),
+                                 mp_context=multiprocessing.get_context('fork')) as pool:
+            return np.vstack(list(pool.map(_featurize_range, bounds)))
+    finally:
+        _fork_state = None
+
+
+def classification_metrics(labels: np.ndarray, scores: np.ndarray, threshold: float) -> Dict[str, Any]:
+    """Matriz de confusión, accuracy, precision, recall y F1 con un umbral"""
+    labels = np.asarray(labels).astype(bool)
+    predicted = np.asarray(scores) >= threshold
+    tp = int(np.count_nonzero(predicted & labels))
+    fp = int(np.count_nonzero(predicted & ~labels))
+    fn = int(np.count_nonzero(~predicted & labels))
+    tn = len(labels) - tp - fp - fn
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        'threshold': float(threshold),
+        'accuracy': (tp + tn) / len(labels) if len(labels) else 0.0,
+        'precision': precision,
+        'recall': recall,
+        'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        'tp': tp, 'fp': fp, 'tn': tn, 'fn': fn,
+    }
+
+
+def roc_auc(labels: np.ndarray, scores: np.ndarray) -> Optional[float]:
+    """ROC-AUC por rangos (Mann-Whitney; los empates reciben el rango promedio).
+
+    Devuelve None si falta alguna de las dos clases.
+    """
+    labels = np.asarray(labels).astype(bool)
+    n_positive = int(labels.sum())
+    n_negative = len(labels) - n_positive
+    if n_positive == 0 or n_negative == 0:
+        return None
+    _, inverse, counts = np.unique(np.asarray(scores, dtype=np.float64), return_inverse=True, return_counts=True)
+    # Rango promedio (base 1) de cada valor distinto
+    average_ranks = np.cumsum(counts) - (counts - 1) / 2.0
+    positive_rank_sum = average_ranks[inverse.ravel()][labels].sum()
+    return float((positive_rank_sum - n_positive * (n_positive + 1) / 2.0) / (n_positive * n_negative))
+
+
+def threshold_sweep(labels: np.ndarray, scores: np.ndarray,
+                    thresholds: Sequence[float] = DEFAULT_THRESHOLDS) -> Dict[str, List[float]]:
+    """Precision, recall, accuracy y F1 para cada umbral, sin recorrer los pares.
+
+    Con los scores de cada clase ordenados, los pares por encima de un umbral
+    salen de un searchsorted, así que el costo es O(n log n) una sola vez.
+    """
+    labels = np.asarray(labels).astype(bool)
+    scores = np.asarray(scores, dtype=np.float64)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    positive_scores = np.sort(scores[labels])
+    negative_scores = np.sort(scores[~labels])
+    tp = len(positive_scores) - np.searchsorted(positive_scores, thresholds, side='left')
+    fp = len(negative_scores) - np.searchsorted(negative_scores, thresholds, side='left')
+    fn = len(positive_scores) - tp
+    tn = len(negative_scores) - fp
+    precision = np.divide(tp, tp + fp, out=np.zeros(len(thresholds)), where=(tp + fp) > 0)
+    recall = np.divide(tp, tp + fn, out=np.zeros(len(thresholds)), where=(tp + fn) > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros(len(thresholds)),
+                   where=(precision + recall) > 0)
+    accuracy = (tp + tn) / len(labels) if len(labels) else np.zeros(len(thresholds))
+    return {
+        'thresholds': thresholds.tolist(),
+        'precision': precision.tolist(),
+        'recall': recall.tolist(),
+        'accuracy': np.asarray(accuracy, dtype=np.float64).tolist(),
+        'f1': f1.tolist(),
+    }
+
+
+def score_report(labels: np.ndarray, scores: np.ndarray, threshold: float,
+                 thresholds: Sequence[float] = DEFAULT_THRESHOLDS) -> Dict[str, Any]:
+    """Métricas de un scorer: con el umbral dado, ROC-AUC y el mejor umbral por F1"""
+    report = classification_metrics(labels, scores, threshold)
+    sweep = threshold_sweep(labels, scores, thresholds)
+    best = int(np.argmax(sweep['f1']))
+    report.update({
+        'roc_auc': roc_auc(labels, scores),
+        'best_threshold': sweep['thresholds'][best],
+        'best_f1': sweep['f1'][best],
+        'sweep': sweep,
+    })
+    return report
+
+
+def evaluate(detector: MLSimilarityDetector, pairs, threshold: float = SIMILARITY_THRESHOLD,
+             thresholds: Sequence[float] = DEFAULT_THRESHOLDS, n_jobs: Optional[int] = None,
+             chunksize: int = DEFAULT_EVAL_CHUNKSIZE) -> Dict[str, Any]:
+    """Evaluar el detector sobre un PairArray o una lista de pares con is_similar.
+
+    Devuelve un reporte con tiempos por etapa y las métricas de los dos
+    scorers ('ml' y 'tfidf'), que salen de la misma matriz de características.
+    Con un PairArray, los scores ML quedan además en pairs.scores y el coseno
+    TF-IDF en pairs.columns['tfidf_similarity'] para todos los pares; las
+    métricas se calculan solo sobre los pares con etiqueta conocida.
+    """
+    if detector.model_store is not None:
+        detector.refresh_model()
+    if not detector.is_trained:
+        raise ValueError("El modelo no está entrenado; no se puede evaluar")
+
+    start = time.perf_counter()
+    titles_a, titles_b, labels = pair_columns(pairs, include_unknown=True)
+    labeled = np.asarray(labels) != UNKNOWN_LABEL
+    if not labeled.any():
+        raise ValueError("No hay pares con etiqueta conocida; no se puede evaluar")
+    labels = np.asarray(labels)[labeled].astype(bool)
+
+    features = featurize(detector, titles_a, titles_b, n_jobs=n_jobs, chunksize=chunksize)
+    featurize_seconds = time.perf_counter() - start
+
+    predict_start = time.perf_counter()
+    ml_scores = detector.predict_proba_features(features) if len(features) else np.zeros(0)
+    predict_seconds = time.perf_counter() - predict_start
+    if hasattr(pairs, 'scores'):
+        pairs.scores = np.asarray(ml_scores, dtype=np.float32)
+        pairs.columns['tfidf_similarity'] = features[:, TFIDF_FEATURE].astype(np.float32)
+
+    metrics_start = time.perf_counter()
+    scorers = {
+        'ml': score_report(labels, np.asarray(ml_scores)[labeled], threshold, thresholds),
+        'tfidf': score_report(labels, features[labeled, TFIDF_FEATURE], threshold, thresholds),
+    }
+    metrics_seconds = time.perf_counter() - metrics_start
+
+    return {
+        'n_pairs': len(labels),
+        'n_positive': int(labels.sum()),
+        'n_unlabeled': int((~labeled).sum()),
+        'threshold': threshold,
+        'featurize_seconds': featurize_seconds,
+        'predict_seconds': predict_seconds,
+        'metrics_seconds': metrics_seconds,
+        'total_seconds': time.perf_counter() - start,
+        'scorers': scorers,
+    }
+
+
+def print_evaluation_report(report: Dict[str, Any]):
+    """Mostrar métricas por scorer y tiempos de la evaluación"""
+    print("\n=== REPORTE DE EVALUACIÓN ===")
+    print(f"Pares: {report['n_pairs']} ({report['n_positive']} positivos, {report['n_unlabeled']} sin etiqueta "
+          f"excluidos), umbral {report['threshold']:.2f}")
+    print(f"{'Scorer':<8} {'Accuracy':>9} {'Precision':>10} {'Recall':>8} {'F1':>7} {'ROC-AUC':>8} {'Mejor umbral (F1)':>18}")
+    for name, metrics in report['scorers'].items():
+        auc = f"{metrics['roc_auc']:.3f}" if metrics['roc_auc'] is not None else '-'
+        print(f"{name:<8} {metrics['accuracy']:>9.2%} {metrics['precision']:>10.2%} {metrics['recall']:>8.2%} "
+              f"{metrics['f1']:>7.3f} {auc:>8} {metrics['best_threshold']:>10.2f} ({metrics['best_f1']:.3f})")
+    print(f"Featurización: {report['featurize_seconds']:.2f}s | Predicción: {report['predict_seconds']:.2f}s | "
+          f"Métricas: {report['metrics_seconds']:.2f}s | Total: {report['total_seconds']:.2f}s")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Evaluar el modelo de similitud sobre un CSV etiquetado")
+    parser.add_argument('csv', help="CSV con TITLE_A/TITLE_B (o item_a_title/item_b_title) e is_similar")
+    parser.add_argument('--model-path', default='models/similarity_model.pkl')
+    parser.add_argument('--threshold', type=float, default=SIMILARITY_THRESHOLD)
+    parser.add_argument('--n-jobs', type=int, default=None, help="Procesos de featurización (por defecto, todos los núcleos)")
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_EVAL_CHUNKSIZE, help="Pares por bloque de featurización")
+    parser.add_argument('--output', default=None, help="Guardar el reporte completo (con el barrido) como JSON")
+    return parser.parse_args()
+
+
+def main():
+    from train_ml_model import load_training_pairs
+
+    args = parse_args()
+    detector = MLSimilarityDetector(args.model_path)
+    if not detector.is_trained:
+        print(f"❌ No hay un modelo entrenado en {args.model_path}")
+        sys.exit(1)
+
+    load_start = time.perf_counter()
+    pairs = load_training_pairs(args.csv)
+    print(f"📊 {len(pairs)} pares cargados en {time.perf_counter() - load_start:.2f}s")
+
+    report = evaluate(detector, pairs, threshold=args.threshold, n_jobs=args.n_jobs, chunksize=args.chunksize)
+    print_evaluation_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Reporte guardado en {args.output}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
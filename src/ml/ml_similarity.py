@@ -4,54 +4,325 @@ Fase 1: XGBoost para similitud de títulos
 """
 
 import numpy as np
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import StandardScaler
-import xgboost as xgb
-import joblib
 import os
-from typing import Dict, List, Tuple, Optional
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, NamedTuple, Tuple, Optional, Sequence
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Callback opcional (etapa, segundos) con la duración de cada etapa de la
+# predicción; lo registran las APIs para sus métricas (set_stage_observer)
+_stage_observer = None
+
+
+def set_stage_observer(observer):
+    global _stage_observer
+    _stage_observer = observer
+
+
+@contextmanager
+def _stage(name: str):
+    if _stage_observer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stage_observer(name, time.perf_counter() - start)
+
+# Orden de las características que consume el modelo
+FEATURE_NAMES = [
+    'length_diff',
+    'length_ratio',
+    'word_count_diff',
+    'word_count_ratio',
+    'exact_match',
+    'contains_same_words',
+    'tfidf_similarity',
+]
+
+# Incrementar cuando cambie la forma de calcular las características:
+# invalida las entradas existentes de la caché de características
+FEATURIZER_VERSION = 1
+
+# Umbral de probabilidad a partir del cual un par se considera similar
+SIMILARITY_THRESHOLD = 0.7
+
+# Etiqueta de los pares sin is_similar conocido (la misma que PairArray)
+UNKNOWN_LABEL = -1
+
+# Perfiles de entrenamiento de XGBoost. 'balanced' son exactamente los
+# hiperparámetros originales (árboles y early stopping por defecto de XGBoost),
+# así que el modelo por defecto no cambia; 'fast' y 'accurate' usan
+# construcción de árboles por histograma. El early stopping solo se aplica
+# cuando hay datos de validación.
+TRAINING_PROFILES: Dict[str, Dict[str, Any]] = {
+    'fast': {
+        'n_estimators': 100,
+        'max_depth': 4,
+        'learning_rate': 0.3,
+        'tree_method': 'hist',
+        'max_bin': 64,
+        'early_stopping_rounds': 5,
+    },
+    'balanced': {
+        'n_estimators': 100,
+        'max_depth': 6,
+        'learning_rate': 0.1,
+    },
+    'accurate': {
+        'n_estimators': 500,
+        'max_depth': 8,
+        'learning_rate': 0.05,
+        'tree_method': 'hist',
+        'max_bin': 512,
+        'early_stopping_rounds': 30,
+    },
+}
+DEFAULT_TRAINING_PROFILE = 'balanced'
+
+# Backends de inferencia: 'joblib' (scaler + XGBoost deserializados), 'onnx'
+# (pipeline exportado con onnx_backend.export_onnx, ejecutado con onnxruntime)
+# o 'numpy' (pipeline exportado con tree_ensemble.export_numpy, solo numpy).
+# sklearn, joblib y xgboost se importan solo cuando hacen falta, de modo que
+# el backend 'numpy' funciona sin ellos.
+INFERENCE_BACKENDS = ('joblib', 'onnx', 'numpy')
+
+
+def get_training_params(profile: str = DEFAULT_TRAINING_PROFILE, **overrides) -> Dict[str, Any]:
+    """Obtener los hiperparámetros de un perfil, con overrides opcionales"""
+    if profile not in TRAINING_PROFILES:
+        raise ValueError(f"Perfil de entrenamiento desconocido: {profile}. "
+                         f"Opciones: {', '.join(TRAINING_PROFILES)}")
+    params = dict(TRAINING_PROFILES[profile])
+    params.update({k: v for k, v in overrides.items() if v is not None})
+    return params
+
+
+def pair_columns(item_pairs, include_unknown: bool = False) -> Tuple[List[str], List[str], np.ndarray]:
+    """Títulos y etiquetas de una lista de dicts o de un PairArray (src/common/pair_array.py).
+
+    Con un PairArray se leen las columnas directamente, sin armar un dict por par.
+    Los pares con etiqueta desconocida (UNKNOWN_LABEL) se descartan: no son
+    negativos. Con include_unknown se conservan, con UNKNOWN_LABEL.
+    """
+    if hasattr(item_pairs, 'title_columns'):
+        titles_a, titles_b = item_pairs.title_columns()
+        labels = np.asarray(item_pairs.labels).astype(int)
+    else:
+        titles_a = [pair.get('item_a_title', '') for pair in item_pairs]
+        titles_b = [pair.get('item_b_title', '') for pair in item_pairs]
+        labels = np.array([pair.get('is_similar', 0) for pair in item_pairs], dtype=int)  # 0 o 1
+    known = labels != UNKNOWN_LABEL
+    if include_unknown or known.all():
+        return titles_a, titles_b, labels
+    rows = np.flatnonzero(known)
+    return [titles_a[row] for row in rows], [titles_b[row] for row in rows], labels[known]
+
+class FeatureCache:
+    """Caché en disco de matrices de características, direccionada por contenido.
+
+    La clave combina la versión del featurizer, el estado del vectorizer TF-IDF
+    y el contenido del dataset, por lo que reentrenar con los mismos datos
+    reutiliza las matrices ya calculadas (se cargan como memmap).
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key_for(self, item_pairs: List[Dict], vectorizer: Optional[Any]) -> str:
+        """Calcular la clave de un dataset para un featurizer dado"""
+        digest = hashlib.sha256()
+        digest.update(f"featurizer-v{FEATURIZER_VERSION}".encode('utf-8'))
+        if vectorizer is not None:
+            vocabulary = sorted((term, int(index)) for term, index in vectorizer.vocabulary_.items())
+            digest.update(json.dumps(vocabulary, ensure_ascii=False).encode('utf-8'))
+            digest.update(np.ascontiguousarray(vectorizer.idf_).tobytes())
+        for title_a, title_b, label in zip(*pair_columns(item_pairs)):
+            record = f"{title_a}\x1f{title_b}\x1f{label}\x1e"
+            digest.update(record.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        return (os.path.join(self.cache_dir, f"{key}_X.npy"),
+                os.path.join(self.cache_dir, f"{key}_y.npy"))
+
+    def load(self, key: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Devolver (X, y) como memmap si la entrada existe"""
+        x_path, y_path = self._paths(key)
+        if not (os.path.exists(x_path) and os.path.exists(y_path)):
+            return None
+        try:
+            return np.load(x_path, mmap_mode='r'), np.load(y_path, mmap_mode='r')
+        except Exception as e:
+            logger.warning(f"Entrada de caché de características corrupta ({key}): {e}")
+            return None
+
+    def store(self, key: str, X: np.ndarray, y: np.ndarray):
+        """Guardar (X, y) de forma atómica"""
+        for path, array in zip(self._paths(key), (X, y)):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+
+class ModelSnapshot(NamedTuple):
+    """Versión inmutable del modelo cargado: todo lo que usa una predicción.
+
+    Cada predicción toma una única referencia al snapshot vigente y trabaja
+    sin locks; una recarga en caliente arma un snapshot nuevo y reemplaza la
+    referencia de una vez, así nunca se mezclan piezas de dos versiones.
+    """
+    model: Any = None
+    tfidf_vectorizer: Any = None
+    scaler: Any = None
+    onnx_session: Any = None
+    numpy_model: Any = None
+    is_trained: bool = False
+
+
+def _snapshot_field(name: str) -> property:
+    """Atributo del detector que lee y reemplaza el snapshot vigente"""
+    def get(self):
+        return getattr(self._snapshot, name)
+
+    def set(self, value):
+        self._snapshot = self._snapshot._replace(**{name: value})
+
+    return property(get, set)
+
+
 class MLSimilarityDetector:
     """Detector de similitudes usando Machine Learning"""
+
+    model = _snapshot_field('model')
+    tfidf_vectorizer = _snapshot_field('tfidf_vectorizer')
+    scaler = _snapshot_field('scaler')
+    onnx_session = _snapshot_field('onnx_session')
+    numpy_model = _snapshot_field('numpy_model')
+    is_trained = _snapshot_field('is_trained')
     
-    def __init__(self, model_path: str = "models/similarity_model.pkl"):
+    def __init__(self, model_path: str = "models/similarity_model.pkl",
+                 feature_cache_dir: Optional[str] = None, backend: str = 'joblib',
+                 onnx_path: Optional[str] = None, numpy_path: Optional[str] = None,
+                 model_cache_dir: Optional[str] = None, refresh_seconds: Optional[float] = None,
+                 s3_client=None):
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Backend de inferencia desconocido: {backend}. "
+                             f"Opciones: {', '.join(INFERENCE_BACKENDS)}")
+        self.backend = backend
+        self.onnx_path = onnx_path
+        self.numpy_path = numpy_path
+        self.model_uri = None
+        self.model_store = None
+        self._snapshot = ModelSnapshot()
+        # Solo serializa a quienes reemplazan el snapshot; las predicciones no lo toman
+        self._model_lock = threading.Lock()
+        if model_path.startswith('s3://'):
+            # Los artefactos se descargan a model_cache_dir (/tmp en Lambda)
+            model_path = self._init_model_store(model_path, model_cache_dir, refresh_seconds, s3_client)
         self.model_path = model_path
-        self.model = None
-        self.tfidf_vectorizer = None
-        self.scaler = None
-        self.is_trained = False
+        self.feature_cache = FeatureCache(feature_cache_dir) if feature_cache_dir else None
         
         # Crear directorio de modelos si no existe
         os.makedirs(os.path.dirname(model_path), exist_ok=True)
         
         # Cargar modelo si existe
         self.load_model()
+
+    def _init_model_store(self, model_uri: str, cache_dir: Optional[str],
+                          refresh_seconds: Optional[float], s3_client) -> str:
+        """Configurar la descarga desde S3 de los artefactos que usa el backend.
+
+        Devuelve la ruta local del .pkl; onnx_path / numpy_path pasan a apuntar
+        a las copias locales de sus artefactos.
+        """
+        from model_store import S3ModelStore, DEFAULT_CACHE_DIR, DEFAULT_REFRESH_SECONDS
+
+        if self.backend == 'onnx':
+            from onnx_backend import default_onnx_path, vectorizer_path_for
+            onnx_uri = self.onnx_path or default_onnx_path(model_uri)
+            uris = [onnx_uri, vectorizer_path_for(onnx_uri)]
+        elif self.backend == 'numpy':
+            from tree_ensemble import default_numpy_path
+            uris = [self.numpy_path or default_numpy_path(model_uri)]
+        else:
+            uris = [model_uri]
+
+        cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.model_uri = model_uri
+        self.model_store = S3ModelStore(
+            uris, cache_dir=cache_dir, s3_client=s3_client,
+            refresh_seconds=DEFAULT_REFRESH_SECONDS if refresh_seconds is None else refresh_seconds
+        )
+        if self.backend == 'onnx':
+            self.onnx_path = self.model_store.local_path(uris[0])
+        elif self.backend == 'numpy':
+            self.numpy_path = self.model_store.local_path(uris[0])
+        return os.path.join(cache_dir, os.path.basename(model_uri))
+
+    def refresh_model(self) -> bool:
+        """Cargar en caliente una versión nueva del modelo publicada en S3.
+
+        Solo consulta S3 cuando venció el intervalo de refresco (GET condicional
+        por ETag); devuelve True si se cargó una versión nueva.
+        """
+        if self.model_store is None or not self.model_store.poll():
+            return False
+        fresh = MLSimilarityDetector(self.model_path, backend=self.backend,
+                                     onnx_path=self.onnx_path, numpy_path=self.numpy_path)
+        if not fresh.is_trained:
+            logger.warning("La versión nueva del modelo no se pudo cargar, se mantiene la anterior")
+            return False
+        with self._model_lock:
+            self._snapshot = fresh._snapshot
+        logger.info(f"Modelo actualizado desde {self.model_uri} (ETag {self.model_store.primary.etag})")
+        return True
     
-    def extract_text_features(self, title1: str, title2: str) -> Dict[str, float]:
-        """Extraer características de texto para comparación"""
+    @staticmethod
+    def _lexical_features(title1_norm: str, title2_norm: str) -> Tuple[float, ...]:
+        """Características léxicas (todas salvo TF-IDF) de dos títulos normalizados"""
+        len1, len2 = len(title1_norm), len(title2_norm)
+        words1, words2 = title1_norm.split(), title2_norm.split()
+        set1, set2 = set(words1), set(words2)
+        union = len(set1 | set2)
+        max_len = max(len1, len2)
+        max_words = max(len(words1), len(words2))
+        return (
+            abs(len1 - len2),
+            min(len1, len2) / max_len if max_len > 0 else 0,
+            abs(len(words1) - len(words2)),
+            min(len(words1), len(words2)) / max_words if max_words > 0 else 0,
+            1.0 if title1_norm == title2_norm else 0.0,
+            len(set1 & set2) / union if union > 0 else 0.0,
+        )
+
+    def extract_text_features(self, title1: str, title2: str,
+                              snapshot: Optional[ModelSnapshot] = None) -> Dict[str, float]:
+        """Extraer características de texto para comparación (con el snapshot dado o el vigente)"""
+        if snapshot is None:
+            snapshot = self._snapshot
         # Normalizar títulos
         title1_norm = title1.lower().strip()
         title2_norm = title2.lower().strip()
         
         # Características básicas de texto
-        features = {
-            'length_diff': abs(len(title1_norm) - len(title2_norm)),
-            'length_ratio': min(len(title1_norm), len(title2_norm)) / max(len(title1_norm), len(title2_norm)) if max(len(title1_norm), len(title2_norm)) > 0 else 0,
-            'word_count_diff': abs(len(title1_norm.split()) - len(title2_norm.split())),
-            'word_count_ratio': min(len(title1_norm.split()), len(title2_norm.split())) / max(len(title1_norm.split()), len(title2_norm.split())) if max(len(title1_norm.split()), len(title2_norm.split())) > 0 else 0,
-            'exact_match': 1.0 if title1_norm == title2_norm else 0.0,
-            'contains_same_words': len(set(title1_norm.split()) & set(title2_norm.split())) / len(set(title1_norm.split()) | set(title2_norm.split())) if len(set(title1_norm.split()) | set(title2_norm.split())) > 0 else 0.0,
-        }
+        features = dict(zip(FEATURE_NAMES, self._lexical_features(title1_norm, title2_norm)))
         
         # TF-IDF similitud
-        if self.tfidf_vectorizer:
+        if snapshot.numpy_model is not None:
+            features['tfidf_similarity'] = snapshot.numpy_model.tfidf.cosine(title1_norm, title2_norm)
+        elif snapshot.tfidf_vectorizer:
             try:
-                tfidf_matrix = self.tfidf_vectorizer.transform([title1_norm, title2_norm])
+                from sklearn.metrics.pairwise import cosine_similarity
+                tfidf_matrix = snapshot.tfidf_vectorizer.transform([title1_norm, title2_norm])
                 tfidf_similarity = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0]
                 features['tfidf_similarity'] = float(tfidf_similarity)
             except Exception as e:
@@ -61,35 +332,99 @@ class MLSimilarityDetector:
             features['tfidf_similarity'] = 0.0
         
         return features
+
+    def extract_features_batch(self, titles_a: Sequence[str], titles_b: Sequence[str],
+                               snapshot: Optional[ModelSnapshot] = None) -> np.ndarray:
+        """Extraer la matriz de características de muchos pares en una sola pasada.
+
+        Equivale a llamar a extract_text_features por cada par, pero transforma
+        todos los títulos con TF-IDF de una vez y calcula el coseno por filas.
+        """
+        if snapshot is None:
+            snapshot = self._snapshot
+        norm_a = [title.lower().strip() for title in titles_a]
+        norm_b = [title.lower().strip() for title in titles_b]
+        features = np.zeros((len(norm_a), len(FEATURE_NAMES)), dtype=np.float64)
+        
+        for i, (title1_norm, title2_norm) in enumerate(zip(norm_a, norm_b)):
+            features[i, :-1] = self._lexical_features(title1_norm, title2_norm)
+        
+        if snapshot.numpy_model is not None and len(norm_a):
+            features[:, -1] = snapshot.numpy_model.tfidf.cosine_batch(norm_a, norm_b)
+        elif snapshot.tfidf_vectorizer and len(norm_a):
+            try:
+                # Cada título distinto se transforma una sola vez (un ítem suele aparecer en muchos pares)
+                unique_titles: Dict[str, int] = {}
+                codes = np.fromiter((unique_titles.setdefault(title, len(unique_titles)) for title in norm_a + norm_b),
+                                    dtype=np.int64, count=2 * len(norm_a))
+                matrix = snapshot.tfidf_vectorizer.transform(list(unique_titles))
+                matrix_a = matrix[codes[:len(norm_a)]]
+                matrix_b = matrix[codes[len(norm_a):]]
+                dots = np.asarray(matrix_a.multiply(matrix_b).sum(axis=1)).ravel()
+                norms = (np.sqrt(np.asarray(matrix_a.multiply(matrix_a).sum(axis=1)).ravel())
+                         * np.sqrt(np.asarray(matrix_b.multiply(matrix_b).sum(axis=1)).ravel()))
+                features[:, -1] = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+            except Exception as e:
+                logger.warning(f"Error calculating TF-IDF similarity: {e}")
+        
+        return features
     
     def prepare_training_data(self, item_pairs: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
         """Preparar datos de entrenamiento desde pares de items"""
-        features_list = []
-        labels = []
+        titles_a, titles_b, labels = pair_columns(item_pairs)
+        return self.extract_features_batch(titles_a, titles_b), labels
+
+    def _featurize(self, item_pairs: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+        """Preparar datos usando la caché de características si está configurada"""
+        if self.feature_cache is None:
+            return self.prepare_training_data(item_pairs)
         
-        for pair in item_pairs:
-            title1 = pair.get('item_a_title', '')
-            title2 = pair.get('item_b_title', '')
-            is_similar = pair.get('is_similar', 0)  # 0 o 1
-            
-            features = self.extract_text_features(title1, title2)
-            features_list.append(list(features.values()))
-            labels.append(is_similar)
+        key = self.feature_cache.key_for(item_pairs, self.tfidf_vectorizer)
+        cached = self.feature_cache.load(key)
+        if cached is not None:
+            logger.info(f"Características cargadas desde caché ({key[:12]})")
+            return cached
         
-        return np.array(features_list), np.array(labels)
+        X, y = self.prepare_training_data(item_pairs)
+        self.feature_cache.store(key, X, y)
+        logger.info(f"Características guardadas en caché ({key[:12]})")
+        return X, y
     
-    def train_model(self, training_data: List[Dict], validation_data: Optional[List[Dict]] = None):
-        """Entrenar el modelo XGBoost"""
+    def train_model(self, training_data: List[Dict], validation_data: Optional[List[Dict]] = None,
+                    feature_cache_dir: Optional[str] = None, profile: str = DEFAULT_TRAINING_PROFILE,
+                    n_jobs: Optional[int] = None, **overrides) -> Dict[str, Any]:
+        """Entrenar el modelo XGBoost.
+
+        Devuelve un reporte con tiempos por etapa, iteración final y accuracy
+        sobre validación (si se pasó validation_data).
+        """
         logger.info("Iniciando entrenamiento del modelo XGBoost...")
+        params = get_training_params(profile, n_jobs=n_jobs, **overrides)
+        start = time.perf_counter()
         
-        # Preparar datos de entrenamiento
-        X_train, y_train = self.prepare_training_data(training_data)
+        if feature_cache_dir:
+            self.feature_cache = FeatureCache(feature_cache_dir)
         
         # Inicializar y entrenar TF-IDF vectorizer
-        all_titles = []
-        for pair in training_data:
-            all_titles.extend([pair.get('item_a_title', ''), pair.get('item_b_title', '')])
+        titles_a, titles_b, _ = pair_columns(training_data)
+        self.fit_vectorizer(titles_a + titles_b)
+        
+        # Calcular características una única vez, con el TF-IDF ya entrenado
+        featurize_start = time.perf_counter()
+        X_train, y_train = self._featurize(training_data)
+        X_val, y_val = self._featurize(validation_data) if validation_data else (None, None)
+        featurize_seconds = time.perf_counter() - featurize_start
         
+        report = self._fit_estimator(X_train, y_train, X_val, y_val, params)
+        report.update({
+            'profile': profile,
+            'featurize_seconds': featurize_seconds,
+            'total_seconds': time.perf_counter() - start,
+        })
+        return report
+
+    def fit_vectorizer(self, all_titles: List[str]):
+        """Entrenar el vectorizer TF-IDF con una lista de títulos"""
         # Verificar que tenemos títulos válidos
         valid_titles = [title for title in all_titles if title and title.strip()]
         if not valid_titles:
@@ -110,6 +445,7 @@ class MLSimilarityDetector:
         logger.info(f"Vocabulario total: {len(all_words)} palabras únicas")
         logger.info(f"Ejemplos de palabras: {list(all_words)[:10]}")
         
+        from sklearn.feature_extraction.text import TfidfVectorizer
         self.tfidf_vectorizer = TfidfVectorizer(
             analyzer='word',
             ngram_range=(1, 2),
@@ -125,64 +461,186 @@ class MLSimilarityDetector:
             logger.error(f"Error entrenando TF-IDF vectorizer: {e}")
             logger.error(f"Títulos de ejemplo: {valid_titles[:5]}")
             raise
+
+    def train_model_from_features(self, feature_chunks: Iterable[Tuple[np.ndarray, np.ndarray]],
+                                  validation_fraction: float = 0.2, profile: str = DEFAULT_TRAINING_PROFILE,
+                                  n_jobs: Optional[int] = None, **overrides) -> Dict[str, Any]:
+        """Entrenar XGBoost consumiendo matrices de características por bloques.
+
+        Requiere haber llamado antes a fit_vectorizer. De cada bloque se reserva
+        la cola (validation_fraction) para validación, igual que el split 80/20
+        del script de entrenamiento. Solo se acumulan las características
+        (float32), nunca los títulos.
+        """
+        if self.tfidf_vectorizer is None:
+            raise ValueError("Se debe entrenar el vectorizer TF-IDF antes de consumir características")
         
-        # Recalcular características con TF-IDF entrenado
-        X_train, y_train = self.prepare_training_data(training_data)
+        logger.info("Iniciando entrenamiento del modelo XGBoost por bloques...")
+        params = get_training_params(profile, n_jobs=n_jobs, **overrides)
+        start = time.perf_counter()
+        
+        train_parts, train_labels, val_parts, val_labels = [], [], [], []
+        for X_chunk, y_chunk in feature_chunks:
+            split_index = len(X_chunk) - int(len(X_chunk) * validation_fraction)
+            train_parts.append(np.asarray(X_chunk[:split_index], dtype=np.float32))
+            train_labels.append(np.asarray(y_chunk[:split_index]))
+            val_parts.append(np.asarray(X_chunk[split_index:], dtype=np.float32))
+            val_labels.append(np.asarray(y_chunk[split_index:]))
+        featurize_seconds = time.perf_counter() - start
+        
+        if not train_parts or sum(len(part) for part in train_parts) == 0:
+            raise ValueError("No hay pares válidos para entrenar el modelo")
+        
+        X_train, y_train = np.concatenate(train_parts), np.concatenate(train_labels)
+        X_val, y_val = np.concatenate(val_parts), np.concatenate(val_labels)
+        report = self._fit_estimator(X_train, y_train, X_val, y_val, params)
+        report.update({
+            'profile': profile,
+            'featurize_seconds': featurize_seconds,
+            'total_seconds': time.perf_counter() - start,
+        })
+        return report
+
+    def _fit_estimator(self, X_train: np.ndarray, y_train: np.ndarray,
+                       X_val: Optional[np.ndarray], y_val: Optional[np.ndarray],
+                       params: Dict[str, Any]) -> Dict[str, Any]:
+        """Normalizar, entrenar XGBoost con los parámetros dados y guardar el modelo"""
+        params = dict(params)
+        has_validation = X_val is not None and len(X_val) > 0
+        if not has_validation:
+            # XGBoost exige un eval_set para hacer early stopping
+            params.pop('early_stopping_rounds', None)
         
         # Normalizar características
-        self.scaler = StandardScaler()
-        X_train_scaled = self.scaler.fit_transform(X_train)
+        from sklearn.preprocessing import StandardScaler
+        scaler = StandardScaler()
+        X_train_scaled = scaler.fit_transform(X_train)
         
         # Configurar y entrenar XGBoost
-        self.model = xgb.XGBClassifier(
-            n_estimators=100,
-            max_depth=6,
-            learning_rate=0.1,
+        import xgboost as xgb
+        model = xgb.XGBClassifier(
             random_state=42,
-            eval_metric='logloss'
+            eval_metric='logloss',
+            **params
         )
         
         # Entrenar modelo
-        if validation_data:
-            X_val, y_val = self.prepare_training_data(validation_data)
-            X_val_scaled = self.scaler.transform(X_val)
+        fit_start = time.perf_counter()
+        if has_validation:
+            X_val_scaled = scaler.transform(X_val)
             
-            self.model.fit(
+            model.fit(
                 X_train_scaled, y_train,
                 eval_set=[(X_val_scaled, y_val)],
                 verbose=False
             )
         else:
-            self.model.fit(X_train_scaled, y_train)
+            model.fit(X_train_scaled, y_train)
+        fit_seconds = time.perf_counter() - fit_start
         
-        self.is_trained = True
+        # Los pipelines exportados (ONNX / NumPy) corresponden al modelo anterior:
+        # hasta reexportar se predice con el modelo recién entrenado
+        with self._model_lock:
+            self._snapshot = ModelSnapshot(model=model, tfidf_vectorizer=self.tfidf_vectorizer,
+                                           scaler=scaler, is_trained=True)
         logger.info("Modelo entrenado exitosamente")
         
         # Guardar modelo
         self.save_model()
+        
+        report = {
+            'params': params,
+            'n_train': int(len(X_train)),
+            'n_validation': int(len(X_val)) if has_validation else 0,
+            'fit_seconds': fit_seconds,
+            'best_iteration': getattr(model, 'best_iteration', None) if 'early_stopping_rounds' in params else None,
+            'validation_accuracy': None,
+        }
+        if has_validation:
+            probabilities = model.predict_proba(X_val_scaled)[:, 1]
+            predictions = probabilities >= SIMILARITY_THRESHOLD
+            report['validation_accuracy'] = float(np.mean(predictions == np.asarray(y_val).astype(bool)))
+        return report
     
     def predict_similarity(self, title1: str, title2: str) -> Dict[str, float]:
-        """Predecir similitud entre dos títulos"""
-        if not self.is_trained:
+        """Predecir similitud entre dos títulos.
+
+        'scorer' indica qué calculó el score: 'ml', o 'basic' si el modelo no
+        está entrenado y se usó la similitud básica.
+        """
+        if self.model_store is not None:
+            self.refresh_model()
+        snapshot = self._snapshot
+        if not snapshot.is_trained:
             logger.warning("Modelo no entrenado, usando similitud básica")
-            return self._basic_similarity(title1, title2)
+            return {**self._basic_similarity(title1, title2), 'scorer': 'basic'}
         
         # Extraer características
-        features = self.extract_text_features(title1, title2)
-        features_array = np.array(list(features.values())).reshape(1, -1)
-        
-        # Normalizar características
-        features_scaled = self.scaler.transform(features_array)
+        with _stage('featurize'):
+            features = self.extract_text_features(title1, title2, snapshot)
+            features_array = np.array(list(features.values())).reshape(1, -1)
         
-        # Predecir
-        similarity_score = self.model.predict_proba(features_scaled)[0][1]  # Probabilidad de ser similar
+        # Predecir (probabilidad de ser similar)
+        similarity_score = float(self.predict_proba_features(features_array, snapshot)[0])
         
         return {
-            'similarity_score': float(similarity_score),
+            'similarity_score': similarity_score,
             'are_equal': title1.lower().strip() == title2.lower().strip(),
-            'are_similar': similarity_score >= 0.7,  # Umbral configurable
-            'confidence': float(max(self.model.predict_proba(features_scaled)[0]))
+            'are_similar': similarity_score >= SIMILARITY_THRESHOLD,
+            'confidence': max(similarity_score, 1.0 - similarity_score),
+            'scorer': 'ml'
         }
+
+    def score_all(self, title1: str, title2: str) -> Dict[str, Any]:
+        """Score ML, coseno TF-IDF y características léxicas de un par en una sola featurización.
+
+        'ml' es None si el modelo no está entrenado y 'tfidf' es None si no hay
+        vectorizer; el coseno es el del vectorizer entrenado (la característica
+        tfidf_similarity).
+        """
+        if self.model_store is not None:
+            self.refresh_model()
+        snapshot = self._snapshot
+        with _stage('featurize'):
+            features = self.extract_text_features(title1, title2, snapshot)
+        ml_score = None
+        if snapshot.is_trained:
+            features_array = np.array(list(features.values())).reshape(1, -1)
+            ml_score = float(self.predict_proba_features(features_array, snapshot)[0])
+        has_tfidf = snapshot.tfidf_vectorizer is not None or snapshot.numpy_model is not None
+        return {
+            'ml': ml_score,
+            'tfidf': float(features['tfidf_similarity']) if has_tfidf else None,
+            'features': {name: float(value) for name, value in features.items() if name != 'tfidf_similarity'},
+        }
+
+    def predict_proba_features(self, features: np.ndarray,
+                               snapshot: Optional[ModelSnapshot] = None) -> np.ndarray:
+        """Probabilidad de ser similar para una matriz de características ya extraídas"""
+        if snapshot is None:
+            snapshot = self._snapshot
+        # Los backends numpy y ONNX incluyen el escalado en el modelo
+        if snapshot.numpy_model is not None:
+            with _stage('predict_proba'):
+                return snapshot.numpy_model.predict_proba(features)
+        if snapshot.onnx_session is not None:
+            with _stage('predict_proba'):
+                return snapshot.onnx_session.predict_proba(features)
+        with _stage('scale'):
+            scaled = snapshot.scaler.transform(features)
+        with _stage('predict_proba'):
+            return snapshot.model.predict_proba(scaled)[:, 1]
+
+    def predict_similarity_batch(self, titles_a: Sequence[str], titles_b: Sequence[str]) -> np.ndarray:
+        """Scores de similitud de muchos pares con una sola featurización y predicción"""
+        if self.model_store is not None:
+            self.refresh_model()
+        snapshot = self._snapshot
+        if not snapshot.is_trained:
+            return np.array([self._basic_similarity(a, b)['similarity_score'] for a, b in zip(titles_a, titles_b)])
+        with _stage('featurize'):
+            features = self.extract_features_batch(titles_a, titles_b, snapshot)
+        return self.predict_proba_features(features, snapshot)
     
     def _basic_similarity(self, title1: str, title2: str) -> Dict[str, float]:
         """Similitud básica como fallback"""
@@ -207,7 +665,7 @@ class MLSimilarityDetector:
         return {
             'similarity_score': float(similarity),
             'are_equal': False,
-            'are_similar': similarity >= 0.7,
+            'are_similar': similarity >= SIMILARITY_THRESHOLD,
             'confidence': 0.8
         }
     
@@ -218,32 +676,90 @@ class MLSimilarityDetector:
                 'model': self.model,
                 'tfidf_vectorizer': self.tfidf_vectorizer,
                 'scaler': self.scaler,
-                'feature_names': list(self.extract_text_features('', '').keys())
+                'feature_names': FEATURE_NAMES
             }
+            import joblib
             joblib.dump(model_data, self.model_path)
             logger.info(f"Modelo guardado en {self.model_path}")
     
     def load_model(self):
         """Cargar modelo entrenado"""
+        if self.model_store is not None:
+            try:
+                self.model_store.fetch()
+            except Exception as e:
+                # Sin S3 se intenta con la copia que haya quedado en el directorio local
+                logger.warning(f"No se pudo descargar el modelo desde {self.model_uri}: {e}")
+        if self.backend == 'onnx':
+            self._load_onnx_model()
+            return
+        if self.backend == 'numpy':
+            self._load_numpy_model()
+            return
         try:
             if os.path.exists(self.model_path):
+                import joblib
                 model_data = joblib.load(self.model_path)
-                self.model = model_data['model']
-                self.tfidf_vectorizer = model_data['tfidf_vectorizer']
-                self.scaler = model_data['scaler']
-                self.is_trained = True
+                self._snapshot = ModelSnapshot(model=model_data['model'],
+                                               tfidf_vectorizer=model_data['tfidf_vectorizer'],
+                                               scaler=model_data['scaler'], is_trained=True)
                 logger.info(f"Modelo cargado desde {self.model_path}")
         except Exception as e:
             logger.warning(f"No se pudo cargar el modelo: {e}")
             self.is_trained = False
 
-# Instancia global del detector
-ml_detector = MLSimilarityDetector()
+    def _load_onnx_model(self):
+        """Cargar el pipeline ONNX y su vectorizer TF-IDF"""
+        try:
+            import joblib
+            from onnx_backend import OnnxSimilarityBackend, default_onnx_path, vectorizer_path_for
+            onnx_path = self.onnx_path or default_onnx_path(self.model_path)
+            if os.path.exists(onnx_path):
+                onnx_session = OnnxSimilarityBackend(
+                    onnx_path, intra_op_threads=int(os.getenv('ML_ONNX_THREADS', '0')) or None
+                )
+                self._snapshot = ModelSnapshot(onnx_session=onnx_session,
+                                               tfidf_vectorizer=joblib.load(vectorizer_path_for(onnx_path)),
+                                               is_trained=True)
+                logger.info(f"Modelo ONNX cargado desde {onnx_path}")
+        except Exception as e:
+            logger.warning(f"No se pudo cargar el modelo ONNX: {e}")
+            self.onnx_session = None
+            self.is_trained = False
+
+    def _load_numpy_model(self):
+        """Cargar el pipeline exportado para el evaluador NumPy"""
+        try:
+            from tree_ensemble import NumpySimilarityModel, default_numpy_path
+            numpy_path = self.numpy_path or default_numpy_path(self.model_path)
+            if os.path.exists(numpy_path):
+                self._snapshot = ModelSnapshot(numpy_model=NumpySimilarityModel.load(numpy_path), is_trained=True)
+                logger.info(f"Modelo NumPy cargado desde {numpy_path}")
+        except Exception as e:
+            logger.warning(f"No se pudo cargar el modelo NumPy: {e}")
+            self.numpy_model = None
+            self.is_trained = False
+
+# Instancia global del detector (MODEL_S3_URI=s3://bucket/key.pkl para distribuir el modelo por S3)
+ml_detector = MLSimilarityDetector(
+    model_path=os.getenv('MODEL_S3_URI') or "models/similarity_model.pkl",
+    feature_cache_dir=os.getenv('ML_FEATURE_CACHE_DIR'),
+    backend=os.getenv('ML_BACKEND', 'joblib'),
+    onnx_path=os.getenv('ML_ONNX_PATH'),
+    numpy_path=os.getenv('ML_NUMPY_PATH')
+)
 
 def get_ml_similarity(title1: str, title2: str) -> Dict[str, float]:
     """Función de conveniencia para obtener similitud ML"""
     return ml_detector.predict_similarity(title1, title2)
 
-def train_ml_model(training_data: List[Dict], validation_data: Optional[List[Dict]] = None):
+def get_ml_scores(title1: str, title2: str) -> Dict[str, Any]:
+    """Función de conveniencia para scores=all (ML, TF-IDF y características en una pasada)"""
+    return ml_detector.score_all(title1, title2)
+
+def train_ml_model(training_data: List[Dict], validation_data: Optional[List[Dict]] = None,
+                   feature_cache_dir: Optional[str] = None, profile: str = DEFAULT_TRAINING_PROFILE,
+                   n_jobs: Optional[int] = None, **overrides) -> Dict[str, Any]:
     """Función de conveniencia para entrenar el modelo"""
-    ml_detector.train_model(training_data, validation_data) 
\ No newline at end of file
+    return ml_detector.train_model(training_data, validation_data, feature_cache_dir=feature_cache_dir,
+                                   profile=profile, n_jobs=n_jobs, **overrides) 
\ No newline at end of file
@@ -0,0 +1,233 @@
+"""
+Distribución del modelo de similitud desde S3
+Descarga los artefactos a un directorio local (/tmp en Lambda) y detecta
+nuevas versiones con un GET condicional por ETag
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Directorio local donde se cachean los artefactos (/tmp es el único escribible en Lambda)
+DEFAULT_CACHE_DIR = os.getenv('MODEL_CACHE_DIR', '/tmp/models')
+
+# Cada cuántos segundos una invocación caliente verifica si hay versión nueva (0 = nunca)
+DEFAULT_REFRESH_SECONDS = float(os.getenv('MODEL_REFRESH_SECONDS', '300'))
+
+_DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+def is_s3_uri(path: Optional[str]) -> bool:
+    """Indica si una ruta de modelo apunta a S3"""
+    return bool(path) and path.startswith('s3://')
+
+
+def parse_s3_uri(uri: str) -> Tuple[str, str]:
+    """Separar una URI s3://bucket/key en (bucket, key)"""
+    if not is_s3_uri(uri):
+        raise ValueError(f"URI de S3 inválida: {uri}")
+    bucket, _, key = uri[len('s3://'):].partition('/')
+    if not bucket or not key:
+        raise ValueError(f"URI de S3 inválida: {uri}")
+    return bucket, key
+
+
+def _is_not_modified(error) -> bool:
+    """Un GET con IfNoneMatch sobre un objeto sin cambios responde 304"""
+    response = getattr(error, 'response', {}) or {}
+    code = str(response.get('Error', {}).get('Code', ''))
+    status = response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return code in ('304', 'NotModified') or status == 304
+
+
+class S3ModelArtifact:
+    """Un artefacto del modelo en S3 con su copia local.
+
+    El ETag de la copia local se guarda junto a ella (archivo .etag), así un
+    contenedor que reutiliza /tmp no vuelve a descargar lo que ya tiene.
+    """
+
+    def __init__(self, uri: str, cache_dir: str = DEFAULT_CACHE_DIR, s3_client=None):
+        self.uri = uri
+        self.bucket, self.key = parse_s3_uri(uri)
+        self.local_path = os.path.join(cache_dir, os.path.basename(self.key))
+        self._s3 = s3_client
+        self.etag = self._read_etag()
+
+    @property
+    def s3(self):
+        if self._s3 is None:
+            import boto3
+            self._s3 = boto3.client('s3')
+        return self._s3
+
+    @property
+    def _etag_path(self) -> str:
+        return f"{self.local_path}.etag"
+
+    def _read_etag(self) -> Optional[str]:
+        if not (os.path.exists(self.local_path) and os.path.exists(self._etag_path)):
+            return None
+        with open(self._etag_path) as f:
+            return f.read().strip() or None
+
+    def sync(self) -> bool:
+        """Descargar el objeto si cambió respecto de la copia local.
+
+        Devuelve True si se descargó una versión nueva. Con copia local el GET
+        lleva IfNoneMatch, por lo que sin cambios S3 responde 304 sin cuerpo.
+        """
+        pending = self.download()
+        if pending is None:
+            return False
+        self.commit(pending)
+        return True
+
+    def download(self) -> Optional[Tuple[str, Optional[str]]]:
+        """Bajar la versión nueva a un archivo temporal sin tocar la copia local.
+
+        Devuelve (ruta temporal, ETag), o None si el objeto no cambió. La
+        versión solo pasa a ser la local con commit().
+        """
+        from botocore.exceptions import ClientError
+
+        request = {'Bucket': self.bucket, 'Key': self.key}
+        if self.etag and os.path.exists(self.local_path):
+            request['IfNoneMatch'] = self.etag
+        try:
+            response = self.s3.get_object(**request)
+        except ClientError as e:
+            if _is_not_modified(e):
+                return None
+            raise
+
+        os.makedirs(os.path.dirname(self.local_path) or '.', exist_ok=True)
+        tmp_path = f"{self.local_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        body = response['Body']
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in iter(lambda: body.read(_DOWNLOAD_CHUNK_BYTES), b''):
+                    f.write(chunk)
+        except Exception:
+            discard_download((tmp_path, None))
+            raise
+        return tmp_path, response.get('ETag')
+
+    def commit(self, pending: Tuple[str, Optional[str]]):
+        """Reemplazar la copia local por una descarga y registrar su ETag"""
+        tmp_path, etag = pending
+        os.replace(tmp_path, self.local_path)
+        self.etag = etag
+        with open(self._etag_path, 'w') as f:
+            f.write(self.etag or '')
+        logger.info(f"Artefacto descargado desde {self.uri} (ETag {self.etag})")
+
+
+def discard_download(pending: Optional[Tuple[str, Optional[str]]]):
+    """Borrar el archivo temporal de una descarga que no se va a usar"""
+    if pending is None:
+        return
+    try:
+        os.remove(pending[0])
+    except OSError:
+        pass
+
+
+class S3ModelStore:
+    """Conjunto de artefactos que forman un modelo (p. ej. .onnx + vectorizer).
+
+    El primer artefacto es el principal: solo su ETag se consulta en cada
+    refresco y, si cambió, se vuelven a sincronizar los demás. Al publicar una
+    versión nueva hay que subir los artefactos secundarios antes que el principal.
+    """
+
+    def __init__(self, uris, cache_dir: str = DEFAULT_CACHE_DIR,
+                 refresh_seconds: float = DEFAULT_REFRESH_SECONDS, s3_client=None):
+        if not uris:
+            raise ValueError("Se necesita al menos un artefacto")
+        self.artifacts = [S3ModelArtifact(uri, cache_dir, s3_client) for uri in uris]
+        self.refresh_seconds = refresh_seconds
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self) -> S3ModelArtifact:
+        return self.artifacts[0]
+
+    def local_path(self, uri: str) -> str:
+        """Ruta local de uno de los artefactos del modelo"""
+        for artifact in self.artifacts:
+            if artifact.uri == uri:
+                return artifact.local_path
+        raise KeyError(uri)
+
+    def fetch(self) -> bool:
+        """Asegurar que todos los artefactos estén en disco; True si alguno cambió"""
+        with self._lock:
+            changed = False
+            for artifact in self.artifacts:
+                changed = artifact.sync() or changed
+            self._last_check = time.monotonic()
+            return changed
+
+    def refresh_due(self) -> bool:
+        """Indica si toca verificar el ETag (sin hacer I/O)"""
+        return self.refresh_seconds > 0 and time.monotonic() - self._last_check >= self.refresh_seconds
+
+    def poll(self) -> bool:
+        """Verificar si hay versión nueva, como mucho una vez por intervalo.
+
+        Devuelve True si se descargó una versión nueva. Todos los artefactos se
+        bajan a temporales y recién cuando están todos se reemplazan las copias
+        locales y se guardan los ETags (el del principal al final): si falla
+        uno, el próximo refresco vuelve a ver el ETag viejo y reintenta todo.
+        Los errores de red se registran y se sigue usando la copia local.
+        """
+        if not self.refresh_due() or not self._lock.acquire(blocking=False):
+            return False
+        downloads = []
+        try:
+            self._last_check = time.monotonic()
+            primary = self.primary.download()
+            if primary is None:
+                return False
+            downloads.append(primary)
+            secondaries = []
+            for artifact in self.artifacts[1:]:
+                pending = artifact.download()
+                downloads.append(pending)
+                secondaries.append((artifact, pending))
+            for artifact, pending in secondaries:
+                if pending is not None:
+                    artifact.commit(pending)
+            self.primary.commit(primary)
+            return True
+        except Exception as e:
+            logger.warning(f"No se pudo verificar la versión del modelo en S3: {e}")
+            for pending in downloads:
+                discard_download(pending)
+            return False
+        finally:
+            self._lock.release()
+
+
+def publish_model(local_paths, s3_uri_prefix: str, s3_client=None):
+    """Subir los artefactos de un modelo a S3 (el primero de la lista al final)"""
+    if s3_client is None:
+        import boto3
+        s3_client = boto3.client('s3')
+    if not is_s3_uri(s3_uri_prefix):
+        raise ValueError(f"URI de S3 inválida: {s3_uri_prefix}")
+    bucket, _, prefix = s3_uri_prefix[len('s3://'):].partition('/')
+    prefix = f"{prefix.rstrip('/')}/" if prefix.strip('/') else ''
+    uris = []
+    for local_path in list(local_paths[1:]) + [local_paths[0]]:
+        key = prefix + os.path.basename(local_path)
+        s3_client.upload_file(local_path, bucket, key)
+        uris.append(f"s3://{bucket}/{key}")
+        logger.info(f"Artefacto publicado en s3://{bucket}/{key}")
+    return uris
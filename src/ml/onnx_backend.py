@@ -0,0 +1,92 @@
+"""
+Backend ONNX para el modelo de similitud
+Exporta el pipeline scaler + XGBoost a ONNX y lo ejecuta con onnxruntime
+"""
+
+import os
+import logging
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Opsets usados en la exportación (dominio estándar y ai.onnx.ml)
+TARGET_OPSET = {'': 17, 'ai.onnx.ml': 3}
+
+
+def default_onnx_path(model_path: str) -> str:
+    """Ruta del grafo ONNX asociado a un modelo .pkl"""
+    return f"{os.path.splitext(model_path)[0]}.onnx"
+
+
+def vectorizer_path_for(onnx_path: str) -> str:
+    """Ruta del vectorizer TF-IDF que acompaña a un grafo ONNX"""
+    return f"{os.path.splitext(onnx_path)[0]}.vectorizer.pkl"
+
+
+def export_onnx(detector, onnx_path: Optional[str] = None) -> str:
+    """Exportar scaler + booster de un detector entrenado a ONNX.
+
+    El vectorizer TF-IDF se guarda aparte (joblib), de modo que el runtime
+    ONNX no necesita xgboost para deserializar el modelo.
+    """
+    if not detector.is_trained or detector.model is None:
+        raise ValueError("El detector debe estar entrenado (backend joblib) para exportar a ONNX")
+
+    import joblib
+    from sklearn.pipeline import Pipeline
+    from xgboost import XGBClassifier
+    from skl2onnx import convert_sklearn, update_registered_converter
+    from skl2onnx.common.data_types import FloatTensorType
+    from skl2onnx.common.shape_calculator import calculate_linear_classifier_output_shapes
+    from onnxmltools.convert.xgboost.operator_converters.XGBoost import convert_xgboost
+
+    update_registered_converter(
+        XGBClassifier, 'XGBoostXGBClassifier',
+        calculate_linear_classifier_output_shapes, convert_xgboost,
+        options={'nocl': [True, False], 'zipmap': [True, False, 'columns']}
+    )
+
+    onnx_path = onnx_path or default_onnx_path(detector.model_path)
+
+    pipeline = Pipeline([('scaler', detector.scaler), ('xgb', detector.model)])
+    n_features = detector.scaler.n_features_in_
+    onnx_model = convert_sklearn(
+        pipeline, 'similarity_pipeline',
+        [('features', FloatTensorType([None, n_features]))],
+        options={id(detector.model): {'zipmap': False}},
+        target_opset=TARGET_OPSET
+    )
+
+    os.makedirs(os.path.dirname(onnx_path) or '.', exist_ok=True)
+    with open(onnx_path, 'wb') as f:
+        f.write(onnx_model.SerializeToString())
+    joblib.dump(detector.tfidf_vectorizer, vectorizer_path_for(onnx_path))
+    logger.info(f"Modelo exportado a ONNX en {onnx_path}")
+    return onnx_path
+
+
+class OnnxSimilarityBackend:
+    """Ejecuta el pipeline exportado reutilizando una única sesión de onnxruntime"""
+
+    def __init__(self, onnx_path: str, intra_op_threads: Optional[int] = None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.onnx_path = onnx_path
+        self.session = ort.InferenceSession(onnx_path, sess_options=options,
+                                            providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        # Salidas del clasificador: [label, probabilities]
+        self.output_name = self.session.get_outputs()[1].name
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        """Probabilidad de la clase similar para un batch de características"""
+        inputs = np.ascontiguousarray(features, dtype=np.float32)
+        if inputs.ndim == 1:
+            inputs = inputs.reshape(1, -1)
+        probabilities = self.session.run([self.output_name], {self.input_name: inputs})[0]
+        return probabilities[:, 1].astype(np.float64)
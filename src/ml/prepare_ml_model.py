@@ -5,10 +5,14 @@ Script para preparar el modelo de ML para despliegue
 import os
 import shutil
 import sys
+import argparse
 
-def check_dependencies():
+# Dependencias adicionales para exportar y ejecutar el modelo en ONNX
+ONNX_PACKAGES = ['skl2onnx', 'onnxmltools', 'onnxruntime']
+
+def check_dependencies(onnx: bool = False):
     """Verificar que las dependencias de ML estén instaladas"""
-    required_packages = ['pandas', 'xgboost', 'joblib', 'sklearn']
+    required_packages = ['pandas', 'xgboost', 'joblib', 'sklearn'] + (ONNX_PACKAGES if onnx else [])
     missing_packages = []
     
     for package in required_packages:
@@ -19,7 +23,7 @@ def check_dependencies():
     
     if missing_packages:
         print(f"❌ Faltan dependencias: {', '.join(missing_packages)}")
-        print("💡 Ejecuta: pip install pandas xgboost joblib scikit-learn")
+        print("💡 Ejecuta: pip install pandas xgboost joblib scikit-learn" + (" " + " ".join(ONNX_PACKAGES) if onnx else ""))
         return False
     
     print("✅ Todas las dependencias están instaladas")
@@ -57,37 +61,115 @@ def prepare_model_for_deployment():
         print("❌ Error: No se pudo crear el modelo")
         return False
 
-def copy_model_to_lambda():
+def export_model_to_onnx():
+    """Exportar el pipeline scaler + XGBoost a ONNX"""
+    print("📦 Exportando modelo a ONNX...")
+    from ml_similarity import MLSimilarityDetector
+    from onnx_backend import export_onnx
+    
+    detector = MLSimilarityDetector("models/similarity_model.pkl")
+    try:
+        onnx_path = export_onnx(detector)
+    except Exception as e:
+        print(f"❌ Error exportando a ONNX: {e}")
+        return False
+    
+    size_mb = os.path.getsize(onnx_path) / (1024 * 1024)
+    print(f"✅ Modelo ONNX creado en {onnx_path} ({size_mb:.2f} MB)")
+    return True
+
+def export_model_to_numpy():
+    """Exportar el pipeline completo al formato .npz del evaluador NumPy"""
+    print("📦 Exportando modelo para el evaluador NumPy...")
+    from ml_similarity import MLSimilarityDetector
+    from tree_ensemble import export_numpy
+    
+    detector = MLSimilarityDetector("models/similarity_model.pkl")
+    try:
+        numpy_path = export_numpy(detector)
+    except Exception as e:
+        print(f"❌ Error exportando a NumPy: {e}")
+        return False
+    
+    size_mb = os.path.getsize(numpy_path) / (1024 * 1024)
+    print(f"✅ Modelo NumPy creado en {numpy_path} ({size_mb:.2f} MB)")
+    return True
+
+def copy_model_to_lambda(onnx: bool = False, numpy_export: bool = False):
     """Copiar modelo al directorio de Lambda"""
     print("📋 Copiando modelo al directorio de Lambda...")
     
     # Crear directorio si no existe
     os.makedirs("lambda_models", exist_ok=True)
     
-    # Copiar modelo
-    source = "models/similarity_model.pkl"
-    destination = "lambda_models/similarity_model.pkl"
+    # Copiar modelo (y el pipeline ONNX con su vectorizer, si se exportó)
+    artifacts = ["similarity_model.pkl"]
+    if onnx:
+        artifacts += ["similarity_model.onnx", "similarity_model.vectorizer.pkl"]
+    if numpy_export:
+        artifacts.append("similarity_model.npz")
     
-    if os.path.exists(source):
+    for artifact in artifacts:
+        source = os.path.join("models", artifact)
+        destination = os.path.join("lambda_models", artifact)
+        if not os.path.exists(source):
+            print(f"❌ Error: Modelo fuente no encontrado ({source})")
+            return False
         shutil.copy2(source, destination)
         print(f"✅ Modelo copiado a {destination}")
-        return True
-    else:
-        print("❌ Error: Modelo fuente no encontrado")
+    return True
+
+def publish_model_to_s3(s3_uri_prefix: str, onnx: bool = False, numpy_export: bool = False):
+    """Subir los artefactos a S3 para que Lambda los cargue sin redeploy"""
+    print(f"☁️ Publicando modelo en {s3_uri_prefix}...")
+    from model_store import publish_model
+    
+    # El .pkl va primero: publish_model lo sube al final, cuando ya están los demás
+    artifacts = ["similarity_model.pkl"]
+    if onnx:
+        artifacts += ["similarity_model.vectorizer.pkl", "similarity_model.onnx"]
+    if numpy_export:
+        artifacts.append("similarity_model.npz")
+    
+    try:
+        uris = publish_model([os.path.join("models", artifact) for artifact in artifacts], s3_uri_prefix)
+    except Exception as e:
+        print(f"❌ Error publicando en S3: {e}")
         return False
+    for uri in uris:
+        print(f"✅ Publicado {uri}")
+    return True
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preparar el modelo de ML para despliegue")
+    parser.add_argument('--onnx', action='store_true',
+                        help="Exportar además el pipeline scaler + XGBoost a ONNX")
+    parser.add_argument('--numpy', action='store_true',
+                        help="Exportar además el pipeline completo para el evaluador NumPy (.npz)")
+    parser.add_argument('--publish', metavar='S3_PREFIX', default=None,
+                        help="Subir los artefactos a S3 (p. ej. s3://bucket/models/) para MODEL_S3_URI")
+    args = parser.parse_args()
+    
     print("🎯 Preparando modelo de Machine Learning...")
     
     # Verificar dependencias primero
-    if not check_dependencies():
+    if not check_dependencies(onnx=args.onnx):
         print("💥 No se pueden preparar las dependencias")
         sys.exit(1)
     
     # Preparar modelo
     if prepare_model_for_deployment():
+        if args.onnx and not export_model_to_onnx():
+            print("💥 Error exportando modelo a ONNX")
+            sys.exit(1)
+        if args.numpy and not export_model_to_numpy():
+            print("💥 Error exportando modelo a NumPy")
+            sys.exit(1)
         # Copiar para Lambda
-        copy_model_to_lambda()
+        copy_model_to_lambda(onnx=args.onnx, numpy_export=args.numpy)
+        if args.publish and not publish_model_to_s3(args.publish, onnx=args.onnx, numpy_export=args.numpy):
+            print("💥 Error publicando modelo en S3")
+            sys.exit(1)
         print("🎉 Modelo preparado exitosamente para despliegue!")
     else:
         print("💥 Error preparando modelo")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los scripts de ML usan imports planos (from ml_similarity import ...)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
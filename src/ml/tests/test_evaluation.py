@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from sklearn.metrics import precision_score, recall_score, roc_auc_score
+
+from evaluation import classification_metrics, evaluate, featurize, roc_auc, threshold_sweep
+from ml_similarity import MLSimilarityDetector
+from train_ml_model import create_synthetic_training_data, PairArray
+
+
+def test_metrics_match_sklearn():
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, 2, 5000)
+    scores = np.round(np.clip(labels * 0.3 + rng.random(5000) * 0.7, 0, 1), 2)  # con empates
+
+    metrics = classification_metrics(labels, scores, 0.7)
+    assert metrics['precision'] == pytest.approx(precision_score(labels, scores >= 0.7))
+    assert metrics['recall'] == pytest.approx(recall_score(labels, scores >= 0.7))
+    assert roc_auc(labels, scores) == pytest.approx(roc_auc_score(labels, scores))
+    assert roc_auc(np.ones(3), scores[:3]) is None
+
+    sweep = threshold_sweep(labels, scores, [0.2, 0.7])
+    assert sweep['precision'][1] == pytest.approx(metrics['precision'])
+    assert sweep['accuracy'][1] == pytest.approx(metrics['accuracy'])
+    assert sweep['recall'][0] >= sweep['recall'][1]
+
+
+def test_evaluate_featurizes_once_for_both_scorers(tmp_path, monkeypatch):
+    pairs = create_synthetic_training_data()
+    detector = MLSimilarityDetector(model_path=str(tmp_path / "models" / "similarity_model.pkl"))
+    detector.train_model(pairs, profile='fast')
+
+    calls = []
+    original = detector.extract_features_batch
+    monkeypatch.setattr(detector, 'extract_features_batch', lambda a, b: calls.append(len(a)) or original(a, b))
+    report = evaluate(detector, pairs, n_jobs=1)
+
+    assert calls == [len(pairs)]
+    assert set(report['scorers']) == {'ml', 'tfidf'}
+    assert report['n_pairs'] == len(pairs) and report['n_positive'] == 12
+    assert len(report['scorers']['ml']['sweep']['f1']) == 101
+
+
+def test_evaluate_excludes_unknown_labels_from_metrics(tmp_path):
+    pairs = create_synthetic_training_data()
+    detector = MLSimilarityDetector(model_path=str(tmp_path / "models" / "similarity_model.pkl"))
+    detector.train_model(pairs, profile='fast')
+    unknown = {'item_a_title': 'Laptop HP Pavilion', 'item_b_title': 'Notebook HP Pavilion'}
+    pair_array = PairArray.from_records(pairs + [unknown])
+
+    report = evaluate(detector, pair_array, n_jobs=1)
+
+    assert report['n_pairs'] == len(pairs) and report['n_unlabeled'] == 1
+    assert report['scorers'] == evaluate(detector, pairs, n_jobs=1)['scorers']
+    assert len(pair_array.scores) == len(pairs) + 1 and pair_array.scores[-1] > 0
+    with pytest.raises(ValueError):
+        evaluate(detector, PairArray.from_records([unknown]), n_jobs=1)
+
+
+def test_parallel_featurization_matches_single_process(tmp_path):
+    pairs = create_synthetic_training_data()
+    detector = MLSimilarityDetector(model_path=str(tmp_path / "models" / "similarity_model.pkl"))
+    detector.train_model(pairs, profile='fast')
+    titles_a = [pair['item_a_title'] for pair in pairs]
+    titles_b = [pair['item_b_title'] for pair in pairs]
+
+    np.testing.assert_array_equal(featurize(detector, titles_a, titles_b, n_jobs=2, chunksize=5),
+                                  detector.extract_features_batch(titles_a, titles_b))
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from ml_similarity import MLSimilarityDetector, FEATURE_NAMES, get_training_params
+from train_ml_model import create_synthetic_training_data
+
+
+@pytest.fixture
+def training_data():
+    return create_synthetic_training_data()
+
+
+@pytest.fixture
+def detector(tmp_path):
+    return MLSimilarityDetector(model_path=str(tmp_path / "models" / "similarity_model.pkl"))
+
+
+def count_featurizations(detector, monkeypatch):
+    calls = []
+    original = detector.extract_features_batch
+
+    def counting(titles_a, titles_b):
+        calls.append(len(titles_a))
+        return original(titles_a, titles_b)
+
+    monkeypatch.setattr(detector, 'extract_features_batch', counting)
+    return calls
+
+
+def test_batch_features_match_single_pair(detector, training_data):
+    detector.train_model(training_data)
+    titles_a = [pair['item_a_title'] for pair in training_data]
+    titles_b = [pair['item_b_title'] for pair in training_data]
+
+    batch = detector.extract_features_batch(titles_a, titles_b)
+    single = np.array([list(detector.extract_text_features(a, b).values()) for a, b in zip(titles_a, titles_b)])
+
+    assert batch.shape == (len(training_data), len(FEATURE_NAMES))
+    np.testing.assert_allclose(batch, single, atol=1e-12)
+
+
+def test_train_featurizes_once(detector, training_data, monkeypatch):
+    calls = count_featurizations(detector, monkeypatch)
+    detector.train_model(training_data)
+    assert calls == [len(training_data)]
+
+
+def test_feature_cache_skips_featurization_on_retrain(detector, training_data, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "feature_cache")
+    detector.train_model(training_data, feature_cache_dir=cache_dir)
+    first_score = detector.predict_similarity('Mouse inalambrico Logitech', 'Mouse wireless Logitech')
+
+    calls = count_featurizations(detector, monkeypatch)
+    detector.train_model(training_data, feature_cache_dir=cache_dir)
+
+    assert calls == []
+    assert detector.predict_similarity('Mouse inalambrico Logitech', 'Mouse wireless Logitech') == first_score
+
+
+def test_unknown_training_profile_is_rejected(detector, training_data):
+    with pytest.raises(ValueError):
+        detector.train_model(training_data, profile='turbo')
+
+
+def test_balanced_profile_keeps_original_hyperparameters():
+    assert get_training_params('balanced') == {'n_estimators': 100, 'max_depth': 6, 'learning_rate': 0.1}
+
+
+def test_training_profile_report(detector, training_data):
+    report = detector.train_model(training_data[:18], training_data[18:], profile='fast', n_jobs=1)
+
+    assert report['profile'] == 'fast'
+    assert report['params']['tree_method'] == 'hist'
+    assert report['params']['n_jobs'] == 1
+    assert report['n_validation'] == len(training_data) - 18
+    assert report['best_iteration'] is not None
+    assert 0.0 <= report['validation_accuracy'] <= 1.0
+
+
+def test_predictions_use_a_snapshot_without_taking_the_model_lock(detector, training_data):
+    import threading
+
+    detector.train_model(training_data)
+    old_snapshot = detector._snapshot
+    results = []
+
+    # Con el lock tomado (p. ej. durante una recarga) las predicciones siguen respondiendo
+    with detector._model_lock:
+        worker = threading.Thread(target=lambda: results.append(
+            detector.predict_similarity('Mouse inalambrico Logitech', 'Mouse wireless Logitech')))
+        worker.start()
+        worker.join(timeout=5)
+    assert results and 0.0 <= results[0]['similarity_score'] <= 1.0
+
+    detector.train_model(training_data, profile='fast')
+    assert detector._snapshot is not old_snapshot and old_snapshot.is_trained
+    assert detector.model is detector._snapshot.model
@@ -0,0 +1,93 @@
+import boto3
+import pytest
+from moto import mock_aws
+
+from ml_similarity import MLSimilarityDetector
+from model_store import S3ModelArtifact, S3ModelStore
+from train_ml_model import create_synthetic_training_data
+
+BUCKET = "models-bucket"
+MODEL_URI = f"s3://{BUCKET}/models/similarity_model.pkl"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def _publish(s3, tmp_path, training_data, name, profile='fast'):
+    local_path = tmp_path / name / "similarity_model.pkl"
+    MLSimilarityDetector(str(local_path)).train_model(training_data, profile=profile)
+    s3.upload_file(str(local_path), BUCKET, "models/similarity_model.pkl")
+
+
+def test_artifact_sync_uses_conditional_get(s3, tmp_path):
+    s3.put_object(Bucket=BUCKET, Key="models/similarity_model.pkl", Body=b"v1")
+    artifact = S3ModelArtifact(MODEL_URI, cache_dir=str(tmp_path), s3_client=s3)
+
+    assert artifact.sync() is True
+    assert artifact.sync() is False  # 304: mismo ETag
+
+    # Un contenedor caliente que reutiliza /tmp conserva el ETag de la copia local
+    assert S3ModelArtifact(MODEL_URI, cache_dir=str(tmp_path), s3_client=s3).sync() is False
+
+    s3.put_object(Bucket=BUCKET, Key="models/similarity_model.pkl", Body=b"v2")
+    assert artifact.sync() is True
+    assert (tmp_path / "similarity_model.pkl").read_bytes() == b"v2"
+
+
+def test_poll_retries_every_artifact_when_a_secondary_fails(s3, tmp_path, monkeypatch):
+    vectorizer_uri = f"s3://{BUCKET}/models/vectorizer.pkl"
+    s3.put_object(Bucket=BUCKET, Key="models/vectorizer.pkl", Body=b"vec-v1")
+    s3.put_object(Bucket=BUCKET, Key="models/similarity_model.pkl", Body=b"v1")
+    store = S3ModelStore([MODEL_URI, vectorizer_uri], cache_dir=str(tmp_path), refresh_seconds=0.01, s3_client=s3)
+    store.fetch()
+
+    s3.put_object(Bucket=BUCKET, Key="models/vectorizer.pkl", Body=b"vec-v2")
+    s3.put_object(Bucket=BUCKET, Key="models/similarity_model.pkl", Body=b"v2")
+    secondary = store.artifacts[1]
+    real_download = secondary.download
+
+    def failing_download():
+        raise ConnectionError("S3 no disponible")
+
+    monkeypatch.setattr(secondary, 'download', failing_download)
+    store._last_check = 0.0
+    assert store.poll() is False
+    # Nada se reemplazó: el principal sigue en v1 con su ETag viejo
+    assert (tmp_path / "similarity_model.pkl").read_bytes() == b"v1"
+    assert not list(tmp_path.glob("*.tmp"))
+
+    monkeypatch.setattr(secondary, 'download', real_download)
+    store._last_check = 0.0
+    assert store.poll() is True
+    assert (tmp_path / "similarity_model.pkl").read_bytes() == b"v2"
+    assert (tmp_path / "vectorizer.pkl").read_bytes() == b"vec-v2"
+
+
+def test_detector_loads_from_s3_and_hot_reloads(s3, tmp_path):
+    training_data = create_synthetic_training_data()
+    _publish(s3, tmp_path, training_data, "v1")
+
+    detector = MLSimilarityDetector(MODEL_URI, model_cache_dir=str(tmp_path / "cache"),
+                                    refresh_seconds=0.01, s3_client=s3)
+    assert detector.is_trained
+    assert detector.model_path == str(tmp_path / "cache" / "similarity_model.pkl")
+    old_model = detector.model
+
+    # Sin versión nueva el refresco no recarga nada
+    detector.model_store._last_check = 0.0
+    assert detector.refresh_model() is False
+
+    # Versión nueva publicada: la siguiente predicción (vencido el intervalo) la carga
+    _publish(s3, tmp_path, training_data, "v2", profile='accurate')
+    detector.model_store._last_check = 0.0
+    result = detector.predict_similarity("iPhone 12 Pro", "iPhone 12 Pro Max")
+
+    assert detector.model is not old_model
+    assert 0.0 <= result['similarity_score'] <= 1.0
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('onnxruntime')
+pytest.importorskip('skl2onnx')
+pytest.importorskip('onnxmltools')
+
+from ml_similarity import MLSimilarityDetector
+from onnx_backend import export_onnx
+from train_ml_model import create_synthetic_training_data
+
+
+def test_onnx_backend_matches_joblib(tmp_path):
+    model_path = str(tmp_path / "models" / "similarity_model.pkl")
+    training_data = create_synthetic_training_data()
+    joblib_detector = MLSimilarityDetector(model_path)
+    joblib_detector.train_model(training_data, profile='fast')
+    export_onnx(joblib_detector)
+
+    onnx_detector = MLSimilarityDetector(model_path, backend='onnx')
+    assert onnx_detector.is_trained and onnx_detector.model is None
+
+    titles_a = [pair['item_a_title'] for pair in training_data]
+    titles_b = [pair['item_b_title'] for pair in training_data]
+    np.testing.assert_allclose(onnx_detector.predict_similarity_batch(titles_a, titles_b),
+                               joblib_detector.predict_similarity_batch(titles_a, titles_b), atol=1e-5)
+
+    single = onnx_detector.predict_similarity(titles_a[0], titles_b[0])
+    assert single['similarity_score'] == pytest.approx(
+        joblib_detector.predict_similarity(titles_a[0], titles_b[0])['similarity_score'], abs=1e-5)
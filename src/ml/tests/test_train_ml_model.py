@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+from ml_similarity import MLSimilarityDetector, FEATURE_NAMES
+from train_ml_model import iter_training_frames, iter_title_sample, iter_feature_chunks, load_training_data_from_csv
+from train_ml_model import create_synthetic_training_data, load_training_pairs, PairArray
+from evaluation import evaluate
+
+
+def write_csv(path, rows):
+    pd.DataFrame(rows, columns=['ITEM_A', 'TITLE_A', 'ITEM_B', 'TITLE_B']).to_csv(path, index=False)
+
+
+def test_iter_training_frames_cleans_and_labels(tmp_path):
+    csv_path = tmp_path / "pairs.csv"
+    write_csv(csv_path, [
+        [1, ' Mouse Logitech ', 2, 'mouse logitech'],
+        [3, 'Laptop HP', 4, ''],
+        [5, 'Monitor LG', 6, 'Pantalla LG'],
+    ])
+
+    frames = list(iter_training_frames(str(csv_path), chunksize=2))
+
+    df = pd.concat(frames, ignore_index=True)
+    assert df['item_a_title'].tolist() == ['Mouse Logitech', 'Monitor LG']
+    assert df['is_similar'].tolist() == [1, 0]
+    assert len(load_training_data_from_csv(str(csv_path))) == 2
+
+
+def test_iter_training_frames_drops_unknown_labels(tmp_path):
+    csv_path = tmp_path / "pairs.csv"
+    pd.DataFrame([
+        ['Mouse Logitech', 'Mouse Logitech MX', 1],
+        ['Laptop HP', 'Notebook HP', ''],
+        ['Monitor LG', 'Pantalla Samsung', 'n/a'],
+        ['Teclado Corsair', 'Silla gamer', 0],
+    ], columns=['item_a_title', 'item_b_title', 'is_similar']).to_csv(csv_path, index=False)
+
+    df = pd.concat(iter_training_frames(str(csv_path)), ignore_index=True)
+
+    assert df['item_a_title'].tolist() == ['Mouse Logitech', 'Teclado Corsair']
+    assert df['is_similar'].tolist() == [1, 0]
+
+
+def test_feature_chunks_are_bounded_by_chunksize(tmp_path):
+    pairs = create_synthetic_training_data()
+    csv_path = tmp_path / "pairs.csv"
+    write_csv(csv_path, [[i, p['item_a_title'], i + 1, p['item_b_title']] for i, p in enumerate(pairs)])
+
+    detector = MLSimilarityDetector(model_path=str(tmp_path / "models" / "similarity_model.pkl"))
+    detector.fit_vectorizer(iter_title_sample(str(csv_path), max_rows=10, chunksize=4))
+    chunks = list(iter_feature_chunks(str(csv_path), detector, chunksize=5))
+
+    assert all(len(X) <= 5 and X.shape[1] == len(FEATURE_NAMES) for X, _ in chunks)
+    assert sum(len(y) for _, y in chunks) == len(pairs)
+
+    report = detector.train_model_from_features(iter(chunks), profile='fast')
+    assert report['n_train'] + report['n_validation'] == len(pairs)
+    assert detector.is_trained
+
+
+def test_pair_array_trains_like_list_of_dicts(tmp_path):
+    pairs = create_synthetic_training_data()
+    csv_path = tmp_path / "pairs.csv"
+    write_csv(csv_path, [[i, p['item_a_title'], i + 1, p['item_b_title']] for i, p in enumerate(pairs)])
+    pair_array = PairArray.from_records(pairs)
+
+    detector = MLSimilarityDetector(model_path=str(tmp_path / "models" / "similarity_model.pkl"))
+    detector.train_model(pairs, profile='fast')
+    X_list, y_list = detector.prepare_training_data(pairs)
+    X_array, y_array = detector.prepare_training_data(pair_array)
+    np.testing.assert_array_equal(X_array, X_list)
+    np.testing.assert_array_equal(y_array, y_list)
+
+    assert evaluate(detector, pair_array, n_jobs=1)['scorers'] == evaluate(detector, pairs, n_jobs=1)['scorers']
+    assert len(load_training_pairs(str(csv_path))) == len(pairs)
+
+
+def test_unknown_labels_are_not_trained_as_negatives(tmp_path):
+    pairs = create_synthetic_training_data()
+    pair_array = PairArray.from_records(pairs + [{'item_a_title': 'Laptop HP', 'item_b_title': 'Notebook HP'}])
+
+    detector = MLSimilarityDetector(model_path=str(tmp_path / "models" / "similarity_model.pkl"))
+    detector.fit_vectorizer([p['item_a_title'] for p in pairs] + [p['item_b_title'] for p in pairs])
+    X, y = detector.prepare_training_data(pair_array)
+
+    assert len(X) == len(y) == len(pairs)
+    assert set(np.unique(y)) == {0, 1}
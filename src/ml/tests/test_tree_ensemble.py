@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from ml_similarity import MLSimilarityDetector
+from train_ml_model import create_synthetic_training_data
+from tree_ensemble import TreeEnsemble, TfidfTable, export_numpy
+
+
+@pytest.fixture
+def trained(tmp_path):
+    training_data = create_synthetic_training_data()
+    detector = MLSimilarityDetector(str(tmp_path / "models" / "similarity_model.pkl"))
+    # Con validación hay early stopping: el evaluador debe respetar best_iteration
+    detector.train_model(training_data[:18], training_data[18:], profile='accurate')
+    return detector, training_data
+
+
+def test_tree_ensemble_matches_predict_proba(trained):
+    detector, _ = trained
+    rng = np.random.default_rng(0)
+    X = detector.scaler.transform(rng.normal(size=(5000, 7)) * 3)
+
+    ensemble = TreeEnsemble.from_xgb_model(detector.model)
+
+    np.testing.assert_allclose(ensemble.predict_proba(X), detector.model.predict_proba(X)[:, 1], atol=1e-6)
+
+
+def test_tfidf_table_matches_vectorizer(trained):
+    detector, training_data = trained
+    table = TfidfTable.from_vectorizer(detector.tfidf_vectorizer)
+    for pair in training_data:
+        a, b = pair['item_a_title'].lower(), pair['item_b_title'].lower()
+        assert table.cosine(a, b) == pytest.approx(detector.extract_text_features(a, b)['tfidf_similarity'], abs=1e-12)
+
+
+def test_numpy_backend_matches_joblib(trained):
+    detector, training_data = trained
+    export_numpy(detector)
+    numpy_detector = MLSimilarityDetector(detector.model_path, backend='numpy')
+    assert numpy_detector.is_trained and numpy_detector.model is None
+
+    titles_a = [pair['item_a_title'] for pair in training_data]
+    titles_b = [pair['item_b_title'] for pair in training_data]
+    np.testing.assert_allclose(numpy_detector.predict_similarity_batch(titles_a, titles_b),
+                               detector.predict_similarity_batch(titles_a, titles_b), atol=1e-6)
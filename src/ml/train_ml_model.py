@@ -2,59 +2,139 @@
 Script para entrenar el modelo de Machine Learning
 """
 
+import os
+import sys
+import time
+import argparse
+import numpy as np
 import pandas as pd
 import json
-from ml_similarity import train_ml_model, MLSimilarityDetector
-from typing import List, Dict
+from ml_similarity import train_ml_model, ml_detector, MLSimilarityDetector, TRAINING_PROFILES, DEFAULT_TRAINING_PROFILE
+from evaluation import evaluate, print_evaluation_report
+from typing import Any, Iterator, List, Dict, Optional, Tuple
 import logging
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from pair_array import PairArray
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def load_training_data_from_csv(csv_path: str) -> List[Dict]:
-    """Cargar datos de entrenamiento desde CSV"""
-    try:
-        df = pd.read_csv(csv_path)
-        training_data = []
-        
-        logger.info(f"CSV cargado con {len(df)} filas")
-        logger.info(f"Columnas disponibles: {list(df.columns)}")
-        
-        # Mapear columnas según el formato del CSV
-        title_a_col = None
-        title_b_col = None
+# Caché de características: reentrenar con los mismos datos no vuelve a featurizar
+FEATURE_CACHE_DIR = os.getenv('ML_FEATURE_CACHE_DIR', 'models/feature_cache')
+
+# Tamaño de bloque del loader por streaming (filas de CSV por lectura)
+DEFAULT_CHUNKSIZE = 100_000
+
+# Filas usadas para ajustar el TF-IDF cuando se entrena por streaming
+VECTORIZER_SAMPLE_ROWS = 200_000
+
+def _resolve_title_columns(columns) -> Optional[Tuple[str, str]]:
+    """Buscar las columnas de títulos según el formato del CSV"""
+    if 'TITLE_A' in columns and 'TITLE_B' in columns:
+        return 'TITLE_A', 'TITLE_B'
+    if 'item_a_title' in columns and 'item_b_title' in columns:
+        return 'item_a_title', 'item_b_title'
+    return None
+
+def iter_training_frames(csv_path: str, chunksize: int = DEFAULT_CHUNKSIZE) -> Iterator[pd.DataFrame]:
+    """Leer el CSV por bloques, devolviendo DataFrames limpios.
+
+    Cada bloque tiene las columnas item_a_title, item_b_title e is_similar.
+    La limpieza y la derivación de etiquetas son vectorizadas; las filas con
+    títulos vacíos o con is_similar vacío o no numérico se descartan (una
+    etiqueta desconocida no es un negativo) y se informan con un único
+    warning por bloque.
+    """
+    columns = list(pd.read_csv(csv_path, nrows=0).columns)
+    title_columns = _resolve_title_columns(columns)
+    if title_columns is None:
+        logger.warning("No se encontraron columnas de títulos válidas")
+        return
+    
+    title_a_col, title_b_col = title_columns
+    # is_similar en los exports de la tabla, IS_SIMILAR en los CSV sintéticos
+    label_col = next((col for col in ('is_similar', 'IS_SIMILAR') if col in columns), None)
+    usecols = [title_a_col, title_b_col] + ([label_col] if label_col else [])
+    logger.info(f"Usando columnas: {title_a_col}, {title_b_col}")
+    
+    reader = pd.read_csv(csv_path, usecols=usecols, chunksize=chunksize,
+                         dtype={title_a_col: str, title_b_col: str}, keep_default_na=False)
+    for chunk_index, chunk in enumerate(reader):
+        title_a = chunk[title_a_col].str.strip()
+        title_b = chunk[title_b_col].str.strip()
+        valid = (title_a != '') & (title_b != '')
+        unlabeled_count = 0
         
-        # Buscar columnas de títulos
-        if 'TITLE_A' in df.columns and 'TITLE_B' in df.columns:
-            title_a_col = 'TITLE_A'
-            title_b_col = 'TITLE_B'
-        elif 'item_a_title' in df.columns and 'item_b_title' in df.columns:
-            title_a_col = 'item_a_title'
-            title_b_col = 'item_b_title'
+        if label_col:
+            labels = pd.to_numeric(chunk[label_col], errors='coerce')
+            unlabeled_count = int((valid & labels.isna()).sum())
+            valid &= labels.notna()
+            labels = labels.fillna(0).astype(np.int8)
         else:
-            logger.warning("No se encontraron columnas de títulos válidas")
-            return []
+            # Para este dataset, asumimos que si los títulos son iguales son similares
+            # y si son diferentes, no son similares (esto es una aproximación)
+            labels = (title_a.str.lower() == title_b.str.lower()).astype(np.int8)
         
-        logger.info(f"Usando columnas: {title_a_col}, {title_b_col}")
+        invalid_count = int((~valid).sum()) - unlabeled_count
+        if invalid_count:
+            logger.warning(f"Bloque {chunk_index}: {invalid_count} filas descartadas por títulos vacíos")
+        if unlabeled_count:
+            logger.warning(f"Bloque {chunk_index}: {unlabeled_count} filas descartadas por is_similar vacío o no numérico")
         
-        for idx, row in df.iterrows():
-            title_a = str(row.get(title_a_col, '')).strip()
-            title_b = str(row.get(title_b_col, '')).strip()
-            
-            # Solo incluir pares con títulos válidos
-            if title_a and title_b:
-                # Para este dataset, asumimos que si los títulos son iguales son similares
-                # y si son diferentes, no son similares (esto es una aproximación)
-                is_similar = 1 if title_a.lower() == title_b.lower() else 0
-                
-                training_data.append({
-                    'item_a_title': title_a,
-                    'item_b_title': title_b,
-                    'is_similar': is_similar
-                })
-            else:
-                logger.warning(f"Fila {idx}: Títulos vacíos - A: '{title_a}', B: '{title_b}'")
+        yield pd.DataFrame({
+            'item_a_title': title_a[valid],
+            'item_b_title': title_b[valid],
+            'is_similar': labels[valid],
+        })
+
+def iter_title_sample(csv_path: str, max_rows: int = VECTORIZER_SAMPLE_ROWS,
+                      chunksize: int = DEFAULT_CHUNKSIZE) -> List[str]:
+    """Títulos de las primeras max_rows filas válidas, para ajustar el TF-IDF"""
+    titles = []
+    remaining = max_rows
+    for frame in iter_training_frames(csv_path, chunksize=min(chunksize, max_rows)):
+        frame = frame.head(remaining)
+        titles.extend(frame['item_a_title'].tolist())
+        titles.extend(frame['item_b_title'].tolist())
+        remaining -= len(frame)
+        if remaining <= 0:
+            break
+    return titles
+
+def iter_feature_chunks(csv_path: str, detector: MLSimilarityDetector,
+                        chunksize: int = DEFAULT_CHUNKSIZE) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Devolver (X, y) por bloque, listos para el entrenador.
+
+    La memoria usada queda acotada por chunksize: cada bloque de títulos se
+    descarta apenas se calculan sus características.
+    """
+    for frame in iter_training_frames(csv_path, chunksize=chunksize):
+        if frame.empty:
+            continue
+        X = detector.extract_features_batch(frame['item_a_title'].tolist(), frame['item_b_title'].tolist())
+        yield X, frame['is_similar'].to_numpy()
+
+def train_from_csv_streaming(csv_path: str, chunksize: int = DEFAULT_CHUNKSIZE,
+                             profile: str = DEFAULT_TRAINING_PROFILE,
+                             n_jobs: Optional[int] = None) -> Dict[str, Any]:
+    """Entrenar el modelo global leyendo el CSV por bloques"""
+    ml_detector.fit_vectorizer(iter_title_sample(csv_path, chunksize=chunksize))
+    return ml_detector.train_model_from_features(
+        iter_feature_chunks(csv_path, ml_detector, chunksize=chunksize),
+        profile=profile, n_jobs=n_jobs
+    )
+
+def load_training_data_from_csv(csv_path: str) -> List[Dict]:
+    """Cargar datos de entrenamiento desde CSV"""
+    try:
+        frames = list(iter_training_frames(csv_path))
+        if not frames:
+            return []
         
+        df = pd.concat(frames, ignore_index=True)
+        df['is_similar'] = df['is_similar'].astype(int)
+        training_data = df.to_dict('records')
         logger.info(f"Cargados {len(training_data)} pares válidos de entrenamiento")
         
         # Mostrar algunos ejemplos
@@ -69,6 +149,24 @@ def load_training_data_from_csv(csv_path: str) -> List[Dict]:
         logger.error(f"Error cargando datos de entrenamiento: {e}")
         return []
 
+def load_training_pairs(csv_path: str, chunksize: int = DEFAULT_CHUNKSIZE) -> PairArray:
+    """Cargar los pares de entrenamiento del CSV como PairArray (columnas, sin un dict por par)"""
+    try:
+        frames = list(iter_training_frames(csv_path, chunksize=chunksize))
+    except Exception as e:
+        logger.error(f"Error cargando datos de entrenamiento: {e}")
+        frames = []
+    if not frames:
+        return PairArray.from_records([])
+    
+    pairs = PairArray.from_frame(pd.concat(frames, ignore_index=True))
+    logger.info(f"Cargados {len(pairs)} pares válidos de entrenamiento "
+                f"({len(pairs.titles)} títulos distintos, {pairs.nbytes / 1024:.1f} KiB)")
+    for i in range(min(3, len(pairs))):
+        pair = pairs[i]
+        logger.info(f"  {i+1}. A: '{pair['item_a_title']}' | B: '{pair['item_b_title']}' | Similar: {pair['is_similar']}")
+    return pairs
+
 def create_synthetic_training_data() -> List[Dict]:
     """Crear datos de entrenamiento sintéticos para pruebas"""
     training_data = [
@@ -103,48 +201,38 @@ def create_synthetic_training_data() -> List[Dict]:
     logger.info(f"Creados {len(training_data)} pares sintéticos de entrenamiento")
     return training_data
 
-def evaluate_model(detector: MLSimilarityDetector, test_data: List[Dict]):
-    """Evaluar el modelo entrenado"""
-    correct_predictions = 0
-    total_predictions = len(test_data)
-    
-    for pair in test_data:
-        title1 = pair['item_a_title']
-        title2 = pair['item_b_title']
-        expected_similar = bool(pair['is_similar'])
-        
-        prediction = detector.predict_similarity(title1, title2)
-        predicted_similar = prediction['are_similar']
-        
-        if predicted_similar == expected_similar:
-            correct_predictions += 1
-        
-        logger.info(f"Títulos: '{title1}' vs '{title2}'")
-        logger.info(f"  Esperado: {'Similar' if expected_similar else 'Diferente'}")
-        logger.info(f"  Predicción: {'Similar' if predicted_similar else 'Diferente'} (score: {prediction['similarity_score']:.3f})")
-        logger.info(f"  Confianza: {prediction['confidence']:.3f}")
-        logger.info("---")
-    
-    accuracy = correct_predictions / total_predictions if total_predictions > 0 else 0
-    logger.info(f"Precisión del modelo: {accuracy:.2%} ({correct_predictions}/{total_predictions})")
-    
-    return accuracy
+def print_training_report(report: Dict[str, Any], evaluation_seconds: float, accuracy: Optional[float], total_seconds: float):
+    """Mostrar tiempos de pared y accuracy del entrenamiento"""
+    params = report['params']
+    print("\n=== REPORTE DE ENTRENAMIENTO ===")
+    print(f"Perfil: {report['profile']} (tree_method={params.get('tree_method')}, max_bin={params.get('max_bin')}, "
+          f"n_jobs={params.get('n_jobs', 'auto')}, early_stopping_rounds={params.get('early_stopping_rounds', '-')})")
+    print(f"Pares: {report['n_train']} entrenamiento / {report['n_validation']} validación")
+    if report['best_iteration'] is not None:
+        print(f"Mejor iteración (early stopping): {report['best_iteration']} de {params['n_estimators']}")
+    print(f"Featurización: {report['featurize_seconds']:.2f}s")
+    print(f"Ajuste XGBoost: {report['fit_seconds']:.2f}s")
+    print(f"Evaluación: {evaluation_seconds:.2f}s")
+    print(f"Tiempo total: {total_seconds:.2f}s")
+    if accuracy is not None:
+        print(f"Accuracy en validación: {accuracy:.2%}")
 
-def main():
+def main(profile: str = DEFAULT_TRAINING_PROFILE, n_jobs: Optional[int] = None):
     """Función principal para entrenar el modelo"""
     logger.info("🚀 Iniciando entrenamiento del modelo de similitud...")
+    start = time.perf_counter()
     
     # Intentar cargar datos desde CSV
-    training_data = load_training_data_from_csv('data_matches - dataset.csv')
+    training_data = load_training_pairs('data_matches - dataset.csv')
     
     # Si no hay datos válidos, usar datos sintéticos
-    if not training_data:
+    if not len(training_data):
         logger.info("No se encontraron datos válidos de entrenamiento, usando datos sintéticos...")
-        training_data = create_synthetic_training_data()
+        training_data = PairArray.from_records(create_synthetic_training_data())
     elif len(training_data) < 10:
         logger.warning(f"Solo se encontraron {len(training_data)} pares válidos, complementando con datos sintéticos...")
-        synthetic_data = create_synthetic_training_data()
-        training_data.extend(synthetic_data)
+        synthetic_data = PairArray.from_records(create_synthetic_training_data())
+        training_data = PairArray.concat([training_data, synthetic_data])
         logger.info(f"Total de datos de entrenamiento: {len(training_data)} pares")
     
     # Dividir datos en entrenamiento y validación (80/20)
@@ -156,20 +244,56 @@ def main():
     logger.info(f"Datos de validación: {len(validation_data)} pares")
     
     # Entrenar modelo
-    train_ml_model(train_data, validation_data)
+    report = train_ml_model(train_data, validation_data, feature_cache_dir=FEATURE_CACHE_DIR,
+                            profile=profile, n_jobs=n_jobs)
     
     # Evaluar modelo
     detector = MLSimilarityDetector()
-    if validation_data:
+    accuracy = None
+    evaluation_start = time.perf_counter()
+    evaluation = None
+    if len(validation_data):
         logger.info("📊 Evaluando modelo...")
-        accuracy = evaluate_model(detector, validation_data)
+        evaluation = evaluate(detector, validation_data, n_jobs=n_jobs)
+        accuracy = evaluation['scorers']['ml']['accuracy']
         
         if accuracy >= 0.8:
             logger.info("✅ Modelo entrenado exitosamente con buena precisión")
         else:
             logger.warning("⚠️ Modelo entrenado pero la precisión es baja")
+    evaluation_seconds = time.perf_counter() - evaluation_start
     
+    print_training_report(report, evaluation_seconds, accuracy, time.perf_counter() - start)
+    if evaluation is not None:
+        print_evaluation_report(evaluation)
+    logger.info("🎉 Entrenamiento completado!")
+    return report
+
+def main_streaming(csv_path: str, chunksize: int = DEFAULT_CHUNKSIZE,
+                   profile: str = DEFAULT_TRAINING_PROFILE, n_jobs: Optional[int] = None):
+    """Entrenar desde un CSV grande sin cargarlo completo en memoria"""
+    logger.info(f"🚀 Entrenando por streaming desde {csv_path} (bloques de {chunksize} filas)...")
+    start = time.perf_counter()
+    report = train_from_csv_streaming(csv_path, chunksize=chunksize, profile=profile, n_jobs=n_jobs)
+    print_training_report(report, 0.0, report['validation_accuracy'], time.perf_counter() - start)
     logger.info("🎉 Entrenamiento completado!")
+    return report
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Entrenar el modelo de similitud")
+    parser.add_argument('--profile', choices=sorted(TRAINING_PROFILES), default=DEFAULT_TRAINING_PROFILE,
+                        help="Perfil de entrenamiento (fast, balanced, accurate)")
+    parser.add_argument('--n-jobs', type=int, default=None,
+                        help="Hilos de XGBoost (por defecto, todos los núcleos)")
+    parser.add_argument('--stream', metavar='CSV', default=None,
+                        help="Entrenar leyendo este CSV por bloques (exports de etiquetas grandes)")
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                        help="Filas por bloque en modo --stream")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    args = parse_args()
+    if args.stream:
+        main_streaming(args.stream, chunksize=args.chunksize, profile=args.profile, n_jobs=args.n_jobs)
+    else:
+        main(profile=args.profile, n_jobs=args.n_jobs) 
\ No newline at end of file
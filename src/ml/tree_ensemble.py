@@ -0,0 +1,282 @@
+"""
+Evaluador NumPy del modelo de similitud
+Convierte el booster XGBoost (y el scaler / TF-IDF asociados) en arrays planos
+y puntúa batches completos recorriendo todos los árboles nivel por nivel.
+Solo requiere numpy en tiempo de inferencia.
+"""
+
+import os
+import re
+import json
+import logging
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Versión del formato .npz exportado
+NUMPY_MODEL_FORMAT = 1
+
+# Filas evaluadas por bloque: acota la memoria de las matrices (filas x árboles)
+EVAL_BLOCK_ROWS = 65536
+
+
+def default_numpy_path(model_path: str) -> str:
+    """Ruta del modelo NumPy asociado a un modelo .pkl"""
+    return f"{os.path.splitext(model_path)[0]}.npz"
+
+
+def _parse_base_score(value) -> float:
+    """base_score viene como '5E-1' o, en XGBoost >= 2, como '[5E-1]'"""
+    return float(str(value).strip('[]'))
+
+
+class TreeEnsemble:
+    """Ensamble de árboles en arrays (árboles x nodos).
+
+    Por nodo se guarda feature, threshold, hijo izquierdo, hijo derecho,
+    dirección por defecto para valores faltantes y valor de hoja. Las hojas
+    apuntan a sí mismas, de modo que max_depth pasos de recorrido dejan
+    a cada fila en su hoja sin necesidad de enmascarar.
+    """
+
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, left: np.ndarray, right: np.ndarray,
+                 default_left: np.ndarray, value: np.ndarray, base_margin: float, max_depth: int):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.value = value
+        self.base_margin = float(base_margin)
+        self.max_depth = int(max_depth)
+        # Vistas planas con índices globales (árbol * max_nodes + nodo) para
+        # recorrer con np.take, bastante más rápido que el indexado 2D
+        n_trees, max_nodes = feature.shape
+        offsets = (np.arange(n_trees, dtype=np.int64) * max_nodes)[:, None]
+        self._offsets = offsets.ravel()
+        self._feature = feature.astype(np.int64).ravel()
+        self._threshold = threshold.ravel()
+        self._left = (left + offsets).ravel()
+        self._right = (right + offsets).ravel()
+        self._default_left = default_left.ravel()
+        self._value = value.ravel()
+
+    @property
+    def n_trees(self) -> int:
+        return self.feature.shape[0]
+
+    @classmethod
+    def from_xgb_model(cls, model) -> 'TreeEnsemble':
+        """Construir el ensamble desde un XGBClassifier binario (binary:logistic)"""
+        booster = model.get_booster()
+        config = json.loads(booster.save_raw(raw_format='json'))
+        learner = config['learner']
+        objective = learner['objective']['name']
+        if objective != 'binary:logistic':
+            raise ValueError(f"Objetivo no soportado por el evaluador NumPy: {objective}")
+        gradient_booster = learner['gradient_booster']
+        if gradient_booster['name'] != 'gbtree':
+            raise ValueError(f"Booster no soportado por el evaluador NumPy: {gradient_booster['name']}")
+
+        trees = gradient_booster['model']['trees']
+        # predict_proba usa solo hasta best_iteration cuando hubo early stopping
+        try:
+            parallel = int(gradient_booster['model']['gbtree_model_param']['num_parallel_tree'])
+            trees = trees[:(model.best_iteration + 1) * parallel]
+        except AttributeError:
+            pass
+
+        max_nodes = max(len(tree['left_children']) for tree in trees)
+        shape = (len(trees), max_nodes)
+        feature = np.zeros(shape, dtype=np.int32)
+        threshold = np.zeros(shape, dtype=np.float32)
+        left = np.zeros(shape, dtype=np.int32)
+        right = np.zeros(shape, dtype=np.int32)
+        default_left = np.zeros(shape, dtype=bool)
+        value = np.zeros(shape, dtype=np.float32)
+        max_depth = 0
+
+        for t, tree in enumerate(trees):
+            n_nodes = len(tree['left_children'])
+            nodes = np.arange(n_nodes, dtype=np.int32)
+            lefts = np.asarray(tree['left_children'], dtype=np.int32)
+            rights = np.asarray(tree['right_children'], dtype=np.int32)
+            conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+            is_leaf = lefts == -1
+
+            feature[t, :n_nodes] = np.where(is_leaf, 0, tree['split_indices'])
+            threshold[t, :n_nodes] = np.where(is_leaf, 0, conditions)
+            left[t, :n_nodes] = np.where(is_leaf, nodes, lefts)
+            right[t, :n_nodes] = np.where(is_leaf, nodes, rights)
+            default_left[t, :n_nodes] = np.asarray(tree['default_left'], dtype=bool)
+            # En las hojas, split_conditions guarda el valor de la hoja
+            value[t, :n_nodes] = np.where(is_leaf, conditions, 0)
+            # Los nodos de relleno (más allá de n_nodes) nunca se alcanzan
+            left[t, n_nodes:] = right[t, n_nodes:] = np.arange(n_nodes, max_nodes)
+
+            depth = np.zeros(n_nodes, dtype=np.int32)
+            for node in range(n_nodes):
+                if not is_leaf[node]:
+                    depth[lefts[node]] = depth[rights[node]] = depth[node] + 1
+            max_depth = max(max_depth, int(depth.max()))
+
+        base_score = _parse_base_score(learner['learner_model_param']['base_score'])
+        base_margin = float(np.log(base_score / (1.0 - base_score)))
+        return cls(feature, threshold, left, right, default_left, value, base_margin, max_depth)
+
+    def predict_margin(self, X: np.ndarray) -> np.ndarray:
+        """Margen (logit) de cada fila, recorriendo todos los árboles a la vez"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_features = X.shape[1]
+        margins = np.empty(len(X), dtype=np.float32)
+        for start in range(0, len(X), EVAL_BLOCK_ROWS):
+            block = X[start:start + EVAL_BLOCK_ROWS]
+            flat_block = block.ravel()
+            has_missing = bool(np.isnan(block).any())
+            row_base = (np.arange(len(block), dtype=np.int64) * n_features)[:, None]
+            node = np.broadcast_to(self._offsets, (len(block), self.n_trees)).copy()
+            for _ in range(self.max_depth):
+                values = np.take(flat_block, row_base + np.take(self._feature, node))
+                go_left = values < np.take(self._threshold, node)
+                if has_missing:
+                    go_left = np.where(np.isnan(values), np.take(self._default_left, node), go_left)
+                node = np.where(go_left, np.take(self._left, node), np.take(self._right, node))
+            margins[start:start + len(block)] = np.take(self._value, node).sum(axis=1, dtype=np.float32)
+        return margins + np.float32(self.base_margin)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Probabilidad de la clase positiva"""
+        return 1.0 / (1.0 + np.exp(-self.predict_margin(X).astype(np.float64)))
+
+
+class TfidfTable:
+    """Réplica en Python puro de un TfidfVectorizer de palabras ya ajustado.
+
+    Solo calcula la similitud coseno entre pares de títulos, que es lo que
+    consume el featurizer; reproduce el token_pattern, los n-gramas y el idf
+    del vectorizer original.
+    """
+
+    def __init__(self, vocabulary: Dict[str, int], idf: np.ndarray, token_pattern: str,
+                 ngram_range: Sequence[int], lowercase: bool = True, sublinear_tf: bool = False):
+        self.vocabulary = vocabulary
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.token_pattern = token_pattern
+        self.ngram_range = (int(ngram_range[0]), int(ngram_range[1]))
+        self.lowercase = bool(lowercase)
+        self.sublinear_tf = bool(sublinear_tf)
+        self._token_re = re.compile(token_pattern)
+
+    @classmethod
+    def from_vectorizer(cls, vectorizer) -> 'TfidfTable':
+        unsupported = [name for name in ('stop_words', 'strip_accents', 'tokenizer', 'preprocessor')
+                       if getattr(vectorizer, name, None) is not None]
+        if vectorizer.analyzer != 'word' or unsupported or vectorizer.norm != 'l2' or not vectorizer.use_idf:
+            raise ValueError("Configuración de TfidfVectorizer no soportada por el evaluador NumPy")
+        vocabulary = {term: int(index) for term, index in vectorizer.vocabulary_.items()}
+        return cls(vocabulary, vectorizer.idf_, vectorizer.token_pattern, vectorizer.ngram_range,
+                   vectorizer.lowercase, vectorizer.sublinear_tf)
+
+    def _terms(self, text: str) -> List[str]:
+        if self.lowercase:
+            text = text.lower()
+        tokens = self._token_re.findall(text)
+        min_n, max_n = self.ngram_range
+        terms = []
+        for n in range(min_n, min(max_n, len(tokens)) + 1):
+            terms.extend(' '.join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return terms
+
+    def _weights(self, text: str) -> Dict[int, float]:
+        counts = Counter(self.vocabulary[term] for term in self._terms(text) if term in self.vocabulary)
+        if self.sublinear_tf:
+            return {index: (1.0 + np.log(count)) * self.idf[index] for index, count in counts.items()}
+        return {index: count * self.idf[index] for index, count in counts.items()}
+
+    def cosine(self, text_a: str, text_b: str) -> float:
+        weights_a, weights_b = self._weights(text_a), self._weights(text_b)
+        if not weights_a or not weights_b:
+            return 0.0
+        dot = sum(weight * weights_b[index] for index, weight in weights_a.items() if index in weights_b)
+        norm_a = np.sqrt(sum(weight * weight for weight in weights_a.values()))
+        norm_b = np.sqrt(sum(weight * weight for weight in weights_b.values()))
+        return float(dot / (norm_a * norm_b))
+
+    def cosine_batch(self, texts_a: Sequence[str], texts_b: Sequence[str]) -> np.ndarray:
+        return np.array([self.cosine(a, b) for a, b in zip(texts_a, texts_b)], dtype=np.float64)
+
+
+class NumpySimilarityModel:
+    """Pipeline completo (TF-IDF + scaler + árboles) sin dependencias más allá de numpy"""
+
+    def __init__(self, ensemble: TreeEnsemble, scaler_mean: np.ndarray, scaler_scale: np.ndarray,
+                 tfidf: TfidfTable, feature_names: Sequence[str]):
+        self.ensemble = ensemble
+        self.scaler_mean = np.asarray(scaler_mean, dtype=np.float64)
+        self.scaler_scale = np.asarray(scaler_scale, dtype=np.float64)
+        self.tfidf = tfidf
+        self.feature_names = list(feature_names)
+
+    @classmethod
+    def from_detector(cls, detector) -> 'NumpySimilarityModel':
+        if not detector.is_trained or detector.model is None:
+            raise ValueError("El detector debe estar entrenado (backend joblib) para exportar a NumPy")
+        scaler = detector.scaler
+        scale = scaler.scale_ if scaler.scale_ is not None else np.ones(scaler.n_features_in_)
+        mean = scaler.mean_ if scaler.mean_ is not None else np.zeros(scaler.n_features_in_)
+        from ml_similarity import FEATURE_NAMES
+        return cls(TreeEnsemble.from_xgb_model(detector.model), mean, scale,
+                   TfidfTable.from_vectorizer(detector.tfidf_vectorizer), FEATURE_NAMES)
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        """Escalar como StandardScaler y evaluar el ensamble"""
+        features = np.asarray(features, dtype=np.float64)
+        if features.ndim == 1:
+            features = features.reshape(1, -1)
+        return self.ensemble.predict_proba((features - self.scaler_mean) / self.scaler_scale)
+
+    def save(self, path: str):
+        terms = sorted(self.tfidf.vocabulary, key=self.tfidf.vocabulary.get)
+        ensemble = self.ensemble
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                format_version=NUMPY_MODEL_FORMAT,
+                feature_names=np.array(self.feature_names),
+                feature=ensemble.feature, threshold=ensemble.threshold,
+                left=ensemble.left, right=ensemble.right,
+                default_left=ensemble.default_left, value=ensemble.value,
+                base_margin=ensemble.base_margin, max_depth=ensemble.max_depth,
+                scaler_mean=self.scaler_mean, scaler_scale=self.scaler_scale,
+                vocabulary_terms=np.array(terms, dtype=str),
+                vocabulary_indices=np.array([self.tfidf.vocabulary[t] for t in terms], dtype=np.int32),
+                idf=self.tfidf.idf, token_pattern=self.tfidf.token_pattern,
+                ngram_range=np.array(self.tfidf.ngram_range),
+                lowercase=self.tfidf.lowercase, sublinear_tf=self.tfidf.sublinear_tf,
+            )
+
+    @classmethod
+    def load(cls, path: str) -> 'NumpySimilarityModel':
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['format_version']) != NUMPY_MODEL_FORMAT:
+                raise ValueError(f"Formato de modelo NumPy no soportado: {int(data['format_version'])}")
+            ensemble = TreeEnsemble(data['feature'], data['threshold'], data['left'], data['right'],
+                                    data['default_left'], data['value'],
+                                    float(data['base_margin']), int(data['max_depth']))
+            vocabulary = dict(zip(data['vocabulary_terms'].tolist(), data['vocabulary_indices'].tolist()))
+            tfidf = TfidfTable(vocabulary, data['idf'], str(data['token_pattern']), data['ngram_range'].tolist(),
+                               bool(data['lowercase']), bool(data['sublinear_tf']))
+            return cls(ensemble, data['scaler_mean'], data['scaler_scale'], tfidf,
+                       data['feature_names'].tolist())
+
+
+def export_numpy(detector, numpy_path: Optional[str] = None) -> str:
+    """Exportar un detector entrenado al formato .npz del evaluador NumPy"""
+    numpy_path = numpy_path or default_numpy_path(detector.model_path)
+    NumpySimilarityModel.from_detector(detector).save(numpy_path)
+    logger.info(f"Modelo exportado a NumPy en {numpy_path}")
+    return numpy_path